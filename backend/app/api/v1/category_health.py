@@ -23,6 +23,8 @@ if str(APP_DIR) not in sys.path:
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
+from app.services.dispatch_service import offload
+
 # 尝试导入数据库
 DATABASE_AVAILABLE = False
 try:
@@ -87,6 +89,7 @@ def get_volatility_level(cv: float) -> str:
 
 
 @router.get("/health", response_model=CategoryHealthResponse)
+@offload()
 async def get_category_health(
     store_name: Optional[str] = Query(None, description="门店名称"),
     channel: Optional[str] = Query(None, description="渠道名称"),
@@ -30,6 +30,8 @@ if str(APP_DIR) not in sys.path:
     sys.path.insert(0, str(APP_DIR))
 
 from .orders import get_order_data
+from app.services.dispatch_service import offload
+from cache_utils import safe_fillna
 
 router = APIRouter()
 
@@ -40,11 +42,12 @@ def get_product_latest_stock(df: pd.DataFrame, stock_col: str, date_col: str) ->
         return {}
     
     df_sorted = df.sort_values(date_col)
-    latest = df_sorted.groupby('商品名称')[stock_col].last()
+    latest = df_sorted.groupby('商品名称', observed=True)[stock_col].last()
     return latest.to_dict()
 
 
 @router.get("/performance")
+@offload()
 async def get_category_performance(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     parent_category: Optional[str] = Query(None, description="父级分类（用于下钻到三级分类）"),
@@ -129,7 +132,7 @@ async def get_category_performance(
         return {"success": True, "data": [], "level": level, "error": f"缺少分类字段: {group_col}"}
     
     # 处理空分类名
-    df[group_col] = df[group_col].fillna('未分类')
+    df[group_col] = safe_fillna(df[group_col], '未分类')
     df.loc[df[group_col].astype(str).isin(['', 'nan', 'None']), group_col] = '未分类'
     
     # 🔴 关键修复：实收价格是单价，需要先乘以销量
@@ -153,7 +156,7 @@ async def get_category_performance(
     if profit_field:
         agg_dict[profit_field] = 'sum'
     
-    category_stats = df.groupby(group_col).agg(agg_dict).reset_index()
+    category_stats = df.groupby(group_col, observed=True).agg(agg_dict).reset_index()
     
     # 重命名列 - 使用rename而不是直接赋值，避免列顺序问题
     if quantity_field and '_销售额' in category_stats.columns:
@@ -211,6 +214,7 @@ async def get_category_performance(
 
 
 @router.get("/with-risk")
+@offload()
 async def get_category_with_risk(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     parent_category: Optional[str] = Query(None, description="父级分类"),
@@ -278,7 +282,7 @@ async def get_category_with_risk(
         return {"success": True, "data": [], "level": level}
     
     # 处理空分类名
-    df[group_col] = df[group_col].fillna('未分类').astype(str)
+    df[group_col] = safe_fillna(df[group_col], '未分类').astype(str)
     df.loc[df[group_col].isin(['', 'nan', 'None']), group_col] = '未分类'
     
     # ==================== 1. 销售数据聚合（向量化）====================
@@ -301,7 +305,7 @@ async def get_category_with_risk(
     if profit_field:
         agg_dict[profit_field] = 'sum'
     
-    category_stats = df.groupby(group_col, as_index=False).agg(agg_dict)
+    category_stats = df.groupby(group_col, as_index=False, observed=True).agg(agg_dict)
     category_stats.columns = ['category', 'revenue', 'orderCount'] + (['profit'] if profit_field else [])
     
     if 'profit' not in category_stats.columns:
@@ -324,7 +328,7 @@ async def get_category_with_risk(
         seven_days_ago = last_date - timedelta(days=7)
         
         # 🆕 获取每个商品的首次出现日期和最后销售日期
-        product_dates = df.sort_values(date_col).groupby('商品名称').agg({
+        product_dates = df.sort_values(date_col).groupby('商品名称', observed=True).agg({
             stock_col: 'last',
             group_col: 'first',
             date_col: ['min', 'max']  # 首次出现日期和最后销售日期
@@ -334,7 +338,7 @@ async def get_category_with_risk(
         # 售罄品：最近7天有销售 + 当前库存=0
         recent_products = set(df[df[date_col] >= seven_days_ago]['商品名称'].unique())
         sellout_mask = (product_dates['stock'] == 0) & (product_dates['商品名称'].isin(recent_products))
-        sellout_by_cat = product_dates[sellout_mask].groupby('category').size()
+        sellout_by_cat = product_dates[sellout_mask].groupby('category', observed=True).size()
         
         # 🆕 滞销品：库存>0 + 从首次出现日期开始计算无销售天数 >= 7
         # 如果最后销售日期 == 首次出现日期，说明只卖过一次，从首次出现日期开始计算
@@ -346,7 +350,7 @@ async def get_category_with_risk(
         
         product_dates['days_no_sale'] = product_dates.apply(calc_days_no_sale, axis=1)
         slowmove_mask = (product_dates['stock'] > 0) & (product_dates['days_no_sale'] >= 7)
-        slowmove_by_cat = product_dates[slowmove_mask].groupby('category').size()
+        slowmove_by_cat = product_dates[slowmove_mask].groupby('category', observed=True).size()
         
         # 更新风险数据
         for cat in risk_data:
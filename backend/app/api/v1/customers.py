@@ -24,11 +24,13 @@ from dependencies import (
     common_store_param,
 )
 from services import CustomerService
+from app.services.dispatch_service import offload
 
 router = APIRouter()
 
 
 @router.get("/churn")
+@offload()
 async def get_churn_customers(
     lookback_days: int = Query(30, ge=7, le=90, description="回溯天数"),
     min_orders: int = Query(2, ge=1, description="最小订单数"),
@@ -63,6 +65,7 @@ async def get_churn_customers(
 
 
 @router.get("/churn/reasons")
+@offload()
 async def get_churn_reasons(
     store_name: Optional[str] = Depends(common_store_param),
     service: CustomerService = Depends(get_customer_service)
@@ -101,6 +104,7 @@ async def get_churn_reasons(
 
 
 @router.get("/recall-suggestions")
+@offload()
 async def get_recall_suggestions(
     top_n: int = Query(10, ge=1, le=50, description="优先召回数量"),
     store_name: Optional[str] = Depends(common_store_param),
@@ -140,6 +144,7 @@ async def get_recall_suggestions(
 
 
 @router.get("/aov-anomaly")
+@offload()
 async def get_aov_anomaly(
     store_name: Optional[str] = Depends(common_store_param),
     service: CustomerService = Depends(get_customer_service)
@@ -36,6 +36,8 @@ DATABASE_AVAILABLE = False
 try:
     from database.connection import SessionLocal, check_connection
     from database.models import Order
+    from database.order_bulk_import import import_orders_frame, UPLOAD_DATE_COLUMNS
+    from database.order_changes import notify_orders_changed
     DATABASE_AVAILABLE = True
 except ImportError:
     print("⚠️ 数据库模块未找到，部分功能不可用")
@@ -59,6 +61,38 @@ except ImportError:
 router = APIRouter()
 
 
+def warm_order_facts(store_names: List[str]):
+    """
+    后台预建写入门店的订单级事实表
+
+    失效已由导入管道/删除流程（notify_orders_changed）同步完成，这里只是提前重建，
+    避免首个请求回退到实时计算
+    """
+    try:
+        from .orders import rebuild_order_facts
+        rebuild_order_facts(store_names)
+    except Exception as e:
+        print(f"⚠️ 订单事实表预建失败: {e}")
+
+
+def refresh_aggregations(written_days: Dict[str, Any], full_stores: Optional[List[str]] = None):
+    """
+    订单数据写入后按 (门店, 日期) 脏集合异步刷新预聚合表
+
+    Args:
+        written_days: 实际写入的 门店 → 日期集合（ImportResult.dirty_days）
+        full_stores: 需要刷新全部日期的门店（替换模式删除了这些门店的全部旧订单）
+    """
+    try:
+        from app.services.aggregation_sync_service import AggregationSyncService
+        dirty_days: Dict[str, Any] = dict(written_days)
+        for store_name in full_stores or []:
+            dirty_days[store_name] = None
+        AggregationSyncService.sync_dirty(dirty_days, async_mode=True)
+    except Exception as e:
+        print(f"⚠️ 预聚合表刷新失败: {e}")
+
+
 # ==================== 请求/响应模型 ====================
 
 class DateRangeParams(BaseModel):
@@ -349,127 +383,32 @@ async def upload_orders(
                 detail=f"缺少必需字段: {', '.join(missing)}"
             )
         
-        # 导入数据库
-        session = SessionLocal()
-        try:
-            store_name = df['门店名称'].iloc[0] if '门店名称' in df.columns else "未知门店"
-            
-            # 替换模式：删除旧数据
-            if mode == "replace":
-                deleted = session.query(Order).filter(Order.store_name == store_name).delete()
-                session.commit()
-                print(f"删除旧数据: {deleted}条")
-            
-            # 批量插入
-            inserted = 0
-            batch_size = 5000
-            
-            for i in range(0, len(df), batch_size):
-                batch = df.iloc[i:i+batch_size]
-                orders = []
-                
-                for _, row in batch.iterrows():
-                    # 辅助函数：安全获取浮点数
-                    def safe_float(val, default=0):
-                        if pd.isna(val):
-                            return default
-                        try:
-                            return float(val)
-                        except:
-                            return default
-                    
-                    # 辅助函数：安全获取整数
-                    def safe_int(val, default=0):
-                        if pd.isna(val):
-                            return default
-                        try:
-                            return int(val)
-                        except:
-                            return default
-                    
-                    # 辅助函数：安全获取字符串
-                    def safe_str(val, default=''):
-                        if pd.isna(val):
-                            return default
-                        return str(val)
-                    
-                    order = Order(
-                        # 基础信息
-                        order_id=safe_str(row.get('订单ID', '')),
-                        order_number=safe_str(row.get('订单编号', '')),
-                        store_name=safe_str(row.get('门店名称', '')),
-                        product_name=safe_str(row.get('商品名称', '')),
-                        date=pd.to_datetime(row.get('下单时间', row.get('日期'))) if pd.notna(row.get('下单时间', row.get('日期'))) else None,
-                        channel=safe_str(row.get('渠道', '')),
-                        address=safe_str(row.get('收货地址', '')),
-                        
-                        # 分类
-                        category_level1=safe_str(row.get('一级分类名', row.get('一级分类', ''))),
-                        category_level3=safe_str(row.get('三级分类名', row.get('三级分类', ''))),
-                        
-                        # 价格和成本
-                        price=safe_float(row.get('商品实售价', 0)),
-                        original_price=safe_float(row.get('商品原价', 0)),
-                        cost=safe_float(row.get('商品采购成本', row.get('成本', 0))),
-                        actual_price=safe_float(row.get('实收价格', 0)),
-                        
-                        # 销量和金额
-                        quantity=safe_int(row.get('销量', row.get('月售', 1)), 1),
-                        stock=safe_int(row.get('库存', 0)),
-                        remaining_stock=safe_float(row.get('剩余库存', row.get('库存', 0))),
-                        amount=safe_float(row.get('预计订单收入', row.get('订单零售额', row.get('销售额', 0)))),
-                        profit=safe_float(row.get('利润额', row.get('实际利润', row.get('利润', 0)))),
-                        
-                        # 费用
-                        delivery_fee=safe_float(row.get('物流配送费', 0)),
-                        commission=safe_float(row.get('平台佣金', 0)),
-                        platform_service_fee=safe_float(row.get('平台服务费', row.get('平台佣金', 0))),
-                        
-                        # 营销活动费用
-                        user_paid_delivery_fee=safe_float(row.get('用户支付配送费', 0)),
-                        delivery_discount=safe_float(row.get('配送费减免金额', 0)),
-                        full_reduction=safe_float(row.get('满减金额', 0)),
-                        product_discount=safe_float(row.get('商品减免金额', 0)),
-                        merchant_voucher=safe_float(row.get('商家代金券', 0)),
-                        merchant_share=safe_float(row.get('商家承担部分券', 0)),
-                        packaging_fee=safe_float(row.get('打包袋金额', 0)),
-                        gift_amount=safe_float(row.get('满赠金额', 0)),
-                        other_merchant_discount=safe_float(row.get('商家其他优惠', 0)),
-                        new_customer_discount=safe_float(row.get('新客减免金额', 0)),
-                        
-                        # 利润补偿项
-                        corporate_rebate=safe_float(row.get('企客后返', 0)),
-                        
-                        # ✅ 配送信息 - 修复BUG: 之前缺少这两个字段导致配送距离数据丢失
-                        delivery_distance=safe_float(row.get('配送距离', 0)),
-                        delivery_platform=safe_str(row.get('配送平台', '')),
-                        
-                        # ✅ 门店信息 - 补充缺失字段
-                        store_id=safe_str(row.get('门店ID', '')),
-                        store_franchise_type=safe_int(row.get('门店加盟类型', 0)) if pd.notna(row.get('门店加盟类型')) else None,
-                        city=safe_str(row.get('城市名称', row.get('城市', ''))),
-                        
-                        # 条码
-                        barcode=safe_str(row.get('条码', '')),
-                        store_code=safe_str(row.get('店内码', '')),
-                    )
-                    orders.append(order)
-                
-                session.bulk_save_objects(orders)
-                session.commit()
-                inserted += len(orders)
-            
-            return {
-                "success": True,
-                "message": f"上传成功",
-                "rows_processed": original_rows,
-                "rows_inserted": inserted,
-                "store_name": store_name,
-                "mode": mode
-            }
-            
-        finally:
-            session.close()
+        # 导入数据库（向量化映射 + COPY，替换模式删除与写入同一事务）
+        store_name = df['门店名称'].iloc[0] if '门店名称' in df.columns else "未知门店"
+        result = import_orders_frame(
+            df,
+            default_store='',
+            replace_stores=[store_name] if mode == "replace" else None,
+            date_columns=UPLOAD_DATE_COLUMNS,
+            date_fallback=False,
+        )
+        if mode == "replace":
+            print(f"删除旧数据: {result.deleted.get(store_name, 0)}条")
+        
+        warm_order_facts(list(result.dirty_days))
+        
+        refresh_aggregations(result.dirty_days, [store_name] if mode == "replace" else None)
+        
+        return {
+            "success": True,
+            "message": f"上传成功",
+            "rows_processed": original_rows,
+            "rows_inserted": result.inserted,
+            "rows_skipped": result.skipped,
+            "rows_per_second": round(result.rows_per_second),
+            "store_name": store_name,
+            "mode": mode
+        }
             
     except HTTPException:
         raise
@@ -789,6 +728,7 @@ async def delete_store_data(store_name: str):
         try:
             deleted = session.query(Order).filter(Order.store_name == store_name).delete()
             session.commit()
+            notify_orders_changed(removed=[store_name])
             
             return {
                 "success": True,
@@ -33,6 +33,8 @@ if str(APP_DIR) not in sys.path:
     sys.path.insert(0, str(APP_DIR))
 
 from .orders import get_order_data
+from cache_utils import observed_value_counts, shared_view
+from app.services.dispatch_service import offload
 
 router = APIRouter()
 
@@ -47,7 +49,7 @@ def get_product_latest_stock(df: pd.DataFrame, stock_col: str, date_col: str) ->
         return {}
     
     df_sorted = df.sort_values(date_col)
-    latest = df_sorted.groupby('商品名称')[stock_col].last()
+    latest = df_sorted.groupby('商品名称', observed=True)[stock_col].last()
     return latest.to_dict()
 
 
@@ -93,7 +95,7 @@ def calculate_inventory_risk_dash_style(df: pd.DataFrame, store_name: str = None
         return result
     
     # ==================== 2. 准备数据 ====================
-    df = df.copy()
+    df = shared_view(df)
     df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
     df = df.dropna(subset=[date_col])
     
@@ -114,7 +116,7 @@ def calculate_inventory_risk_dash_style(df: pd.DataFrame, store_name: str = None
         })
         
         # 添加分类信息
-        product_category_map = df.groupby('商品名称')[category_col].first().to_dict()
+        product_category_map = df.groupby('商品名称', observed=True)[category_col].first().to_dict()
         last_stock['分类'] = last_stock['商品名称'].map(product_category_map)
     else:
         print("⚠️ 缺少库存字段，无法计算库存风险")
@@ -136,7 +138,7 @@ def calculate_inventory_risk_dash_style(df: pd.DataFrame, store_name: str = None
     # 按分类统计售罄品
     if len(sellout_products) > 0:
         sellout_df = df[df['商品名称'].isin(sellout_products)][[category_col, '商品名称']].drop_duplicates()
-        sellout_by_cat = sellout_df.groupby(category_col).size().to_dict()
+        sellout_by_cat = sellout_df.groupby(category_col, observed=True).size().to_dict()
         result["sold_out"]["by_category"] = sellout_by_cat
         
         # 生成售罄品详情列表
@@ -161,10 +163,10 @@ def calculate_inventory_risk_dash_style(df: pd.DataFrame, store_name: str = None
     
     # ==================== 5. 滞销品四级分级统计（🆕 优化版：以首次出现日期为基准） ====================
     # 🆕 计算每个商品的首次出现日期和最后销售日期
-    product_first_sale = df.groupby('商品名称')[date_col].min().reset_index()
+    product_first_sale = df.groupby('商品名称', observed=True)[date_col].min().reset_index()
     product_first_sale.columns = ['商品名称', '首次出现日期']
     
-    product_last_sale = df.groupby('商品名称')[date_col].max().reset_index()
+    product_last_sale = df.groupby('商品名称', observed=True)[date_col].max().reset_index()
     product_last_sale.columns = ['商品名称', '最后销售日期']
     
     # 合并首次和最后销售日期
@@ -208,7 +210,7 @@ def calculate_inventory_risk_dash_style(df: pd.DataFrame, store_name: str = None
     result["slow_moving"]["total"] = sum(result["slow_moving"]["by_severity"].values())
     
     # 按分类汇总滞销品
-    stagnant_by_cat = product_stagnant.groupby('分类').agg({
+    stagnant_by_cat = product_stagnant.groupby('分类', observed=True).agg({
         '关注': 'sum',
         '轻度滞销': 'sum',
         '中度滞销': 'sum',
@@ -238,7 +240,7 @@ def calculate_inventory_risk_dash_style(df: pd.DataFrame, store_name: str = None
     # 🔧 性能优化：预计算每个商品的平均单价，避免循环内过滤
     avg_price_map = {}
     if '实收价格' in df.columns:
-        avg_price_map = df.groupby('商品名称')['实收价格'].mean().to_dict()
+        avg_price_map = df.groupby('商品名称', observed=True)['实收价格'].mean().to_dict()
     
     for _, row in slow_products.iterrows():
         # 🆕 确定滞销等级（4级：关注/轻度/中度/重度）
@@ -279,13 +281,13 @@ def calculate_inventory_risk_dash_style(df: pd.DataFrame, store_name: str = None
             date_range_days = 1
         
         # 按分类统计
-        category_stats = df.groupby(category_col).agg({
+        category_stats = df.groupby(category_col, observed=True).agg({
             sales_col: 'sum'
         }).reset_index()
         category_stats.columns = ['分类', '总销量']
         
         # 按分类统计当前库存
-        category_stock = last_stock.groupby('分类')['库存'].sum().reset_index()
+        category_stock = last_stock.groupby('分类', observed=True)['库存'].sum().reset_index()
         category_stock.columns = ['分类', '当前库存']
         
         category_stats = category_stats.merge(category_stock, on='分类', how='left')
@@ -323,6 +325,7 @@ def calculate_inventory_risk_dash_style(df: pd.DataFrame, store_name: str = None
 
 
 @router.get("/summary")
+@offload()
 async def get_inventory_risk_summary(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     category: Optional[str] = Query(None, description="分类筛选")
@@ -354,6 +357,7 @@ async def get_inventory_risk_summary(
 
 
 @router.get("/sold-out")
+@offload()
 async def get_sold_out_products(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     category: Optional[str] = Query(None, description="分类筛选"),
@@ -391,6 +395,7 @@ async def get_sold_out_products(
 
 
 @router.get("/slow-moving")
+@offload()
 async def get_slow_moving_products(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     category: Optional[str] = Query(None, description="分类筛选"),
@@ -438,6 +443,7 @@ async def get_slow_moving_products(
 
 
 @router.get("/category-risk")
+@offload()
 async def get_category_risk_stats(
     store_name: Optional[str] = Query(None, description="门店名称筛选")
 ) -> Dict[str, Any]:
@@ -456,6 +462,7 @@ async def get_category_risk_stats(
 
 
 @router.get("/trend")
+@offload()
 async def get_inventory_risk_trend(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     category: Optional[str] = Query(None, description="分类筛选"),
@@ -480,8 +487,12 @@ async def get_inventory_risk_trend(
     - 每日售罄率、滞销率（百分比）
     - 可用的滞销等级列表
     - 趋势有效起始日期
+    
+    加载全部历史（只下推一级分类）：商品首次出现日期、最后销售日期、
+    最后库存都依赖窗口之前的数据
     """
-    df = get_order_data(store_name)
+    load_category = category.split('|')[0] if category else None
+    df = get_order_data(store_name, categories=[load_category] if load_category else None)
     if df.empty:
         return {"success": True, "data": [], "message": "无数据", "availableLevels": []}
     
@@ -502,7 +513,7 @@ async def get_inventory_risk_trend(
         return {"success": True, "data": [], "message": f"缺少必需字段: date={date_col}, stock={stock_col}", "availableLevels": []}
     
     # 准备数据
-    df = df.copy()
+    df = shared_view(df)
     df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
     df = df.dropna(subset=[date_col])
     
@@ -591,23 +602,23 @@ async def get_inventory_risk_trend(
     all_dates = pd.date_range(start=min_date, end=max_date, freq='D')
     
     # 按日期和商品分组，取每天每个商品的最后库存
-    daily_stock_df = df_sorted.groupby([df_sorted[date_col].dt.date, '商品名称'])[stock_col].last().unstack(fill_value=np.nan)
+    daily_stock_df = df_sorted.groupby([df_sorted[date_col].dt.date, '商品名称'], observed=True)[stock_col].last().unstack(fill_value=np.nan)
     
     # 前向填充：如果某天没有数据，使用前一天的库存
     daily_stock_df = daily_stock_df.ffill()
     
     # 2. 🆕 预计算每个商品的首次出现日期（作为滞销计算的基准点）
     # 商品首次出现日期 = 该商品在数据中第一次有销售记录的日期
-    product_first_appearance = df_sorted.groupby('商品名称')[date_col].min()
+    product_first_appearance = df_sorted.groupby('商品名称', observed=True)[date_col].min()
     print(f"[inventory_risk] 商品首次出现日期示例: {dict(list(product_first_appearance.items())[:3])}")
     
     # 3. 预计算每个商品每天的最后销售日期（用于判断是否有新销售）
-    daily_last_sale = df_sorted.groupby([df_sorted[date_col].dt.date, '商品名称'])[date_col].max().unstack()
+    daily_last_sale = df_sorted.groupby([df_sorted[date_col].dt.date, '商品名称'], observed=True)[date_col].max().unstack()
     daily_last_sale = daily_last_sale.ffill()  # 前向填充
     
     # 4. 预计算每个商品在每个7天窗口内是否有销量
     # 创建一个标记：每天每个商品是否有销售记录
-    daily_has_sale = df_sorted.groupby([df_sorted[date_col].dt.date, '商品名称']).size().unstack(fill_value=0)
+    daily_has_sale = df_sorted.groupby([df_sorted[date_col].dt.date, '商品名称'], observed=True).size().unstack(fill_value=0)
     daily_has_sale = (daily_has_sale > 0).astype(int)
     
     # 计算7天滚动窗口内是否有销量
@@ -762,6 +773,7 @@ async def get_inventory_risk_trend(
     }
 
 @router.get("/sold-out-analysis")
+@offload()
 async def get_sold_out_analysis(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     category: Optional[str] = Query(None, description="分类筛选"),
@@ -820,7 +832,7 @@ async def get_sold_out_analysis(
         }
     
     # 准备数据
-    df = df.copy()
+    df = shared_view(df)
     df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
     df = df.dropna(subset=[date_col])
     
@@ -876,7 +888,7 @@ async def get_sold_out_analysis(
     # ==================== 1. 当前售罄品 ====================
     # 获取每个商品的最新库存
     df_sorted = df.sort_values(date_col)
-    latest_stock = df_sorted.groupby('商品名称')[stock_col].last()
+    latest_stock = df_sorted.groupby('商品名称', observed=True)[stock_col].last()
     
     # 近7天有销量的商品
     recent_sales = df[df[date_col] >= seven_days_ago]
@@ -894,7 +906,7 @@ async def get_sold_out_analysis(
         sold_out_df = recent_sales[recent_sales['商品名称'].isin(sold_out_products)]
         if not sold_out_df.empty:
             # 按商品分组计算近7天总销售额
-            product_sales = sold_out_df.groupby('商品名称')[price_col].sum()
+            product_sales = sold_out_df.groupby('商品名称', observed=True)[price_col].sum()
             # 日均销售额
             daily_avg_sales = product_sales / 7
             # 估算损失 = 日均销售额 × 假设售罄1天
@@ -904,10 +916,10 @@ async def get_sold_out_analysis(
     by_category = []
     if len(sold_out_products) > 0 and category_col in df.columns:
         # 获取售罄品的分类
-        product_category = df[df['商品名称'].isin(sold_out_products)].groupby('商品名称')[category_col].first()
+        product_category = df[df['商品名称'].isin(sold_out_products)].groupby('商品名称', observed=True)[category_col].first()
         
         # 按分类统计
-        category_counts = product_category.value_counts()
+        category_counts = observed_value_counts(product_category)
         
         # 计算每个分类的损失
         for cat, count in category_counts.items():
@@ -936,11 +948,11 @@ async def get_sold_out_analysis(
     df_period_sorted = df_period.sort_values(date_col)
     
     # 预计算每个商品每天的库存
-    daily_stock_pivot = df_period_sorted.groupby([df_period_sorted[date_col].dt.date, '商品名称'])[stock_col].last().unstack(fill_value=np.nan)
+    daily_stock_pivot = df_period_sorted.groupby([df_period_sorted[date_col].dt.date, '商品名称'], observed=True)[stock_col].last().unstack(fill_value=np.nan)
     daily_stock_pivot = daily_stock_pivot.ffill()
     
     # 预计算每个商品每天是否有销售
-    daily_has_sale = df_period_sorted.groupby([df_period_sorted[date_col].dt.date, '商品名称']).size().unstack(fill_value=0)
+    daily_has_sale = df_period_sorted.groupby([df_period_sorted[date_col].dt.date, '商品名称'], observed=True).size().unstack(fill_value=0)
     daily_has_sale = (daily_has_sale > 0).astype(int)
     
     # 计算7天滚动窗口内是否有销量
@@ -978,7 +990,7 @@ async def get_sold_out_analysis(
             product_recovery_days[product] = recovery_times
     
     # 生成高频售罄品列表
-    product_category_map = df.groupby('商品名称')[category_col].first().to_dict() if category_col in df.columns else {}
+    product_category_map = df.groupby('商品名称', observed=True)[category_col].first().to_dict() if category_col in df.columns else {}
     
     for product, dates_list in product_sold_out_days.items():
         times = len(dates_list)
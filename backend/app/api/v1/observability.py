@@ -377,6 +377,22 @@ async def get_database_pool_status():
     }
 
 
+@router.get("/aggregation/refresh")
+async def get_aggregation_refresh_status():
+    """
+    获取最近一次预聚合表刷新状态
+
+    返回:
+    - 刷新范围（门店/日期区间）
+    - 各表写入/清理行数与耗时
+    """
+    from ...services.aggregation_sync_service import AggregationSyncService
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "last_refresh": AggregationSyncService.get_last_refresh()
+    }
+
+
 @router.get("/backend/status")
 async def get_backend_status():
     """
@@ -436,12 +452,12 @@ async def refresh_query_router():
 
 
 @router.post("/query-router/force-engine")
-async def force_query_engine(engine: str = Query(..., description="引擎类型: postgresql 或 duckdb")):
+async def force_query_engine(engine: str = Query(..., description="引擎类型: postgresql、duckdb 或 auto（恢复按查询路由）")):
     """
     强制切换查询引擎（仅用于测试）
     
     Args:
-        engine: "postgresql" 或 "duckdb"
+        engine: "postgresql"、"duckdb" 或 "auto"
     """
     from ...services.query_router_service import query_router_service
     result = query_router_service.force_engine(engine)
@@ -22,6 +22,8 @@ import numpy as np
 import hashlib
 import json
 import time
+import threading
+from collections import OrderedDict
 
 import sys
 from pathlib import Path
@@ -34,18 +36,30 @@ if str(PROJECT_ROOT) not in sys.path:
 
 from database.connection import SessionLocal
 from database.models import Order
+from database.order_changes import get_data_version as current_data_version
+from cache_utils import (
+    encode_dataframe, decode_dataframe, DATAFRAME_CODEC_VERSION,
+    freeze_dataframe, shared_view,
+)
+from app.services.order_loader_service import order_loader_service, API_COLUMNS, OrderQuery
+from app.services.order_snapshot_service import order_snapshot_service
+from app.services.order_facts_service import order_facts_service
+from app.services.dispatch_service import offload
 
 # 尝试导入Redis缓存
 try:
     import redis
     REDIS_AVAILABLE = True
     redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+    # 二进制客户端（DataFrame缓存使用Arrow IPC编码，不能按utf-8解码）
+    redis_binary_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=False)
     # 测试连接
     redis_client.ping()
     print("✅ Redis缓存已连接")
 except Exception as e:
     REDIS_AVAILABLE = False
     redis_client = None
+    redis_binary_client = None
     print(f"⚠️ Redis缓存不可用: {e}")
 
 router = APIRouter()
@@ -57,6 +71,15 @@ ORDER_DATA_CACHE_KEY = "order_data_cache"
 ORDER_DATA_TIMESTAMP_KEY = "order_data_timestamp"
 DATA_VERSION_KEY = "order_data_version"  # 数据版本号（用于智能失效）
 
+
+def _cache_version(data_version: str) -> str:
+    """
+    写入DATA_VERSION_KEY的版本值 = 数据版本 + 缓存编码版本
+    
+    编码格式升级（如JSON → Arrow IPC）时，旧格式的缓存版本号不再匹配，自动失效
+    """
+    return f"{data_version}@{DATAFRAME_CODEC_VERSION}"
+
 # 内存缓存（备用）
 _memory_cache = {
     "order_data": None,
@@ -64,41 +87,25 @@ _memory_cache = {
     "store_cache": {},  # 按门店缓存: {store_name: {data: df, timestamp: time}}
     "data_version": None  # 数据版本号
 }
+# 端点在线程池中并发执行（dispatch_service），读写 _memory_cache 需持锁
+_memory_cache_lock = threading.Lock()
+
+# 谓词结果缓存（本进程，按数据版本失效）: {OrderQuery: {"version", "data"}}
+# 更宽范围的结果可直接回答更窄的查询，无需重新加载
+RANGE_CACHE_MAX_ENTRIES = 16
+_range_cache: "OrderedDict[OrderQuery, Dict[str, Any]]" = OrderedDict()
+_range_cache_lock = threading.Lock()
 
 
 def get_data_version(store_name: str = None) -> str:
     """
     获取数据版本号 (Global Data Versioning)
     
-    优先使用Redis全局版本号 (Generation Clock)
-    当发生任何写入(上传/删除)时，版本号自增，导致所有旧缓存失效
+    优先使用Redis全局版本号 (Generation Clock)：
+    orders 表的所有写入入口提交后都会调用 notify_orders_changed 自增版本号，
+    旧版本的缓存/快照/事实表随之失效。Redis不可用时退回数据库 MAX(updated_at)。
     """
-    # 1. 尝试获取全局版本号 (健壮模式)
-    if REDIS_AVAILABLE:
-        try:
-            from redis_cache_manager import REDIS_CACHE_MANAGER
-            if REDIS_CACHE_MANAGER and REDIS_CACHE_MANAGER.enabled:
-                return REDIS_CACHE_MANAGER.get_global_version()
-        except Exception as e:
-            print(f"⚠️ 获取全局版本失败: {e}")
-
-    # 2. 降级模式：数据库时间戳 (仅当Redis不可用时)
-    session = SessionLocal()
-    try:
-        from sqlalchemy import func
-        query = session.query(func.max(Order.updated_at))
-        if store_name:
-            query = query.filter(Order.store_name == store_name)
-        
-        last_updated = query.scalar()
-        if last_updated:
-            return last_updated.strftime("%Y%m%d%H%M%S")
-        return "0"
-    except Exception as e:
-        print(f"⚠️ 获取数据版本失败: {e}")
-        return "0"
-    finally:
-        session.close()
+    return current_data_version(store_name)
 
 
 def check_cache_valid(store_name: str = None) -> bool:
@@ -116,7 +123,7 @@ def check_cache_valid(store_name: str = None) -> bool:
         cached_version = redis_client.get(version_key)
         current_version = get_data_version(store_name)
         
-        if cached_version and cached_version == current_version:
+        if cached_version and cached_version == _cache_version(current_version):
             return True
         return False
     except Exception as e:
@@ -138,19 +145,38 @@ PLATFORM_FEE_CHANNELS = [
 ]
 
 
-def get_order_data(store_name: str = None) -> pd.DataFrame:
+def get_order_data(
+    store_name: str = None,
+    start_date=None,
+    end_date=None,
+    channels=None,
+    categories=None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
     """
     从数据库加载订单数据（带智能缓存）
     
     缓存策略（优化版）:
-    1. 优先检查Redis缓存 + 数据版本号
-    2. 版本号匹配则直接使用缓存（即使后端重启）
-    3. 版本号不匹配则重新加载（数据有更新）
+    1. 优先挂载当前数据版本的共享快照（多worker共用一份内存映射数据）
+    2. 其次检查Redis缓存 + 数据版本号（即使后端重启）
+    3. 版本号不匹配则重新加载（数据有更新），并发布新版本快照
     4. 缓存有效期24小时（数据每天更新一次）
     
+    指定日期/渠道/分类/列时走谓词下推（见 _get_filtered_order_data），
+    返回结果是筛选条件的超集之外的数据不会被加载；调用方原有的 pandas 筛选仍然有效。
+    
     Args:
         store_name: 门店名称，如果指定则只加载该门店数据
+        start_date: 开始日期（含）
+        end_date: 结束日期（含当天）
+        channels: 渠道（字符串或列表，'all' 表示全部）
+        categories: 一级分类列表
+        columns: 需要的列（默认全部 API_COLUMNS）
     """
+    query = OrderQuery.build(store_name, start_date, end_date, channels, categories, columns)
+    if query.has_predicate:
+        return _get_filtered_order_data(query)
+    
     global _memory_cache
     current_time = time.time()
     
@@ -163,127 +189,275 @@ def get_order_data(store_name: str = None) -> pd.DataFrame:
     # 获取当前数据版本
     current_version = get_data_version(store_name)
     
+    # 0. 共享快照（版本变化时自动挂载新版本，旧句柄原子替换）
+    snapshot_df = order_snapshot_service.get(cache_key, current_version)
+    if snapshot_df is not None:
+        print(f"📦 使用共享快照数据 (门店: {store_name or '全部'}, {len(snapshot_df)} 条)")
+        return shared_view(snapshot_df)
+    
     # 1. 尝试从Redis获取缓存（智能版本检查）
     if REDIS_AVAILABLE and redis_client:
         try:
             cached_version = redis_client.get(version_key)
             cached_timestamp = redis_client.get(redis_timestamp_key)
             
-            # 版本号匹配 + 未过期 = 缓存有效
-            if cached_version and cached_version == current_version:
+            # 版本号匹配（含编码版本） + 未过期 = 缓存有效
+            if cached_version and cached_version == _cache_version(current_version):
                 if cached_timestamp and (current_time - float(cached_timestamp) < CACHE_TTL):
-                    cached_data = redis_client.get(redis_cache_key)
+                    cached_data = redis_binary_client.get(redis_cache_key)
                     if cached_data:
-                        data = json.loads(cached_data)
-                        print(f"📦 使用Redis缓存数据 (门店: {store_name or '全部'}, {len(data)} 条)")
-                        return pd.DataFrame(data)
+                        df = decode_dataframe(cached_data)
+                        print(f"📦 使用Redis缓存数据 (门店: {store_name or '全部'}, {len(df)} 条)")
+                        # 发布为共享快照，其余worker直接挂载，不再各自解码
+                        order_snapshot_service.publish(cache_key, current_version, df)
+                        return df
         except Exception as e:
             print(f"⚠️ Redis读取失败: {e}")
     
     # 2. 尝试使用内存缓存（同样检查版本）
-    cached_version = _memory_cache.get("data_version")
-    if cached_version == current_version:
-        if store_name:
-            store_cache = _memory_cache.get("store_cache", {}).get(store_name)
-            if store_cache and current_time - store_cache.get("timestamp", 0) < CACHE_TTL:
-                print(f"📦 使用内存缓存数据 (门店: {store_name})")
-                return store_cache["data"].copy()
-        else:
-            if _memory_cache["order_data"] is not None:
-                if current_time - _memory_cache["timestamp"] < CACHE_TTL:
-                    print(f"📦 使用内存缓存数据 (全部门店)")
-                    return _memory_cache["order_data"].copy()
-    
-    # 3. 从数据库加载
-    print(f"🔄 从数据库加载订单数据 (门店: {store_name or '全部'})...")
-    session = SessionLocal()
-    try:
-        query = session.query(Order)
-        
-        # 如果指定门店，只加载该门店数据
-        if store_name:
-            query = query.filter(Order.store_name == store_name)
-        
-        orders = query.all()
-        if not orders:
-            return pd.DataFrame()
-        
-        # 转换为DataFrame（字段名与数据库模型一致）
-        data = []
-        for order in orders:
-            data.append({
-                '订单ID': order.order_id,
-                '门店名称': order.store_name,
-                '日期': order.date,  # 数据库字段是date
-                '渠道': order.channel,
-                '商品名称': order.product_name,
-                '一级分类名': order.category_level1,
-                '三级分类名': order.category_level3,  # 数据库只有三级分类
-                '月售': order.quantity if order.quantity is not None else 1,  # 默认为1
-                '实收价格': float(order.actual_price or 0),
-                '商品实售价': float(order.price or 0),  # 数据库字段是price
-                '商品原价': float(order.original_price or 0),  # ✅ 新增：商品原价（用于GMV计算）
-                '商品采购成本': float(order.cost or 0),  # 数据库字段是cost
-                '利润额': float(order.profit or 0),
-                '物流配送费': float(order.delivery_fee or 0),
-                '平台服务费': float(order.platform_service_fee or 0),
-                '平台佣金': float(order.commission or 0),
-                '预计订单收入': float(order.amount or 0),  # 使用amount作为预计订单收入
-                '企客后返': float(order.corporate_rebate or 0),  # 数据库字段是corporate_rebate
-                '用户支付配送费': float(order.user_paid_delivery_fee or 0),
-                '配送费减免金额': float(order.delivery_discount or 0),
-                '满减金额': float(order.full_reduction or 0),
-                '商品减免金额': float(order.product_discount or 0),
-                '新客减免金额': float(order.new_customer_discount or 0),
-                # ✅ 新增：商家活动成本相关字段（与Dash版本一致）
-                '商家代金券': float(order.merchant_voucher or 0),
-                '商家承担部分券': float(order.merchant_share or 0),
-                '满赠金额': float(order.gift_amount or 0),
-                '商家其他优惠': float(order.other_merchant_discount or 0),
-                '打包袋金额': float(order.packaging_fee or 0),  # ✅ 新增：打包袋金额（用于GMV计算）
-                '库存': order.stock,
-            })
-        
-        df = pd.DataFrame(data)
-        print(f"✅ 数据库加载完成: {len(df)} 条记录 (门店: {store_name or '全部'})")
-        
-        # 4. 更新缓存（包含版本号）
-        # 更新内存缓存
+    cached_df = _get_memory_cached(store_name, current_version)
+    if cached_df is not None:
+        print(f"📦 使用内存缓存数据 (门店: {store_name or '全部'})")
+        return shared_view(cached_df)
+    
+    # 3. 加载（Parquet 与数据库一致时经 DuckDB 列式读取，否则从数据库流式加载）
+    print(f"🔄 加载订单数据 (门店: {store_name or '全部'})...")
+    df = order_loader_service.load_query(OrderQuery.build(store_name), API_COLUMNS, data_version=current_version)
+    if df.empty:
+        return pd.DataFrame()
+    
+    # 4. 更新缓存（包含版本号）
+    # 发布共享快照；内存缓存保存快照引用（快照发布失败时为本进程只读数据）
+    # 调用方拿到的都是 shared_view，缓存本身不会被修改，无需防御性复制
+    cached_df = freeze_dataframe(order_snapshot_service.publish(cache_key, current_version, df))
+    with _memory_cache_lock:
         _memory_cache["data_version"] = current_version
         if store_name:
-            if "store_cache" not in _memory_cache:
-                _memory_cache["store_cache"] = {}
-            _memory_cache["store_cache"][store_name] = {
-                "data": df.copy(),
+            _memory_cache.setdefault("store_cache", {})[store_name] = {
+                "data": cached_df,
                 "timestamp": current_time
             }
         else:
-            _memory_cache["order_data"] = df.copy()
+            _memory_cache["order_data"] = cached_df
             _memory_cache["timestamp"] = current_time
-        
-        # 更新Redis缓存（包含版本号）
-        if REDIS_AVAILABLE and redis_client:
+    
+    # 更新Redis缓存（包含版本号）
+    if REDIS_AVAILABLE and redis_client:
+        try:
+            # Arrow IPC二进制编码（保留dtype，门店/渠道/分类字典编码）
+            redis_binary_client.set(redis_cache_key, encode_dataframe(df))
+            redis_client.set(redis_timestamp_key, str(current_time))
+            redis_client.set(version_key, _cache_version(current_version))  # ✅ 保存版本号（含编码版本）
+            # 设置过期时间（24小时）
+            redis_client.expire(redis_cache_key, CACHE_TTL)
+            redis_client.expire(redis_timestamp_key, CACHE_TTL)
+            redis_client.expire(version_key, CACHE_TTL)
+            print(f"✅ 数据已缓存到Redis (门店: {store_name or '全部'}, 版本: {current_version})")
+        except Exception as e:
+            print(f"⚠️ Redis缓存写入失败: {e}")
+    
+    return shared_view(cached_df)
+
+
+def _get_cached_scope_frame(store_name: Optional[str], current_version: str) -> Optional[pd.DataFrame]:
+    """已缓存的门店/全量数据（共享快照或内存缓存），不触发加载"""
+    cache_key = f"order_data:{store_name}" if store_name else "order_data:all"
+    snapshot_df = order_snapshot_service.get(cache_key, current_version)
+    if snapshot_df is not None:
+        return snapshot_df
+    return _get_memory_cached(store_name, current_version)
+
+
+def _get_memory_cached(store_name: Optional[str], current_version: str) -> Optional[pd.DataFrame]:
+    """内存缓存中当前版本、未过期的门店/全量数据"""
+    current_time = time.time()
+    with _memory_cache_lock:
+        if _memory_cache.get("data_version") != current_version:
+            return None
+        if store_name:
+            store_cache = _memory_cache.get("store_cache", {}).get(store_name)
+            if store_cache and current_time - store_cache.get("timestamp", 0) < CACHE_TTL:
+                return store_cache["data"]
+        elif _memory_cache["order_data"] is not None:
+            if current_time - _memory_cache["timestamp"] < CACHE_TTL:
+                return _memory_cache["order_data"]
+    return None
+
+
+def _get_filtered_order_data(query: OrderQuery) -> pd.DataFrame:
+    """
+    按谓词获取订单数据
+    
+    1. 门店/全量数据已缓存 → 直接在缓存上筛选
+    2. 已缓存的谓词结果覆盖本次查询（日期范围更宽、渠道/分类/列是超集）→ 在其上筛选
+    3. 否则谓词下推加载（Parquet 与数据库一致时走 DuckDB，否则 SQL），结果按数据版本缓存
+    """
+    current_version = get_data_version(query.store_name)
+    
+    scope_df = _get_cached_scope_frame(query.store_name, current_version)
+    if scope_df is not None:
+        return query.apply(shared_view(scope_df))
+    
+    with _range_cache_lock:
+        for cached_query in reversed(_range_cache):
+            entry = _range_cache[cached_query]
+            if entry["version"] == current_version and cached_query.covers(query):
+                _range_cache.move_to_end(cached_query)
+                print(f"📦 使用范围缓存数据 (门店: {query.store_name or '全部'}, {query.start_date}~{query.end_date})")
+                return query.apply(shared_view(entry["data"]))
+    
+    print(f"🔄 加载订单数据 (门店: {query.store_name or '全部'}, "
+          f"{query.start_date}~{query.end_date}, 渠道: {query.channels or '全部'})...")
+    df = freeze_dataframe(order_loader_service.load_query(query, data_version=current_version))
+    
+    with _range_cache_lock:
+        # 新结果覆盖的旧条目不再需要
+        for cached_query in [q for q, e in _range_cache.items()
+                             if e["version"] != current_version or query.covers(q)]:
+            del _range_cache[cached_query]
+        _range_cache[query] = {"version": current_version, "data": df}
+        while len(_range_cache) > RANGE_CACHE_MAX_ENTRIES:
+            _range_cache.popitem(last=False)
+    
+    return shared_view(df)
+
+
+def get_order_date_bounds(store_name: str = None) -> tuple:
+    """
+    订单日期范围 (最早, 最晚)
+    
+    优先用已缓存数据计算，否则走 MIN/MAX 索引查询；
+    供“最近N天/最后一天”类端点先确定日期窗口，再按窗口下推加载
+    """
+    current_version = get_data_version(store_name)
+    scope_df = _get_cached_scope_frame(store_name, current_version)
+    if scope_df is not None:
+        if scope_df.empty or '日期' not in scope_df.columns:
+            return None, None
+        dates = pd.to_datetime(scope_df['日期'], errors='coerce')
+        return dates.min(), dates.max()
+    
+    try:
+        min_date, max_date = order_loader_service.get_date_bounds(*OrderQuery.build(store_name).criteria())
+    except Exception as e:
+        print(f"⚠️ 查询订单日期范围失败: {e}")
+        return None, None
+    return (pd.Timestamp(min_date) if min_date else None,
+            pd.Timestamp(max_date) if max_date else None)
+
+
+# ==================== 订单级事实表 ====================
+# 导入时按门店物化 calculate_order_metrics 的结果（见 order_facts_service），
+# 概览/渠道/趋势/环比端点直接读取，不再逐请求 groupby 明细数据
+
+_facts_rebuild_lock = threading.Lock()
+_facts_rebuilding: set = set()  # 正在重建的门店（'*' 表示全量重建）
+
+
+def get_order_facts(
+    store_name: str = None,
+    start_date=None,
+    end_date=None,
+    channels=None,
+    detail_df: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """
+    订单级事实（与 calculate_order_metrics(按相同条件筛选的明细) 结果一致）
+
+    优先读取当前数据版本的事实表；缺失或过期时实时计算，并在后台补建。
+    事实表按门店计算，回退的实时计算同样按门店（calculate_order_metrics_by_store）：
+    全部门店视图中，不同门店的相同订单ID各自为一个订单，结果与事实表是否已建好无关。
+
+    Args:
+        store_name: 门店名称，None 表示全部门店
+        start_date: 开始日期（含）
+        end_date: 结束日期（含当天）
+        channels: 渠道（字符串或列表，'all' 表示全部）
+        detail_df: 调用方已按相同条件筛选好的明细（回退时直接在其上计算，避免重复加载）
+    """
+    query = OrderQuery.build(store_name, start_date, end_date, channels)
+    facts = order_facts_service.get(query.store_name, get_data_version())
+    if facts is not None:
+        return query.apply(shared_view(facts))
+
+    rebuild_order_facts([query.store_name] if query.store_name else None)
+    if detail_df is None:
+        detail_df = get_order_data(store_name, start_date=start_date, end_date=end_date, channels=channels)
+    return calculate_order_metrics_by_store(detail_df)
+
+
+def calculate_order_metrics_by_store(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    按门店分别 calculate_order_metrics 后合并（订单事实表的计算口径）
+
+    订单按 (门店名称, 订单ID) 聚合：不同门店出现相同订单ID时各自为一个订单
+    """
+    if df.empty or '门店名称' not in df.columns or df['门店名称'].nunique() <= 1:
+        return calculate_order_metrics(df)
+    parts = [
+        calculate_order_metrics(store_df)
+        for _, store_df in df.groupby('门店名称', sort=False, observed=True)
+    ]
+    parts = [p for p in parts if not p.empty]
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+
+def rebuild_order_facts(
+    store_names: Optional[List[str]] = None,
+    async_mode: bool = True,
+):
+    """
+    重建订单级事实表
+
+    写入/删除后受影响门店的事实表已由 notify_orders_changed 删除，其余门店沿用到新版本；
+    这里补建指定门店（或全部缺失/过期的门店），全部门店均为当前版本后标记为完整。
+
+    Args:
+        store_names: 需要重建的门店，None 表示全部门店中缺失或过期的门店
+        async_mode: 是否在后台线程执行
+    """
+    def run():
+        keys = list(store_names) if store_names is not None else ['*']
+        with _facts_rebuild_lock:
+            keys = [k for k in keys if k not in _facts_rebuilding]
+            _facts_rebuilding.update(keys)
+        if not keys:
+            return
+
+        try:
+            version = get_data_version()
+            session = SessionLocal()
             try:
-                # 将日期转换为字符串以便JSON序列化
-                cache_data = data.copy()
-                for item in cache_data:
-                    if item.get('日期'):
-                        item['日期'] = str(item['日期'])
-                
-                redis_client.set(redis_cache_key, json.dumps(cache_data, ensure_ascii=False))
-                redis_client.set(redis_timestamp_key, str(current_time))
-                redis_client.set(version_key, current_version)  # ✅ 保存版本号
-                # 设置过期时间（24小时）
-                redis_client.expire(redis_cache_key, CACHE_TTL)
-                redis_client.expire(redis_timestamp_key, CACHE_TTL)
-                redis_client.expire(version_key, CACHE_TTL)
-                print(f"✅ 数据已缓存到Redis (门店: {store_name or '全部'}, 版本: {current_version})")
-            except Exception as e:
-                print(f"⚠️ Redis缓存写入失败: {e}")
-        
-        return df
-    finally:
-        session.close()
+                all_stores = [row[0] for row in session.query(Order.store_name).distinct() if row[0]]
+            finally:
+                session.close()
+            stores = keys if store_names is not None else order_facts_service.missing_stores(all_stores, version)
+
+            start = time.time()
+            for store in stores:
+                df = order_loader_service.load(API_COLUMNS, Order.store_name == store)
+                facts = calculate_order_metrics(df)
+                del df
+                # 构建期间数据又有写入：放弃发布，由下一次重建处理
+                if get_data_version() != version:
+                    print(f"⚠️ 订单事实表构建期间数据已更新，放弃发布 (门店: {store})")
+                    return
+                order_facts_service.publish(store, version, facts)
+
+            if not order_facts_service.missing_stores(all_stores, version):
+                order_facts_service.mark_complete()
+            print(f"✅ 订单事实表重建完成 ({len(stores)} 个门店, 版本: {version}, "
+                  f"{(time.time() - start) * 1000:.0f}ms)")
+        except Exception as e:
+            print(f"⚠️ 订单事实表重建失败: {e}")
+        finally:
+            with _facts_rebuild_lock:
+                _facts_rebuilding.difference_update(keys)
+
+    if async_mode:
+        threading.Thread(target=run, name="order-facts-rebuild", daemon=True).start()
+    else:
+        run()
 
 
 def invalidate_cache(store_name: str = None):
@@ -297,12 +471,22 @@ def invalidate_cache(store_name: str = None):
     
     if store_name:
         # 只清除指定门店的缓存
-        if "store_cache" in _memory_cache and store_name in _memory_cache["store_cache"]:
-            del _memory_cache["store_cache"][store_name]
+        with _memory_cache_lock:
+            removed = _memory_cache.get("store_cache", {}).pop(store_name, None) is not None
+        if removed:
             print(f"✅ 内存缓存已清除 (门店: {store_name})")
+        order_snapshot_service.evict(f"order_data:{store_name}", remove_files=True)
+        with _range_cache_lock:
+            for cached_query in [q for q in _range_cache if q.store_name in (store_name, None)]:
+                del _range_cache[cached_query]
     else:
         # 清除全部缓存
-        _memory_cache = {"order_data": None, "timestamp": 0, "store_cache": {}, "data_version": None}
+        with _memory_cache_lock:
+            _memory_cache = {"order_data": None, "timestamp": 0, "store_cache": {}, "data_version": None}
+        order_snapshot_service.evict(remove_files=True)
+        order_facts_service.evict()
+        with _range_cache_lock:
+            _range_cache.clear()
         print("✅ 内存缓存已全部清除")
     
     if REDIS_AVAILABLE and redis_client:
@@ -363,7 +547,7 @@ def calculate_order_metrics(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty or '订单ID' not in df.columns:
         return pd.DataFrame()
     
-    df = df.copy()
+    df = shared_view(df)
     
     # 统一订单ID类型为字符串
     df['订单ID'] = df['订单ID'].astype(str)
@@ -516,7 +700,7 @@ def calculate_gmv(df: pd.DataFrame) -> Dict[str, float]:
             "marketing_cost_rate": 0
         }
     
-    df = df.copy()
+    df = shared_view(df)
     
     # 确保必要字段存在
     sales_field = '月售' if '月售' in df.columns else '销量'
@@ -593,6 +777,7 @@ def calculate_gmv(df: pd.DataFrame) -> Dict[str, float]:
 
 
 @router.get("/overview")
+@offload()
 async def get_order_overview(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     start_date: Optional[date] = Query(None, description="开始日期"),
@@ -699,8 +884,8 @@ async def get_order_overview(
             }
         }
     
-    # 计算订单级指标
-    order_agg = calculate_order_metrics(df)
+    # 订单级指标（读取事实表，缺失时在已筛选明细上实时计算）
+    order_agg = get_order_facts(store_name, start_date, end_date, detail_df=df)
     
     # 六大核心卡片
     total_orders = len(order_agg)
@@ -739,6 +924,7 @@ async def get_order_overview(
 
 
 @router.get("/all-stores-overview")
+@offload()
 async def get_all_stores_overview(
     start_date: Optional[date] = Query(None, description="开始日期"),
     end_date: Optional[date] = Query(None, description="结束日期"),
@@ -776,7 +962,7 @@ async def get_all_stores_overview(
         df['日期'] = pd.to_datetime(df['日期'], errors='coerce')
     
     # 1. 计算当前周期数据
-    current_df = df.copy()
+    current_df = shared_view(df)
     
     # DEBUG: Print data types
     print(f"DEBUG: start_date={start_date} type={type(start_date)}, end_date={end_date} type={type(end_date)}, channels={channels}")
@@ -814,7 +1000,7 @@ async def get_all_stores_overview(
             curr_mask = (current_df['日期'].dt.date >= effective_start) & (current_df['日期'].dt.date <= effective_end)
             curr_trend_df = current_df[curr_mask]
             if not curr_trend_df.empty and '实收价格' in curr_trend_df.columns:
-                current_sales_map = curr_trend_df.groupby('门店名称')['实收价格'].sum().to_dict()
+                current_sales_map = curr_trend_df.groupby('门店名称', observed=True)['实收价格'].sum().to_dict()
     
     if effective_start and effective_end:
         duration = effective_end - effective_start
@@ -973,6 +1159,7 @@ async def get_all_stores_overview(
 
 
 @router.get("/channels")
+@offload()
 async def get_channel_stats(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     start_date: Optional[date] = Query(None, description="开始日期"),
@@ -984,24 +1171,8 @@ async def get_channel_stats(
     与老版本Tab1渠道卡片完全一致
     注意：排除咖啡渠道（美团咖啡店、饿了么咖啡店）
     """
-    # 按门店加载数据
-    df = get_order_data(store_name)
-    if df.empty:
-        return {"success": True, "data": []}
-    
-    # 日期筛选
-    if '日期' in df.columns:
-        df['日期'] = pd.to_datetime(df['日期'], errors='coerce')
-    if start_date:
-        df = df[df['日期'].dt.date >= start_date]
-    if end_date:
-        df = df[df['日期'].dt.date <= end_date]
-    
-    if df.empty or '渠道' not in df.columns:
-        return {"success": True, "data": []}
-    
-    # 计算订单级指标
-    order_agg = calculate_order_metrics(df)
+    # 订单级指标（读取事实表，日期窗口筛选；缺失时按窗口下推加载后实时计算）
+    order_agg = get_order_facts(store_name, start_date, end_date)
     
     if order_agg.empty or '渠道' not in order_agg.columns:
         return {"success": True, "data": []}
@@ -1014,7 +1185,7 @@ async def get_channel_stats(
         return {"success": True, "data": []}
     
     # 按渠道聚合
-    channel_stats = order_agg.groupby('渠道').agg({
+    channel_stats = order_agg.groupby('渠道', observed=True).agg({
         '订单ID': 'count',
         '实收价格': 'sum',
         '订单实际利润': 'sum',
@@ -1056,6 +1227,7 @@ async def get_channel_stats(
 
 
 @router.get("/trend")
+@offload()
 async def get_order_trend(
     days: int = Query(30, ge=1, le=365, description="统计天数"),
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
@@ -1146,47 +1318,28 @@ async def get_order_trend(
             print(f"⚠️ 预聚合表查询失败，回退到原始查询: {e}")
     
     # 回退到原始查询
-    # 按门店加载数据（利用缓存）
-    df = get_order_data(store_name)
-    
-    if df.empty:
-        return empty_result
-    
-    if '日期' not in df.columns:
-        return {"success": False, "error": "缺少日期字段"}
-    
-    df['日期'] = pd.to_datetime(df['日期'], errors='coerce')
-    df = df.dropna(subset=['日期'])
-    
-    if df.empty:
-        return empty_result
-    
-    # 🆕 日期筛选：优先使用日期范围，否则使用最近N天
-    if start_date and end_date:
-        try:
-            range_start = pd.to_datetime(start_date)
-            range_end = pd.to_datetime(end_date)
-            df = df[(df['日期'].dt.date >= range_start.date()) & (df['日期'].dt.date <= range_end.date())]
-        except:
-            # 日期解析失败，回退到默认行为
-            max_date = df['日期'].max()
-            min_date = max_date - timedelta(days=days)
-            df = df[df['日期'] >= min_date]
+    # 读取订单级事实表（日期窗口/渠道筛选），缺失时按窗口下推加载后实时计算
+    window = OrderQuery.build(start_date=start_date, end_date=end_date)
+    if window.start_date and window.end_date:
+        # 渠道与订单一一对应，先按行筛选与聚合后再筛选结果一致
+        order_agg = get_order_facts(store_name, window.start_date, window.end_date, channels=channel)
     else:
-        # 筛选最近N天
-        max_date = df['日期'].max()
-        if pd.isna(max_date):
+        # 筛选最近N天（以数据最后一天为基准）
+        _, max_date = get_order_date_bounds(store_name)
+        if max_date is None or pd.isna(max_date):
             return empty_result
-        
         min_date = max_date - timedelta(days=days)
-        df = df[df['日期'] >= min_date]
+        order_agg = get_order_facts(store_name, start_date=min_date.date())
+        if not order_agg.empty and '日期' in order_agg.columns:
+            order_agg = order_agg[pd.to_datetime(order_agg['日期']) >= min_date]
     
-    if df.empty:
+    if order_agg.empty:
         return empty_result
     
-    # 先聚合到订单级（与Dash版本一致）
-    order_agg = calculate_order_metrics(df)
+    if '日期' not in order_agg.columns:
+        return {"success": False, "error": "缺少日期字段"}
     
+    order_agg = order_agg.dropna(subset=['日期'])
     if order_agg.empty:
         return empty_result
     
@@ -1201,38 +1354,22 @@ async def get_order_trend(
             return empty_result
     
     # 根据粒度分组
-    if '日期' in order_agg.columns:
-        order_agg['日期'] = pd.to_datetime(order_agg['日期'])
-        if granularity == 'week':
-            order_agg['period'] = order_agg['日期'].dt.to_period('W').apply(lambda x: x.start_time)
-        elif granularity == 'month':
-            order_agg['period'] = order_agg['日期'].dt.to_period('M').apply(lambda x: x.start_time)
-        else:
-            order_agg['period'] = order_agg['日期'].dt.date
-        
-        # 按周期聚合（与Dash版本一致）
-        daily = order_agg.groupby('period').agg({
-            '订单ID': 'count',
-            '实收价格': 'sum',
-            '订单实际利润': 'sum',
-        }).reset_index()
-        
-        daily.columns = ['date', 'order_count', 'amount', 'profit']
+    order_agg['日期'] = pd.to_datetime(order_agg['日期'])
+    if granularity == 'week':
+        order_agg['period'] = order_agg['日期'].dt.to_period('W').apply(lambda x: x.start_time)
+    elif granularity == 'month':
+        order_agg['period'] = order_agg['日期'].dt.to_period('M').apply(lambda x: x.start_time)
     else:
-        # 备用方案：按原始数据日期聚合
-        if granularity == 'week':
-            df['period'] = df['日期'].dt.to_period('W').apply(lambda x: x.start_time)
-        elif granularity == 'month':
-            df['period'] = df['日期'].dt.to_period('M').apply(lambda x: x.start_time)
-        else:
-            df['period'] = df['日期'].dt.date
-            
-        daily = df.groupby('period').agg({
-            '订单ID': 'nunique' if '订单ID' in df.columns else 'count',
-            '实收价格': 'sum' if '实收价格' in df.columns else lambda x: 0,
-            '利润额': 'sum' if '利润额' in df.columns else lambda x: 0,
-        }).reset_index()
-        daily.columns = ['date', 'order_count', 'amount', 'profit']
+        order_agg['period'] = order_agg['日期'].dt.date
+    
+    # 按周期聚合（与Dash版本一致）
+    daily = order_agg.groupby('period').agg({
+        '订单ID': 'count',
+        '实收价格': 'sum',
+        '订单实际利润': 'sum',
+    }).reset_index()
+    
+    daily.columns = ['date', 'order_count', 'amount', 'profit']
     
     daily = daily.sort_values('date')
     
@@ -1262,6 +1399,7 @@ async def get_order_trend(
 
 
 @router.get("/list")
+@offload()
 async def get_order_list(
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=100, description="每页数量"),
@@ -1275,8 +1413,8 @@ async def get_order_list(
     """
     获取订单列表（支持分页和筛选）
     """
-    # 按门店加载数据（利用缓存）
-    df = get_order_data(store_name)
+    # 按门店加载数据（日期/渠道下推到加载层）
+    df = get_order_data(store_name, start_date=start_date, end_date=end_date, channels=channel)
     if df.empty:
         return {"success": True, "data": [], "total": 0, "page": page, "page_size": page_size, "total_pages": 0}
     
@@ -1339,6 +1477,7 @@ async def get_order_list(
 
 
 @router.get("/stores")
+@offload()
 async def get_store_list() -> Dict[str, Any]:
     """获取门店列表（直接从数据库查询）"""
     try:
@@ -1360,8 +1499,8 @@ async def get_store_list() -> Dict[str, Any]:
             session.close()
     except Exception as e:
         print(f"⚠️ 门店列表查询失败: {e}")
-        # 备用方案：从缓存数据获取
-        df = get_order_data()
+        # 备用方案：从缓存数据获取（只加载门店名称列）
+        df = get_order_data(columns=['门店名称'])
         if df.empty or '门店名称' not in df.columns:
             return {"success": True, "data": []}
         
@@ -1370,6 +1509,7 @@ async def get_store_list() -> Dict[str, Any]:
 
 
 @router.get("/channel-list")
+@offload()
 async def get_channel_list(
     store_name: Optional[str] = Query(None, description="门店名称筛选")
 ) -> Dict[str, Any]:
@@ -1399,8 +1539,8 @@ async def get_channel_list(
             session.close()
     except Exception as e:
         print(f"⚠️ 渠道列表查询失败: {e}")
-        # 备用方案：从缓存数据获取
-        df = get_order_data(store_name)
+        # 备用方案：从缓存数据获取（只加载渠道列）
+        df = get_order_data(store_name, columns=['渠道'])
         if df.empty or '渠道' not in df.columns:
             return {"success": True, "data": []}
         
@@ -1421,6 +1561,7 @@ async def get_channel_list(
 
 
 @router.get("/comparison")
+@offload()
 async def get_order_comparison(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     start_date: Optional[date] = Query(None, description="开始日期"),
@@ -1485,10 +1626,12 @@ async def get_order_comparison(
     
     print(f"📊 环比计算: 当前周期 {start_date} ~ {end_date} ({len(current_df)}条)")
     print(f"            上一周期 {prev_start_date} ~ {prev_end_date} ({len(prev_df)}条)")
-    # 计算当前周期指标
-    current_metrics = calculate_period_metrics(current_df)
+    # 计算当前周期指标（订单级指标读取事实表）
+    current_metrics = calculate_period_metrics(
+        current_df, get_order_facts(store_name, start_date, end_date, detail_df=current_df))
     # 计算上一周期指标
-    prev_metrics = calculate_period_metrics(prev_df)
+    prev_metrics = calculate_period_metrics(
+        prev_df, get_order_facts(store_name, prev_start_date, prev_end_date, detail_df=prev_df))
     
     # 计算环比变化
     changes = {}
@@ -1523,8 +1666,14 @@ async def get_order_comparison(
     }
 
 
-def calculate_period_metrics(df: pd.DataFrame) -> Dict[str, Any]:
-    """计算单个周期的指标"""
+def calculate_period_metrics(df: pd.DataFrame, order_agg: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+    """
+    计算单个周期的指标
+    
+    Args:
+        df: 周期内明细（动销商品数）
+        order_agg: 周期内订单级事实（None 时由 df 实时计算）
+    """
     if df.empty:
         return {
             "order_count": 0,
@@ -1535,7 +1684,8 @@ def calculate_period_metrics(df: pd.DataFrame) -> Dict[str, Any]:
             "active_products": 0
         }
     
-    order_agg = calculate_order_metrics(df)
+    if order_agg is None:
+        order_agg = calculate_order_metrics(df)
     
     order_count = len(order_agg)
     total_sales = order_agg['实收价格'].sum() if '实收价格' in order_agg.columns else 0
@@ -1561,6 +1711,7 @@ def calculate_period_metrics(df: pd.DataFrame) -> Dict[str, Any]:
 
 
 @router.get("/channel-comparison")
+@offload()
 async def get_channel_comparison(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     start_date: Optional[date] = Query(None, description="开始日期"),
@@ -1641,17 +1792,22 @@ async def get_channel_comparison(
     # 获取当前周期的所有渠道
     channels = current_df['渠道'].dropna().unique().tolist()
     
+    # 订单级事实（按周期读取一次，渠道内再筛选）
+    current_facts = get_order_facts(store_name, start_date, end_date, detail_df=current_df)
+    prev_facts = (get_order_facts(store_name, prev_start_date, prev_end_date, detail_df=prev_df)
+                  if has_prev_data else None)
+    
     result = []
     for channel in channels:
         # 当前周期渠道数据
         curr_ch = current_df[current_df['渠道'] == channel]
-        curr_metrics = calculate_channel_metrics(curr_ch)
+        curr_metrics = calculate_channel_metrics(curr_ch, _filter_channel(current_facts, channel))
         
         # 如果有上一周期数据，计算环比
         if has_prev_data:
             # 上一周期渠道数据
             prev_ch = prev_df[prev_df['渠道'] == channel]
-            prev_metrics = calculate_channel_metrics(prev_ch)
+            prev_metrics = calculate_channel_metrics(prev_ch, _filter_channel(prev_facts, channel))
             
             # 计算环比
             changes = {}
@@ -1689,7 +1845,14 @@ async def get_channel_comparison(
     return {"success": True, "data": result}
 
 
-def calculate_channel_metrics(df: pd.DataFrame) -> Dict[str, Any]:
+def _filter_channel(order_agg: pd.DataFrame, channel: str) -> pd.DataFrame:
+    """订单级事实按渠道筛选"""
+    if order_agg.empty or '渠道' not in order_agg.columns:
+        return order_agg
+    return order_agg[order_agg['渠道'] == channel]
+
+
+def calculate_channel_metrics(df: pd.DataFrame, order_agg: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
     """
     计算单个渠道的完整指标（包含成本结构）
     
@@ -1697,6 +1860,10 @@ def calculate_channel_metrics(df: pd.DataFrame) -> Dict[str, Any]:
     - 基础指标: 订单数、销售额、利润、客单价、利润率
     - 成本结构: 商品成本、耗材成本、商品减免、活动补贴、配送成本、平台服务费
     - 单均经济: 单均利润、单均营销、单均配送
+    
+    Args:
+        df: 渠道明细（商品级成本结构）
+        order_agg: 渠道订单级事实（None 时由 df 实时计算）
     """
     if df.empty:
         return {
@@ -1725,7 +1892,8 @@ def calculate_channel_metrics(df: pd.DataFrame) -> Dict[str, Any]:
             "avg_delivery_per_order": 0,
         }
     
-    order_agg = calculate_order_metrics(df)
+    if order_agg is None:
+        order_agg = calculate_order_metrics(df)
     
     order_count = len(order_agg)
     amount = order_agg['实收价格'].sum() if '实收价格' in order_agg.columns else 0
@@ -1855,6 +2023,7 @@ from fastapi.responses import StreamingResponse
 import io
 
 @router.get("/export")
+@offload()
 async def export_orders(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     start_date: Optional[date] = Query(None, description="开始日期"),
@@ -1962,6 +2131,7 @@ async def export_orders(
 
 
 @router.get("/date-range")
+@offload()
 async def get_date_range(
     store_name: Optional[str] = Query(None, description="门店名称筛选")
 ) -> Dict[str, Any]:
@@ -1969,20 +2139,10 @@ async def get_date_range(
     获取门店数据的日期范围
     
     用于前端日历选择器限制可选日期范围
+    只需要日期列：有缓存时直接计算，否则走 MIN/MAX 查询，不加载订单明细
     """
-    # 按门店加载数据（利用缓存）
-    df = get_order_data(store_name)
-    if df.empty:
-        return {
-            "success": True,
-            "data": {
-                "min_date": None,
-                "max_date": None,
-                "total_days": 0
-            }
-        }
-    
-    if '日期' not in df.columns:
+    min_date, max_date = get_order_date_bounds(store_name)
+    if min_date is None or max_date is None or pd.isna(min_date) or pd.isna(max_date):
         return {
             "success": True,
             "data": {
@@ -1992,21 +2152,6 @@ async def get_date_range(
             }
         }
     
-    df['日期'] = pd.to_datetime(df['日期'], errors='coerce')
-    df = df.dropna(subset=['日期'])
-    
-    if df.empty:
-        return {
-            "success": True,
-            "data": {
-                "min_date": None,
-                "max_date": None,
-                "total_days": 0
-            }
-        }
-    
-    min_date = df['日期'].min()
-    max_date = df['日期'].max()
     total_days = (max_date - min_date).days + 1
     
     return {
@@ -19,11 +19,14 @@ import numpy as np
 
 # 从主模块导入公共函数
 from .orders import get_order_data, calculate_order_metrics
+from app.services.dispatch_service import offload
+from cache_utils import safe_fillna
 
 router = APIRouter()
 
 
 @router.get("/profit-distribution")
+@offload()
 async def get_profit_distribution(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     start_date: Optional[date] = Query(None, description="开始日期"),
@@ -83,6 +86,7 @@ async def get_profit_distribution(
 
 
 @router.get("/price-distribution")
+@offload()
 async def get_price_distribution(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     start_date: Optional[date] = Query(None, description="开始日期"),
@@ -196,6 +200,7 @@ def get_price_range_color(price: float) -> str:
 
 
 @router.get("/category-trend")
+@offload()
 async def get_category_trend(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     channel: Optional[str] = Query(None, description="渠道筛选"),
@@ -243,7 +248,7 @@ async def get_category_trend(
     if sales_field not in df.columns:
         return {"success": True, "data": {"categories": [], "weeks": [], "series": []}}
     
-    category_weekly = df.groupby(['一级分类名', '周'])[sales_field].sum().reset_index()
+    category_weekly = df.groupby(['一级分类名', '周'], observed=True)[sales_field].sum().reset_index()
     category_weekly.columns = ['category', 'week', 'sales']
     
     # 获取所有分类和周
@@ -278,6 +283,7 @@ async def get_category_trend(
 
 
 @router.get("/anomaly-detection")
+@offload()
 async def get_anomaly_detection(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     start_date: Optional[date] = Query(None, description="开始日期"),
@@ -392,6 +398,7 @@ async def get_anomaly_detection(
 
 
 @router.get("/category-hourly-trend")
+@offload()
 async def get_category_hourly_trend(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     date: Optional[str] = Query(None, description="指定日期(YYYY-MM-DD或MM-DD格式)"),
@@ -438,7 +445,7 @@ async def get_category_hourly_trend(
     df = df.dropna(subset=['日期'])
     
     # 🆕 处理空分类名：填充为"未分类"而不是过滤掉
-    df['一级分类名'] = df['一级分类名'].fillna('未分类')
+    df['一级分类名'] = safe_fillna(df['一级分类名'], '未分类')
     df.loc[df['一级分类名'].astype(str).isin(['', 'nan', 'None']), '一级分类名'] = '未分类'
     
     if df.empty:
@@ -489,11 +496,11 @@ async def get_category_hourly_trend(
                 return {"success": True, "data": {"labels": [], "categories": [], "series": [], "mode": "daily"}}
             
             # 按日期和分类聚合
-            daily_category = range_df.groupby([range_df['日期'].dt.strftime('%m-%d'), '一级分类名'])[sales_field].sum().reset_index()
+            daily_category = range_df.groupby([range_df['日期'].dt.strftime('%m-%d'), '一级分类名'], observed=True)[sales_field].sum().reset_index()
             daily_category.columns = ['date', 'category', 'revenue']
             
             # 按总销售额降序排序分类
-            category_totals = daily_category.groupby('category')['revenue'].sum().sort_values(ascending=False)
+            category_totals = daily_category.groupby('category', observed=True)['revenue'].sum().sort_values(ascending=False)
             categories = category_totals.index.tolist()
             
             # 生成完整的日期序列
@@ -547,11 +554,11 @@ async def get_category_hourly_trend(
             day_df['小时'] = day_df['日期'].dt.hour
         
         # 按小时和分类聚合
-        hourly_category = day_df.groupby(['小时', '一级分类名'])[sales_field].sum().reset_index()
+        hourly_category = day_df.groupby(['小时', '一级分类名'], observed=True)[sales_field].sum().reset_index()
         hourly_category.columns = ['hour', 'category', 'revenue']
         
         # 🆕 按总销售额降序排序分类（返回所有分类，前端做筛选）
-        category_totals = hourly_category.groupby('category')['revenue'].sum().sort_values(ascending=False)
+        category_totals = hourly_category.groupby('category', observed=True)['revenue'].sum().sort_values(ascending=False)
         categories = category_totals.index.tolist()  # 返回所有分类
         
         hours = list(range(0, 24, 2))  # 每2小时一个点
@@ -599,11 +606,11 @@ async def get_category_hourly_trend(
             return {"success": True, "data": {"labels": [], "categories": [], "series": [], "mode": "daily"}}
         
         # 按日期和分类聚合
-        daily_category = week_df.groupby([week_df['日期'].dt.strftime('%m-%d'), '一级分类名'])[sales_field].sum().reset_index()
+        daily_category = week_df.groupby([week_df['日期'].dt.strftime('%m-%d'), '一级分类名'], observed=True)[sales_field].sum().reset_index()
         daily_category.columns = ['date', 'category', 'revenue']
         
         # 🆕 按总销售额降序排序分类（返回所有分类，前端做筛选）
-        category_totals = daily_category.groupby('category')['revenue'].sum().sort_values(ascending=False)
+        category_totals = daily_category.groupby('category', observed=True)['revenue'].sum().sort_values(ascending=False)
         categories = category_totals.index.tolist()  # 返回所有分类
         
         # 🆕 生成完整的日期序列（确保每天都有数据点）
@@ -642,6 +649,7 @@ async def get_category_hourly_trend(
 
 
 @router.get("/top-products-by-date")
+@offload()
 async def get_top_products_by_date(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     date: Optional[str] = Query(None, description="指定日期(YYYY-MM-DD或MM-DD格式)"),
@@ -778,7 +786,7 @@ async def get_top_products_by_date(
     if not agg_dict:
         return {"success": True, "data": {"products": [], "sort_by": sort_by}}
     
-    product_agg = df.groupby(group_key).agg(**agg_dict).reset_index()
+    product_agg = df.groupby(group_key, observed=True).agg(**agg_dict).reset_index()
     
     # 如果按店内码聚合，重命名列
     if group_key == '店内码':
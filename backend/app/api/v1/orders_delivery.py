@@ -17,7 +17,9 @@ import numpy as np
 from database.connection import SessionLocal
 
 # 从主模块导入公共函数
-from .orders import get_order_data, calculate_order_metrics
+from .orders import get_order_data, get_order_date_bounds, calculate_order_metrics
+from app.services.order_loader_service import OrderQuery
+from app.services.dispatch_service import offload
 
 router = APIRouter()
 
@@ -95,6 +97,7 @@ def identify_peak_periods(hourly_orders: pd.Series) -> List[Dict[str, Any]]:
 
 
 @router.get("/hourly-profit")
+@offload()
 async def get_hourly_profit(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     target_date: Optional[str] = Query(None, description="目标日期(YYYY-MM-DD或MM-DD格式)，默认为数据最后一天"),
@@ -130,8 +133,27 @@ async def get_hourly_profit(
             }
         }
     """
-    # 加载数据
-    df = get_order_data(store_name)
+    # 加载数据（日期窗口/渠道下推到SQL，下方 pandas 筛选逻辑不变）
+    load_start = load_end = None
+    load_channel = channel
+    if target_date:
+        if len(target_date) == 5 and '-' in target_date:
+            # MM-DD 格式：年份取数据最后一天所在年
+            _, latest = get_order_date_bounds(store_name)
+            if latest is not None:
+                load_start = load_end = OrderQuery.build(start_date=f"{latest.year}-{target_date}").start_date
+        else:
+            load_start = load_end = OrderQuery.build(start_date=target_date).start_date
+    elif start_date or end_date:
+        window = OrderQuery.build(start_date=start_date, end_date=end_date)
+        load_start, load_end = window.start_date, window.end_date
+    else:
+        # 默认数据最后一天（按全部渠道确定，渠道在选定日期后再筛选）
+        _, latest = get_order_date_bounds(store_name)
+        if latest is not None:
+            load_start = load_end = latest.date()
+        load_channel = None
+    df = get_order_data(store_name, start_date=load_start, end_date=load_end, channels=load_channel)
     
     empty_result = {
         "success": True,
@@ -448,6 +470,7 @@ async def get_hourly_profit(
 
 
 @router.get("/cost-structure")
+@offload()
 async def get_cost_structure(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     start_date: Optional[date] = Query(None, description="开始日期"),
@@ -519,7 +542,7 @@ async def get_cost_structure(
     # 按渠道和订单ID计算商品成本
     cost_field = '商品采购成本' if '商品采购成本' in df_valid.columns else '成本'
     if cost_field in df_valid.columns:
-        product_cost_by_channel = df_valid.groupby('渠道')[cost_field].sum().to_dict()
+        product_cost_by_channel = df_valid.groupby('渠道', observed=True)[cost_field].sum().to_dict()
     else:
         product_cost_by_channel = {}
     
@@ -540,7 +563,7 @@ async def get_cost_structure(
     elif '平台佣金' in order_agg.columns:
         agg_dict['平台佣金'] = 'sum'
     
-    channel_stats = order_agg.groupby('渠道').agg(agg_dict).reset_index()
+    channel_stats = order_agg.groupby('渠道', observed=True).agg(agg_dict).reset_index()
     
     # 构建返回数据
     channels_data = []
@@ -686,6 +709,7 @@ def get_distance_band_index(distance: float) -> int:
 
 
 @router.get("/distance-analysis")
+@offload()
 async def get_distance_analysis(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     channel: Optional[str] = Query(None, description="渠道筛选"),
@@ -1105,6 +1129,7 @@ async def get_distance_analysis(
 
 
 @router.get("/delivery-radar")
+@offload()
 async def get_delivery_radar_data(
     store_name: Optional[str] = Query(None, description="门店名称"),
     channel: Optional[str] = Query(None, description="渠道筛选"),
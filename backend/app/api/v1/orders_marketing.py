@@ -14,6 +14,7 @@ import pandas as pd
 
 # 从主模块导入公共函数
 from .orders import get_order_data, calculate_order_metrics
+from app.services.dispatch_service import offload
 
 router = APIRouter()
 
@@ -21,6 +22,7 @@ router = APIRouter()
 # ==================== 营销成本结构分析API（营销成本桑基图专用） ====================
 
 @router.get("/marketing-structure")
+@offload()
 async def get_marketing_structure(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     start_date: Optional[date] = Query(None, description="开始日期"),
@@ -114,7 +116,7 @@ async def get_marketing_structure(
         if cn_field in order_agg.columns:
             agg_dict[cn_field] = 'sum'
     
-    channel_stats = order_agg.groupby('渠道').agg(agg_dict).reset_index()
+    channel_stats = order_agg.groupby('渠道', observed=True).agg(agg_dict).reset_index()
     
     # 构建返回数据
     channels_data = []
@@ -177,6 +179,7 @@ async def get_marketing_structure(
 # ==================== 营销成本趋势分析API（营销成本趋势图专用） ====================
 
 @router.get("/marketing-trend")
+@offload()
 async def get_marketing_trend(
     store_name: Optional[str] = Query(None, description="门店名称筛选"),
     channel: Optional[str] = Query(None, description="渠道筛选"),
@@ -25,6 +25,7 @@ from dependencies import (
     common_store_param,
 )
 from services import ProductService
+from cache_utils import shared_view
 from schemas.product import (
     ProductRankingResponse,
     ProductCategoryResponse,
@@ -264,7 +265,7 @@ async def get_product_list(
     if df.empty:
         raise HTTPException(status_code=404, detail="暂无订单数据")
     
-    data = df.copy()
+    data = shared_view(df)
     
     # 门店筛选
     if store_name and '门店名称' in data.columns:
@@ -296,7 +297,7 @@ async def get_product_list(
     if '实收价格' in data.columns:
         agg_dict['销售额'] = ('实收价格', 'sum')
     
-    products = data.groupby(group_key).agg(**agg_dict).reset_index()
+    products = data.groupby(group_key, observed=True).agg(**agg_dict).reset_index()
     
     # 分页
     total = len(products)
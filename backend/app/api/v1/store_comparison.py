@@ -38,7 +38,14 @@ if str(PROJECT_ROOT) not in sys.path:
 
 from database.connection import SessionLocal
 from database.models import Order
-from .orders import calculate_order_metrics, calculate_gmv
+from .orders import calculate_order_metrics_by_store, calculate_gmv, get_data_version, get_order_facts
+from cache_utils import (
+    encode_dataframe, decode_dataframe, DATAFRAME_CODEC_VERSION,
+    freeze_dataframe, shared_view,
+)
+from app.services.order_loader_service import order_loader_service, OrderQuery, STORE_COMPARISON_COLUMNS
+from app.services.order_snapshot_service import order_snapshot_service
+from app.services.dispatch_service import offload
 from sqlalchemy import and_, or_, func, text
 
 # 尝试导入Redis缓存
@@ -46,12 +53,15 @@ try:
     import redis
     REDIS_AVAILABLE = True
     redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+    # 二进制客户端（DataFrame缓存使用Arrow IPC编码，不能按utf-8解码）
+    redis_binary_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=False)
     # 测试连接
     redis_client.ping()
     print("✅ Redis缓存已连接")
 except Exception as e:
     REDIS_AVAILABLE = False
     redis_client = None
+    redis_binary_client = None
     print(f"⚠️ Redis缓存不可用: {e}")
 
 # 检查预聚合表是否可用
@@ -234,20 +244,30 @@ def get_all_stores_data(
     # 生成缓存key（包含日期范围和渠道）
     channel_key = channel if channel else "all"
     date_key = f"{start_date}:{end_date}:{channel_key}"
-    redis_cache_key = f"{STORE_COMPARISON_CACHE_KEY}:{date_key}"
+    # 缓存数据键带编码版本，格式升级后旧数据不会被误读
+    redis_cache_key = f"{STORE_COMPARISON_CACHE_KEY}:{DATAFRAME_CODEC_VERSION}:{date_key}"
     redis_timestamp_key = f"{STORE_COMPARISON_TIMESTAMP_KEY}:{date_key}"
     
+    # 0. 共享快照（按数据版本发布，多worker共用）
+    snapshot_scope = f"store_comparison:{date_key}"
+    current_version = get_data_version()
+    snapshot_df = order_snapshot_service.get(snapshot_scope, current_version)
+    if snapshot_df is not None:
+        print(f"📦 使用共享快照数据 (全量门店对比, 渠道={channel_key}, {len(snapshot_df)} 条)")
+        return shared_view(snapshot_df)
+    
     # 1. 尝试从Redis获取缓存
     if REDIS_AVAILABLE and redis_client:
         try:
             cached_timestamp = redis_client.get(redis_timestamp_key)
             if cached_timestamp:
                 if current_time - float(cached_timestamp) < CACHE_TTL:
-                    cached_data = redis_client.get(redis_cache_key)
+                    cached_data = redis_binary_client.get(redis_cache_key)
                     if cached_data:
-                        data = json.loads(cached_data)
-                        print(f"📦 使用Redis缓存数据 (全量门店对比, 渠道={channel_key}, {len(data)} 条)")
-                        return pd.DataFrame(data)
+                        df = decode_dataframe(cached_data)
+                        print(f"📦 使用Redis缓存数据 (全量门店对比, 渠道={channel_key}, {len(df)} 条)")
+                        order_snapshot_service.publish(snapshot_scope, current_version, df)
+                        return df
         except Exception as e:
             print(f"⚠️ Redis读取失败: {e}")
     
@@ -255,101 +275,64 @@ def get_all_stores_data(
     cache_entry = _store_comparison_cache.get(date_key)
     if cache_entry and current_time - cache_entry.get("timestamp", 0) < CACHE_TTL:
         print(f"📦 使用内存缓存数据 (全量门店对比, 渠道={channel_key})")
-        return cache_entry["data"].copy()
+        return shared_view(cache_entry["data"])
     
-    # 3. 从数据库加载（SQL层面直接筛选）
-    print(f"🔄 从数据库加载全量门店数据 (日期: {start_date}~{end_date}, 渠道: {channel_key})...")
-    session = SessionLocal()
-    try:
-        query = session.query(Order)
+    # 3. 加载（SQL层面直接筛选，列式流式加载；无渠道筛选且 Parquet 与数据库一致时经 DuckDB 读取）
+    print(f"🔄 加载全量门店数据 (日期: {start_date}~{end_date}, 渠道: {channel_key})...")
+    if channel and channel in CHANNEL_PREFIX_MAP:
+        criteria = []
         
         # 日期筛选
         if start_date:
-            query = query.filter(Order.date >= datetime.combine(start_date, datetime.min.time()))
+            criteria.append(Order.date >= datetime.combine(start_date, datetime.min.time()))
         if end_date:
-            query = query.filter(Order.date <= datetime.combine(end_date, datetime.max.time()))
-        
-        # ✅ SQL层面渠道筛选（避免N+1查询）
-        if channel and channel in CHANNEL_PREFIX_MAP:
-            prefix = CHANNEL_PREFIX_MAP[channel]
-            query = query.filter(Order.order_number.like(f'{prefix}%'))
-            print(f"   SQL渠道筛选: order_number LIKE '{prefix}%'")
-        
-        orders = query.all()
-        if not orders:
-            return pd.DataFrame()
-        
-        # 转换为DataFrame
-        data = []
-        for order in orders:
-            data.append({
-                '订单ID': order.order_id,
-                '门店名称': order.store_name,
-                '门店ID': order.store_id,
-                '日期': order.date,
-                '渠道': order.channel,
-                '商品名称': order.product_name,
-                '一级分类名': order.category_level1,
-                '三级分类名': order.category_level3,
-                '月售': order.quantity if order.quantity is not None else 1,
-                '实收价格': float(order.actual_price or 0),
-                '商品实售价': float(order.price or 0),
-                '商品原价': float(order.original_price or 0),  # ✅ 新增：GMV计算需要
-                '商品采购成本': float(order.cost or 0),
-                '利润额': float(order.profit or 0),
-                '物流配送费': float(order.delivery_fee or 0),
-                '平台服务费': float(order.platform_service_fee or 0),
-                '平台佣金': float(order.commission or 0),
-                '预计订单收入': float(order.amount or 0),
-                '企客后返': float(order.corporate_rebate or 0),
-                '用户支付配送费': float(order.user_paid_delivery_fee or 0),
-                '配送费减免金额': float(order.delivery_discount or 0),
-                '满减金额': float(order.full_reduction or 0),
-                '商品减免金额': float(order.product_discount or 0),
-                '新客减免金额': float(order.new_customer_discount or 0),
-                '商家代金券': float(order.merchant_voucher or 0),
-                '商家承担部分券': float(order.merchant_share or 0),
-                '满赠金额': float(order.gift_amount or 0),
-                '商家其他优惠': float(order.other_merchant_discount or 0),
-                '打包袋金额': float(order.packaging_fee or 0),  # ✅ 新增：GMV计算需要
-            })
-        
-        df = pd.DataFrame(data)
-        print(f"✅ 全量门店数据加载完成: {len(df)} 条记录, {df['门店名称'].nunique()} 个门店")
-        
-        # 4. 更新缓存
-        # 更新内存缓存
-        _store_comparison_cache[date_key] = {
-            "data": df.copy(),
-            "timestamp": current_time
-        }
+            criteria.append(Order.date <= datetime.combine(end_date, datetime.max.time()))
         
-        # 更新Redis缓存
-        if REDIS_AVAILABLE and redis_client:
-            try:
-                # 将日期转换为字符串以便JSON序列化
-                cache_data = data.copy()
-                for item in cache_data:
-                    if item.get('日期'):
-                        item['日期'] = str(item['日期'])
-                
-                redis_client.set(redis_cache_key, json.dumps(cache_data, ensure_ascii=False))
-                redis_client.set(redis_timestamp_key, str(current_time))
-                # 设置过期时间
-                redis_client.expire(redis_cache_key, CACHE_TTL)
-                redis_client.expire(redis_timestamp_key, CACHE_TTL)
-                print(f"✅ 数据已缓存到Redis (全量门店对比, 渠道={channel_key})")
-            except Exception as e:
-                print(f"⚠️ Redis缓存写入失败: {e}")
-        
-        return df
-    finally:
-        session.close()
+        # ✅ SQL层面渠道筛选（避免N+1查询；订单编号前缀不在Parquet中，只能查数据库）
+        prefix = CHANNEL_PREFIX_MAP[channel]
+        criteria.append(Order.order_number.like(f'{prefix}%'))
+        print(f"   SQL渠道筛选: order_number LIKE '{prefix}%'")
+        df = order_loader_service.load(STORE_COMPARISON_COLUMNS, *criteria)
+    else:
+        df = order_loader_service.load_query(
+            OrderQuery.build(None, start_date, end_date),
+            STORE_COMPARISON_COLUMNS,
+            data_version=current_version,
+        )
+    if df.empty:
+        return pd.DataFrame()
+    
+    print(f"✅ 全量门店数据加载完成: {len(df)} 条记录, {df['门店名称'].nunique()} 个门店")
+    
+    # 4. 更新缓存
+    # 发布共享快照；内存缓存保存快照引用（快照发布失败时为本进程只读数据）
+    cached_df = freeze_dataframe(order_snapshot_service.publish(snapshot_scope, current_version, df))
+    _store_comparison_cache[date_key] = {
+        "data": cached_df,
+        "timestamp": current_time
+    }
+    
+    # 更新Redis缓存
+    if REDIS_AVAILABLE and redis_client:
+        try:
+            # Arrow IPC二进制编码（保留dtype，门店/渠道/分类字典编码）
+            redis_binary_client.set(redis_cache_key, encode_dataframe(df))
+            redis_client.set(redis_timestamp_key, str(current_time))
+            # 设置过期时间
+            redis_client.expire(redis_cache_key, CACHE_TTL)
+            redis_client.expire(redis_timestamp_key, CACHE_TTL)
+            print(f"✅ 数据已缓存到Redis (全量门店对比, 渠道={channel_key})")
+        except Exception as e:
+            print(f"⚠️ Redis缓存写入失败: {e}")
+    
+    return shared_view(cached_df)
 
 
 def invalidate_store_comparison_cache():
     """清除全量门店对比缓存（数据更新时调用）"""
     global _store_comparison_cache
+    for date_key in _store_comparison_cache:
+        order_snapshot_service.evict(f"store_comparison:{date_key}", remove_files=True)
     _store_comparison_cache = {}
     
     if REDIS_AVAILABLE and redis_client:
@@ -368,7 +351,23 @@ def invalidate_store_comparison_cache():
     print("✅ 全量门店对比内存缓存已清除")
 
 
-def calculate_store_metrics(df: pd.DataFrame) -> pd.DataFrame:
+def get_stores_order_facts(
+    df: pd.DataFrame,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    channel: Optional[str] = None
+) -> Optional[pd.DataFrame]:
+    """
+    全部门店订单级事实（与 get_all_stores_data 相同的日期范围）
+    
+    渠道按订单号前缀筛选，事实表不含订单号，此时返回None由明细实时计算
+    """
+    if df.empty or (channel and channel in CHANNEL_PREFIX_MAP):
+        return None
+    return get_order_facts(None, start_date, end_date, detail_df=df)
+
+
+def calculate_store_metrics(df: pd.DataFrame, order_agg: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     计算每个门店的关键指标
     
@@ -377,12 +376,17 @@ def calculate_store_metrics(df: pd.DataFrame) -> pd.DataFrame:
     公式说明：
     - 营销成本率 = 营销成本 / GMV × 100%（GMV = 商品原价×销量 + 打包袋 + 用户支付配送费）
     - 配送成本率 = 配送净成本 / 实收金额 × 100%
+    
+    Args:
+        df: 门店明细（GMV按商品行计算）
+        order_agg: 订单级事实（见 get_stores_order_facts，None 时由 df 按门店实时计算，口径与事实表一致）
     """
     if df.empty or '门店名称' not in df.columns:
         return pd.DataFrame()
     
     # 先计算订单级指标（复用 orders.py 的函数）
-    order_agg = calculate_order_metrics(df)
+    if order_agg is None:
+        order_agg = calculate_order_metrics_by_store(df)
     
     if order_agg.empty or '门店名称' not in order_agg.columns:
         return pd.DataFrame()
@@ -409,7 +413,7 @@ def calculate_store_metrics(df: pd.DataFrame) -> pd.DataFrame:
         }
     
     # 按门店聚合
-    store_stats = order_agg.groupby('门店名称').agg({
+    store_stats = order_agg.groupby('门店名称', observed=True).agg({
         '订单ID': 'count',
         '实收价格': 'sum',
         '订单实际利润': 'sum',
@@ -462,6 +466,7 @@ async def clear_store_comparison_cache():
 
 
 @router.get("/comparison")
+@offload()
 async def get_stores_comparison(
     start_date: Optional[date] = Query(None, description="开始日期"),
     end_date: Optional[date] = Query(None, description="结束日期"),
@@ -522,7 +527,7 @@ async def get_stores_comparison(
             }
         
         # 计算门店指标
-        store_stats = calculate_store_metrics(df)
+        store_stats = calculate_store_metrics(df, get_stores_order_facts(df, start_date, end_date, channel))
         print(f"⚠️ [原始查询] 查询耗时: {(time.time() - query_start)*1000:.1f}ms")
     
     if store_stats.empty:
@@ -638,6 +643,7 @@ async def get_stores_comparison(
 
 
 @router.get("/comparison/week-over-week")
+@offload()
 async def get_stores_week_over_week(
     end_date: Optional[date] = Query(None, description="本期结束日期（默认为数据最大日期）"),
     previous_start: Optional[date] = Query(None, description="上期开始日期（可选，用于自定义对比周期）"),
@@ -694,8 +700,12 @@ async def get_stores_week_over_week(
     last_week_df = get_all_stores_data(last_week_start, last_week_end, channel)
     
     # 计算本周指标
-    this_week_stats = calculate_store_metrics(this_week_df) if not this_week_df.empty else pd.DataFrame()
-    last_week_stats = calculate_store_metrics(last_week_df) if not last_week_df.empty else pd.DataFrame()
+    this_week_stats = calculate_store_metrics(
+        this_week_df, get_stores_order_facts(this_week_df, this_week_start, this_week_end, channel)
+    ) if not this_week_df.empty else pd.DataFrame()
+    last_week_stats = calculate_store_metrics(
+        last_week_df, get_stores_order_facts(last_week_df, last_week_start, last_week_end, channel)
+    ) if not last_week_df.empty else pd.DataFrame()
     
     if this_week_stats.empty:
         return {
@@ -775,6 +785,7 @@ async def get_stores_week_over_week(
 
 
 @router.get("/comparison/ranking")
+@offload()
 async def get_stores_ranking(
     metric: str = Query("revenue", description="排名指标: revenue, profit, profit_margin, order_count"),
     limit: int = Query(10, ge=1, le=50, description="返回Top N"),
@@ -791,7 +802,7 @@ async def get_stores_ranking(
         return {"success": True, "data": []}
     
     # 计算门店指标
-    store_stats = calculate_store_metrics(df)
+    store_stats = calculate_store_metrics(df, get_stores_order_facts(df, start_date, end_date))
     
     if store_stats.empty:
         return {"success": True, "data": []}
@@ -824,6 +835,7 @@ async def get_stores_ranking(
 
 
 @router.get("/comparison/available-channels")
+@offload()
 async def get_available_channels(
     start_date: Optional[date] = Query(None, description="开始日期"),
     end_date: Optional[date] = Query(None, description="结束日期")
@@ -876,6 +888,7 @@ async def get_available_channels(
 
 
 @router.get("/comparison/export")
+@offload()
 async def export_stores_comparison(
     start_date: Optional[date] = Query(None, description="开始日期"),
     end_date: Optional[date] = Query(None, description="结束日期"),
@@ -897,7 +910,7 @@ async def export_stores_comparison(
     if df.empty:
         return {"success": False, "error": "无数据可导出"}
     
-    store_stats = calculate_store_metrics(df)
+    store_stats = calculate_store_metrics(df, get_stores_order_facts(df, start_date, end_date, channel))
     
     if store_stats.empty:
         return {"success": False, "error": "无数据可导出"}
@@ -955,6 +968,7 @@ async def export_stores_comparison(
 
 
 @router.get("/comparison/stores-by-channel")
+@offload()
 async def get_stores_by_channel(
     start_date: Optional[date] = Query(None, description="开始日期"),
     end_date: Optional[date] = Query(None, description="结束日期"),
@@ -1742,6 +1756,7 @@ class InsightsEngine:
 
 
 @router.get("/comparison/global-insights")
+@offload()
 async def get_global_insights(
     start_date: Optional[date] = Query(None, description="开始日期"),
     end_date: Optional[date] = Query(None, description="结束日期"),
@@ -1773,7 +1788,7 @@ async def get_global_insights(
     if store_stats is None or store_stats.empty:
         df = get_all_stores_data(start_date, end_date, channel)
         if not df.empty:
-            store_stats = calculate_store_metrics(df)
+            store_stats = calculate_store_metrics(df, get_stores_order_facts(df, start_date, end_date, channel))
     
     if store_stats is None or store_stats.empty:
         return {"success": True, "data": None, "message": "暂无门店数据"}
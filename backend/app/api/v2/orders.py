@@ -3,6 +3,9 @@
 订单 API v2 - 使用 DuckDB 查询引擎
 
 专为千万级数据优化，查询性能提升100-600倍
+
+DuckDB 查询是同步阻塞调用，端点用 @offload() 放到线程池执行，
+每个请求线程从 duckdb_service 的游标池借用独立游标，并发请求互不阻塞。
 """
 from fastapi import APIRouter, Query, HTTPException
 from typing import Optional, Dict, Any, List
@@ -10,11 +13,13 @@ from datetime import date
 import time
 
 from app.services import duckdb_service
+from app.services.dispatch_service import offload
 
 router = APIRouter()
 
 
 @router.get("/overview")
+@offload()
 async def get_order_overview_v2(
     store_name: Optional[str] = Query(None, description="门店名称"),
     start_date: Optional[date] = Query(None, description="开始日期"),
@@ -50,6 +55,7 @@ async def get_order_overview_v2(
 
 
 @router.get("/trend")
+@offload()
 async def get_order_trend_v2(
     days: int = Query(30, ge=1, le=365, description="统计天数"),
     store_name: Optional[str] = Query(None, description="门店名称"),
@@ -87,6 +93,7 @@ async def get_order_trend_v2(
 
 
 @router.get("/channels")
+@offload()
 async def get_channel_stats_v2(
     store_name: Optional[str] = Query(None, description="门店名称"),
     start_date: Optional[date] = Query(None, description="开始日期"),
@@ -112,6 +119,7 @@ async def get_channel_stats_v2(
 
 
 @router.get("/categories")
+@offload()
 async def get_category_stats_v2(
     store_name: Optional[str] = Query(None, description="门店名称"),
     start_date: Optional[date] = Query(None, description="开始日期"),
@@ -137,10 +145,51 @@ async def get_category_stats_v2(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/date-range")
+@offload()
+async def get_date_range_v2(
+    store_name: Optional[str] = Query(None, description="门店名称")
+) -> Dict[str, Any]:
+    """
+    获取日期范围（v2 - DuckDB 加速，只读取日期列）
+    """
+    try:
+        return {"success": True, "data": duckdb_service.query_date_range(store_name), "source": "duckdb"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/stores")
+@offload()
+async def get_store_list_v2() -> Dict[str, Any]:
+    """
+    获取门店列表（v2 - DuckDB 加速，只读取门店名称列）
+    """
+    try:
+        return {"success": True, "data": duckdb_service.query_distinct('门店名称'), "source": "duckdb"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/channel-list")
+@offload()
+async def get_channel_list_v2(
+    store_name: Optional[str] = Query(None, description="门店名称")
+) -> Dict[str, Any]:
+    """
+    获取渠道列表（v2 - DuckDB 加速，只读取渠道/门店名称列）
+    """
+    try:
+        return {"success": True, "data": duckdb_service.query_distinct('渠道', store_name), "source": "duckdb"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/status")
+@offload()
 async def get_duckdb_status() -> Dict[str, Any]:
     """
-    获取 DuckDB 服务状态
+    获取 DuckDB 服务状态（含游标池指标: 已创建/借出/等待次数/最大等待时间）
     """
     return {
         "success": True,
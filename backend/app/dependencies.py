@@ -31,6 +31,7 @@ from services import (
     DataManagementService,
 )
 from services.cache.hierarchical_cache_adapter import get_cache_manager
+from cache_utils import freeze_dataframe, shared_view
 
 # 导入数据加载器（复用现有）
 try:
@@ -80,12 +81,12 @@ def get_order_data(store_name: str = None) -> pd.DataFrame:
         store_cache = _memory_cache.get("store_cache", {}).get(store_name)
         if store_cache and current_time - store_cache.get("timestamp", 0) < CACHE_TTL:
             print(f"📦 使用内存缓存数据 (门店: {store_name})")
-            return store_cache["data"].copy()
+            return shared_view(store_cache["data"])
     else:
         if _memory_cache["order_data"] is not None:
             if current_time - _memory_cache["timestamp"] < CACHE_TTL:
                 print(f"📦 使用内存缓存数据 (全部门店)")
-                return _memory_cache["order_data"].copy()
+                return shared_view(_memory_cache["order_data"])
     
     # 2. 从数据库加载
     print(f"🔄 从数据库加载订单数据 (门店: {store_name or '全部'})...")
@@ -150,14 +151,14 @@ def get_order_data(store_name: str = None) -> pd.DataFrame:
                 if "store_cache" not in _memory_cache:
                     _memory_cache["store_cache"] = {}
                 _memory_cache["store_cache"][store_name] = {
-                    "data": df.copy(),
+                    "data": freeze_dataframe(df),
                     "timestamp": current_time
                 }
             else:
-                _memory_cache["order_data"] = df.copy()
+                _memory_cache["order_data"] = freeze_dataframe(df)
                 _memory_cache["timestamp"] = current_time
             
-            return df
+            return shared_view(df)
         finally:
             session.close()
             
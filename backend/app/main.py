@@ -17,6 +17,10 @@ from .config import settings
 from .api.v1 import router as v1_router
 from .api.v2 import router as v2_router
 from .middleware import ObservabilityMiddleware, RateLimitMiddleware
+from cache_utils import enable_copy_on_write
+
+# 缓存的订单DataFrame以Copy-on-Write视图共享给各请求（pandas 2.x 需显式开启）
+enable_copy_on_write()
 
 # 创建FastAPI应用（使用orjson提升JSON性能2-3倍）
 app = FastAPI(
@@ -242,6 +246,14 @@ async def shutdown_event():
     except Exception as e:
         logging_service.warning(f"⚠️ 定时任务关闭失败: {e}")
     
+    # 关闭分析端点线程池
+    try:
+        from .services.dispatch_service import dispatch_service
+        dispatch_service.shutdown()
+        logging_service.info("✅ 分析线程池已关闭")
+    except Exception as e:
+        logging_service.warning(f"⚠️ 分析线程池关闭失败: {e}")
+    
     logging_service.info("✅ 应用已关闭")
 
 
@@ -14,6 +14,11 @@
 - cache_warmup_service: 缓存预热服务
 - cache_protection_service: 缓存保护服务
 - slow_query_service: 慢查询监控服务
+- order_loader_service: 订单数据列式加载服务
+- order_snapshot_service: 订单数据共享快照服务（多worker零拷贝）
+- order_facts_service: 订单级事实表服务（导入时预计算订单指标）
+- dispatch_service: 分析端点线程池分发服务
+- kpi_query_plan: 统一KPI查询计划（PostgreSQL / DuckDB 共用，一次扫描）
 """
 
 from .aggregation_service import aggregation_service, AggregationService
@@ -28,6 +33,10 @@ from .cache_warmup_service import cache_warmup_service, CacheWarmupService
 from .cache_protection_service import cache_protection_service, CacheProtectionService
 from .slow_query_service import slow_query_service, SlowQueryService
 from .query_router_service import query_router_service, QueryRouterService
+from .order_loader_service import order_loader_service, OrderLoaderService
+from .order_snapshot_service import order_snapshot_service, OrderSnapshotService
+from .order_facts_service import order_facts_service, OrderFactsService
+from .dispatch_service import dispatch_service, DispatchService
 
 __all__ = [
     'aggregation_service', 'AggregationService',
@@ -42,4 +51,8 @@ __all__ = [
     'cache_protection_service', 'CacheProtectionService',
     'slow_query_service', 'SlowQueryService',
     'query_router_service', 'QueryRouterService',
+    'order_loader_service', 'OrderLoaderService',
+    'order_snapshot_service', 'OrderSnapshotService',
+    'order_facts_service', 'OrderFactsService',
+    'dispatch_service', 'DispatchService',
 ]
@@ -8,12 +8,13 @@
 - 支持自定义聚合维度和计算字段
 
 使用方法：
-1. 在 AGGREGATION_CONFIGS 中添加新表配置
-2. 运行数据库迁移创建表
-3. 系统自动处理同步和缓存
+1. 在 AGGREGATION_CONFIGS 中添加新表配置（unique_key 声明唯一键，增量 upsert 的冲突目标）
+2. 运行数据库迁移创建表（database/generate_table_sql.py 同时生成唯一索引）
+3. 系统自动处理同步和缓存：按 (门店, 日期区间) 脏集合增量刷新
 """
 
-from typing import Dict, List, Any, Optional
+import re
+from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass, field
 
 
@@ -44,6 +45,28 @@ class AggregationConfig:
     derived_fields: List[DerivedField] = field(default_factory=list)  # 派生字段
     filter_condition: Optional[str] = None  # 过滤条件（SQL WHERE）
     order_level_first: bool = True     # 是否需要先按订单聚合
+    unique_key: List[str] = field(default_factory=list)  # 唯一键（为空时为全部分组维度）
+    date_column: str = "summary_date"  # 汇总日期列（增量刷新按该列限定范围）
+    
+    def group_by_columns(self) -> List[Tuple[str, str]]:
+        """分组维度 → (表达式, 列名)，如 "DATE(date) as summary_date" → ("DATE(date)", "summary_date")"""
+        columns = []
+        for g in self.group_by:
+            match = re.match(r"^(.*\S)\s+as\s+(\w+)\s*$", g.strip(), flags=re.IGNORECASE | re.DOTALL)
+            columns.append((match.group(1), match.group(2)) if match else (g.strip(), g.strip()))
+        return columns
+    
+    def key_columns(self) -> List[str]:
+        """唯一键列（不在唯一键中的分组维度作为属性列，取 MAX）"""
+        return list(self.unique_key) or [name for _, name in self.group_by_columns()]
+    
+    def output_columns(self) -> List[str]:
+        """写入预聚合表的全部列：分组维度 + 聚合字段 + 派生字段"""
+        return (
+            [name for _, name in self.group_by_columns()]
+            + [f.name for f in self.fields]
+            + [d.name for d in self.derived_fields]
+        )
 
 
 # ==================== 预聚合表配置 ====================
@@ -58,6 +81,7 @@ AGGREGATION_CONFIGS: Dict[str, AggregationConfig] = {
         table_name="store_daily_summary",
         description="门店日汇总（订单数、收入、利润等）",
         group_by=["store_name", "DATE(date) as summary_date", "channel"],
+        unique_key=["store_name", "summary_date", "channel"],
         fields=[
             AggregationField("order_count", "order_id", "COUNT_DISTINCT"),
             AggregationField("total_revenue", "COALESCE(actual_price, 0) * COALESCE(quantity, 1)", "SUM"),
@@ -105,6 +129,7 @@ AGGREGATION_CONFIGS: Dict[str, AggregationConfig] = {
         table_name="store_hourly_summary",
         description="门店小时汇总（分时段分析）",
         group_by=["store_name", "DATE(date) as summary_date", "EXTRACT(HOUR FROM date)::INTEGER as hour_of_day", "channel"],
+        unique_key=["store_name", "summary_date", "hour_of_day", "channel"],
         fields=[
             AggregationField("order_count", "order_id", "COUNT_DISTINCT"),
             AggregationField("total_revenue", "COALESCE(actual_price, 0) * COALESCE(quantity, 1)", "SUM"),
@@ -126,6 +151,7 @@ AGGREGATION_CONFIGS: Dict[str, AggregationConfig] = {
         table_name="category_daily_summary",
         description="品类日汇总（品类分析）",
         group_by=["store_name", "DATE(date) as summary_date", "category_level1", "category_level3", "channel"],
+        unique_key=["store_name", "summary_date", "category_level1", "category_level3", "channel"],
         fields=[
             AggregationField("order_count", "order_id", "COUNT_DISTINCT"),
             AggregationField("product_count", "product_name", "COUNT_DISTINCT"),
@@ -162,6 +188,7 @@ AGGREGATION_CONFIGS: Dict[str, AggregationConfig] = {
             END as distance_band""",
             "channel"
         ],
+        unique_key=["store_name", "summary_date", "hour_of_day", "distance_band", "channel"],
         fields=[
             AggregationField("order_count", "order_id", "COUNT_DISTINCT"),
             AggregationField("total_revenue", "COALESCE(actual_price, 0) * COALESCE(quantity, 1)", "SUM"),
@@ -184,6 +211,8 @@ AGGREGATION_CONFIGS: Dict[str, AggregationConfig] = {
         table_name="product_daily_summary",
         description="商品日汇总（商品排行）",
         group_by=["store_name", "DATE(date) as summary_date", "product_name", "category_level1", "channel"],
+        # 一级分类不在唯一键中：同一商品跨分类时取 MAX，保证每个键一行
+        unique_key=["store_name", "summary_date", "product_name", "channel"],
         fields=[
             AggregationField("order_count", "order_id", "COUNT_DISTINCT"),
             AggregationField("total_quantity", "COALESCE(quantity, 1)", "SUM"),
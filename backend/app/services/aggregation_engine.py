@@ -4,11 +4,17 @@
 
 根据 aggregation_config.py 中的配置自动生成 SQL 并执行同步。
 新增预聚合表只需添加配置，无需修改此文件。
+
+增量维护：按 (门店, 日期区间) 脏集合（RefreshScope）生成参数化 SQL，
+重算结果以 INSERT ... ON CONFLICT (配置的唯一键) DO UPDATE 写入，
+范围内不再存在的旧行在同一语句中删除。
 """
 
 import sys
 from pathlib import Path
-from typing import List, Optional
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 from sqlalchemy import text
 
 APP_DIR = Path(__file__).resolve().parent.parent
@@ -27,28 +33,192 @@ from .aggregation_config import (
 )
 
 
+@dataclass
+class RefreshScope:
+    """
+    预聚合刷新范围（脏集合）：门店 → 日期区间列表
+    
+    区间为闭区间 (开始日期, 结束日期)；区间列表为 None 表示该门店的全部日期
+    """
+    ranges: Dict[str, Optional[List[Tuple[date, date]]]] = field(default_factory=dict)
+    
+    # 单个门店的区间数超过该值时合并为一个区间（避免过长的 OR 条件）
+    MAX_RANGES_PER_STORE = 30
+    
+    @classmethod
+    def from_days(cls, days: Dict[str, Optional[Iterable[date]]]) -> "RefreshScope":
+        """门店 → 变更日期集合（None 表示全部日期），连续日期合并为区间"""
+        ranges: Dict[str, Optional[List[Tuple[date, date]]]] = {}
+        for store_name, store_days in days.items():
+            if store_days is None:
+                ranges[store_name] = None
+                continue
+            ordered = sorted(set(store_days))
+            if not ordered:
+                continue
+            store_ranges = [(ordered[0], ordered[0])]
+            for day in ordered[1:]:
+                if day - store_ranges[-1][1] <= timedelta(days=1):
+                    store_ranges[-1] = (store_ranges[-1][0], day)
+                else:
+                    store_ranges.append((day, day))
+            if len(store_ranges) > cls.MAX_RANGES_PER_STORE:
+                store_ranges = [(ordered[0], ordered[-1])]
+            ranges[store_name] = store_ranges
+        return cls(ranges)
+    
+    @classmethod
+    def for_stores(cls, store_names: Iterable[str]) -> "RefreshScope":
+        """门店的全部日期"""
+        return cls({store_name: None for store_name in store_names})
+    
+    def merge(self, other: "RefreshScope") -> "RefreshScope":
+        """合并两个刷新范围（同一门店取区间并集）"""
+        merged: Dict[str, Optional[Set[date]]] = {}
+        for scope in (self, other):
+            for store_name, store_ranges in scope.ranges.items():
+                if store_ranges is None or (store_name in merged and merged[store_name] is None):
+                    merged[store_name] = None
+                    continue
+                days = merged.setdefault(store_name, set())
+                for start, end in store_ranges:
+                    days.update(start + timedelta(days=i) for i in range((end - start).days + 1))
+        return RefreshScope.from_days(merged)
+    
+    @property
+    def store_names(self) -> List[str]:
+        return list(self.ranges)
+    
+    def where(self, date_column: str) -> Tuple[str, Dict]:
+        """
+        SQL 条件与绑定参数（源表用 date，预聚合表用 summary_date）
+        
+        结束日期转换为次日的开区间，时间戳列按自然日筛选
+        """
+        conditions, params = [], {}
+        for i, (store_name, store_ranges) in enumerate(self.ranges.items()):
+            params[f"s{i}"] = store_name
+            if store_ranges is None:
+                conditions.append(f"store_name = :s{i}")
+                continue
+            for j, (start, end) in enumerate(store_ranges):
+                params[f"f{i}_{j}"] = start
+                params[f"t{i}_{j}"] = end + timedelta(days=1)
+                conditions.append(
+                    f"(store_name = :s{i} AND {date_column} >= :f{i}_{j} AND {date_column} < :t{i}_{j})"
+                )
+        return "(" + " OR ".join(conditions or ["FALSE"]) + ")", params
+    
+    def describe(self) -> str:
+        parts = []
+        for store_name, store_ranges in self.ranges.items():
+            if store_ranges is None:
+                parts.append(f"{store_name}(全部日期)")
+            else:
+                days = sum((end - start).days + 1 for start, end in store_ranges)
+                parts.append(f"{store_name}({store_ranges[0][0]}~{store_ranges[-1][1]}, {days}天)")
+        return ", ".join(parts)
+
+
+def build_upsert_sql(table: str, columns: List[str], keys: List[str], select_sql: str,
+                     target_where: str, has_unique_key: bool = True) -> str:
+    """
+    范围内 upsert 语句：一条语句完成重算结果的写入与旧行清理，返回 (写入行数, 清理行数)
+    
+    - 有唯一索引：INSERT ... ON CONFLICT (唯一键) DO UPDATE，范围内未被覆盖的旧行删除
+    - 没有唯一索引：范围内删除 + 插入（同一语句，同一快照）
+    
+    Args:
+        columns: 写入的列（与 select_sql 输出列一致）
+        keys: 唯一键列
+        select_sql: 重算查询
+        target_where: 预聚合表上的刷新范围条件（RefreshScope.where 生成）
+    """
+    column_list = ", ".join(columns)
+    
+    if has_unique_key:
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c not in keys)
+        return f"""
+        WITH new_rows AS ({select_sql}),
+        upserted AS (
+            INSERT INTO {table} ({column_list})
+            SELECT {column_list} FROM new_rows
+            ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}
+            RETURNING id
+        ),
+        removed AS (
+            DELETE FROM {table}
+            WHERE {target_where} AND id NOT IN (SELECT id FROM upserted)
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM upserted), (SELECT COUNT(*) FROM removed)
+        """
+    
+    return f"""
+        WITH new_rows AS ({select_sql}),
+        removed AS (
+            DELETE FROM {table} WHERE {target_where}
+            RETURNING 1
+        ),
+        inserted AS (
+            INSERT INTO {table} ({column_list})
+            SELECT {column_list} FROM new_rows
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM inserted), (SELECT COUNT(*) FROM removed)
+        """
+
+
 class AggregationEngine:
     """配置驱动的预聚合表引擎"""
     
+    # 表是否有与配置唯一键匹配的唯一索引（未记录表示尚未检查）
+    _upsert_ready: Dict[str, bool] = {}
+    
     @staticmethod
-    def sync_all_tables(store_names: List[str], session=None):
+    def sync_all_tables(store_names: List[str], session=None,
+                        start_date: Optional[date] = None, end_date: Optional[date] = None):
         """
         同步所有预聚合表
         
         Args:
             store_names: 需要同步的门店列表
             session: 数据库会话（可选，不传则自动创建）
+            start_date/end_date: 日期区间（闭区间，不传则为门店全部日期）
         """
+        AggregationEngine.sync_dirty(
+            AggregationEngine._store_scope(store_names, start_date, end_date), session
+        )
+    
+    @staticmethod
+    def sync_dirty(scope, session=None) -> Dict[str, Tuple[int, int]]:
+        """
+        按脏集合增量同步所有预聚合表
+        
+        Args:
+            scope: RefreshScope，或 门店 → 日期集合（None 表示该门店全部日期）
+            session: 数据库会话（可选，不传则自动创建）
+        
+        Returns:
+            表名 → (写入行数, 清理行数)
+        """
+        if not isinstance(scope, RefreshScope):
+            scope = RefreshScope.from_days(scope)
+        if not scope.ranges:
+            return {}
+        
         own_session = session is None
         if own_session:
             session = SessionLocal()
         
         try:
+            results = {}
             for table_name in get_all_table_names():
-                AggregationEngine.sync_table(table_name, store_names, session)
+                results[table_name] = AggregationEngine.sync_table_scope(table_name, scope, session)
             
             if own_session:
                 session.commit()
+            return results
         except Exception as e:
             if own_session:
                 session.rollback()
@@ -58,7 +228,8 @@ class AggregationEngine:
                 session.close()
     
     @staticmethod
-    def sync_table(table_name: str, store_names: List[str], session=None):
+    def sync_table(table_name: str, store_names: List[str], session=None,
+                   start_date: Optional[date] = None, end_date: Optional[date] = None):
         """
         同步单个预聚合表
         
@@ -66,235 +237,225 @@ class AggregationEngine:
             table_name: 表名
             store_names: 需要同步的门店列表
             session: 数据库会话
+            start_date/end_date: 日期区间（闭区间，不传则为门店全部日期）
+        """
+        return AggregationEngine.sync_table_scope(
+            table_name, AggregationEngine._store_scope(store_names, start_date, end_date), session
+        )
+    
+    @staticmethod
+    def sync_table_scope(table_name: str, scope: RefreshScope, session=None) -> Optional[Tuple[int, int]]:
+        """
+        按脏集合增量同步单个预聚合表
+        
+        Returns:
+            (写入行数, 清理行数)，失败时 None
         """
         config = get_config(table_name)
         if not config:
             print(f"   ⚠️ 未找到表配置: {table_name}")
-            return
+            return None
         
         own_session = session is None
         if own_session:
             session = SessionLocal()
         
         try:
-            store_list = "', '".join(store_names)
-            
-            # 1. 删除旧数据
-            delete_sql = f"DELETE FROM {table_name} WHERE store_name IN ('{store_list}')"
-            result = session.execute(text(delete_sql))
-            if result.rowcount > 0:
-                print(f"   🗑️ {table_name}: 删除 {result.rowcount} 条")
-            
-            # 2. 生成并执行插入 SQL
-            insert_sql = AggregationEngine._generate_insert_sql(config, store_list)
-            session.execute(text(insert_sql))
-            
-            # 3. 更新派生字段
-            if config.derived_fields:
-                update_sql = AggregationEngine._generate_update_sql(config, store_list)
-                session.execute(text(update_sql))
+            sql, params = AggregationEngine.generate_upsert_sql(config, scope)
+            written, removed = session.execute(text(sql), params).one()
             
             if own_session:
                 session.commit()
             
-            # 统计结果
-            count_result = session.execute(
-                text(f"SELECT COUNT(*) FROM {table_name} WHERE store_name IN ('{store_list}')")
-            )
-            count = count_result.scalar()
-            print(f"   ✅ {table_name}: {count} 条")
+            print(f"   ✅ {table_name}: 写入 {written} 条，清理 {removed} 条")
+            return written, removed
             
         except Exception as e:
             print(f"   ❌ {table_name}: {e}")
             if own_session:
                 session.rollback()
+            return None
         finally:
             if own_session:
                 session.close()
     
     @staticmethod
-    def _generate_insert_sql(config: AggregationConfig, store_list: str) -> str:
+    def _store_scope(store_names: List[str], start_date: Optional[date], end_date: Optional[date]) -> RefreshScope:
+        """门店列表 + 可选日期区间 → 刷新范围"""
+        if start_date is None and end_date is None:
+            return RefreshScope.for_stores(store_names)
+        start_date = start_date or end_date
+        end_date = end_date or start_date
+        return RefreshScope({store_name: [(start_date, end_date)] for store_name in store_names})
+    
+    @staticmethod
+    def generate_upsert_sql(config: AggregationConfig, scope: RefreshScope) -> Tuple[str, Dict]:
+        """
+        根据配置生成范围内 upsert SQL 与绑定参数
+        
+        源数据按 scope 过滤 orders.date，预聚合表按 config.date_column 限定清理范围
+        """
+        where, params = scope.where("date")
+        target_where, _ = scope.where(config.date_column)
+        select_sql = AggregationEngine._generate_select_sql(config, where)
+        sql = build_upsert_sql(
+            config.table_name, config.output_columns(), config.key_columns(), select_sql,
+            target_where, AggregationEngine.ensure_unique_key(config.table_name)
+        )
+        return sql, params
+    
+    @staticmethod
+    def ensure_unique_key(table_name: str) -> bool:
         """
-        根据配置生成 INSERT SQL
+        表上是否有与配置唯一键一致的唯一索引（没有时尝试创建）
+        
+        已有重复数据导致无法创建时返回 False，该表改用范围内删除 + 插入。
+        使用独立连接，不影响调用方会话中的事务。
+        """
+        ready = AggregationEngine._upsert_ready.get(table_name)
+        if ready is not None:
+            return ready
+        
+        keys = get_config(table_name).key_columns()
+        session = SessionLocal()
+        try:
+            exists = session.execute(text("""
+                SELECT 1
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indrelid
+                WHERE c.relname = :table AND i.indisunique
+                  AND (
+                      SELECT array_agg(a.attname::text ORDER BY a.attname::text)
+                      FROM pg_attribute a
+                      WHERE a.attrelid = c.oid AND a.attnum = ANY(i.indkey)
+                  ) = CAST(:keys AS text[])
+                LIMIT 1
+            """), {"table": table_name, "keys": sorted(keys)}).first() is not None
+            
+            if not exists:
+                try:
+                    session.execute(text(
+                        f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table_name}_key ON {table_name} ({', '.join(keys)})"
+                    ))
+                    session.commit()
+                    print(f"   ✅ {table_name}: 已创建唯一索引 ({', '.join(keys)})")
+                    exists = True
+                except Exception as e:
+                    session.rollback()
+                    print(f"   ⚠️ {table_name}: 无法创建唯一索引，改用范围内删除+插入: {str(e)[:100]}")
+        finally:
+            session.close()
+        
+        AggregationEngine._upsert_ready[table_name] = exists
+        return exists
+    
+    @staticmethod
+    def _generate_select_sql(config: AggregationConfig, where: str) -> str:
+        """
+        根据配置生成重算查询（输出列与 config.output_columns() 一致）
         
         对于订单级字段（is_order_level=True），需要先按订单聚合再汇总：
         1. 子查询：按 order_id 聚合，取 MAX
         2. 外层查询：按目标维度聚合，取 SUM
+        派生字段在外层按公式计算，不再单独 UPDATE
         """
+        if config.filter_condition:
+            where = f"{where} AND ({config.filter_condition})"
         
         # 检查是否有订单级字段
         has_order_level_fields = any(f.is_order_level for f in config.fields)
         
         if has_order_level_fields and config.order_level_first:
-            return AggregationEngine._generate_order_level_insert_sql(config, store_list)
+            sql = AggregationEngine._generate_order_level_select_sql(config, where)
         else:
-            return AggregationEngine._generate_simple_insert_sql(config, store_list)
-    
-    @staticmethod
-    def _generate_simple_insert_sql(config: AggregationConfig, store_list: str) -> str:
-        """生成简单的 INSERT SQL（无订单级字段）"""
+            sql = AggregationEngine._generate_simple_select_sql(config, where)
         
-        # 提取目标字段名
-        target_fields = [f.name for f in config.fields]
+        if not config.derived_fields:
+            return sql
         
-        # 提取分组字段名（去掉 AS 别名部分用于 SELECT）
-        group_by_selects = []
-        group_by_names = []
-        for g in config.group_by:
-            if " as " in g.lower():
-                # 有别名，如 "DATE(date) as summary_date"
-                parts = g.lower().split(" as ")
-                group_by_selects.append(g)
-                group_by_names.append(parts[1].strip())
-            else:
-                group_by_selects.append(g)
-                group_by_names.append(g)
+        derived = ", ".join(f"{d.formula} as {d.name}" for d in config.derived_fields)
+        return f"SELECT agg.*, {derived} FROM ({sql}) agg"
+    
+    @staticmethod
+    def _aggregate(f) -> str:
+        """聚合字段表达式"""
+        if f.agg_func == "COUNT_DISTINCT":
+            return f"COUNT(DISTINCT {f.source})"
+        if f.agg_func == "FIRST":
+            # PostgreSQL 没有 FIRST，用 MIN
+            return f"MIN({f.source})"
+        return f"{f.agg_func}({f.source})"
+    
+    @staticmethod
+    def _generate_simple_select_sql(config: AggregationConfig, where: str) -> str:
+        """生成简单的重算查询（无订单级字段）"""
+        keys = config.key_columns()
         
-        # 生成 SELECT 字段
+        # 唯一键维度参与分组，其余维度作为属性列取 MAX
         select_fields = []
-        for g in group_by_selects:
-            select_fields.append(g)
-        
-        for f in config.fields:
-            if f.agg_func == "COUNT_DISTINCT":
-                select_fields.append(f"COUNT(DISTINCT {f.source}) as {f.name}")
-            elif f.agg_func == "FIRST":
-                # PostgreSQL 没有 FIRST，用子查询或 MIN
-                select_fields.append(f"MIN({f.source}) as {f.name}")
-            else:
-                select_fields.append(f"{f.agg_func}({f.source}) as {f.name}")
-        
-        # 生成 GROUP BY（只用字段名，不用别名）
         group_by_clause = []
-        for g in config.group_by:
-            if " as " in g.lower():
-                # 提取表达式部分
-                expr = g.lower().split(" as ")[0].strip()
-                # 还原大小写
-                for orig in config.group_by:
-                    if orig.lower().startswith(expr):
-                        group_by_clause.append(orig.split(" as ")[0].strip() if " as " in orig.lower() else orig)
-                        break
+        for expr, name in config.group_by_columns():
+            if name in keys:
+                select_fields.append(expr if expr == name else f"{expr} as {name}")
+                group_by_clause.append(expr)
             else:
-                group_by_clause.append(g)
+                select_fields.append(f"MAX({expr}) as {name}")
         
-        # 生成 INSERT 字段列表
-        insert_fields = group_by_names + target_fields
+        for f in config.fields:
+            select_fields.append(f"{AggregationEngine._aggregate(f)} as {f.name}")
         
-        sql = f"""
-        INSERT INTO {config.table_name} ({', '.join(insert_fields)})
+        return f"""
         SELECT {', '.join(select_fields)}
         FROM orders
-        WHERE store_name IN ('{store_list}')
+        WHERE {where}
+        GROUP BY {', '.join(group_by_clause)}
         """
-        
-        if config.filter_condition:
-            sql += f" AND {config.filter_condition}"
-        
-        sql += f" GROUP BY {', '.join(group_by_clause)}"
-        
-        return sql
     
     @staticmethod
-    def _generate_order_level_insert_sql(config: AggregationConfig, store_list: str) -> str:
+    def _generate_order_level_select_sql(config: AggregationConfig, where: str) -> str:
         """
-        生成带订单级聚合的 INSERT SQL
+        生成带订单级聚合的重算查询
         
         两层聚合：
         1. 内层：按 order_id + 分组维度聚合，订单级字段取 MAX
         2. 外层：按分组维度聚合，订单级字段取 SUM
         """
-        
-        # 提取分组字段
-        group_by_selects = []
-        group_by_names = []
-        group_by_exprs = []  # 用于 GROUP BY 子句
-        
-        for g in config.group_by:
-            if " as " in g.lower():
-                parts = g.lower().split(" as ")
-                expr = g.split(" as ")[0].strip() if " as " in g else g
-                alias = parts[1].strip()
-                group_by_selects.append(g)
-                group_by_names.append(alias)
-                group_by_exprs.append(expr)
-            else:
-                group_by_selects.append(g)
-                group_by_names.append(g)
-                group_by_exprs.append(g)
+        keys = config.key_columns()
         
         # 内层查询：按 order_id + 分组维度聚合
         inner_select = ["order_id"]
-        for g in group_by_selects:
-            inner_select.append(g)
+        inner_group_by = ["order_id"]
+        outer_select = []
+        outer_group_by = []
+        for expr, name in config.group_by_columns():
+            if name in keys:
+                inner_select.append(expr if expr == name else f"{expr} as {name}")
+                inner_group_by.append(expr)
+                outer_select.append(name)
+                outer_group_by.append(name)
+            else:
+                inner_select.append(f"MAX({expr}) as {name}")
+                outer_select.append(f"MAX({name}) as {name}")
         
         for f in config.fields:
             if f.is_order_level:
                 # 订单级字段：内层取 MAX
                 inner_select.append(f"MAX({f.source}) as {f.name}")
-            elif f.agg_func == "COUNT_DISTINCT":
-                # COUNT_DISTINCT 在内层也需要处理
-                inner_select.append(f"COUNT(DISTINCT {f.source}) as {f.name}")
-            else:
-                inner_select.append(f"{f.agg_func}({f.source}) as {f.name}")
-        
-        inner_group_by = ["order_id"] + group_by_exprs
-        
-        # 外层查询：按分组维度聚合
-        outer_select = []
-        for name in group_by_names:
-            outer_select.append(name)
-        
-        for f in config.fields:
-            if f.is_order_level:
-                # 订单级字段：外层取 SUM
-                outer_select.append(f"SUM({f.name}) as {f.name}")
-            elif f.agg_func == "COUNT_DISTINCT":
-                # COUNT_DISTINCT 在外层取 SUM（因为内层已经去重）
-                outer_select.append(f"SUM({f.name}) as {f.name}")
             else:
-                outer_select.append(f"SUM({f.name}) as {f.name}")
+                inner_select.append(f"{AggregationEngine._aggregate(f)} as {f.name}")
+            # 外层取 SUM（订单级字段按订单求和；COUNT_DISTINCT 内层已去重）
+            outer_select.append(f"SUM({f.name}) as {f.name}")
         
-        # 生成 INSERT 字段列表
-        target_fields = [f.name for f in config.fields]
-        insert_fields = group_by_names + target_fields
-        
-        # 构建完整 SQL
-        sql = f"""
-        INSERT INTO {config.table_name} ({', '.join(insert_fields)})
+        return f"""
         SELECT {', '.join(outer_select)}
         FROM (
             SELECT {', '.join(inner_select)}
             FROM orders
-            WHERE store_name IN ('{store_list}')
-        """
-        
-        if config.filter_condition:
-            sql += f" AND {config.filter_condition}"
-        
-        sql += f"""
+            WHERE {where}
             GROUP BY {', '.join(inner_group_by)}
         ) order_agg
-        GROUP BY {', '.join(group_by_names)}
-        """
-        
-        return sql
-    
-    @staticmethod
-    def _generate_update_sql(config: AggregationConfig, store_list: str) -> str:
-        """根据配置生成 UPDATE SQL（更新派生字段）"""
-        
-        set_clauses = []
-        for df in config.derived_fields:
-            set_clauses.append(f"{df.name} = {df.formula}")
-        
-        sql = f"""
-        UPDATE {config.table_name} SET
-            {', '.join(set_clauses)}
-        WHERE store_name IN ('{store_list}')
+        GROUP BY {', '.join(outer_group_by)}
         """
-        
-        return sql
     
     @staticmethod
     def check_table_exists(table_name: str) -> bool:
@@ -314,9 +475,11 @@ class AggregationEngine:
         session = SessionLocal()
         try:
             sql = f"SELECT COUNT(*) FROM {table_name}"
+            params = {}
             if store_name:
-                sql += f" WHERE store_name = '{store_name}'"
-            result = session.execute(text(sql))
+                sql += " WHERE store_name = :store_name"
+                params["store_name"] = store_name
+            result = session.execute(text(sql), params)
             return result.scalar() or 0
         except:
             return 0
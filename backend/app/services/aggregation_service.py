@@ -29,6 +29,7 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from database.connection import SessionLocal
+from .kpi_query_plan import build_kpi_sql, parse_kpi_row
 
 # 检查预聚合表是否可用
 AGGREGATION_TABLES_AVAILABLE = False
@@ -187,6 +188,43 @@ class AggregationService:
         finally:
             session.close()
     
+    @staticmethod
+    def get_store_overview_raw(
+        store_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        channel: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        从原始订单表计算经营总览（预聚合表不可用时的回退）
+        
+        使用统一 KPI 查询计划（与 DuckDB 路径同一份SQL），一次扫描得到
+        六大核心指标 + GMV + 营销成本
+        """
+        where_clauses = []
+        params = {}
+        if store_name:
+            where_clauses.append("store_name = :store_name")
+            params['store_name'] = store_name
+        if start_date:
+            where_clauses.append("DATE(date) >= :start_date")
+            params['start_date'] = start_date
+        if end_date:
+            where_clauses.append("DATE(date) <= :end_date")
+            params['end_date'] = end_date
+        if channel and channel != 'all':
+            where_clauses.append("channel = :channel")
+            params['channel'] = channel
+        
+        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+        sql = build_kpi_sql("postgresql", "orders", where_sql)
+        
+        session = SessionLocal()
+        try:
+            return parse_kpi_row(session.execute(text(sql), params).fetchone())
+        finally:
+            session.close()
+    
     @staticmethod
     def get_daily_trend(
         store_name: Optional[str] = None,
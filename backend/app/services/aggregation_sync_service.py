@@ -7,17 +7,25 @@
 
 设计原则：
 1. 增量更新：只更新受影响的门店和日期，而不是全量重建
+   导入时记录 (门店, 日期) 脏集合（RefreshScope），每张表只重算脏集合内的分区，
+   以 INSERT ... ON CONFLICT (唯一键) DO UPDATE 写入，范围内不再存在的旧行同一语句删除
+   （唯一键在 aggregation_config 中声明，upsert 语句与 AggregationEngine 共用）
 2. 自动触发：数据变更后自动调用，无需手动干预
-3. 异步执行：不阻塞主请求，后台完成更新
+3. 异步执行：不阻塞主请求，后台完成更新；五张表在独立连接上并行刷新，记录各表耗时
+   每次刷新只扫描一次 orders（订单明细级 UNLOGGED 暂存表），各表从暂存再分组
 4. 配置驱动：表列表从配置文件读取，新增表只需添加配置
 """
 
 import sys
 from pathlib import Path
-from typing import List, Optional, Set
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
 from datetime import date, datetime
 from sqlalchemy import text
+import os
 import threading
+import time
+import uuid
 
 # 添加项目路径
 APP_DIR = Path(__file__).resolve().parent.parent
@@ -28,6 +36,8 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from database.connection import SessionLocal
+from .aggregation_config import get_config
+from .aggregation_engine import AggregationEngine, RefreshScope, build_upsert_sql
 
 # 从配置文件读取预聚合表列表
 try:
@@ -44,9 +54,32 @@ except ImportError:
     ]
 
 
+# 订单级营销费用字段（每个字段取订单内最大值后相加即订单营销成本）
+MARKETING_FIELDS = [
+    'full_reduction', 'product_discount', 'merchant_voucher', 'merchant_share',
+    'gift_amount', 'other_merchant_discount', 'new_customer_discount',
+]
+
+
 class AggregationSyncService:
     """预聚合表自动同步服务"""
     
+    # 并行刷新的连接数（每张表一个连接，不超过表数）
+    REFRESH_WORKERS = int(os.getenv("AGGREGATION_REFRESH_WORKERS", "5"))
+    
+    # 刷新串行执行（并发上传触发的刷新排队，避免同一范围的 upsert/删除互相等待）
+    _refresh_lock = threading.Lock()
+    
+    # 最近一次刷新的结果与各表耗时
+    _last_refresh: Optional[Dict] = None
+    
+    # 订单明细暂存表名前缀（每次刷新一张 UNLOGGED 表，结束后删除）
+    # 表名为 前缀 + 创建时间戳 + 随机后缀，进程崩溃遗留的暂存表在之后的刷新开始时按时间戳清理
+    STAGING_TABLE_PREFIX = "agg_order_lines_"
+    
+    # 超过该时长（秒）的暂存表视为遗留（其他进程正在进行的刷新不会运行这么久）
+    STAGING_MAX_AGE = int(os.getenv("AGGREGATION_STAGING_MAX_AGE", "3600"))
+    
     @staticmethod
     def get_table_list() -> List[str]:
         """获取预聚合表列表（从配置读取）"""
@@ -55,7 +88,7 @@ class AggregationSyncService:
     @staticmethod
     def sync_store_data(store_names: List[str], async_mode: bool = True):
         """
-        同步指定门店的预聚合数据
+        同步指定门店的预聚合数据（全部日期）
         
         Args:
             store_names: 需要同步的门店列表
@@ -63,25 +96,66 @@ class AggregationSyncService:
         """
         if not store_names:
             return
+        AggregationSyncService.sync_dirty(RefreshScope.for_stores(store_names), async_mode=async_mode)
+    
+    @staticmethod
+    def sync_dirty(scope, async_mode: bool = True):
+        """
+        按 (门店, 日期区间) 脏集合增量刷新预聚合表
+        
+        Args:
+            scope: RefreshScope，或 门店 → 日期集合（None 表示该门店全部日期）
+            async_mode: 是否异步执行（默认True，不阻塞主请求）
+        """
+        if not isinstance(scope, RefreshScope):
+            scope = RefreshScope.from_days(scope)
+        if not scope.ranges:
+            return
         
         if async_mode:
             # 异步执行，不阻塞主请求
             thread = threading.Thread(
                 target=AggregationSyncService._do_sync_store_data,
-                args=(store_names,),
+                args=(scope,),
                 daemon=True
             )
             thread.start()
-            print(f"🔄 预聚合表异步更新已启动: {store_names}")
+            print(f"🔄 预聚合表异步更新已启动: {scope.describe()}")
         else:
             # 同步执行
-            AggregationSyncService._do_sync_store_data(store_names)
+            AggregationSyncService._do_sync_store_data(scope)
     
     @staticmethod
-    def _do_sync_store_data(store_names: List[str]):
-        """执行门店数据同步"""
-        session = SessionLocal()
+    def _table_builders() -> List[Tuple[str, Callable]]:
+        """预聚合表 → 重算方法（各表互不依赖，可并行）"""
+        return [
+            ('store_daily_summary', AggregationSyncService._rebuild_store_daily_summary),
+            ('store_hourly_summary', AggregationSyncService._rebuild_store_hourly_summary),
+            ('category_daily_summary', AggregationSyncService._rebuild_category_daily_summary),
+            ('delivery_summary', AggregationSyncService._rebuild_delivery_summary),
+            ('product_daily_summary', AggregationSyncService._rebuild_product_daily_summary),
+        ]
+    
+    @staticmethod
+    def _do_sync_store_data(scope: RefreshScope):
+        """
+        执行预聚合刷新：只重算脏集合内的分区
+        
+        - 每张表一条语句完成：重算结果 INSERT ... ON CONFLICT 更新，
+          范围内未被本次结果覆盖的旧行（如某渠道数据已删除）同一语句内删除，
+          读取方不会看到删除后、插入前的空数据
+        - 五张表互不依赖，在连接池的独立连接上并行刷新，各自一个事务
+        - 同一时间只执行一次刷新（多次上传触发的刷新排队执行）
+        """
+        with AggregationSyncService._refresh_lock:
+            AggregationSyncService._run_refresh(scope)
+    
+    @staticmethod
+    def _run_refresh(scope: RefreshScope):
         sync_errors = []  # 收集同步错误
+        started_at = datetime.now()
+        start = time.perf_counter()
+        tables: Dict[str, Dict] = {}
         
         try:
             # 0. 先验证并修复表结构
@@ -95,52 +169,35 @@ class AggregationSyncService:
             except ImportError:
                 pass  # 验证器不存在时跳过
             
+            builders = AggregationSyncService._table_builders()
+            workers = max(1, min(AggregationSyncService.REFRESH_WORKERS, len(builders)))
             print(f"\n{'='*60}")
-            print(f"🔄 开始同步预聚合表: {store_names}")
-            print(f"   📋 表列表: {AGGREGATION_TABLES}")
+            print(f"🔄 开始增量刷新预聚合表: {scope.describe()}")
+            print(f"   📋 表列表: {AGGREGATION_TABLES}（{workers} 个并行连接）")
             print(f"{'='*60}")
             
-            for store_name in store_names:
-                # 1. 删除该门店的旧预聚合数据
-                for table in AGGREGATION_TABLES:
-                    try:
-                        result = session.execute(
-                            text(f"DELETE FROM {table} WHERE store_name = :store_name"),
-                            {"store_name": store_name}
-                        )
-                        if result.rowcount > 0:
-                            print(f"   🗑️ {table}: 删除 {result.rowcount} 条")
-                    except Exception as e:
-                        print(f"   ⚠️ {table}: {e}")
-                
-                session.commit()
-            
-            # 2. 重新生成这些门店的预聚合数据
-            # 使用手写 SQL，同步失败时记录错误
-            try:
-                AggregationSyncService._rebuild_store_daily_summary(session, store_names)
-            except Exception as e:
-                sync_errors.append(f"store_daily_summary: {e}")
-            
-            try:
-                AggregationSyncService._rebuild_store_hourly_summary(session, store_names)
-            except Exception as e:
-                sync_errors.append(f"store_hourly_summary: {e}")
-            
-            try:
-                AggregationSyncService._rebuild_category_daily_summary(session, store_names)
-            except Exception as e:
-                sync_errors.append(f"category_daily_summary: {e}")
+            # 扫描一次 orders 物化订单明细暂存，各表从暂存再分组
+            AggregationSyncService._drop_leftover_staging()
+            source = AggregationSyncService._stage_order_lines(scope)
             
+            # 按脏集合重算并 upsert，每张表独立连接、独立事务（失败时记录错误）
             try:
-                AggregationSyncService._rebuild_delivery_summary(session, store_names)
-            except Exception as e:
-                sync_errors.append(f"delivery_summary: {e}")
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agg-refresh") as pool:
+                    futures = {
+                        pool.submit(AggregationSyncService._refresh_table, table, rebuild, scope, source): table
+                        for table, rebuild in builders
+                    }
+                    for future in as_completed(futures):
+                        result = future.result()
+                        tables[futures[future]] = result
+                        if result.get("error"):
+                            sync_errors.append(f"{futures[future]}: {result['error']}")
+            finally:
+                AggregationSyncService._drop_staging(source)
             
-            try:
-                AggregationSyncService._rebuild_product_daily_summary(session, store_names)
-            except Exception as e:
-                sync_errors.append(f"product_daily_summary: {e}")
+            print(f"   ⏱️ 各表耗时: " + ", ".join(
+                f"{table} {tables[table]['seconds']:.2f}s" for table, _ in builders
+            ) + f"，总计 {time.perf_counter() - start:.2f}s")
             
             # 检查是否有同步错误
             if sync_errors:
@@ -149,9 +206,7 @@ class AggregationSyncService:
                     print(f"   - {err}")
                 raise Exception(f"预聚合表同步失败: {len(sync_errors)} 个表出错")
             
-            print(f"   ✅ 使用手写 SQL 同步")
-            
-            print(f"\n✅ 预聚合表同步完成: {store_names}")
+            print(f"\n✅ 预聚合表同步完成: {scope.store_names}")
             
             # 同步完成后，刷新预聚合表可用性状态
             try:
@@ -163,59 +218,244 @@ class AggregationSyncService:
             
             # 清除缓存，确保下次查询获取最新数据
             try:
-                AggregationSyncService._clear_all_caches(store_names)
+                AggregationSyncService._clear_all_caches(scope.store_names)
             except Exception as e:
                 print(f"   ⚠️ 清除缓存失败: {e}")
             
         except Exception as e:
             print(f"❌ 预聚合表同步失败: {e}")
+        finally:
+            AggregationSyncService._last_refresh = {
+                "started_at": started_at.isoformat(),
+                "scope": scope.describe(),
+                "seconds": round(time.perf_counter() - start, 3),
+                "success": not sync_errors and len(tables) == len(AggregationSyncService._table_builders()),
+                "tables": tables,
+            }
+    
+    @staticmethod
+    def _refresh_table(table: str, rebuild: Callable, scope: RefreshScope, source: str) -> Dict:
+        """
+        在独立的连接上刷新一张预聚合表（source 为订单明细暂存表或等价子查询）
+        
+        Returns:
+            {"written", "removed", "seconds"}，失败时 {"error", "seconds"}
+        """
+        session = SessionLocal()
+        start = time.perf_counter()
+        try:
+            written, removed = rebuild(session, scope, source)
+            return {"written": written, "removed": removed, "seconds": round(time.perf_counter() - start, 3)}
+        except Exception as e:
+            return {"error": str(e), "seconds": round(time.perf_counter() - start, 3)}
+        finally:
+            session.close()
+    
+    @staticmethod
+    def get_last_refresh() -> Optional[Dict]:
+        """最近一次预聚合刷新的范围、结果和各表耗时"""
+        return AggregationSyncService._last_refresh
+    
+    @staticmethod
+    def _upsert(session, table: str, columns: List[str], select_sql: str, scope: RefreshScope, params: Dict):
+        """
+        范围内 upsert：一条语句完成重算结果的写入与旧行清理（语句由 build_upsert_sql 生成，
+        唯一键与汇总日期列取自 aggregation_config）
+        
+        Args:
+            select_sql: 重算查询（输出列与 columns 一致，源数据已按 scope 过滤）
+            params: select_sql 的绑定参数（scope.where 生成，参数名与目标表条件共用）
+        
+        Returns:
+            (写入行数, 清理行数)
+        """
+        config = get_config(table)
+        target_where, _ = scope.where(config.date_column)
+        sql = build_upsert_sql(
+            table, columns, config.key_columns(), select_sql, target_where,
+            AggregationEngine.ensure_unique_key(table)
+        )
+        
+        try:
+            written, removed = session.execute(text(sql), params).one()
+            session.commit()
+            print(f"   ✅ {table}: 写入 {written} 条，清理 {removed} 条")
+            return written, removed
+        except Exception as e:
+            print(f"   ❌ {table}: {e}")
+            session.rollback()
+            raise
+    
+    @staticmethod
+    def _marketing_cost(prefix: str = "") -> str:
+        """订单营销成本：各营销字段取订单内最大值后相加"""
+        return " + ".join(f"MAX({prefix}{c})" for c in MARKETING_FIELDS)
+    
+    @staticmethod
+    def _order_lines_sql(where: str) -> str:
+        """
+        订单明细级暂存的查询：orders 按 (门店, 日期, 小时, 订单, 渠道, 分类, 商品) 分组
+        
+        - 商品级金额（实收/原价/成本/利润/销量）求和，品类/商品汇总直接再分组
+        - 订单级费用（配送费、各营销字段等）取最大值，订单内再取 MAX 与直接从 orders 取一致
+        - gmv_* 只统计 original_price > 0 的明细（对应原 gmv_order_level 的筛选）
+        """
+        marketing = ",\n            ".join(f"MAX(COALESCE({c}, 0)) AS {c}" for c in MARKETING_FIELDS)
+        marketing_gmv = ",\n            ".join(
+            f"MAX(COALESCE({c}, 0)) FILTER (WHERE original_price > 0) AS gmv_{c}" for c in MARKETING_FIELDS
+        )
+        return f"""
+        SELECT 
+            store_name,
+            DATE(date) AS order_date,
+            EXTRACT(HOUR FROM date)::INTEGER AS hour_of_day,
+            order_id,
+            channel,
+            category_level1,
+            category_level3,
+            product_name,
+            SUM(COALESCE(actual_price, 0) * COALESCE(quantity, 1)) AS revenue,
+            SUM(COALESCE(original_price, 0) * COALESCE(quantity, 1)) AS original_sales,
+            SUM(COALESCE(cost, 0) * COALESCE(quantity, 1)) AS cost_total,
+            SUM(COALESCE(profit, 0)) AS profit,
+            SUM(COALESCE(quantity, 1)) AS quantity,
+            SUM(COALESCE(platform_service_fee, 0)) AS platform_fee,
+            SUM(COALESCE(corporate_rebate, 0)) AS rebate_sum,
+            MAX(COALESCE(corporate_rebate, 0)) AS rebate_max,
+            MAX(COALESCE(delivery_fee, 0)) AS delivery_fee,
+            MAX(COALESCE(user_paid_delivery_fee, 0)) AS user_paid_delivery,
+            MAX(COALESCE(delivery_discount, 0)) AS delivery_discount,
+            MAX(COALESCE(delivery_distance, 0)) AS distance,
+            {marketing},
+            BOOL_OR(quantity > 0) AS has_positive_qty,
+            BOOL_OR(original_price > 0) AS has_gmv,
+            SUM(COALESCE(original_price, 0) * COALESCE(quantity, 1)) FILTER (WHERE original_price > 0) AS gmv_original_sales,
+            MAX(COALESCE(packaging_fee, 0)) FILTER (WHERE original_price > 0) AS gmv_packaging_fee,
+            MAX(COALESCE(user_paid_delivery_fee, 0)) FILTER (WHERE original_price > 0) AS gmv_user_paid_delivery,
+            {marketing_gmv}
+        FROM orders
+        WHERE {where}
+        GROUP BY 1, 2, 3, 4, 5, 6, 7, 8
+        """
+    
+    @staticmethod
+    def _stage_order_lines(scope: RefreshScope) -> str:
+        """
+        扫描一次 orders，把脏集合范围的订单明细级数据物化为 UNLOGGED 暂存表
+        
+        五张汇总表都从暂存表再分组（orders 扫描从每次刷新约 7 次降为 1 次）。
+        各表在不同连接上并行刷新，临时表（TEMP）跨连接不可见，因此用普通 UNLOGGED 表，刷新结束后删除。
+        创建失败时返回等价的子查询，各表各自扫描 orders（结果不变），
+        子查询的绑定参数与各表 upsert 语句共用（均来自 scope.where）。
+        
+        Returns:
+            各表查询的 FROM 来源（暂存表名或子查询）
+        """
+        where, params = scope.where("date")
+        select_sql = AggregationSyncService._order_lines_sql(where)
+        staging = f"{AggregationSyncService.STAGING_TABLE_PREFIX}{int(time.time())}_{uuid.uuid4().hex[:8]}"
+        
+        session = SessionLocal()
+        start = time.perf_counter()
+        try:
+            session.execute(text(f"CREATE UNLOGGED TABLE {staging} AS {select_sql}"), params)
+            session.execute(text(f"ANALYZE {staging}"))
+            session.commit()
+            rows = session.execute(text(f"SELECT COUNT(*) FROM {staging}")).scalar()
+            print(f"   📦 订单明细暂存: {rows:,} 行，{time.perf_counter() - start:.2f}s")
+            return staging
+        except Exception as e:
+            session.rollback()
+            print(f"   ⚠️ 订单明细暂存表创建失败，各表直接扫描 orders: {str(e)[:100]}")
+            return f"({select_sql})"
+        finally:
+            session.close()
+    
+    @staticmethod
+    def _drop_leftover_staging():
+        """
+        删除进程崩溃遗留的订单明细暂存表（刷新开始时调用）
+        
+        只删除创建时间超过 STAGING_MAX_AGE 的表，其他进程正在使用的暂存表不受影响；
+        表名中没有时间戳的（旧版本创建）一律视为遗留。
+        """
+        prefix = AggregationSyncService.STAGING_TABLE_PREFIX
+        cutoff = time.time() - AggregationSyncService.STAGING_MAX_AGE
+        session = SessionLocal()
+        try:
+            names = session.execute(
+                text("SELECT tablename FROM pg_tables WHERE tablename LIKE :pattern"),
+                {"pattern": prefix.replace("_", r"\_") + "%"}
+            ).scalars().all()
+            leftovers = []
+            for name in names:
+                created, _, suffix = name[len(prefix):].partition("_")
+                if not suffix or not created.isdigit() or int(created) < cutoff:
+                    leftovers.append(name)
+            for name in leftovers:
+                session.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            session.commit()
+            if leftovers:
+                print(f"   🧹 已删除遗留暂存表 {len(leftovers)} 张")
+        except Exception as e:
+            session.rollback()
+            print(f"   ⚠️ 清理遗留暂存表失败: {e}")
+        finally:
+            session.close()
+    
+    @staticmethod
+    def _drop_staging(source: str):
+        """删除订单明细暂存表（子查询来源无需处理）"""
+        if not source.startswith(AggregationSyncService.STAGING_TABLE_PREFIX):
+            return
+        session = SessionLocal()
+        try:
+            session.execute(text(f"DROP TABLE IF EXISTS {source}"))
+            session.commit()
+        except Exception as e:
             session.rollback()
+            print(f"   ⚠️ 删除暂存表 {source} 失败: {e}")
         finally:
             session.close()
     
     @staticmethod
-    def _rebuild_store_daily_summary(session, store_names: List[str]):
-        """重建门店日汇总表"""
-        store_list = "', '".join(store_names)
+    def _rebuild_store_daily_summary(session, scope: RefreshScope, source: str):
+        """重算门店日汇总表（脏集合范围内，来源为订单明细暂存）"""
+        _, params = scope.where("date")
+        marketing = AggregationSyncService._marketing_cost()
+        marketing_gmv = AggregationSyncService._marketing_cost("gmv_")
         
         sql = f"""
         WITH order_level AS (
             SELECT 
                 store_name,
-                DATE(date) as order_date,
+                order_date,
                 order_id,
                 channel,
-                SUM(COALESCE(actual_price, 0) * COALESCE(quantity, 1)) as order_revenue,
-                SUM(COALESCE(profit, 0)) as order_profit_raw,
-                SUM(COALESCE(platform_service_fee, 0)) as order_platform_fee,
-                SUM(COALESCE(corporate_rebate, 0)) as order_corporate_rebate,
-                MAX(COALESCE(delivery_fee, 0)) as order_delivery_fee,
-                MAX(COALESCE(user_paid_delivery_fee, 0)) as order_user_paid_delivery,
-                MAX(COALESCE(delivery_discount, 0)) as order_delivery_discount,
-                MAX(COALESCE(full_reduction, 0)) + MAX(COALESCE(product_discount, 0)) + 
-                MAX(COALESCE(merchant_voucher, 0)) + MAX(COALESCE(merchant_share, 0)) + 
-                MAX(COALESCE(gift_amount, 0)) + MAX(COALESCE(other_merchant_discount, 0)) + 
-                MAX(COALESCE(new_customer_discount, 0)) as order_marketing_cost
-            FROM orders
-            WHERE store_name IN ('{store_list}')
-            GROUP BY store_name, DATE(date), order_id, channel
+                SUM(revenue) as order_revenue,
+                SUM(profit) as order_profit_raw,
+                SUM(platform_fee) as order_platform_fee,
+                SUM(rebate_sum) as order_corporate_rebate,
+                MAX(delivery_fee) as order_delivery_fee,
+                MAX(user_paid_delivery) as order_user_paid_delivery,
+                MAX(delivery_discount) as order_delivery_discount,
+                {marketing} as order_marketing_cost
+            FROM {source} lines
+            GROUP BY store_name, order_date, order_id, channel
         ),
         gmv_order_level AS (
             SELECT 
                 store_name,
-                DATE(date) as order_date,
+                order_date,
                 order_id,
                 channel,
-                SUM(COALESCE(original_price, 0) * COALESCE(quantity, 1)) as order_original_price_sales,
-                MAX(COALESCE(packaging_fee, 0)) as order_packaging_fee,
-                MAX(COALESCE(user_paid_delivery_fee, 0)) as order_user_paid_delivery_gmv,
-                MAX(COALESCE(full_reduction, 0)) + MAX(COALESCE(product_discount, 0)) + 
-                MAX(COALESCE(merchant_voucher, 0)) + MAX(COALESCE(merchant_share, 0)) + 
-                MAX(COALESCE(gift_amount, 0)) + MAX(COALESCE(other_merchant_discount, 0)) + 
-                MAX(COALESCE(new_customer_discount, 0)) as order_marketing_cost_gmv
-            FROM orders
-            WHERE store_name IN ('{store_list}') AND original_price > 0
-            GROUP BY store_name, DATE(date), order_id, channel
+                SUM(gmv_original_sales) as order_original_price_sales,
+                MAX(gmv_packaging_fee) as order_packaging_fee,
+                MAX(gmv_user_paid_delivery) as order_user_paid_delivery_gmv,
+                {marketing_gmv} as order_marketing_cost_gmv
+            FROM {source} lines
+            WHERE has_gmv
+            GROUP BY store_name, order_date, order_id, channel
         ),
         gmv_daily AS (
             SELECT 
@@ -240,95 +480,75 @@ class AggregationSyncService:
         daily_products AS (
             SELECT 
                 store_name,
-                DATE(date) as order_date,
+                order_date,
                 COUNT(DISTINCT product_name) as active_products
-            FROM orders
-            WHERE store_name IN ('{store_list}') AND quantity > 0
-            GROUP BY store_name, DATE(date)
-        )
-        INSERT INTO store_daily_summary (
-            store_name, summary_date, channel, order_count, 
-            total_revenue, total_profit, total_delivery_fee,
-            total_user_paid_delivery, total_delivery_discount,
-            total_corporate_rebate, total_marketing_cost, total_platform_fee,
-            active_products, gmv
+            FROM {source} lines
+            WHERE has_positive_qty
+            GROUP BY store_name, order_date
+        ),
+        summary AS (
+            SELECT 
+                f.store_name, 
+                f.order_date as summary_date, 
+                f.channel,
+                COUNT(DISTINCT f.order_id) as order_count,
+                SUM(f.order_revenue) as total_revenue,
+                SUM(f.order_actual_profit) as total_profit,
+                SUM(f.order_delivery_fee) as total_delivery_fee,
+                SUM(f.order_user_paid_delivery) as total_user_paid_delivery,
+                SUM(f.order_delivery_discount) as total_delivery_discount,
+                SUM(f.order_corporate_rebate) as total_corporate_rebate,
+                COALESCE(g.daily_marketing_cost, 0) as total_marketing_cost,
+                SUM(f.order_platform_fee) as total_platform_fee,
+                COALESCE(dp.active_products, 0) as active_products,
+                COALESCE(g.daily_gmv, 0) as gmv
+            FROM filtered_orders f
+            LEFT JOIN daily_products dp ON f.store_name = dp.store_name AND f.order_date = dp.order_date
+            LEFT JOIN gmv_daily g ON f.store_name = g.store_name AND f.order_date = g.order_date AND f.channel = g.channel
+            GROUP BY f.store_name, f.order_date, f.channel, dp.active_products, g.daily_gmv, g.daily_marketing_cost
         )
         SELECT 
-            f.store_name, 
-            f.order_date, 
-            f.channel,
-            COUNT(DISTINCT f.order_id) as order_count,
-            SUM(f.order_revenue) as total_revenue,
-            SUM(f.order_actual_profit) as total_profit,
-            SUM(f.order_delivery_fee) as total_delivery_fee,
-            SUM(f.order_user_paid_delivery) as total_user_paid_delivery,
-            SUM(f.order_delivery_discount) as total_delivery_discount,
-            SUM(f.order_corporate_rebate) as total_corporate_rebate,
-            COALESCE(g.daily_marketing_cost, 0) as total_marketing_cost,
-            SUM(f.order_platform_fee) as total_platform_fee,
-            COALESCE(dp.active_products, 0) as active_products,
-            COALESCE(g.daily_gmv, 0) as gmv
-        FROM filtered_orders f
-        LEFT JOIN daily_products dp ON f.store_name = dp.store_name AND f.order_date = dp.order_date
-        LEFT JOIN gmv_daily g ON f.store_name = g.store_name AND f.order_date = g.order_date AND f.channel = g.channel
-        GROUP BY f.store_name, f.order_date, f.channel, dp.active_products, g.daily_gmv, g.daily_marketing_cost
+            s.*,
+            CASE WHEN order_count > 0 THEN total_revenue / order_count ELSE 0 END as avg_order_value,
+            CASE WHEN total_revenue > 0 THEN total_profit / total_revenue * 100 ELSE 0 END as profit_margin,
+            total_delivery_fee - total_user_paid_delivery + total_delivery_discount - total_corporate_rebate as delivery_net_cost
+        FROM summary s
         """
         
-        try:
-            session.execute(text(sql))
-            
-            # 更新派生字段
-            session.execute(text(f"""
-                UPDATE store_daily_summary SET
-                    avg_order_value = CASE WHEN order_count > 0 THEN total_revenue / order_count ELSE 0 END,
-                    profit_margin = CASE WHEN total_revenue > 0 THEN total_profit / total_revenue * 100 ELSE 0 END,
-                    delivery_net_cost = total_delivery_fee - total_user_paid_delivery + total_delivery_discount - total_corporate_rebate
-                WHERE store_name IN ('{store_list}')
-            """))
-            
-            session.commit()
-            
-            result = session.execute(text(f"SELECT COUNT(*) FROM store_daily_summary WHERE store_name IN ('{store_list}')"))
-            count = result.scalar()
-            print(f"   ✅ store_daily_summary: {count} 条")
-        except Exception as e:
-            print(f"   ❌ store_daily_summary: {e}")
-            session.rollback()
+        return AggregationSyncService._upsert(session, 'store_daily_summary', [
+            'store_name', 'summary_date', 'channel', 'order_count',
+            'total_revenue', 'total_profit', 'total_delivery_fee',
+            'total_user_paid_delivery', 'total_delivery_discount',
+            'total_corporate_rebate', 'total_marketing_cost', 'total_platform_fee',
+            'active_products', 'gmv', 'avg_order_value', 'profit_margin', 'delivery_net_cost',
+        ], sql, scope, params)
     
     @staticmethod
-    def _rebuild_store_hourly_summary(session, store_names: List[str]):
-        """重建门店小时汇总表"""
-        store_list = "', '".join(store_names)
+    def _rebuild_store_hourly_summary(session, scope: RefreshScope, source: str):
+        """重算门店小时汇总表（脏集合范围内，来源为订单明细暂存）"""
+        _, params = scope.where("date")
+        marketing = AggregationSyncService._marketing_cost()
         
         sql = f"""
         WITH order_level AS (
             SELECT 
                 store_name,
-                DATE(date) as order_date,
-                EXTRACT(HOUR FROM date)::INTEGER as hour_of_day,
+                order_date,
+                hour_of_day,
                 order_id,
                 channel,
-                SUM(COALESCE(actual_price, 0) * COALESCE(quantity, 1)) as order_revenue,
-                SUM(COALESCE(profit, 0)) as order_profit,
-                MAX(COALESCE(delivery_fee, 0)) as order_delivery_fee,
-                MAX(COALESCE(user_paid_delivery_fee, 0)) - MAX(COALESCE(delivery_discount, 0)) as user_net_delivery,
-                MAX(COALESCE(corporate_rebate, 0)) as order_corporate_rebate,
-                MAX(COALESCE(full_reduction, 0)) + MAX(COALESCE(product_discount, 0)) + 
-                MAX(COALESCE(merchant_voucher, 0)) + MAX(COALESCE(merchant_share, 0)) + 
-                MAX(COALESCE(gift_amount, 0)) + MAX(COALESCE(other_merchant_discount, 0)) + 
-                MAX(COALESCE(new_customer_discount, 0)) as order_marketing_cost
-            FROM orders
-            WHERE store_name IN ('{store_list}')
-            GROUP BY store_name, DATE(date), EXTRACT(HOUR FROM date), order_id, channel
-        )
-        INSERT INTO store_hourly_summary (
-            store_name, summary_date, hour_of_day, channel,
-            order_count, total_revenue, total_profit, total_delivery_fee,
-            delivery_net_cost, total_marketing_cost
+                SUM(revenue) as order_revenue,
+                SUM(profit) as order_profit,
+                MAX(delivery_fee) as order_delivery_fee,
+                MAX(user_paid_delivery) - MAX(delivery_discount) as user_net_delivery,
+                MAX(rebate_max) as order_corporate_rebate,
+                {marketing} as order_marketing_cost
+            FROM {source} lines
+            GROUP BY store_name, order_date, hour_of_day, order_id, channel
         )
         SELECT 
             store_name, 
-            order_date, 
+            order_date as summary_date, 
             hour_of_day,
             channel,
             COUNT(DISTINCT order_id) as order_count,
@@ -341,195 +561,154 @@ class AggregationSyncService:
         GROUP BY store_name, order_date, hour_of_day, channel
         """
         
-        try:
-            session.execute(text(sql))
-            session.commit()
-            
-            result = session.execute(text(f"SELECT COUNT(*) FROM store_hourly_summary WHERE store_name IN ('{store_list}')"))
-            count = result.scalar()
-            print(f"   ✅ store_hourly_summary: {count} 条")
-        except Exception as e:
-            print(f"   ❌ store_hourly_summary: {e}")
-            session.rollback()
+        return AggregationSyncService._upsert(session, 'store_hourly_summary', [
+            'store_name', 'summary_date', 'hour_of_day', 'channel',
+            'order_count', 'total_revenue', 'total_profit', 'total_delivery_fee',
+            'delivery_net_cost', 'total_marketing_cost',
+        ], sql, scope, params)
     
     @staticmethod
-    def _rebuild_category_daily_summary(session, store_names: List[str]):
-        """重建品类日汇总表"""
-        store_list = "', '".join(store_names)
+    def _rebuild_category_daily_summary(session, scope: RefreshScope, source: str):
+        """重算品类日汇总表（脏集合范围内，来源为订单明细暂存）"""
+        _, params = scope.where("date")
         
         sql = f"""
-        INSERT INTO category_daily_summary (
-            store_name, summary_date, category_level1, category_level3, channel,
-            order_count, product_count, total_quantity, total_revenue, 
-            total_original_price, total_cost, total_profit
+        WITH summary AS (
+            SELECT 
+                store_name,
+                order_date as summary_date,
+                category_level1,
+                category_level3,
+                channel,
+                COUNT(DISTINCT order_id) as order_count,
+                COUNT(DISTINCT product_name) as product_count,
+                SUM(quantity) as total_quantity,
+                SUM(revenue) as total_revenue,
+                SUM(original_sales) as total_original_price,
+                SUM(cost_total) as total_cost,
+                SUM(profit) as total_profit
+            FROM {source} lines
+            GROUP BY store_name, order_date, category_level1, category_level3, channel
         )
         SELECT 
-            store_name,
-            DATE(date) as summary_date,
-            category_level1,
-            category_level3,
-            channel,
-            COUNT(DISTINCT order_id) as order_count,
-            COUNT(DISTINCT product_name) as product_count,
-            SUM(COALESCE(quantity, 1)) as total_quantity,
-            SUM(COALESCE(actual_price, 0) * COALESCE(quantity, 1)) as total_revenue,
-            SUM(COALESCE(original_price, 0) * COALESCE(quantity, 1)) as total_original_price,
-            SUM(COALESCE(cost, 0) * COALESCE(quantity, 1)) as total_cost,
-            SUM(COALESCE(profit, 0)) as total_profit
-        FROM orders
-        WHERE store_name IN ('{store_list}')
-        GROUP BY store_name, DATE(date), category_level1, category_level3, channel
+            s.*,
+            CASE WHEN total_original_price > 0 
+                THEN (1 - total_revenue / total_original_price) * 10 ELSE 0 END as avg_discount,
+            CASE WHEN total_revenue > 0 
+                THEN total_profit / total_revenue * 100 ELSE 0 END as profit_margin
+        FROM summary s
         """
         
-        try:
-            session.execute(text(sql))
-            
-            # 更新派生字段
-            session.execute(text(f"""
-                UPDATE category_daily_summary SET
-                    avg_discount = CASE WHEN total_original_price > 0 
-                        THEN (1 - total_revenue / total_original_price) * 10 ELSE 0 END,
-                    profit_margin = CASE WHEN total_revenue > 0 
-                        THEN total_profit / total_revenue * 100 ELSE 0 END
-                WHERE store_name IN ('{store_list}')
-            """))
-            
-            session.commit()
-            
-            result = session.execute(text(f"SELECT COUNT(*) FROM category_daily_summary WHERE store_name IN ('{store_list}')"))
-            count = result.scalar()
-            print(f"   ✅ category_daily_summary: {count} 条")
-        except Exception as e:
-            print(f"   ❌ category_daily_summary: {e}")
-            session.rollback()
+        return AggregationSyncService._upsert(session, 'category_daily_summary', [
+            'store_name', 'summary_date', 'category_level1', 'category_level3', 'channel',
+            'order_count', 'product_count', 'total_quantity', 'total_revenue',
+            'total_original_price', 'total_cost', 'total_profit', 'avg_discount', 'profit_margin',
+        ], sql, scope, params)
     
     @staticmethod
-    def _rebuild_delivery_summary(session, store_names: List[str]):
-        """重建配送分析汇总表"""
-        store_list = "', '".join(store_names)
+    def _rebuild_delivery_summary(session, scope: RefreshScope, source: str):
+        """重算配送分析汇总表（脏集合范围内，来源为订单明细暂存）"""
+        _, params = scope.where("date")
         
         sql = f"""
         WITH order_level AS (
             SELECT 
                 store_name,
-                DATE(date) as order_date,
-                EXTRACT(HOUR FROM date)::INTEGER as hour_of_day,
+                order_date,
+                hour_of_day,
                 order_id,
                 channel,
-                MAX(COALESCE(delivery_distance, 0)) as distance,
-                SUM(COALESCE(actual_price, 0) * COALESCE(quantity, 1)) as order_revenue,
-                MAX(COALESCE(delivery_fee, 0)) as delivery_fee,
-                MAX(COALESCE(user_paid_delivery_fee, 0)) as user_paid,
-                MAX(COALESCE(delivery_discount, 0)) as discount,
-                MAX(COALESCE(corporate_rebate, 0)) as rebate
-            FROM orders
-            WHERE store_name IN ('{store_list}')
-            GROUP BY store_name, DATE(date), EXTRACT(HOUR FROM date), order_id, channel
-        )
-        INSERT INTO delivery_summary (
-            store_name, summary_date, hour_of_day, distance_band, channel,
-            order_count, total_revenue, delivery_net_cost, high_delivery_count
+                MAX(distance) as distance,
+                SUM(revenue) as order_revenue,
+                MAX(delivery_fee) as delivery_fee,
+                MAX(user_paid_delivery) as user_paid,
+                MAX(delivery_discount) as discount,
+                MAX(rebate_max) as rebate
+            FROM {source} lines
+            GROUP BY store_name, order_date, hour_of_day, order_id, channel
+        ),
+        banded AS (
+            SELECT 
+                o.*,
+                CASE 
+                    WHEN distance < 1 THEN '0-1km'
+                    WHEN distance < 2 THEN '1-2km'
+                    WHEN distance < 3 THEN '2-3km'
+                    WHEN distance < 4 THEN '3-4km'
+                    WHEN distance < 5 THEN '4-5km'
+                    ELSE '5km+'
+                END as distance_band
+            FROM order_level o
+        ),
+        summary AS (
+            SELECT 
+                store_name,
+                order_date as summary_date,
+                hour_of_day,
+                distance_band,
+                channel,
+                COUNT(DISTINCT order_id) as order_count,
+                SUM(order_revenue) as total_revenue,
+                SUM(delivery_fee - user_paid + discount - rebate) as delivery_net_cost,
+                SUM(CASE WHEN (delivery_fee - user_paid + discount - rebate) > 5 THEN 1 ELSE 0 END) as high_delivery_count
+            FROM banded
+            GROUP BY store_name, order_date, hour_of_day, distance_band, channel
         )
         SELECT 
-            store_name,
-            order_date,
-            hour_of_day,
-            CASE 
-                WHEN distance < 1 THEN '0-1km'
-                WHEN distance < 2 THEN '1-2km'
-                WHEN distance < 3 THEN '2-3km'
-                WHEN distance < 4 THEN '3-4km'
-                WHEN distance < 5 THEN '4-5km'
-                ELSE '5km+'
-            END as distance_band,
-            channel,
-            COUNT(DISTINCT order_id) as order_count,
-            SUM(order_revenue) as total_revenue,
-            SUM(delivery_fee - user_paid + discount - rebate) as delivery_net_cost,
-            SUM(CASE WHEN (delivery_fee - user_paid + discount - rebate) > 5 THEN 1 ELSE 0 END) as high_delivery_count
-        FROM order_level
-        GROUP BY store_name, order_date, hour_of_day, 
-            CASE 
-                WHEN distance < 1 THEN '0-1km'
-                WHEN distance < 2 THEN '1-2km'
-                WHEN distance < 3 THEN '2-3km'
-                WHEN distance < 4 THEN '3-4km'
-                WHEN distance < 5 THEN '4-5km'
-                ELSE '5km+'
-            END,
-            channel
+            s.*,
+            CASE WHEN order_count > 0 THEN delivery_net_cost / order_count ELSE 0 END as avg_delivery_fee,
+            CASE distance_band
+                WHEN '0-1km' THEN 0 WHEN '1-2km' THEN 1 WHEN '2-3km' THEN 2
+                WHEN '3-4km' THEN 3 WHEN '4-5km' THEN 4 ELSE 5 END as distance_min,
+            CASE distance_band
+                WHEN '0-1km' THEN 1 WHEN '1-2km' THEN 2 WHEN '2-3km' THEN 3
+                WHEN '3-4km' THEN 4 WHEN '4-5km' THEN 5 ELSE 10 END as distance_max
+        FROM summary s
         """
         
-        try:
-            session.execute(text(sql))
-            
-            # 更新派生字段
-            session.execute(text(f"""
-                UPDATE delivery_summary SET
-                    avg_delivery_fee = CASE WHEN order_count > 0 THEN delivery_net_cost / order_count ELSE 0 END,
-                    distance_min = CASE distance_band
-                        WHEN '0-1km' THEN 0 WHEN '1-2km' THEN 1 WHEN '2-3km' THEN 2
-                        WHEN '3-4km' THEN 3 WHEN '4-5km' THEN 4 ELSE 5 END,
-                    distance_max = CASE distance_band
-                        WHEN '0-1km' THEN 1 WHEN '1-2km' THEN 2 WHEN '2-3km' THEN 3
-                        WHEN '3-4km' THEN 4 WHEN '4-5km' THEN 5 ELSE 10 END
-                WHERE store_name IN ('{store_list}')
-            """))
-            
-            session.commit()
-            
-            result = session.execute(text(f"SELECT COUNT(*) FROM delivery_summary WHERE store_name IN ('{store_list}')"))
-            count = result.scalar()
-            print(f"   ✅ delivery_summary: {count} 条")
-        except Exception as e:
-            print(f"   ❌ delivery_summary: {e}")
-            session.rollback()
+        return AggregationSyncService._upsert(session, 'delivery_summary', [
+            'store_name', 'summary_date', 'hour_of_day', 'distance_band', 'channel',
+            'order_count', 'total_revenue', 'delivery_net_cost', 'high_delivery_count',
+            'avg_delivery_fee', 'distance_min', 'distance_max',
+        ], sql, scope, params)
     
     @staticmethod
-    def _rebuild_product_daily_summary(session, store_names: List[str]):
-        """重建商品日汇总表"""
-        store_list = "', '".join(store_names)
+    def _rebuild_product_daily_summary(session, scope: RefreshScope, source: str):
+        """
+        重算商品日汇总表（脏集合范围内，来源为订单明细暂存）
+        
+        按唯一键 (门店, 日期, 商品, 渠道) 分组，一级分类取 MAX（同一商品跨分类时保证一行一个键）
+        """
+        _, params = scope.where("date")
         
         sql = f"""
-        INSERT INTO product_daily_summary (
-            store_name, summary_date, product_name, category_level1, channel,
-            order_count, total_quantity, total_revenue, total_cost, total_profit
+        WITH summary AS (
+            SELECT 
+                store_name,
+                order_date as summary_date,
+                product_name,
+                MAX(category_level1) as category_level1,
+                channel,
+                COUNT(DISTINCT order_id) as order_count,
+                SUM(quantity) as total_quantity,
+                SUM(revenue) as total_revenue,
+                SUM(cost_total) as total_cost,
+                SUM(profit) as total_profit
+            FROM {source} lines
+            GROUP BY store_name, order_date, product_name, channel
         )
         SELECT 
-            store_name,
-            DATE(date) as summary_date,
-            product_name,
-            category_level1,
-            channel,
-            COUNT(DISTINCT order_id) as order_count,
-            SUM(COALESCE(quantity, 1)) as total_quantity,
-            SUM(COALESCE(actual_price, 0) * COALESCE(quantity, 1)) as total_revenue,
-            SUM(COALESCE(cost, 0) * COALESCE(quantity, 1)) as total_cost,
-            SUM(COALESCE(profit, 0)) as total_profit
-        FROM orders
-        WHERE store_name IN ('{store_list}')
-        GROUP BY store_name, DATE(date), product_name, category_level1, channel
+            s.*,
+            CASE WHEN total_quantity > 0 THEN total_revenue / total_quantity ELSE 0 END as avg_price,
+            CASE WHEN total_revenue > 0 THEN total_profit / total_revenue * 100 ELSE 0 END as profit_margin
+        FROM summary s
         """
         
-        try:
-            session.execute(text(sql))
-            
-            # 更新派生字段
-            session.execute(text(f"""
-                UPDATE product_daily_summary SET
-                    avg_price = CASE WHEN total_quantity > 0 THEN total_revenue / total_quantity ELSE 0 END,
-                    profit_margin = CASE WHEN total_revenue > 0 THEN total_profit / total_revenue * 100 ELSE 0 END
-                WHERE store_name IN ('{store_list}')
-            """))
-            
-            session.commit()
-            
-            result = session.execute(text(f"SELECT COUNT(*) FROM product_daily_summary WHERE store_name IN ('{store_list}')"))
-            count = result.scalar()
-            print(f"   ✅ product_daily_summary: {count} 条")
-        except Exception as e:
-            print(f"   ❌ product_daily_summary: {e}")
-            session.rollback()
+        return AggregationSyncService._upsert(session, 'product_daily_summary', [
+            'store_name', 'summary_date', 'product_name', 'category_level1', 'channel',
+            'order_count', 'total_quantity', 'total_revenue', 'total_cost', 'total_profit',
+            'avg_price', 'profit_margin',
+        ], sql, scope, params)
 
 
     @staticmethod
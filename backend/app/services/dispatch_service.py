@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+分析端点分发服务（线程池 + 按端点并发限制）
+
+问题：v1 大部分路由声明为 `async def`，但函数体内是同步的 SQLAlchemy 查询和
+数秒级的 pandas 计算，直接在事件循环上执行。一个慢请求
+（如 /comparison/global-insights）会卡住同一worker上的所有请求。
+
+方案：
+- 用 @offload() 装饰这类端点：函数体整体放到有界线程池执行，事件循环只负责等待
+- 每个端点一个并发信号量（ENDPOINT_LIMITS / DEFAULT_LIMIT），超出的请求在事件循环上排队，
+  不占用线程池，也不阻塞其他端点
+- 排队深度、等待时间上报到 health_service（/observability/metrics 可见）
+
+说明：选择线程池而非进程池——端点依赖数据库会话、全局缓存和共享快照，
+无法跨进程序列化；pandas/numpy/数据库驱动的主要耗时段会释放GIL。
+
+使用方式:
+    @router.get("/comparison/global-insights")
+    @offload()
+    async def get_global_insights(...):
+        ...
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class DispatchService:
+    """分析端点分发服务"""
+
+    # 线程池大小（环境变量 ANALYTICS_POOL_WORKERS 可覆盖）
+    MAX_WORKERS = int(os.getenv("ANALYTICS_POOL_WORKERS", min(16, (os.cpu_count() or 4) + 4)))
+
+    # 未单独配置的端点的并发上限
+    DEFAULT_LIMIT = 4
+
+    # 重型端点并发上限（键: 模块名.函数名）
+    ENDPOINT_LIMITS = {
+        "store_comparison.get_global_insights": 2,
+        "store_comparison.get_stores_comparison": 3,
+        "store_comparison.get_stores_week_over_week": 3,
+        "inventory_risk.get_inventory_risk_trend": 2,
+        "orders.get_order_overview": 6,
+    }
+
+    def __init__(self):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._waiting: Dict[str, int] = {}
+        self._running: Dict[str, int] = {}
+        # 排队/执行计数可能在多个事件循环线程中更新（协程端点在线程池内用独立事件循环执行）
+        self._counts_lock = threading.Lock()
+        # 标记当前线程是否为分发线程（嵌套调用其他已分发端点时直接执行）
+        self._local = threading.local()
+
+    # ==================== 线程池 ====================
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """懒加载线程池（shutdown 后再次调用会重建）"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.MAX_WORKERS,
+                        thread_name_prefix="analytics",
+                    )
+        return self._executor
+
+    def _get_semaphore(self, key: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            limit = self.ENDPOINT_LIMITS.get(key, self.DEFAULT_LIMIT)
+            semaphore = self._semaphores.setdefault(key, asyncio.Semaphore(limit))
+        return semaphore
+
+    def _adjust(self, key: str, waiting: int = 0, running: int = 0) -> Tuple[int, int]:
+        """原子地调整端点的排队/执行计数，返回调整后的 (排队数, 执行数)"""
+        with self._counts_lock:
+            self._waiting[key] = self._waiting.get(key, 0) + waiting
+            self._running[key] = self._running.get(key, 0) + running
+            return self._waiting[key], self._running[key]
+
+    def in_worker(self) -> bool:
+        """当前是否在分发线程内执行"""
+        return getattr(self._local, "active", False)
+
+    def _run_in_worker(self, func: Callable, args: tuple, kwargs: dict) -> Any:
+        """线程池内执行；协程函数用独立事件循环跑完"""
+        self._local.active = True
+        try:
+            if asyncio.iscoroutinefunction(func):
+                return asyncio.run(func(*args, **kwargs))
+            return func(*args, **kwargs)
+        finally:
+            self._local.active = False
+
+    # ==================== 分发 ====================
+
+    async def run(self, key: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        在线程池中执行 func（受端点并发上限约束）
+
+        Args:
+            key: 端点标识（用于并发限制和指标）
+            func: 同步函数或函数体内无跨循环await的协程函数
+        """
+        from .health_service import health_service
+
+        semaphore = self._get_semaphore(key)
+        queued_at = time.time()
+        health_service.record_dispatch_queue(key, *self._adjust(key, waiting=1))
+        try:
+            await semaphore.acquire()
+        except BaseException:
+            self._adjust(key, waiting=-1)
+            raise
+
+        wait_ms = (time.time() - queued_at) * 1000
+        health_service.record_dispatch_wait(key, wait_ms, *self._adjust(key, waiting=-1, running=1))
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_executor(),
+                functools.partial(self._run_in_worker, func, args, kwargs),
+            )
+        finally:
+            semaphore.release()
+            health_service.record_dispatch_queue(key, *self._adjust(key, running=-1))
+
+    def offload(self, key: Optional[str] = None):
+        """
+        端点装饰器：把阻塞型 async 端点放到线程池执行
+
+        放在 @router.get(...) 之下；FastAPI 通过 __wrapped__ 解析原函数签名，
+        参数校验和依赖注入不受影响。
+
+        Args:
+            key: 端点标识，默认 "模块名.函数名"
+        """
+        def decorator(func: Callable) -> Callable:
+            endpoint_key = key or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                # 已在分发线程内（端点间互相调用）：直接执行，避免占用第二个线程
+                if self.in_worker():
+                    if asyncio.iscoroutinefunction(func):
+                        return await func(*args, **kwargs)
+                    return func(*args, **kwargs)
+                return await self.run(endpoint_key, func, *args, **kwargs)
+
+            wrapper.dispatch_key = endpoint_key
+            return wrapper
+
+        return decorator
+
+    # ==================== 管理 ====================
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取分发状态"""
+        with self._counts_lock:
+            waiting, running = dict(self._waiting), dict(self._running)
+        return {
+            "max_workers": self.MAX_WORKERS,
+            "default_limit": self.DEFAULT_LIMIT,
+            "endpoints": {
+                key: {
+                    "limit": self.ENDPOINT_LIMITS.get(key, self.DEFAULT_LIMIT),
+                    "waiting": waiting.get(key, 0),
+                    "running": running.get(key, 0),
+                }
+                for key in list(self._semaphores)
+            },
+        }
+
+    def shutdown(self):
+        """关闭线程池（应用关闭时调用）"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+# 全局单例
+dispatch_service = DispatchService()
+
+# 装饰器快捷方式
+offload = dispatch_service.offload
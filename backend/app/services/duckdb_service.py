@@ -8,13 +8,116 @@ DuckDB 查询服务（完整版）
 性能对比（千万级数据）：
 - Pandas: 30-60秒
 - DuckDB: < 1秒
+
+查询参数（门店/日期/渠道/条数）全部走绑定参数（?），SQL 文本只随查询形状变化；
+解析后的语句按 SQL 文本缓存，看板重复刷新时跳过 SQL 拼接后的解析。
+
+持久化模式（可选，DUCKDB_PERSISTENT=1）：
+- 数据库文件 data/analytics.duckdb，原始Parquet按同步日增量加载为原生表 orders
+  （每个同步日按 门店名称, 日期 排序写入，行组的 min/max 区间图对这两列过滤有效）
+- 物化汇总表: order_rollup（一行一个订单）、daily_rollup（日 × 门店 × 渠道）
+- ParquetSyncService 写入某天后调用 refresh()，只重新加载文件签名变化的同步日；
+  其他进程写入时通过 metadata/partitions.json 的修改时间发现，后台刷新完成前回退到Parquet
+- 数据库文件被其他进程占用时回退到内存模式
+
+并发：查询从游标池借用游标（共享同一数据库的独立连接），每个请求线程同一时刻独占一个游标。
+池大小、DuckDB threads / memory_limit 由环境变量配置，池指标见 /api/v2/orders/status。
 """
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
 import duckdb
 from pathlib import Path
-from typing import Optional, List, Dict, Any
-from datetime import date, datetime
+from typing import Optional, List, Dict, Any, Tuple
+from datetime import date, datetime, timedelta
 import pandas as pd
 
+from .kpi_query_plan import build_kpi_sql, parse_kpi_row
+
+
+class _CursorPool:
+    """
+    DuckDB 游标池
+    
+    游标由 conn.cursor() 创建（共享数据库的独立连接），按需创建到 size 个；
+    借出期间只属于一个线程，池满时等待归还，超过 timeout 抛出 TimeoutError。
+    """
+    
+    def __init__(self, conn: "duckdb.DuckDBPyConnection", size: int, timeout: float):
+        self._conn = conn
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._idle: List["duckdb.DuckDBPyConnection"] = []
+        self._created = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "acquired": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_ms_total": 0.0,
+            "max_wait_ms": 0.0,
+        }
+    
+    @contextmanager
+    def cursor(self):
+        """借用游标（with 块结束后归还）"""
+        start = time.perf_counter()
+        with self._cond:
+            waited = False
+            while not self._idle and self._created >= self.size:
+                remaining = self.timeout - (time.perf_counter() - start)
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise TimeoutError(f"DuckDB游标池已满（{self.size}），等待超时")
+                waited = True
+                self._cond.wait(remaining)
+            cursor = self._idle.pop() if self._idle else None
+            if cursor is None:
+                self._created += 1
+            self._in_use += 1
+            
+            wait_ms = (time.perf_counter() - start) * 1000
+            self._stats["acquired"] += 1
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_ms_total"] += wait_ms
+                self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], wait_ms)
+        
+        try:
+            if cursor is None:
+                cursor = self._conn.cursor()
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        
+        try:
+            yield cursor
+        finally:
+            with self._cond:
+                self._idle.append(cursor)
+                self._in_use -= 1
+                self._cond.notify()
+    
+    def get_status(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                **self._stats,
+                "wait_ms_total": round(self._stats["wait_ms_total"], 1),
+                "max_wait_ms": round(self._stats["max_wait_ms"], 1),
+            }
+
 
 class DuckDBService:
     """
@@ -24,16 +127,28 @@ class DuckDBService:
     1. 预聚合Parquet存在 → 直接查询（最快）
     2. 原始Parquet存在 → 实时聚合（较快）
     3. 都不存在 → 回退到PostgreSQL预聚合表
+    
+    持久化模式下趋势/渠道读取汇总表，KPI/品类/明细读取 orders 表
     """
     
     _instance = None
     
+    # 连接配置（环境变量可覆盖）
+    POOL_SIZE = int(os.getenv("DUCKDB_POOL_SIZE", 8))
+    POOL_TIMEOUT = float(os.getenv("DUCKDB_POOL_TIMEOUT", 30))
+    THREADS = int(os.getenv("DUCKDB_THREADS", 8))
+    MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT", "8GB")
+    
+    # 持久化数据库（可选）
+    PERSISTENT = os.getenv("DUCKDB_PERSISTENT", "0").lower() in ("1", "true", "yes")
+    DATABASE_FILE = "analytics.duckdb"
+    
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
     
-    def __init__(self, data_dir: str = None):
+    def __init__(self, data_dir: str = None, persistent: Optional[bool] = None):
         if hasattr(self, '_initialized'):
             return
         
@@ -47,30 +162,453 @@ class DuckDBService:
         self.agg_dir = self.data_dir / "aggregated"
         
         # 创建数据库连接
-        self.conn = duckdb.connect(':memory:', read_only=False)
+        self.db_path: Optional[Path] = None
+        self.conn = self._connect(self.PERSISTENT if persistent is None else persistent)
+        
+        # 查询游标池（线程数/内存上限在连接时配置，对所有游标生效）
+        self._pool = _CursorPool(self.conn, self.POOL_SIZE, self.POOL_TIMEOUT)
+        
+        # 语句缓存: {参数化SQL文本: 解析后的Statement}（LRU）
+        self._statements: "OrderedDict[str, Any]" = OrderedDict()
+        self._stmt_lock = threading.Lock()
+        self._stmt_stats = {"hits": 0, "misses": 0}
+        
+        # 持久化表状态: 刷新时的原始数据标记（None 表示尚未加载）
+        self._tables_marker: Optional[int] = None
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self._refresh_stats: Dict[str, Any] = {"refreshes": 0, "last_refresh": None}
         
-        # 配置优化（根据用户16核CPU优化）
-        self.conn.execute("SET threads TO 8")
-        self.conn.execute("SET memory_limit = '8GB'")
+        # 原始数据元信息缓存: {名称: (数据版本, 值)}（公共列、每日行数）
+        self._raw_meta: Dict[str, Tuple[int, Any]] = {}
         
         self._initialized = True
         self._enabled = True  # 默认启用
         
-        print("✅ DuckDB服务已初始化（完整版）")
+        if self.db_path is not None:
+            self._init_tables()
+            self.refresh_async()
+        
+        mode = f"持久化: {self.db_path}" if self.db_path is not None else "内存"
+        print(f"✅ DuckDB服务已初始化（完整版，{mode}，游标池 {self.POOL_SIZE}，"
+              f"threads={self.THREADS}，memory_limit={self.MEMORY_LIMIT}）")
+    
+    def _connect(self, persistent: bool) -> "duckdb.DuckDBPyConnection":
+        """打开数据库（持久化文件被其他进程占用时回退到内存模式）"""
+        config = {"threads": self.THREADS, "memory_limit": self.MEMORY_LIMIT}
+        if persistent:
+            db_path = self.data_dir / self.DATABASE_FILE
+            try:
+                db_path.parent.mkdir(parents=True, exist_ok=True)
+                conn = duckdb.connect(str(db_path), read_only=False, config=config)
+                self.db_path = db_path
+                return conn
+            except duckdb.IOException as e:
+                print(f"⚠️ DuckDB持久化数据库不可用，回退到内存模式: {e}")
+        return duckdb.connect(':memory:', read_only=False, config=config)
     
     @property
     def is_enabled(self) -> bool:
         return self._enabled and self.conn is not None
     
+    @property
+    def is_persistent(self) -> bool:
+        return self.db_path is not None
+    
+    # ==================== 语句缓存 ====================
+    
+    # 缓存的查询形状数量上限（每个方法 × 条件组合 × 数据源布局，实际远小于此值）
+    STATEMENT_CACHE_SIZE = 128
+    
+    def _statement(self, sql: str):
+        """
+        获取解析后的语句（按参数化SQL文本缓存）
+        
+        SQL 中不含任何参数值，文本只取决于查询形状，同一形状只解析一次。
+        说明：DuckDB 执行时仍会重新绑定/规划（read_parquet 的文件通配需要看到新同步的文件）
+        """
+        with self._stmt_lock:
+            stmt = self._statements.get(sql)
+            if stmt is not None:
+                self._statements.move_to_end(sql)
+                self._stmt_stats["hits"] += 1
+                return stmt
+        
+        stmt = self.conn.extract_statements(sql)[0]
+        with self._stmt_lock:
+            self._statements[sql] = stmt
+            while len(self._statements) > self.STATEMENT_CACHE_SIZE:
+                self._statements.popitem(last=False)
+            self._stmt_stats["misses"] += 1
+        return stmt
+    
+    def _execute(self, sql: str, params: Optional[List[Any]] = None, fetch: str = "all"):
+        """
+        执行参数化查询（参数值只通过绑定传入）
+        
+        Args:
+            fetch: one / all / df / arrow，结果在归还游标前取出
+        """
+        statement = self._statement(sql)
+        with self._pool.cursor() as cur:
+            result = cur.execute(statement, params or [])
+            if fetch == "one":
+                return result.fetchone()
+            if fetch == "df":
+                return result.fetchdf()
+            if fetch == "arrow":
+                if hasattr(result, "to_arrow_table"):
+                    return result.to_arrow_table()
+                return result.fetch_arrow_table()
+            return result.fetchall()
+    
+    def clear_statement_cache(self):
+        """清空语句缓存"""
+        with self._stmt_lock:
+            self._statements.clear()
+    
     def has_parquet_data(self) -> bool:
-        """检查是否有Parquet数据"""
-        raw_files = list(self.raw_dir.glob("**/*.parquet")) if self.raw_dir.exists() else []
-        return len(raw_files) > 0
+        """检查是否有Parquet数据（找到第一个文件即返回）"""
+        if not self.raw_dir.exists():
+            return False
+        return next(self.raw_dir.glob("**/*.parquet"), None) is not None
+    
+    def is_hive_layout(self) -> bool:
+        """原始数据是否为 month=/store=/date= hive分区布局"""
+        return self.raw_dir.exists() and next(self.raw_dir.glob("month=*"), None) is not None
     
     def get_parquet_pattern(self) -> str:
         """获取原始Parquet文件匹配模式"""
+        if self.is_hive_layout():
+            return str(self.raw_dir / "month=*" / "store=*" / "date=*" / "*.parquet")
         return str(self.raw_dir / "**" / "*.parquet")
     
+    def get_raw_source(self) -> str:
+        """
+        原始数据的 read_parquet 表达式
+        
+        hive布局下暴露分区列 month(VARCHAR) / store(VARCHAR) / date(DATE)，
+        配合 partition_filters 的条件，DuckDB 只打开匹配分区的文件
+        """
+        pattern = self.get_parquet_pattern().replace("'", "''")
+        if self.is_hive_layout():
+            return (
+                f"read_parquet('{pattern}', hive_partitioning=true, "
+                f"hive_types={{'month': VARCHAR, 'store': VARCHAR, 'date': DATE}})"
+            )
+        return f"read_parquet('{pattern}')"
+    
+    def partition_filters(
+        self,
+        store_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> Tuple[List[str], List[Any]]:
+        """
+        分区裁剪条件（仅hive布局）
+        
+        只作用于分区列，与原有的行级条件一起使用，查询结果不变
+        
+        Returns:
+            (条件列表, 绑定参数列表)
+        """
+        if not self.is_hive_layout():
+            return [], []
+        
+        filters, params = [], []
+        if store_name:
+            filters.append("store = ?")
+            params.append(store_name)
+        if start_date:
+            filters.append("month >= ?")
+            filters.append("date >= CAST(? AS DATE)")
+            params.extend([str(start_date)[:7], str(start_date)[:10]])
+        if end_date:
+            filters.append("month <= ?")
+            filters.append("date <= CAST(? AS DATE)")
+            params.extend([str(end_date)[:7], str(end_date)[:10]])
+        return filters, params
+    
+    def row_filters(
+        self,
+        store_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        channel: Optional[str] = None,
+        by_day: bool = False
+    ) -> Tuple[List[str], List[Any]]:
+        """
+        行级过滤条件（门店/日期/渠道）
+        
+        Args:
+            by_day: True 按 CAST(日期 AS DATE) 比较，False 按时间戳比较
+        
+        Returns:
+            (条件列表, 绑定参数列表)
+        """
+        date_cond = "CAST(日期 AS DATE) {} CAST(? AS DATE)" if by_day else "日期 {} CAST(? AS TIMESTAMP)"
+        
+        filters, params = [], []
+        if store_name:
+            filters.append("门店名称 = ?")
+            params.append(store_name)
+        if start_date:
+            filters.append(date_cond.format(">="))
+            params.append(str(start_date))
+        if end_date:
+            filters.append(date_cond.format("<="))
+            params.append(str(end_date))
+        if channel and channel != 'all':
+            filters.append("渠道 = ?")
+            params.append(channel)
+        return filters, params
+    
+    @staticmethod
+    def _where_sql(where_clauses: List[str]) -> str:
+        return f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    
+    def get_aggregated_source(
+        self,
+        dataset: str,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> Optional[List[str]]:
+        """
+        聚合数据的文件列表（按分区清单裁剪到日期范围）
+        
+        Returns:
+            文件路径列表（作为 read_parquet(?) 的绑定参数），无数据时返回None
+        """
+        from .parquet_sync_service import parquet_sync_service
+        
+        files = parquet_sync_service.get_aggregated_files(dataset, start_date, end_date)
+        if not files:
+            return None
+        return [str(f) for f in files]
+    
+    # ==================== 持久化表 ====================
+    
+    def _init_tables(self):
+        """创建同步状态表和汇总表（orders 表在首次加载时按Parquet结构创建）"""
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                sync_day DATE PRIMARY KEY,
+                signature VARCHAR,
+                files INTEGER,
+                rows BIGINT,
+                loaded_at TIMESTAMP
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS order_rollup (
+                sync_day DATE,
+                订单ID VARCHAR,
+                门店名称 VARCHAR,
+                渠道 VARCHAR,
+                日期 TIMESTAMP,
+                订单金额 DOUBLE,
+                订单利润 DOUBLE
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS daily_rollup (
+                sync_day DATE,
+                日期 DATE,
+                门店名称 VARCHAR,
+                渠道 VARCHAR,
+                订单数 BIGINT,
+                销售额 DOUBLE,
+                利润 DOUBLE
+            )
+        """)
+    
+    def _raw_marker(self) -> int:
+        """原始数据变更标记（ParquetSyncService 每次写入都会更新 partitions.json）"""
+        try:
+            return (self.data_dir / "metadata" / "partitions.json").stat().st_mtime_ns
+        except OSError:
+            return 0
+    
+    def _raw_day_files(self) -> Dict[date, List[Path]]:
+        """按同步日分组的原始Parquet文件（hive: date=YYYY-MM-DD 目录，旧版: orders_YYYYMMDD 文件名）"""
+        day_files: Dict[date, List[Path]] = {}
+        if self.is_hive_layout():
+            for f in self.raw_dir.glob("month=*/store=*/date=*/*.parquet"):
+                sync_day = date.fromisoformat(f.parent.name[len("date="):])
+                day_files.setdefault(sync_day, []).append(f)
+        elif self.raw_dir.exists():
+            for f in self.raw_dir.glob("**/orders_*.parquet"):
+                sync_day = datetime.strptime(f.stem[len("orders_"):], "%Y%m%d").date()
+                day_files.setdefault(sync_day, []).append(f)
+        return day_files
+    
+    @staticmethod
+    def _files_signature(files: List[Path]) -> str:
+        stats = [f.stat() for f in files]
+        return f"{len(stats)}:{sum(st.st_size for st in stats)}:{max(st.st_mtime_ns for st in stats)}"
+    
+    def _tables_ready(self) -> bool:
+        """持久化表是否与原始Parquet一致（不一致时触发后台刷新，本次查询回退到Parquet）"""
+        if self.db_path is None or self._tables_marker is None:
+            return False
+        if self._raw_marker() != self._tables_marker:
+            self.refresh_async()
+            return False
+        return True
+    
+    def refresh(self) -> Dict[str, Any]:
+        """
+        增量刷新持久化表（仅重新加载文件签名变化的同步日）
+        
+        每个同步日: 删除旧行 → orders 按 门店名称, 日期 排序插入 → 重算该日的
+        order_rollup / daily_rollup，全部在一个事务内完成，读请求看到的始终是完整快照。
+        
+        Returns:
+            {"loaded_days", "removed_days", "rows", "elapsed_ms"}
+        """
+        if self.db_path is None:
+            return {"loaded_days": 0, "removed_days": 0, "rows": 0, "elapsed_ms": 0}
+        
+        with self._refresh_lock:
+            start = time.time()
+            # 先取标记再列文件：刷新期间的新写入会让标记不一致，下次查询再次刷新
+            marker = self._raw_marker()
+            day_files = self._raw_day_files()
+            signatures = {d: self._files_signature(files) for d, files in day_files.items()}
+            
+            cur = self.conn.cursor()
+            state = dict(cur.execute("SELECT sync_day, signature FROM sync_state").fetchall())
+            removed = [d for d in state if d not in signatures]
+            changed = sorted(d for d, sig in signatures.items() if state.get(d) != sig)
+            
+            rows = 0
+            if removed or changed:
+                tables = ["order_rollup", "daily_rollup", "sync_state"]
+                if self._table_columns(cur, "orders"):
+                    tables.append("orders")
+                cur.execute("BEGIN TRANSACTION")
+                try:
+                    for table in tables:
+                        cur.execute(f"DELETE FROM {table} WHERE list_contains(?, sync_day)", [removed + changed])
+                    for sync_day in changed:
+                        rows += self._load_day(cur, sync_day, day_files[sync_day], signatures[sync_day])
+                    cur.execute("COMMIT")
+                except Exception:
+                    cur.execute("ROLLBACK")
+                    raise
+                cur.execute("CHECKPOINT")
+            cur.close()
+            
+            self._tables_marker = marker
+            elapsed_ms = round((time.time() - start) * 1000, 1)
+            self._refresh_stats["refreshes"] += 1
+            self._refresh_stats["last_refresh"] = {
+                "loaded_days": len(changed),
+                "removed_days": len(removed),
+                "rows": rows,
+                "elapsed_ms": elapsed_ms,
+                "finished_at": datetime.now().isoformat(timespec="seconds"),
+            }
+        
+        if changed or removed:
+            print(f"✅ DuckDB持久化表已刷新: 加载 {len(changed)} 天 ({rows} 行), "
+                  f"移除 {len(removed)} 天, {elapsed_ms:.0f}ms")
+        return self._refresh_stats["last_refresh"]
+    
+    def refresh_async(self):
+        """后台刷新持久化表（已有刷新在进行时跳过）"""
+        if self.db_path is None or self._refreshing:
+            return
+        self._refreshing = True
+        
+        def _run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ DuckDB持久化表刷新失败: {e}")
+            finally:
+                self._refreshing = False
+        
+        threading.Thread(target=_run, name="duckdb-refresh", daemon=True).start()
+    
+    @staticmethod
+    def _table_columns(cur, table: str) -> set:
+        return {
+            row[0] for row in cur.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = ?", [table]
+            ).fetchall()
+        }
+    
+    def _load_day(self, cur, sync_day: date, files: List[Path], signature: str) -> int:
+        """加载一个同步日的原始文件并重算该日汇总"""
+        file_list = [str(f) for f in files]
+        source = "read_parquet(?, union_by_name=true, hive_partitioning=false)"
+        
+        # orders 表结构跟随Parquet（新增列自动补充，缺失列写入NULL）
+        file_columns = cur.execute(
+            f"SELECT column_name, column_type FROM (DESCRIBE SELECT * FROM {source})", [file_list]
+        ).fetchall()
+        table_columns = self._table_columns(cur, "orders")
+        if not table_columns:
+            cur.execute(
+                f"CREATE TABLE orders AS SELECT CAST(? AS DATE) AS sync_day, * FROM {source} LIMIT 0",
+                [sync_day, file_list]
+            )
+        else:
+            for name, column_type in file_columns:
+                if name not in table_columns:
+                    cur.execute(f'ALTER TABLE orders ADD COLUMN "{name}" {column_type}')
+        
+        rows = cur.execute(f"""
+            INSERT INTO orders BY NAME
+            SELECT CAST(? AS DATE) AS sync_day, *
+            FROM {source}
+            ORDER BY 门店名称, 日期
+        """, [sync_day, file_list]).fetchone()[0]
+        
+        cur.execute("""
+            INSERT INTO order_rollup
+            SELECT
+                sync_day, 订单ID, 门店名称, 渠道, 日期,
+                SUM(实收价格 * 月售) as 订单金额,
+                SUM(利润额) - SUM(平台服务费) - MAX(物流配送费) + SUM(企客后返) as 订单利润
+            FROM orders
+            WHERE sync_day = ?
+            GROUP BY sync_day, 订单ID, 门店名称, 渠道, 日期
+            ORDER BY 门店名称, 日期
+        """, [sync_day])
+        cur.execute("""
+            INSERT INTO daily_rollup
+            SELECT
+                sync_day, CAST(日期 AS DATE), 门店名称, 渠道,
+                COUNT(*), SUM(订单金额), SUM(订单利润)
+            FROM order_rollup
+            WHERE sync_day = ?
+            GROUP BY sync_day, CAST(日期 AS DATE), 门店名称, 渠道
+            ORDER BY 门店名称
+        """, [sync_day])
+        cur.execute(
+            "INSERT INTO sync_state VALUES (?, ?, ?, ?, ?)",
+            [sync_day, signature, len(files), rows, datetime.now()]
+        )
+        return int(rows)
+    
+    def _detail_source(
+        self,
+        store_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> Tuple[str, List[str], List[Any]]:
+        """
+        明细数据源
+        
+        Returns:
+            (FROM 表达式, 分区裁剪条件, 参数)：持久化表就绪时为 orders 表，否则为原始Parquet
+        """
+        if self._tables_ready():
+            return "orders", [], []
+        return (self.get_raw_source(), *self.partition_filters(store_name, start_date, end_date))
+    
     # ==================== KPI 查询 ====================
     
     def query_kpi(
@@ -94,21 +632,17 @@ class DuckDBService:
     
     def _query_kpi_from_aggregated(
         self,
-        agg_file: Path,
         store_name: Optional[str],
         start_date: Optional[date],
         end_date: Optional[date]
     ) -> Dict[str, Any]:
-        """从预聚合Parquet查询KPI"""
-        where_clauses = []
-        if store_name:
-            where_clauses.append(f"门店名称 = '{store_name}'")
-        if start_date:
-            where_clauses.append(f"日期 >= '{start_date}'")
-        if end_date:
-            where_clauses.append(f"日期 <= '{end_date}'")
+        """从预聚合Parquet查询KPI（只读取与日期范围有交集的月分区）"""
+        agg_files = self.get_aggregated_source('kpi_daily', start_date, end_date)
+        if agg_files is None:
+            return self._empty_kpi()
         
-        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+        where_clauses, params = self.row_filters(store_name, start_date, end_date)
+        where_sql = self._where_sql(where_clauses)
         
         sql = f"""
             SELECT 
@@ -118,11 +652,11 @@ class DuckDBService:
                 COALESCE(SUM(商品实收额) / NULLIF(SUM(订单数), 0), 0) as avg_order_value,
                 COALESCE(SUM(总利润) / NULLIF(SUM(商品实收额), 0) * 100, 0) as profit_rate,
                 COALESCE(SUM(动销商品数), 0) as active_products
-            FROM read_parquet('{agg_file}')
+            FROM read_parquet(?)
             {where_sql}
         """
         
-        result = self.conn.execute(sql).fetchone()
+        result = self._execute(sql, [agg_files] + params, fetch="one")
         
         return {
             "total_orders": int(result[0] or 0),
@@ -140,71 +674,23 @@ class DuckDBService:
         end_date: Optional[date],
         channel: Optional[str]
     ) -> Dict[str, Any]:
-        """从原始Parquet实时计算KPI"""
-        parquet_pattern = self.get_parquet_pattern()
-        
-        where_clauses = []
-        if store_name:
-            where_clauses.append(f"门店名称 = '{store_name}'")
-        if start_date:
-            where_clauses.append(f"日期 >= '{start_date}'")
-        if end_date:
-            where_clauses.append(f"日期 <= '{end_date}'")
-        if channel and channel != 'all':
-            where_clauses.append(f"渠道 = '{channel}'")
-        
-        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
-        
-        # 两阶段聚合：先订单级，再总体
-        sql = f"""
-            WITH order_level AS (
-                SELECT 
-                    订单ID,
-                    门店名称,
-                    SUM(实收价格 * 月售) as 订单金额,
-                    SUM(利润额) - SUM(平台服务费) - MAX(物流配送费) + SUM(企客后返) as 订单利润
-                FROM read_parquet('{parquet_pattern}')
-                {where_sql}
-                GROUP BY 订单ID, 门店名称
-            )
-            SELECT 
-                COUNT(*) as total_orders,
-                COALESCE(SUM(订单金额), 0) as total_actual_sales,
-                COALESCE(SUM(订单利润), 0) as total_profit,
-                COALESCE(AVG(订单金额), 0) as avg_order_value,
-                COALESCE(SUM(订单利润) / NULLIF(SUM(订单金额), 0) * 100, 0) as profit_rate
-            FROM order_level
         """
+        从原始数据实时计算KPI（六大卡片 + GMV + 营销成本）
         
-        result = self.conn.execute(sql).fetchone()
-        
-        # 动销商品数单独查询
-        active_sql = f"""
-            SELECT COUNT(DISTINCT 商品名称)
-            FROM read_parquet('{parquet_pattern}')
-            {where_sql}
-            {"AND" if where_clauses else "WHERE"} 月售 > 0
+        使用统一 KPI 查询计划（kpi_query_plan），一次扫描完成订单级聚合和动销商品去重；
+        持久化表就绪时扫描 orders 表，否则扫描原始Parquet（附分区裁剪条件）
         """
-        active_products = self.conn.execute(active_sql).fetchone()[0] or 0
+        detail_source, part_clauses, part_params = self._detail_source(store_name, start_date, end_date)
         
-        return {
-            "total_orders": int(result[0] or 0),
-            "total_actual_sales": round(float(result[1] or 0), 2),
-            "total_profit": round(float(result[2] or 0), 2),
-            "avg_order_value": round(float(result[3] or 0), 2),
-            "profit_rate": round(float(result[4] or 0), 2),
-            "active_products": int(active_products),
-        }
+        where_clauses, params = self.row_filters(store_name, start_date, end_date, channel)
+        where_clauses += part_clauses
+        params += part_params
+        
+        sql = build_kpi_sql("duckdb", detail_source, self._where_sql(where_clauses))
+        return parse_kpi_row(self._execute(sql, params, fetch="one"))
     
     def _empty_kpi(self) -> Dict[str, Any]:
-        return {
-            "total_orders": 0,
-            "total_actual_sales": 0,
-            "total_profit": 0,
-            "avg_order_value": 0,
-            "profit_rate": 0,
-            "active_products": 0,
-        }
+        return parse_kpi_row(None)
     
     # ==================== 趋势查询 ====================
     
@@ -219,11 +705,13 @@ class DuckDBService:
     ) -> Dict[str, List]:
         """
         查询趋势数据（日/周/月）
+        
+        持久化表就绪时按 daily_rollup 汇总
         """
         if not self.has_parquet_data():
             return self._empty_trend()
         
-        parquet_pattern = self.get_parquet_pattern()
+        use_rollup = self._tables_ready()
         
         # 日期截断函数 - DuckDB语法
         date_trunc = {
@@ -233,44 +721,65 @@ class DuckDBService:
         }.get(granularity, "CAST(日期 AS DATE)")
         
         # 构建WHERE条件
-        where_clauses = []
         if start_date and end_date:
-            where_clauses.append(f"CAST(日期 AS DATE) >= '{start_date}'")
-            where_clauses.append(f"CAST(日期 AS DATE) <= '{end_date}'")
+            where_clauses, params = self.row_filters(None, start_date, end_date, by_day=True)
+            part_clauses, part_params = self.partition_filters(store_name, start_date, end_date)
         else:
-            where_clauses.append(f"CAST(日期 AS DATE) >= CURRENT_DATE - INTERVAL '{days} days'")
+            where_clauses = ["CAST(日期 AS DATE) >= CURRENT_DATE - CAST(? AS INTEGER)"]
+            params = [int(days)]
+            # 分区条件多留一天，避免时区差异漏掉边界分区
+            part_clauses, part_params = self.partition_filters(
+                store_name, date.today() - timedelta(days=days + 1)
+            )
+        if not use_rollup:
+            where_clauses += part_clauses
+            params += part_params
         
-        if store_name:
-            where_clauses.append(f"门店名称 = '{store_name}'")
-        if channel and channel != 'all':
-            where_clauses.append(f"渠道 = '{channel}'")
+        store_clauses, store_params = self.row_filters(store_name, channel=channel)
+        where_clauses += store_clauses
+        params += store_params
         
-        where_sql = f"WHERE {' AND '.join(where_clauses)}"
+        where_sql = self._where_sql(where_clauses)
         
-        sql = f"""
-            WITH order_level AS (
+        if use_rollup:
+            sql = f"""
                 SELECT 
-                    订单ID,
-                    {date_trunc} as period,
-                    SUM(实收价格 * 月售) as 订单金额,
-                    SUM(利润额) - SUM(平台服务费) - MAX(物流配送费) + SUM(企客后返) as 订单利润
-                FROM read_parquet('{parquet_pattern}')
+                    {date_trunc} as date,
+                    SUM(订单数) as order_count,
+                    COALESCE(SUM(销售额), 0) as amount,
+                    COALESCE(SUM(利润), 0) as profit,
+                    COALESCE(SUM(销售额) / NULLIF(SUM(订单数), 0), 0) as avg_value,
+                    COALESCE(SUM(利润) / NULLIF(SUM(销售额), 0) * 100, 0) as profit_rate
+                FROM daily_rollup
                 {where_sql}
-                GROUP BY 订单ID, {date_trunc}
-            )
-            SELECT 
-                period as date,
-                COUNT(*) as order_count,
-                COALESCE(SUM(订单金额), 0) as amount,
-                COALESCE(SUM(订单利润), 0) as profit,
-                COALESCE(AVG(订单金额), 0) as avg_value,
-                COALESCE(SUM(订单利润) / NULLIF(SUM(订单金额), 0) * 100, 0) as profit_rate
-            FROM order_level
-            GROUP BY period
-            ORDER BY period
-        """
+                GROUP BY {date_trunc}
+                ORDER BY {date_trunc}
+            """
+        else:
+            sql = f"""
+                WITH order_level AS (
+                    SELECT 
+                        订单ID,
+                        {date_trunc} as period,
+                        SUM(实收价格 * 月售) as 订单金额,
+                        SUM(利润额) - SUM(平台服务费) - MAX(物流配送费) + SUM(企客后返) as 订单利润
+                    FROM {self.get_raw_source()}
+                    {where_sql}
+                    GROUP BY 订单ID, {date_trunc}
+                )
+                SELECT 
+                    period as date,
+                    COUNT(*) as order_count,
+                    COALESCE(SUM(订单金额), 0) as amount,
+                    COALESCE(SUM(订单利润), 0) as profit,
+                    COALESCE(AVG(订单金额), 0) as avg_value,
+                    COALESCE(SUM(订单利润) / NULLIF(SUM(订单金额), 0) * 100, 0) as profit_rate
+                FROM order_level
+                GROUP BY period
+                ORDER BY period
+            """
         
-        df = self.conn.execute(sql).fetchdf()
+        df = self._execute(sql, params, fetch="df")
         
         if df.empty:
             return self._empty_trend()
@@ -302,37 +811,47 @@ class DuckDBService:
         start_date: Optional[date] = None,
         end_date: Optional[date] = None
     ) -> List[Dict]:
-        """查询渠道分析数据 - 直接从原始Parquet查询"""
+        """查询渠道分析数据 - 从原始Parquet查询（持久化表就绪时按 daily_rollup 汇总）"""
         if not self.has_parquet_data():
             return []
         
-        parquet_pattern = self.get_parquet_pattern()
+        use_rollup = self._tables_ready()
         
-        where_clauses = []
-        if store_name:
-            where_clauses.append(f"门店名称 = '{store_name}'")
-        if start_date:
-            where_clauses.append(f"CAST(日期 AS DATE) >= '{start_date}'")
-        if end_date:
-            where_clauses.append(f"CAST(日期 AS DATE) <= '{end_date}'")
+        where_clauses, params = self.row_filters(store_name, start_date, end_date, by_day=True)
         
         # 排除咖啡渠道
         where_clauses.append("渠道 NOT IN ('美团咖啡店', '饿了么咖啡店')")
+        if not use_rollup:
+            part_clauses, part_params = self.partition_filters(store_name, start_date, end_date)
+            where_clauses += part_clauses
+            params += part_params
         
-        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+        where_sql = self._where_sql(where_clauses)
         
-        sql = f"""
-            WITH order_level AS (
+        if use_rollup:
+            channel_stats_sql = f"""
                 SELECT 
-                    订单ID,
-                    渠道,
-                    SUM(实收价格 * 月售) as 订单金额,
-                    SUM(利润额) - SUM(平台服务费) - MAX(物流配送费) + SUM(企客后返) as 订单利润
-                FROM read_parquet('{parquet_pattern}')
+                    渠道 as channel,
+                    SUM(订单数) as order_count,
+                    COALESCE(SUM(销售额), 0) as amount,
+                    COALESCE(SUM(利润), 0) as profit,
+                    COALESCE(SUM(销售额) / NULLIF(SUM(订单数), 0), 0) as avg_value
+                FROM daily_rollup
                 {where_sql}
-                GROUP BY 订单ID, 渠道
-            ),
-            channel_stats AS (
+                GROUP BY 渠道
+            """
+        else:
+            channel_stats_sql = f"""
+                WITH order_level AS (
+                    SELECT 
+                        订单ID,
+                        渠道,
+                        SUM(实收价格 * 月售) as 订单金额,
+                        SUM(利润额) - SUM(平台服务费) - MAX(物流配送费) + SUM(企客后返) as 订单利润
+                    FROM {self.get_raw_source()}
+                    {where_sql}
+                    GROUP BY 订单ID, 渠道
+                )
                 SELECT 
                     渠道 as channel,
                     COUNT(*) as order_count,
@@ -341,6 +860,11 @@ class DuckDBService:
                     COALESCE(AVG(订单金额), 0) as avg_value
                 FROM order_level
                 GROUP BY 渠道
+            """
+        
+        sql = f"""
+            WITH channel_stats AS (
+                {channel_stats_sql}
             ),
             totals AS (
                 SELECT 
@@ -361,7 +885,7 @@ class DuckDBService:
             ORDER BY c.order_count DESC
         """
         
-        df = self.conn.execute(sql).fetchdf()
+        df = self._execute(sql, params, fetch="df")
         
         return [
             {
@@ -379,22 +903,19 @@ class DuckDBService:
     
     def _query_channels_from_aggregated(
         self,
-        agg_file: Path,
         store_name: Optional[str],
         start_date: Optional[date],
         end_date: Optional[date]
     ) -> List[Dict]:
-        """从预聚合Parquet查询渠道数据"""
-        where_clauses = []
-        if store_name:
-            where_clauses.append(f"门店名称 = '{store_name}'")
-        if start_date:
-            where_clauses.append(f"日期 >= '{start_date}'")
-        if end_date:
-            where_clauses.append(f"日期 <= '{end_date}'")
+        """从预聚合Parquet查询渠道数据（只读取与日期范围有交集的月分区）"""
+        agg_files = self.get_aggregated_source('channel_daily', start_date, end_date)
+        if agg_files is None:
+            return []
+        
+        where_clauses, params = self.row_filters(store_name, start_date, end_date)
         where_clauses.append("渠道 NOT IN ('美团咖啡店', '饿了么咖啡店')")
         
-        where_sql = f"WHERE {' AND '.join(where_clauses)}"
+        where_sql = self._where_sql(where_clauses)
         
         sql = f"""
             WITH channel_agg AS (
@@ -403,7 +924,7 @@ class DuckDBService:
                     SUM(订单数) as order_count,
                     SUM(销售额) as amount,
                     SUM(利润) as profit
-                FROM read_parquet('{agg_file}')
+                FROM read_parquet(?)
                 {where_sql}
                 GROUP BY 渠道
             ),
@@ -424,7 +945,7 @@ class DuckDBService:
             ORDER BY c.order_count DESC
         """
         
-        df = self.conn.execute(sql).fetchdf()
+        df = self._execute(sql, [agg_files] + params, fetch="df")
         
         return [
             {
@@ -453,17 +974,13 @@ class DuckDBService:
         if not self.has_parquet_data():
             return []
         
-        parquet_pattern = self.get_parquet_pattern()
+        detail_source, part_clauses, part_params = self._detail_source(store_name, start_date, end_date)
         
-        where_clauses = []
-        if store_name:
-            where_clauses.append(f"门店名称 = '{store_name}'")
-        if start_date:
-            where_clauses.append(f"日期 >= '{start_date}'")
-        if end_date:
-            where_clauses.append(f"日期 <= '{end_date}'")
+        where_clauses, params = self.row_filters(store_name, start_date, end_date)
+        where_clauses += part_clauses
+        params += part_params
         
-        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+        where_sql = self._where_sql(where_clauses)
         
         sql = f"""
             SELECT 
@@ -472,14 +989,14 @@ class DuckDBService:
                 COALESCE(SUM(实收价格 * 月售), 0) as amount,
                 COALESCE(SUM(利润额), 0) as profit,
                 COALESCE(SUM(月售), 0) as quantity
-            FROM read_parquet('{parquet_pattern}')
+            FROM {detail_source}
             {where_sql}
             GROUP BY 一级分类名
             ORDER BY amount DESC
-            LIMIT {top_n}
+            LIMIT CAST(? AS INTEGER)
         """
         
-        df = self.conn.execute(sql).fetchdf()
+        df = self._execute(sql, params + [int(top_n)], fetch="df")
         
         return [
             {
@@ -492,6 +1009,213 @@ class DuckDBService:
             for _, row in df.iterrows()
         ]
     
+    # ==================== 明细查询（列投影） ====================
+
+    def load_orders(
+        self,
+        columns: List[str],
+        store_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        channels: Optional[List[str]] = None,
+        categories: Optional[List[str]] = None,
+        categorical: Optional[bool] = None
+    ) -> pd.DataFrame:
+        """
+        按列加载订单明细（v1 端点订单数据的 Parquet 列式路径）
+
+        只读取声明的列，筛选下推到 Parquet 扫描，结果经 Arrow 转为 DataFrame。
+        列类型与 OrderLoaderService.load 一致：金额空值为 0、销量空值为 1、
+        门店/渠道/分类/商品名称列为分类类型（类别按字典序）。
+
+        Args:
+            columns: 需要的中文列名（必须是Parquet同步的列）
+            start_date/end_date: 按自然日闭区间
+            channels: 渠道列表
+            categories: 一级分类列表
+            categorical: 是否分类编码（默认 categorical_encoding_enabled()）
+        """
+        from .order_loader_service import PARQUET_SYNC_COLUMNS, ORDER_FIELD_MAP, _FLOAT, _QTY
+        from cache_utils import CATEGORICAL_COLUMNS, categorical_encoding_enabled
+
+        unknown = [c for c in columns if c not in PARQUET_SYNC_COLUMNS]
+        if not columns or unknown:
+            raise ValueError(f"未知订单字段: {unknown or columns}")
+
+        if not self.has_parquet_data():
+            return pd.DataFrame()
+
+        detail_source, part_clauses, part_params = self._detail_source(store_name, start_date, end_date)
+        where_clauses, params = self.row_filters(store_name, start_date, end_date, by_day=True)
+        if channels:
+            where_clauses.append("list_contains(?, 渠道)")
+            params.append(list(channels))
+        if categories:
+            where_clauses.append("list_contains(?, 一级分类名)")
+            params.append(list(categories))
+        where_clauses += part_clauses
+        params += part_params
+
+        sql = f"""
+            SELECT {', '.join(f'"{c}"' for c in columns)}
+            FROM {detail_source}
+            {self._where_sql(where_clauses)}
+        """
+        table = self._execute(sql, params, fetch="arrow")
+        if table.num_rows == 0:
+            return pd.DataFrame()
+
+        if categorical is None:
+            categorical = categorical_encoding_enabled()
+        if categorical:
+            for i, name in enumerate(table.column_names):
+                if name in CATEGORICAL_COLUMNS:
+                    table = table.set_column(i, name, table.column(i).dictionary_encode())
+
+        # 同步写入的值已按数据库加载规则补齐默认值，只在仍有空值/类型不同时补齐（比SQL中逐列 COALESCE 快）
+        df = table.to_pandas()
+        for name in df.columns:
+            kind = ORDER_FIELD_MAP[name][1]
+            if isinstance(df[name].dtype, pd.CategoricalDtype):
+                df[name] = df[name].cat.reorder_categories(sorted(df[name].cat.categories))
+            elif kind == _FLOAT and (df[name].dtype != "float64" or df[name].hasnans):
+                df[name] = df[name].fillna(0).astype("float64")
+            elif kind == _QTY and (df[name].dtype != "int64" or df[name].hasnans):
+                df[name] = df[name].fillna(1).astype("int64")
+        return df
+
+    def _cached_raw_meta(self, name: str, compute):
+        """按原始数据版本缓存的元信息"""
+        version = self.data_version()
+        cached = self._raw_meta.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        value = compute()
+        self._raw_meta[name] = (version, value)
+        return value
+
+    def raw_columns(self) -> set:
+        """
+        所有原始Parquet文件都包含的列（只读文件元数据）
+
+        同步列新增后，新旧文件混存期间只有公共列可以用 Parquet 回答
+        """
+        def compute() -> set:
+            if not self.has_parquet_data():
+                return set()
+            files: Dict[str, set] = {}
+            for file_name, name in self._execute(
+                "SELECT file_name, name FROM parquet_schema(?)", [self.get_parquet_pattern()]
+            ):
+                files.setdefault(file_name, set()).add(name)
+            return set.intersection(*files.values()) if files else set()
+
+        return self._cached_raw_meta("columns", compute)
+
+    def raw_day_counts(self) -> Dict[str, int]:
+        """原始数据每日行数（按 CAST(日期 AS DATE)，用于与 PostgreSQL 核对新鲜度）"""
+        def compute() -> Dict[str, int]:
+            if not self.has_parquet_data():
+                return {}
+            detail_source, _, _ = self._detail_source()
+            rows = self._execute(f"""
+                SELECT CAST(日期 AS DATE), COUNT(*)
+                FROM {detail_source}
+                GROUP BY 1
+            """)
+            return {str(day): int(count) for day, count in rows}
+
+        return self._cached_raw_meta("day_counts", compute)
+
+    def query_date_range(self, store_name: Optional[str] = None) -> Dict[str, Any]:
+        """查询日期范围（只读取日期列）"""
+        empty = {"min_date": None, "max_date": None, "total_days": 0}
+        if not self.has_parquet_data():
+            return empty
+
+        detail_source, part_clauses, part_params = self._detail_source(store_name)
+        where_clauses, params = self.row_filters(store_name)
+        where_clauses += part_clauses
+        params += part_params
+        where_sql = self._where_sql(where_clauses)
+        sql = f"""
+            SELECT MIN(CAST(日期 AS DATE)), MAX(CAST(日期 AS DATE))
+            FROM {detail_source}
+            {where_sql}
+        """
+        min_date, max_date = self._execute(sql, params, fetch="one")
+        if min_date is None or max_date is None:
+            return empty
+
+        return {
+            "min_date": str(min_date)[:10],
+            "max_date": str(max_date)[:10],
+            "total_days": (max_date - min_date).days + 1,
+        }
+
+    def query_distinct(self, column: str, store_name: Optional[str] = None) -> List[str]:
+        """查询某列的去重取值（门店列表/渠道列表，只读取该列）"""
+        from .order_loader_service import PARQUET_SYNC_COLUMNS
+
+        if column not in PARQUET_SYNC_COLUMNS:
+            raise ValueError(f"未知订单字段: {column}")
+        if not self.has_parquet_data():
+            return []
+
+        detail_source, part_clauses, part_params = self._detail_source(store_name)
+        store_clauses, params = self.row_filters(store_name)
+        where_clauses = [f'"{column}" IS NOT NULL'] + store_clauses + part_clauses
+        params += part_params
+
+        sql = f"""
+            SELECT DISTINCT "{column}"
+            FROM {detail_source}
+            WHERE {' AND '.join(where_clauses)}
+            ORDER BY 1
+        """
+        return [row[0] for row in self._execute(sql, params)]
+
+    # ==================== 分区统计 ====================
+
+    def data_version(self) -> int:
+        """原始数据版本（每次同步写入后变化，只读文件修改时间）"""
+        return self._raw_marker()
+
+    def _read_partitions(self) -> Dict[str, Any]:
+        """metadata/partitions.json 的 partitions（{月份: {"dates": {日期: 行数}, "synced_at": {日期: 时间}}}）"""
+        try:
+            with open(self.data_dir / "metadata" / "partitions.json", 'r', encoding='utf-8') as f:
+                return json.load(f).get("partitions", {})
+        except (OSError, ValueError):
+            return {}
+
+    def get_partition_stats(self) -> Dict[str, Any]:
+        """
+        分区统计（供查询路由估算扫描行数）
+
+        Returns:
+            {"version": 数据版本, "day_rows": {日期: 行数}, "stores": 门店数}
+        """
+        day_rows: Dict[str, int] = {}
+        for partition in self._read_partitions().values():
+            for day, rows in partition.get("dates", {}).items():
+                day_rows[day[:10]] = day_rows.get(day[:10], 0) + int(rows)
+
+        if self.is_hive_layout():
+            stores = len({p.name for p in self.raw_dir.glob("month=*/store=*")})
+        else:
+            stores = len(self.query_distinct('门店名称'))
+
+        return {"version": self.data_version(), "day_rows": day_rows, "stores": stores}
+
+    def raw_synced_at(self) -> Dict[str, datetime]:
+        """每日最后同步时间（记录同步时间之前写入的分区没有此项）"""
+        synced_at: Dict[str, datetime] = {}
+        for partition in self._read_partitions().values():
+            for day, value in partition.get("synced_at", {}).items():
+                synced_at[day[:10]] = max(datetime.fromisoformat(value), synced_at.get(day[:10], datetime.min))
+        return synced_at
+
     # ==================== 自定义查询 ====================
     
     def execute_custom_query(self, sql: str) -> pd.DataFrame:
@@ -507,7 +1231,8 @@ class DuckDBService:
             if word in sql_upper:
                 raise ValueError(f"禁止执行 {word} 操作")
         
-        return self.conn.execute(sql).fetchdf()
+        with self._pool.cursor() as cur:
+            return cur.execute(sql).fetchdf()
     
     # ==================== 状态查询 ====================
     
@@ -529,6 +1254,39 @@ class DuckDBService:
             "aggregated_parquet_count": len(agg_files),
             "aggregated_parquet_size_mb": round(agg_size / 1024 / 1024, 2),
             "has_data": len(raw_files) > 0,
+            "config": {
+                "threads": self.THREADS,
+                "memory_limit": self.MEMORY_LIMIT,
+                "pool_timeout_s": self.POOL_TIMEOUT,
+            },
+            "pool": self._pool.get_status(),
+            "statement_cache": {
+                **self._stmt_stats,
+                "size": len(self._statements),
+            },
+            "persistent": self._persistent_status(),
+        }
+    
+    def _persistent_status(self) -> Dict[str, Any]:
+        """持久化数据库状态"""
+        if self.db_path is None:
+            return {"enabled": False}
+        
+        tables = {}
+        with self._pool.cursor() as cur:
+            for table in ["orders", "order_rollup", "daily_rollup"]:
+                if self._table_columns(cur, table):
+                    tables[table] = cur.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            synced_days = cur.execute("SELECT COUNT(*) FROM sync_state").fetchone()[0]
+        return {
+            "enabled": True,
+            "database": str(self.db_path),
+            "size_mb": round(self.db_path.stat().st_size / 1024 / 1024, 2) if self.db_path.exists() else 0,
+            "ready": self._tables_marker is not None and self._raw_marker() == self._tables_marker,
+            "refreshing": self._refreshing,
+            "synced_days": synced_days,
+            "tables": tables,
+            **self._refresh_stats,
         }
 
 
@@ -46,6 +46,7 @@ class HealthService:
         "db_latency_ms": 100,
         "redis_latency_ms": 50,
         "error_rate_percent": 5,
+        "dispatch_wait_ms": 1000,
     }
     
     def __init__(self):
@@ -64,6 +65,9 @@ class HealthService:
         self._latency_sum = 0.0
         self._last_reset = datetime.now()
         self._lock = threading.Lock()
+        
+        # 分析端点分发统计（按端点）: 排队深度、执行中数量、等待时间
+        self._dispatch_stats: Dict[str, Dict[str, Any]] = {}
     
     def record_request(self, latency_ms: float, is_error: bool = False):
         """记录请求指标"""
@@ -73,6 +77,57 @@ class HealthService:
             if is_error:
                 self._error_count += 1
     
+    def _get_dispatch_entry(self, endpoint: str) -> Dict[str, Any]:
+        entry = self._dispatch_stats.get(endpoint)
+        if entry is None:
+            entry = {
+                "queue_depth": 0,
+                "running": 0,
+                "max_queue_depth": 0,
+                "calls": 0,
+                "wait_ms_sum": 0.0,
+                "wait_ms_max": 0.0,
+                "recent_waits": deque(maxlen=100),
+            }
+            self._dispatch_stats[endpoint] = entry
+        return entry
+    
+    def record_dispatch_queue(self, endpoint: str, queue_depth: int, running: int):
+        """记录分发排队深度（请求入队/出队时调用）"""
+        with self._lock:
+            entry = self._get_dispatch_entry(endpoint)
+            entry["queue_depth"] = queue_depth
+            entry["running"] = running
+            entry["max_queue_depth"] = max(entry["max_queue_depth"], queue_depth)
+    
+    def record_dispatch_wait(self, endpoint: str, wait_ms: float, queue_depth: int, running: int):
+        """记录分发等待时间（请求开始执行时调用）"""
+        with self._lock:
+            entry = self._get_dispatch_entry(endpoint)
+            entry["queue_depth"] = queue_depth
+            entry["running"] = running
+            entry["calls"] += 1
+            entry["wait_ms_sum"] += wait_ms
+            entry["wait_ms_max"] = max(entry["wait_ms_max"], wait_ms)
+            entry["recent_waits"].append(wait_ms)
+    
+    def get_dispatch_metrics(self) -> Dict[str, Any]:
+        """获取分发指标（按端点）"""
+        with self._lock:
+            result = {}
+            for endpoint, entry in self._dispatch_stats.items():
+                recent = list(entry["recent_waits"])
+                result[endpoint] = {
+                    "queue_depth": entry["queue_depth"],
+                    "running": entry["running"],
+                    "max_queue_depth": entry["max_queue_depth"],
+                    "calls": entry["calls"],
+                    "wait_avg_ms": round(entry["wait_ms_sum"] / entry["calls"], 2) if entry["calls"] else 0,
+                    "wait_max_ms": round(entry["wait_ms_max"], 2),
+                    "wait_recent_avg_ms": round(sum(recent) / len(recent), 2) if recent else 0,
+                }
+            return result
+    
     def _collect_metrics(self):
         """收集当前指标"""
         now = datetime.now()
@@ -315,6 +370,7 @@ class HealthService:
                 "api_error_rate": get_avg("api_errors"),
                 "api_latency_avg_ms": get_avg("api_latency_avg"),
             },
+            "dispatch": self.get_dispatch_metrics(),
             "thresholds": self.THRESHOLDS
         }
     
@@ -342,6 +398,16 @@ class HealthService:
                 "timestamp": datetime.now().isoformat()
             })
         
+        # 检查分析端点排队等待
+        for endpoint, stats in self.get_dispatch_metrics().items():
+            if stats["wait_recent_avg_ms"] > self.THRESHOLDS["dispatch_wait_ms"]:
+                alerts.append({
+                    "level": "warning",
+                    "source": "dispatch",
+                    "message": f"{endpoint} 排队等待过长: {stats['wait_recent_avg_ms']:.0f}ms (排队 {stats['queue_depth']})",
+                    "timestamp": datetime.now().isoformat()
+                })
+        
         # 检查Redis
         redis_status = self.check_redis()
         if redis_status.status == "unhealthy":
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+订单级事实表服务（预计算 calculate_order_metrics 结果）
+
+问题：/overview、/channels、/trend、/comparison、/channel-comparison 每次请求都把
+商品行数据 groupby('订单ID') 聚合一遍（calculate_order_metrics），再算订单实际利润、
+配送净成本、商家活动成本，并过滤异常订单。数据每天只导入一次，结果却每次重算。
+
+方案：
+- 按门店把 calculate_order_metrics 的结果物化为 Parquet：
+  data/order_facts/<门店哈希>.parquet，一行一个订单
+- orders 的所有写入入口（导入管道、删除门店、生命周期清理、Dash 上传）提交后经
+  notify_orders_changed 删除受影响门店的事实表，其余门店沿用到新版本；
+  受影响门店由看板上传后台预建，或在首次请求时按需补建
+- manifest.json 记录每个门店的事实文件及其数据版本（REDIS 全局版本号 / 数据库更新时间）
+- 端点按 (门店, 数据版本) 读取事实表，版本不一致视为过期，调用方回退到实时计算
+- 写入临时文件后 os.replace 原子替换；manifest 读改写由 O_EXCL 锁文件保护（多worker）
+
+说明：事实表由 calculate_order_metrics 本身生成，公式只有一份，与实时计算结果一致。
+口径：事实表按门店计算，不同门店出现相同订单ID时各自保留为一个订单；
+事实表缺失时端点的实时计算同样按门店（orders.calculate_order_metrics_by_store），
+结果不随事实表是否已建好而变化（见 测试订单事实表.py）。
+
+存储结构:
+data/order_facts/
+├── manifest.json         # {"complete": bool, "stores": {门店: {file, version, rows, built_at}}}
+├── 3f2a9c....parquet     # 门店名含中文，用哈希命名
+└── ...
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+import sys
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from cache_utils import freeze_dataframe
+
+
+class OrderFactsService:
+    """
+    订单级事实表服务
+
+    使用方式:
+        facts = order_facts_service.get(store_name, version)   # None 表示缺失或过期
+        if facts is None:
+            facts = calculate_order_metrics(df)
+        order_facts_service.publish(store_name, version, facts)
+    """
+
+    # manifest 锁超时（秒），超时视为持锁者已崩溃
+    LOCK_TIMEOUT = 60
+
+    # 本进程缓存的门店事实表数量上限（全量视图单独缓存）
+    MAX_CACHED_STORES = 32
+
+    def __init__(self, facts_dir: str = None):
+        if facts_dir is None:
+            facts_dir = PROJECT_ROOT / "data" / "order_facts"
+
+        self.facts_dir = Path(facts_dir)
+        self.facts_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.RLock()
+        # 本进程已加载的事实表: {门店: (version, df)}，全量视图: (version, df)
+        self._frames: Dict[str, Tuple[str, pd.DataFrame]] = {}
+        self._all: Optional[Tuple[str, pd.DataFrame]] = None
+        # manifest 缓存: (mtime_ns, manifest)
+        self._manifest_cache: Optional[Tuple[int, Dict]] = None
+        self._stats = {
+            "hits": 0,
+            "loads": 0,
+            "misses": 0,
+            "publishes": 0,
+            "last_publish_ms": 0.0,
+        }
+
+    # ==================== 路径 / manifest ====================
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.facts_dir / "manifest.json"
+
+    def _store_file(self, store_name: str) -> str:
+        return hashlib.md5(store_name.encode("utf-8")).hexdigest()[:16] + ".parquet"
+
+    def _read_manifest(self) -> Dict:
+        """读取 manifest（按修改时间缓存）"""
+        try:
+            mtime = self.manifest_path.stat().st_mtime_ns
+        except OSError:
+            return {"complete": False, "stores": {}}
+
+        cached = self._manifest_cache
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 订单事实表 manifest 读取失败: {e}")
+            return {"complete": False, "stores": {}}
+        manifest.setdefault("complete", False)
+        manifest.setdefault("stores", {})
+        self._manifest_cache = (mtime, manifest)
+        return manifest
+
+    def _write_manifest(self, manifest: Dict):
+        tmp_path = self.manifest_path.with_name(f"manifest.json.tmp-{os.getpid()}-{threading.get_ident()}")
+        tmp_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.manifest_path)
+
+    @contextmanager
+    def _manifest_lock(self):
+        """manifest 读改写锁（本进程线程锁 + 跨进程 O_EXCL 锁文件）"""
+        lock_path = self.facts_dir / ".manifest.lock"
+        with self._lock:
+            deadline = time.time() + self.LOCK_TIMEOUT
+            while True:
+                try:
+                    fd = os.open(str(lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                    os.write(fd, str(os.getpid()).encode())
+                    os.close(fd)
+                    break
+                except FileExistsError:
+                    try:
+                        if time.time() - lock_path.stat().st_mtime > self.LOCK_TIMEOUT:
+                            lock_path.unlink()
+                            continue
+                    except OSError:
+                        continue
+                    if time.time() > deadline:
+                        raise TimeoutError("订单事实表 manifest 锁等待超时")
+                    time.sleep(0.05)
+            try:
+                yield copy.deepcopy(self._read_manifest())
+            finally:
+                try:
+                    lock_path.unlink()
+                except OSError:
+                    pass
+
+    # ==================== 读取 ====================
+
+    def _load_store(self, store_name: str, entry: Dict) -> Optional[pd.DataFrame]:
+        """读取门店事实文件（本进程按版本缓存，返回只读数据）"""
+        version = entry["version"]
+        with self._lock:
+            cached = self._frames.get(store_name)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+        try:
+            df = freeze_dataframe(pd.read_parquet(self.facts_dir / entry["file"]))
+        except Exception as e:
+            print(f"⚠️ 订单事实表读取失败 (门店: {store_name}): {e}")
+            return None
+
+        with self._lock:
+            self._frames.pop(store_name, None)
+            self._frames[store_name] = (version, df)
+            while len(self._frames) > self.MAX_CACHED_STORES:
+                self._frames.pop(next(iter(self._frames)))
+            self._stats["loads"] += 1
+        return df
+
+    def get(self, store_name: Optional[str], version: str) -> Optional[pd.DataFrame]:
+        """
+        获取订单事实表（只读，调用方不得原地修改）
+
+        Args:
+            store_name: 门店名称，None 表示全部门店
+            version: 当前数据版本
+
+        Returns:
+            DataFrame，缺失或版本不一致时返回None
+        """
+        if store_name is None:
+            return self._get_all(version)
+
+        entry = self._read_manifest()["stores"].get(store_name)
+        if entry is None or entry.get("version") != version:
+            self._stats["misses"] += 1
+            return None
+        df = self._load_store(store_name, entry)
+        if df is None:
+            self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        return df
+
+    def _get_all(self, version: str) -> Optional[pd.DataFrame]:
+        """全部门店事实表（要求 manifest 覆盖全部门店且均为当前版本）"""
+        with self._lock:
+            if self._all is not None and self._all[0] == version:
+                self._stats["hits"] += 1
+                return self._all[1]
+
+        manifest = self._read_manifest()
+        stores = manifest["stores"]
+        if not manifest["complete"] or any(e.get("version") != version for e in stores.values()):
+            self._stats["misses"] += 1
+            return None
+
+        frames = []
+        for store_name, entry in stores.items():
+            df = self._load_store(store_name, entry)
+            if df is None:
+                self._stats["misses"] += 1
+                return None
+            frames.append(df)
+
+        all_df = freeze_dataframe(pd.concat(frames, ignore_index=True)) if frames else pd.DataFrame()
+        with self._lock:
+            self._all = (version, all_df)
+        self._stats["hits"] += 1
+        return all_df
+
+    def missing_stores(self, store_names: Iterable[str], version: str) -> List[str]:
+        """给定门店中事实表缺失或过期的门店"""
+        stores = self._read_manifest()["stores"]
+        return [s for s in store_names if stores.get(s, {}).get("version") != version]
+
+    # ==================== 写入 ====================
+
+    def publish(self, store_name: str, version: str, facts: pd.DataFrame) -> bool:
+        """
+        发布门店事实表
+
+        Args:
+            store_name: 门店名称
+            version: 生成事实表时（加载数据前）读取的数据版本
+            facts: calculate_order_metrics 的结果
+        """
+        start = time.time()
+        file_name = self._store_file(store_name)
+        path = self.facts_dir / file_name
+        tmp_path = path.with_name(f"{file_name}.tmp-{os.getpid()}-{threading.get_ident()}")
+        try:
+            facts.to_parquet(tmp_path, index=False, compression="zstd")
+            with self._manifest_lock() as manifest:
+                os.replace(tmp_path, path)
+                manifest["stores"][store_name] = {
+                    "file": file_name,
+                    "version": str(version),
+                    "rows": int(len(facts)),
+                    "built_at": datetime.now().isoformat(timespec="seconds"),
+                }
+                self._write_manifest(manifest)
+        except Exception as e:
+            print(f"⚠️ 订单事实表发布失败 (门店: {store_name}): {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return False
+
+        elapsed_ms = (time.time() - start) * 1000
+        with self._lock:
+            self._frames.pop(store_name, None)
+            self._all = None
+            self._stats["publishes"] += 1
+            self._stats["last_publish_ms"] = round(elapsed_ms, 1)
+        print(f"✅ 订单事实表已发布 (门店: {store_name}, 版本: {version}, {len(facts)} 单, {elapsed_ms:.0f}ms)")
+        return True
+
+    def remove(self, store_names: Iterable[str]):
+        """删除门店事实表（门店数据被替换/删除时同步调用，重建完成前该门店回退到实时计算）"""
+        store_names = list(store_names)
+        try:
+            with self._manifest_lock() as manifest:
+                for store_name in store_names:
+                    entry = manifest["stores"].pop(store_name, None)
+                    if entry is not None:
+                        try:
+                            (self.facts_dir / entry["file"]).unlink()
+                        except OSError:
+                            pass
+                self._write_manifest(manifest)
+        except Exception as e:
+            print(f"⚠️ 订单事实表删除失败: {e}")
+            return
+        with self._lock:
+            for store_name in store_names:
+                self._frames.pop(store_name, None)
+            self._all = None
+
+    def carry_forward(self, version: str, complete: Optional[bool] = None):
+        """
+        把现存条目标记为指定版本
+
+        仅由 notify_orders_changed（orders 写入/删除提交后）调用：受影响门店已先 remove()，
+        其余门店数据未变，版本号变化不应使其事实表失效。
+
+        Args:
+            version: 新数据版本
+            complete: 是否覆盖全部门店（None 表示保持不变）
+        """
+        try:
+            with self._manifest_lock() as manifest:
+                for entry in manifest["stores"].values():
+                    entry["version"] = str(version)
+                if complete is not None:
+                    manifest["complete"] = complete
+                self._write_manifest(manifest)
+        except Exception as e:
+            print(f"⚠️ 订单事实表版本更新失败: {e}")
+
+    def mark_complete(self, complete: bool = True):
+        """标记 manifest 是否覆盖全部门店（全量重建后调用）"""
+        try:
+            with self._manifest_lock() as manifest:
+                manifest["complete"] = complete
+                self._write_manifest(manifest)
+        except Exception as e:
+            print(f"⚠️ 订单事实表状态更新失败: {e}")
+
+    # ==================== 管理 ====================
+
+    def evict(self):
+        """释放本进程缓存的事实表"""
+        with self._lock:
+            self._frames.clear()
+            self._all = None
+
+    def get_status(self) -> Dict:
+        """获取事实表统计"""
+        manifest = self._read_manifest()
+        with self._lock:
+            cached = {store: version for store, (version, _) in self._frames.items()}
+        return {
+            **self._stats,
+            "complete": manifest["complete"],
+            "stores": manifest["stores"],
+            "cached": cached,
+            "facts_dir": str(self.facts_dir),
+        }
+
+
+# 全局单例
+order_facts_service = OrderFactsService()
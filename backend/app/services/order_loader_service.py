@@ -0,0 +1,638 @@
+# -*- coding: utf-8 -*-
+"""
+订单数据列式加载服务
+
+替代 `session.query(Order).all()` + 逐行构造字典 + `pd.DataFrame(data)` 的加载方式：
+- 只SELECT需要的列，`or 0` 默认值下推到SQL（COALESCE）
+- 服务端游标流式读取（stream_results + fetchmany），不物化ORM对象
+- 每批直接转成按列的 numpy 数组，最后一次性拼接成 DataFrame
+- 门店/渠道/分类/商品名称列分批字典编码为分类类型（不物化整列Python字符串）
+- OrderQuery 谓词（门店/日期/渠道/分类/列）下推为 SQL WHERE + 投影，
+  同一谓词也可在已缓存的更宽范围数据上用 pandas 回答
+- iter_arrow_batches：同一SELECT按批转为 Arrow RecordBatch，供 Parquet 导出流式写入
+  （每批处理完即释放，内存与批大小相关，与导出天数/行数无关）
+- Parquet 列式路径：load_query 在 Parquet 覆盖本次查询时改由 DuckDB 读取
+  （列齐全，且日期范围内每天的行数与 PostgreSQL 一致、同步时间不早于最后更新），
+  筛选/投影下推到 Parquet 扫描，经 Arrow 转为 DataFrame，列类型与数据库加载一致
+
+中文字段映射与原 get_order_data / get_all_stores_data / sync_scheduler 完全一致，
+由以下模块共享：
+- api/v1/orders.py: get_order_data
+- api/v1/store_comparison.py: get_all_stores_data
+- services/parquet_sync_service.py: export_day / backfill（定时同步、历史回填）
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import Float, Integer, cast, func, select
+
+import sys
+from pathlib import Path
+APP_DIR = Path(__file__).resolve().parent.parent
+PROJECT_ROOT = APP_DIR.parent.parent
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from database.connection import engine
+from database.models import Order
+from cache_utils import CATEGORICAL_COLUMNS, categorical_encoding_enabled
+
+
+# 字段类型
+_STR = "str"        # 字符串（保持None）
+_DATE = "date"      # 日期时间
+_FLOAT = "float"    # 金额类字段：float(x or 0)
+_QTY = "qty"        # 销量：None 时默认 1
+_RAW_INT = "raw"    # 原样返回（允许None，如库存）
+
+# 中文列名 -> (ORM列, 类型)，顺序即DataFrame列顺序
+ORDER_FIELD_MAP: Dict[str, Tuple[object, str]] = {
+    '订单ID': (Order.order_id, _STR),
+    '门店名称': (Order.store_name, _STR),
+    '门店ID': (Order.store_id, _STR),
+    '日期': (Order.date, _DATE),
+    '渠道': (Order.channel, _STR),
+    '商品名称': (Order.product_name, _STR),
+    '一级分类名': (Order.category_level1, _STR),
+    '三级分类名': (Order.category_level3, _STR),
+    '月售': (Order.quantity, _QTY),
+    '实收价格': (Order.actual_price, _FLOAT),
+    '商品实售价': (Order.price, _FLOAT),
+    '商品原价': (Order.original_price, _FLOAT),
+    '商品采购成本': (Order.cost, _FLOAT),
+    '利润额': (Order.profit, _FLOAT),
+    '物流配送费': (Order.delivery_fee, _FLOAT),
+    '平台服务费': (Order.platform_service_fee, _FLOAT),
+    '平台佣金': (Order.commission, _FLOAT),
+    '预计订单收入': (Order.amount, _FLOAT),
+    '企客后返': (Order.corporate_rebate, _FLOAT),
+    '用户支付配送费': (Order.user_paid_delivery_fee, _FLOAT),
+    '配送费减免金额': (Order.delivery_discount, _FLOAT),
+    '满减金额': (Order.full_reduction, _FLOAT),
+    '商品减免金额': (Order.product_discount, _FLOAT),
+    '新客减免金额': (Order.new_customer_discount, _FLOAT),
+    '商家代金券': (Order.merchant_voucher, _FLOAT),
+    '商家承担部分券': (Order.merchant_share, _FLOAT),
+    '满赠金额': (Order.gift_amount, _FLOAT),
+    '商家其他优惠': (Order.other_merchant_discount, _FLOAT),
+    '打包袋金额': (Order.packaging_fee, _FLOAT),
+    '库存': (Order.stock, _RAW_INT),
+}
+
+# Arrow 类型（Parquet 导出），与 pandas 写出的原始文件 schema 一致
+_ARROW_TYPES = {
+    _STR: pa.string(),
+    _DATE: pa.timestamp('ns'),
+    _FLOAT: pa.float64(),
+    _QTY: pa.int64(),
+    _RAW_INT: pa.int64(),
+}
+
+# 各调用方使用的列集合（与改造前的字典字段一一对应）
+API_COLUMNS: List[str] = [c for c in ORDER_FIELD_MAP if c != '门店ID']
+STORE_COMPARISON_COLUMNS: List[str] = [c for c in ORDER_FIELD_MAP if c != '库存']
+# Parquet 同步全部字段（v1 端点的订单数据可直接从 Parquet 读取）
+PARQUET_SYNC_COLUMNS: List[str] = list(ORDER_FIELD_MAP)
+
+
+def _as_tuple(values) -> Optional[Tuple[str, ...]]:
+    """列表参数规范化为有序元组（None/空 表示不筛选）"""
+    if not values:
+        return None
+    if isinstance(values, str):
+        values = [values]
+    return tuple(sorted(set(values)))
+
+
+class _DictionaryEncoder:
+    """
+    分批字典编码（字符串列 -> 分类编码）
+
+    每批只对本批的去重值查全局字典，整列只保留 int32 编码，
+    最后按字典序重排分类，分组/排序顺序与字符串列一致。
+    """
+
+    def __init__(self):
+        self._lookup: Dict[str, int] = {}
+        self._categories: List[str] = []
+
+    def encode(self, values) -> np.ndarray:
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        if len(uniques) == 0:
+            return np.full(len(codes), -1, dtype=np.int32)
+        mapping = np.empty(len(uniques), dtype=np.int32)
+        for i, value in enumerate(uniques):
+            code = self._lookup.get(value)
+            if code is None:
+                code = self._lookup[value] = len(self._categories)
+                self._categories.append(value)
+            mapping[i] = code
+        return np.where(codes >= 0, mapping[codes], -1).astype(np.int32)
+
+    def finish(self, chunks: List[np.ndarray]) -> pd.Categorical:
+        codes = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+        categories = np.asarray(self._categories, dtype=object)
+        order = np.argsort(categories, kind='stable')
+        rank = np.empty(len(order), dtype=np.int32)
+        rank[order] = np.arange(len(order), dtype=np.int32)
+        if len(rank):
+            codes = np.where(codes >= 0, rank[codes], -1).astype(np.int32)
+        return pd.Categorical.from_codes(codes, categories=list(categories[order]))
+
+
+@dataclass(frozen=True)
+class OrderQuery:
+    """
+    订单数据谓词（可下推到SQL，也可在缓存数据上回答）
+
+    - start_date/end_date: 闭区间，按自然日（end_date 含当天全部时间）
+    - channels: 渠道（Order.channel）
+    - categories: 一级分类（Order.category_level1）
+    - columns: 需要的中文列（None 表示 API_COLUMNS 全部）
+    """
+    store_name: Optional[str] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    channels: Optional[Tuple[str, ...]] = None
+    categories: Optional[Tuple[str, ...]] = None
+    columns: Optional[Tuple[str, ...]] = None
+
+    @classmethod
+    def build(
+        cls,
+        store_name: Optional[str] = None,
+        start_date=None,
+        end_date=None,
+        channels=None,
+        categories=None,
+        columns=None,
+    ) -> "OrderQuery":
+        """从端点参数构造（日期支持 date/datetime/'YYYY-MM-DD'，解析失败视为不筛选）"""
+        def to_date(value) -> Optional[date]:
+            if value is None or value == "":
+                return None
+            if isinstance(value, datetime):
+                return value.date()
+            if isinstance(value, date):
+                return value
+            try:
+                return pd.to_datetime(value).date()
+            except (ValueError, TypeError):
+                return None
+
+        if isinstance(channels, str):
+            channels = [channels]
+        # 'all' 表示全部渠道
+        channels = [c for c in (channels or []) if c and c != 'all']
+        return cls(
+            store_name=store_name or None,
+            start_date=to_date(start_date),
+            end_date=to_date(end_date),
+            channels=_as_tuple(channels),
+            categories=_as_tuple(categories),
+            columns=tuple(columns) if columns else None,
+        )
+
+    @property
+    def has_predicate(self) -> bool:
+        """除门店外是否还有行筛选/列投影"""
+        return any([self.start_date, self.end_date, self.channels, self.categories, self.columns])
+
+    def criteria(self) -> list:
+        """转换为 SQLAlchemy 过滤条件"""
+        criteria = []
+        if self.store_name:
+            criteria.append(Order.store_name == self.store_name)
+        if self.start_date:
+            criteria.append(Order.date >= datetime.combine(self.start_date, datetime.min.time()))
+        if self.end_date:
+            criteria.append(Order.date <= datetime.combine(self.end_date, datetime.max.time()))
+        if self.channels:
+            criteria.append(Order.channel.in_(self.channels))
+        if self.categories:
+            criteria.append(Order.category_level1.in_(self.categories))
+        return criteria
+
+    def select_columns(self, default: Sequence[str]) -> List[str]:
+        """需要加载的列（保持 default 中的顺序）"""
+        if not self.columns:
+            return list(default)
+        return [c for c in default if c in self.columns]
+
+    def narrowing_columns(self, other: "OrderQuery") -> List[str]:
+        """在本谓词的结果上得到 other 时需要筛选的列（other 在该维度上比本谓词更窄）"""
+        needed = []
+        if other.store_name and not self.store_name:
+            needed.append('门店名称')
+        if (other.start_date, other.end_date) != (self.start_date, self.end_date):
+            needed.append('日期')
+        if other.channels and set(other.channels) != set(self.channels or ()):
+            needed.append('渠道')
+        if other.categories and set(other.categories) != set(self.categories or ()):
+            needed.append('一级分类名')
+        return needed
+
+    def covers(self, other: "OrderQuery") -> bool:
+        """
+        本谓词的结果是否包含 other 的结果（可在本结果上筛选得到 other）
+
+        带列投影的结果必须包含 other 需要再筛选的列，否则 apply 无法执行该筛选
+        （如只含 渠道 列的全量结果不能回答指定门店的查询）
+        """
+        if self.store_name and self.store_name != other.store_name:
+            return False
+        if self.start_date and (not other.start_date or other.start_date < self.start_date):
+            return False
+        if self.end_date and (not other.end_date or other.end_date > self.end_date):
+            return False
+        for mine, theirs in ((self.channels, other.channels), (self.categories, other.categories)):
+            if mine and (not theirs or not set(theirs) <= set(mine)):
+                return False
+        if self.columns:
+            if not other.columns or not set(other.columns) <= set(self.columns):
+                return False
+            if not set(self.narrowing_columns(other)) <= set(self.columns):
+                return False
+        return True
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """在（更宽范围的）已加载数据上执行本谓词"""
+        if df.empty:
+            return df
+        mask = None
+
+        def add(condition):
+            nonlocal mask
+            mask = condition if mask is None else (mask & condition)
+
+        if self.store_name and '门店名称' in df.columns:
+            add(df['门店名称'] == self.store_name)
+        if (self.start_date or self.end_date) and '日期' in df.columns:
+            dates = pd.to_datetime(df['日期'])
+            if self.start_date:
+                add(dates >= pd.Timestamp(self.start_date))
+            if self.end_date:
+                add(dates < pd.Timestamp(self.end_date) + pd.Timedelta(days=1))
+        if self.channels and '渠道' in df.columns:
+            add(df['渠道'].isin(self.channels))
+        if self.categories and '一级分类名' in df.columns:
+            add(df['一级分类名'].isin(self.categories))
+
+        result = df if mask is None else df[mask]
+        if self.columns:
+            result = result[[c for c in result.columns if c in self.columns]]
+        return result
+
+
+class OrderLoaderService:
+    """
+    订单数据列式加载服务
+
+    使用方式:
+        df = order_loader_service.load(API_COLUMNS, Order.store_name == store_name)
+        df = order_loader_service.load_query(OrderQuery.build(store_name, start_date, end_date))
+        df = order_loader_service.load_query(query, data_version=version)  # 允许走 Parquet
+    """
+
+    # 每批从服务端游标读取的行数
+    BATCH_SIZE = 50_000
+
+    # Parquet 列式路径（环境变量 ORDER_FRAME_PARQUET=0 关闭，始终从数据库加载）
+    PARQUET_ENABLED = os.getenv("ORDER_FRAME_PARQUET", "1").lower() in ("1", "true", "yes")
+
+    def __init__(self):
+        self._stats = {
+            "loads": 0,
+            "rows": 0,
+            "last_load_ms": 0.0,
+            "last_rows": 0,
+            "parquet_loads": 0,
+            "last_source": None,
+        }
+        self._stats_lock = threading.Lock()
+        # 与 PostgreSQL 不一致的日期（按 (数据版本, Parquet版本) 缓存，只含已核对的日期区间）
+        self._stale_key: Optional[Tuple] = None
+        self._stale_ranges: List[Tuple[str, str]] = []
+        self._stale_days: set = set()
+        self._stale_lock = threading.Lock()
+
+    def _select_expr(self, name: str):
+        """构造单列SELECT表达式（默认值下推到SQL）"""
+        column, kind = ORDER_FIELD_MAP[name]
+        if kind == _FLOAT:
+            expr = cast(func.coalesce(column, 0), Float)
+        elif kind == _QTY:
+            expr = cast(func.coalesce(column, 1), Integer)
+        else:
+            expr = column
+        return expr.label(name)
+
+    def _finalize_column(self, name: str, chunks: List[np.ndarray], encoder: Optional[_DictionaryEncoder] = None):
+        """把分批读取的列数组拼接为最终列"""
+        if encoder is not None:
+            return encoder.finish(chunks)
+        kind = ORDER_FIELD_MAP[name][1]
+        values = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+        if kind == _DATE:
+            return pd.to_datetime(values)
+        if kind == _RAW_INT:
+            # 与 pd.DataFrame(list_of_dicts) 的推断一致：无空值为int，有空值为float
+            return pd.to_numeric(pd.Series(values, dtype=object))
+        return values
+
+    def load(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        *criteria,
+        batch_size: Optional[int] = None,
+        categorical: Optional[bool] = None,
+    ) -> pd.DataFrame:
+        """
+        流式加载订单数据为DataFrame
+
+        Args:
+            columns: 需要的中文列名（默认 API_COLUMNS）
+            *criteria: SQLAlchemy 过滤条件（如 Order.store_name == 'xx'）
+            batch_size: 每批读取行数
+            categorical: CATEGORICAL_COLUMNS 是否编码为分类类型
+                （默认 categorical_encoding_enabled()）
+
+        Returns:
+            DataFrame（无数据时返回空DataFrame）
+        """
+        columns = list(columns or API_COLUMNS)
+        unknown = [c for c in columns if c not in ORDER_FIELD_MAP]
+        if unknown:
+            raise ValueError(f"未知订单字段: {unknown}")
+
+        batch_size = batch_size or self.BATCH_SIZE
+        dtypes = {
+            _FLOAT: np.float64,
+            _QTY: np.int64,
+        }
+
+        stmt = select(*[self._select_expr(c) for c in columns])
+        if criteria:
+            stmt = stmt.where(*criteria)
+
+        if categorical is None:
+            categorical = categorical_encoding_enabled()
+        encoders: Dict[str, _DictionaryEncoder] = {
+            c: _DictionaryEncoder() for c in columns
+            if categorical and c in CATEGORICAL_COLUMNS and ORDER_FIELD_MAP[c][1] == _STR
+        }
+
+        start = time.time()
+        chunks: Dict[str, List[np.ndarray]] = {c: [] for c in columns}
+        total = 0
+
+        with engine.connect() as conn:
+            result = conn.execution_options(
+                stream_results=True, max_row_buffer=batch_size
+            ).execute(stmt)
+            for rows in result.partitions(batch_size):
+                col_values = list(zip(*rows))
+                for i, name in enumerate(columns):
+                    if name in encoders:
+                        chunks[name].append(encoders[name].encode(col_values[i]))
+                        continue
+                    kind = ORDER_FIELD_MAP[name][1]
+                    chunks[name].append(
+                        np.asarray(col_values[i], dtype=dtypes.get(kind, object))
+                    )
+                total += len(rows)
+
+        if total == 0:
+            return pd.DataFrame()
+
+        df = pd.DataFrame(
+            {name: self._finalize_column(name, chunks[name], encoders.get(name)) for name in columns},
+            columns=columns,
+        )
+
+        self._record_load("postgresql", total, start)
+        return df
+
+    @staticmethod
+    def arrow_schema(columns: Sequence[str]) -> pa.Schema:
+        """中文列对应的 Arrow schema"""
+        return pa.schema([(name, _ARROW_TYPES[ORDER_FIELD_MAP[name][1]]) for name in columns])
+
+    def iter_arrow_batches(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        *criteria,
+        batch_size: Optional[int] = None,
+    ) -> Iterator[pa.RecordBatch]:
+        """
+        流式读取订单数据为 Arrow RecordBatch（Parquet 导出用）
+
+        与 load 使用同一SELECT（默认值下推到SQL），服务端游标每次取 batch_size 行，
+        转为按列的 Arrow 数组后交给调用方，不在内存中累积
+
+        Args:
+            columns: 需要的中文列名（默认 PARQUET_SYNC_COLUMNS）
+            *criteria: SQLAlchemy 过滤条件
+            batch_size: 每批读取行数
+        """
+        columns = list(columns or PARQUET_SYNC_COLUMNS)
+        unknown = [c for c in columns if c not in ORDER_FIELD_MAP]
+        if unknown:
+            raise ValueError(f"未知订单字段: {unknown}")
+
+        batch_size = batch_size or self.BATCH_SIZE
+        schema = self.arrow_schema(columns)
+        stmt = select(*[self._select_expr(c) for c in columns])
+        if criteria:
+            stmt = stmt.where(*criteria)
+
+        start = time.time()
+        total = 0
+        with engine.connect() as conn:
+            result = conn.execution_options(
+                stream_results=True, max_row_buffer=batch_size
+            ).execute(stmt)
+            for rows in result.partitions(batch_size):
+                col_values = list(zip(*rows))
+                yield pa.RecordBatch.from_arrays(
+                    [pa.array(col_values[i], type=field.type) for i, field in enumerate(schema)],
+                    schema=schema,
+                )
+                total += len(rows)
+
+        self._record_load("postgresql", total, start)
+
+    def probe_rows(self, *criteria, known_id: Optional[int] = None) -> Dict:
+        """
+        行数 / 最大id / 最大更新时间（增量同步的水位线，一条聚合查询，快照一致）
+
+        Args:
+            *criteria: SQLAlchemy 过滤条件（如某一天的日期范围）
+            known_id: 已同步的最大id；给出时另外统计 id <= known_id 的行数和最大更新时间，
+                用于判断已同步的行是否被修改或删除
+
+        Returns:
+            {"max_id", "rows", "max_updated_at"}，给出 known_id 时还有 {"known_rows", "known_max_updated_at"}
+        """
+        columns = [func.max(Order.id), func.count(Order.id), func.max(Order.updated_at)]
+        if known_id is not None:
+            known = Order.id <= known_id
+            columns += [func.count(Order.id).filter(known), func.max(Order.updated_at).filter(known)]
+        stmt = select(*columns)
+        if criteria:
+            stmt = stmt.where(*criteria)
+        with engine.connect() as conn:
+            row = conn.execute(stmt).one()
+
+        result = {"max_id": row[0], "rows": row[1], "max_updated_at": row[2]}
+        if known_id is not None:
+            result["known_rows"] = row[3]
+            result["known_max_updated_at"] = row[4]
+        return result
+
+    def _record_load(self, source: str, rows: int, start: float):
+        elapsed_ms = round((time.time() - start) * 1000, 1)
+        # 加载在线程池中并发执行
+        with self._stats_lock:
+            self._stats["loads"] += 1
+            self._stats["rows"] += rows
+            self._stats["last_load_ms"] = elapsed_ms
+            self._stats["last_rows"] = rows
+            self._stats["last_source"] = source
+            if source == "parquet":
+                self._stats["parquet_loads"] += 1
+
+    def load_query(
+        self,
+        query: OrderQuery,
+        default_columns: Sequence[str] = API_COLUMNS,
+        data_version: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """
+        按谓词加载（行筛选下推为WHERE，列投影下推为SELECT）
+
+        Args:
+            data_version: 数据库数据版本（get_data_version）；给出且 Parquet 覆盖本次查询时
+                从 Parquet 读取，不给出时始终从数据库加载
+
+        本次的数据来源在这里输出（get_status 的 last_source 是进程共享的统计，并发加载时不可靠）
+        """
+        columns = query.select_columns(default_columns)
+        if data_version is not None and self.parquet_covers(query, columns, data_version):
+            from .duckdb_service import duckdb_service
+
+            start = time.time()
+            df = duckdb_service.load_orders(
+                columns,
+                store_name=query.store_name,
+                start_date=query.start_date,
+                end_date=query.end_date,
+                channels=list(query.channels or []),
+                categories=list(query.categories or []),
+            )
+            self._record_load("parquet", len(df), start)
+            source = "Parquet"
+        else:
+            df = self.load(columns, *query.criteria())
+            source = "数据库"
+        print(f"✅ {source}加载完成: {len(df)} 条记录 (门店: {query.store_name or '全部'})")
+        return df
+
+    def parquet_covers(self, query: OrderQuery, columns: Sequence[str], data_version: str) -> bool:
+        """Parquet 能否回答本次查询（列齐全，日期范围内没有与数据库不一致的日期）"""
+        if not self.PARQUET_ENABLED:
+            return False
+        try:
+            from .duckdb_service import duckdb_service
+
+            if not duckdb_service.has_parquet_data() or not set(columns) <= duckdb_service.raw_columns():
+                return False
+            stale = self._get_stale_days(data_version, query.start_date, query.end_date)
+        except Exception as e:
+            print(f"⚠️ Parquet新鲜度检查失败，从数据库加载: {e}")
+            return False
+        return not stale
+
+    def _get_stale_days(
+        self,
+        data_version: str,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+    ) -> set:
+        """
+        [start_date, end_date] 内 Parquet 与数据库不一致的日期（按 数据版本 + Parquet版本 缓存）
+
+        某天不一致：行数不同，或数据库该天的最后更新时间晚于该天的 Parquet 同步时间；
+        没有同步时间的日期（记录同步时间之前导出的分区）无法判断是否原地修改过，
+        同样视为不一致（由迁移脚本/定时任务 ParquetSyncService.reexport_unsynced_days 重新导出）
+
+        Parquet 侧的行数/同步时间在同步时写入 partitions.json；数据库侧只按本次查询的日期范围
+        分组统计（走日期索引），已核对过的区间在数据版本不变时直接复用
+        """
+        from .duckdb_service import duckdb_service
+
+        key = (data_version, duckdb_service.data_version())
+        low = str(start_date) if start_date else "0000-00-00"
+        high = str(end_date) if end_date else "9999-99-99"
+        with self._stale_lock:
+            if self._stale_key != key:
+                self._stale_key, self._stale_ranges, self._stale_days = key, [], set()
+            if any(a <= low and high <= b for a, b in self._stale_ranges):
+                return {d for d in self._stale_days if low <= d <= high}
+
+        day = func.date(Order.date)
+        stmt = select(day, func.count(), func.max(Order.updated_at)).group_by(day)
+        criteria = OrderQuery(start_date=start_date, end_date=end_date).criteria()
+        if criteria:
+            stmt = stmt.where(*criteria)
+        with engine.connect() as conn:
+            db_days = {str(d)[:10]: (count, updated) for d, count, updated in conn.execute(stmt)}
+
+        parquet_counts = {
+            d: count for d, count in duckdb_service.raw_day_counts().items() if low <= d <= high
+        }
+        synced_at = duckdb_service.raw_synced_at()
+        stale = set()
+        for d in set(db_days) | set(parquet_counts):
+            count, updated = db_days.get(d, (0, None))
+            if parquet_counts.get(d, 0) != count or d not in synced_at:
+                stale.add(d)
+            elif updated is not None and updated > synced_at[d]:
+                stale.add(d)
+
+        with self._stale_lock:
+            if self._stale_key == key:
+                self._stale_ranges.append((low, high))
+                self._stale_days |= stale
+        return stale
+
+    def get_date_bounds(self, *criteria) -> Tuple[Optional[datetime], Optional[datetime]]:
+        """
+        查询订单日期范围（MIN/MAX，走日期索引）
+
+        用于“最近N天/最后一天”这类相对数据最大日期的筛选，先确定范围再下推加载
+        """
+        stmt = select(func.min(Order.date), func.max(Order.date))
+        if criteria:
+            stmt = stmt.where(*criteria)
+        with engine.connect() as conn:
+            row = conn.execute(stmt).one()
+        return row[0], row[1]
+
+    def get_status(self) -> Dict:
+        """获取加载统计"""
+        with self._stats_lock:
+            return dict(self._stats)
+
+
+# 全局单例
+order_loader_service = OrderLoaderService()
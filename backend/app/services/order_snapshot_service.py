@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+订单数据共享快照服务（多worker共享内存）
+
+问题：uvicorn/gunicorn 多worker部署时，每个worker各自持有一份完整订单DataFrame
+（orders._memory_cache / store_cache / store_comparison._store_comparison_cache），
+16个worker = 16份相同数据。
+
+方案：
+- 每个 (scope, 数据版本) 只发布一次只读快照：data/snapshots/<scope>/v_<版本>.arrow
+  （Arrow IPC 文件格式，不压缩，才能内存映射）
+- 写入临时文件后 os.replace 原子替换；O_EXCL 锁文件保证只有一个worker写
+- 各worker通过 pa.memory_map 挂载，数值列零拷贝，物理页由操作系统页缓存共享
+- 数据版本（REDIS_CACHE_MANAGER.get_global_version()）变化时，
+  worker 挂载新版本并原子替换本地句柄，旧版本文件由发布者清理
+
+存储结构:
+data/snapshots/
+├── 3f2a9c.../            # scope 哈希（如 order_data:all）
+│   └── v_12.arrow
+└── ...
+"""
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+from pathlib import Path
+
+
+class OrderSnapshotService:
+    """
+    订单数据共享快照服务
+
+    使用方式:
+        df = order_snapshot_service.get("order_data:all", version)
+        if df is None:
+            df = load_from_db()
+            df = order_snapshot_service.publish("order_data:all", version, df)
+    """
+
+    # 发布锁超时（秒），超时视为发布者已崩溃
+    LOCK_TIMEOUT = 300
+
+    def __init__(self, snapshot_dir: str = None):
+        if snapshot_dir is None:
+            project_root = Path(__file__).resolve().parent.parent.parent.parent
+            snapshot_dir = project_root / "data" / "snapshots"
+
+        self.snapshot_dir = Path(snapshot_dir)
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+
+        # 本进程已挂载的快照: {scope: (version, df)}
+        self._attached: Dict[str, Tuple[str, pd.DataFrame]] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "attaches": 0,
+            "publishes": 0,
+            "misses": 0,
+        }
+
+    # ==================== 路径 ====================
+
+    def _scope_dir(self, scope: str) -> Path:
+        """scope 目录（门店名含中文，用哈希命名）"""
+        return self.snapshot_dir / hashlib.md5(scope.encode("utf-8")).hexdigest()[:16]
+
+    def _snapshot_path(self, scope: str, version: str) -> Path:
+        safe_version = re.sub(r"[^0-9A-Za-z_.-]", "_", str(version))
+        return self._scope_dir(scope) / f"v_{safe_version}.arrow"
+
+    # ==================== 挂载 ====================
+
+    def _attach(self, path: Path) -> pd.DataFrame:
+        """
+        内存映射挂载快照
+
+        数值/日期列直接引用映射页（零拷贝、只读），字符串列在本进程物化
+        """
+        with pa.memory_map(str(path), "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        return table.to_pandas(split_blocks=True)
+
+    def get(self, scope: str, version: str) -> Optional[pd.DataFrame]:
+        """
+        获取指定版本的快照（只读，调用方不得原地修改）
+
+        Returns:
+            DataFrame，快照不存在时返回None
+        """
+        with self._lock:
+            entry = self._attached.get(scope)
+            if entry is not None and entry[0] == version:
+                self._stats["hits"] += 1
+                return entry[1]
+
+        path = self._snapshot_path(scope, version)
+        if not path.exists():
+            self._stats["misses"] += 1
+            return None
+
+        try:
+            df = self._attach(path)
+        except Exception as e:
+            print(f"⚠️ 快照挂载失败 {path.name}: {e}")
+            self._stats["misses"] += 1
+            return None
+
+        # 原子替换本进程句柄（旧版本映射随引用释放）
+        with self._lock:
+            self._attached[scope] = (version, df)
+            self._stats["attaches"] += 1
+        print(f"📎 已挂载共享快照 (scope: {scope}, 版本: {version}, {len(df)} 条)")
+        return df
+
+    # ==================== 发布 ====================
+
+    def _acquire_publish_lock(self, lock_path: Path) -> bool:
+        """O_EXCL 创建锁文件，过期锁自动清除"""
+        try:
+            if lock_path.exists() and time.time() - lock_path.stat().st_mtime > self.LOCK_TIMEOUT:
+                lock_path.unlink()
+        except OSError:
+            pass
+        try:
+            fd = os.open(str(lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            return True
+        except FileExistsError:
+            return False
+
+    def publish(self, scope: str, version: str, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        发布快照并返回挂载后的只读DataFrame
+
+        其他worker正在发布同一版本时不等待，直接返回传入的df；
+        写入失败时同样降级为返回传入的df。
+        """
+        if df is None or df.empty:
+            return df
+
+        path = self._snapshot_path(scope, version)
+        if path.exists():
+            attached = self.get(scope, version)
+            return attached if attached is not None else df
+
+        scope_dir = self._scope_dir(scope)
+        scope_dir.mkdir(parents=True, exist_ok=True)
+        lock_path = scope_dir / ".publish.lock"
+        if not self._acquire_publish_lock(lock_path):
+            return df
+
+        tmp_path = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+        try:
+            table = pa.Table.from_pandas(df)
+            with pa.OSFile(str(tmp_path), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+            self._stats["publishes"] += 1
+            size_mb = path.stat().st_size / 1024 / 1024
+            print(f"✅ 共享快照已发布 (scope: {scope}, 版本: {version}, {size_mb:.1f}MB)")
+        except Exception as e:
+            print(f"⚠️ 快照发布失败 (scope: {scope}): {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return df
+        finally:
+            try:
+                lock_path.unlink()
+            except OSError:
+                pass
+
+        self._cleanup_old_versions(scope_dir, keep=path)
+        attached = self.get(scope, version)
+        return attached if attached is not None else df
+
+    def _cleanup_old_versions(self, scope_dir: Path, keep: Path):
+        """
+        删除旧版本快照
+
+        Linux 下已挂载旧版本的worker不受影响（映射在引用释放前保持有效）；
+        Windows 下被映射的文件无法删除，留待下次清理。
+        """
+        for old in scope_dir.glob("v_*.arrow"):
+            if old == keep:
+                continue
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+    # ==================== 管理 ====================
+
+    def evict(self, scope: Optional[str] = None, remove_files: bool = False):
+        """
+        释放本进程挂载的快照
+
+        Args:
+            scope: 指定scope，None表示全部
+            remove_files: 同时删除快照文件（手动清缓存时使用，强制下次重新加载）
+        """
+        with self._lock:
+            if scope is None:
+                self._attached.clear()
+            else:
+                self._attached.pop(scope, None)
+
+        if not remove_files:
+            return
+        scope_dirs = [self._scope_dir(scope)] if scope else list(self.snapshot_dir.iterdir())
+        for scope_dir in scope_dirs:
+            if scope_dir.is_dir():
+                shutil.rmtree(scope_dir, ignore_errors=True)
+
+    def get_status(self) -> Dict:
+        """获取快照统计"""
+        with self._lock:
+            attached = {
+                scope: {"version": version, "rows": len(df)}
+                for scope, (version, df) in self._attached.items()
+            }
+        return {**self._stats, "attached": attached, "snapshot_dir": str(self.snapshot_dir)}
+
+
+# 全局单例
+order_snapshot_service = OrderSnapshotService()
@@ -7,38 +7,112 @@ Parquet 数据同步服务
 
 存储结构:
 data/
-├── raw/                          # 原始数据（按日期分区）
-│   ├── 2025/
-│   │   ├── 12/
-│   │   │   ├── orders_20251201.parquet
+├── raw/                          # 原始数据（hive分区：月/门店/日期）
+│   ├── month=2025-12/
+│   │   ├── store=惠宜选-门店A/
+│   │   │   ├── date=2025-12-01/orders.parquet
 │   │   │   └── ...
-│   └── 2026/
-├── aggregated/                   # 预聚合数据
+│   │   └── store=.../
+│   └── month=2026-01/
+├── aggregated/                   # 预聚合数据（按月分区，一个月一个文件）
 │   ├── daily/
-│   │   ├── kpi_daily.parquet
-│   │   ├── channel_daily.parquet
-│   │   └── category_daily.parquet
+│   │   ├── kpi_daily/
+│   │   │   ├── 2025-12.parquet
+│   │   │   └── 2026-01.parquet
+│   │   ├── channel_daily/
+│   │   └── category_daily/
+├── staging/                      # 流式导出临时文件（完成后原子移动到 raw/）
 └── metadata/
     ├── partitions.json
-    └── last_update.json
+    ├── aggregated_manifest.json  # 聚合分区清单（日期范围，供DuckDB分区裁剪）
+    ├── compaction.json           # 文件整理记录（前后文件数、扫描耗时）
+    └── last_update.json          # 最后同步时间 + 当天增量同步水位线
+
+聚合数据增量写入：同步某一天只读写该日所在月份的分区文件，
+先删除该日旧行再追加（重复同步幂等），写临时文件后原子替换。
+旧版单文件（daily/kpi_daily.parquet 等）在首次写入时自动拆分为月分区。
+
+原始数据按 month=/store=/date= 分区，DuckDB 以 hive_partitioning 读取，
+按分区列过滤后单门店7天查询只打开7个文件。门店名中的路径保留字符按URL编码
+（DuckDB 读取分区值时自动解码）。旧版 raw/YYYY/MM/orders_YYYYMMDD.parquet
+由 migrate_raw_layout() 迁移，sync_raw_data 首次写入时自动执行。
+
+从 PostgreSQL 导出（export_day / backfill）不经过 DataFrame：服务端游标按批读取为
+Arrow RecordBatch，按门店拆分后直接写入各分区的 ParquetWriter，内存只与批大小有关。
+backfill 按天并行导出任意日期范围（每个 worker 一天），结束后统一刷新 DuckDB。
+
+当天增量同步（sync_intraday）：last_update.json 按天记录水位线（最大id、行数、最大updated_at），
+每小时只导出 id 超过水位线的新行，写为分区内的 delta-*.parquet 小文件；
+DuckDB 按 date=*/*.parquet 读取，基础文件与增量文件自动合并。已同步的行被修改或删除时
+（行数或最大updated_at变化）该日整体重新导出。次日凌晨 compact_raw_day 把增量文件合并进当天文件。
+
+文件整理（compact）：同步/重放/手动导入留下的多文件分区和小 row group 定期整理——
+每个分区合并为一个文件，按 (门店名称, 日期, 订单ID) 排序使 row group 的 min/max 统计紧凑，
+zstd 压缩、row group 大小与 DuckDB 一致；整理前后的文件数/row group 数/扫描耗时
+记录在 metadata/compaction.json。已整理的文件带 schema 元数据标记，不重复整理。
 
 状态: ✅ 已落地（2026-01-20）
 - 30个原始Parquet文件（18.52MB）
 - 3个聚合Parquet文件
 - 定时任务每天02:00自动同步
 """
+import duckdb
 import pandas as pd
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, date, timedelta
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Optional, Dict, Iterable, List, Sequence, Tuple
+from urllib.parse import quote
 import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
 
 
 class ParquetSyncService:
     """Parquet 数据同步服务"""
     
+    # 聚合数据集（daily/<名称>/<YYYY-MM>.parquet）
+    AGGREGATED_DATASETS = ['kpi_daily', 'channel_daily', 'category_daily']
+    
+    # 原始数据文件名（每个 月/门店/日期 分区一个文件）
+    RAW_FILE_NAME = "orders.parquet"
+    
+    # 门店名为空时的分区值（DuckDB 读取为NULL）
+    NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+    
+    # 按天并行回填的 worker 数（每个 worker 占用一个数据库连接）
+    EXPORT_WORKERS = int(os.getenv("PARQUET_EXPORT_WORKERS", "4"))
+    
+    # 增量文件名前缀（与 RAW_FILE_NAME 同目录，compact_raw_day 合并后删除）
+    DELTA_FILE_PREFIX = "delta-"
+    
+    # 增量同步水位线保留天数（更早的日期不再做增量同步）
+    WATERMARK_KEEP_DAYS = int(os.getenv("PARQUET_WATERMARK_KEEP_DAYS", "3"))
+    
+    # 文件整理：row group 行数（与 DuckDB 的 row group 大小一致，按 row group 并行扫描）、压缩算法
+    COMPACT_ROW_GROUP_SIZE = int(os.getenv("PARQUET_ROW_GROUP_SIZE", "122880"))
+    COMPACT_COMPRESSION = os.getenv("PARQUET_COMPACT_COMPRESSION", "zstd")
+    
+    # 整理时的排序键（有序后 row group 的 min/max 统计紧凑，过滤时可跳过更多数据）
+    RAW_SORT_KEYS = ['门店名称', '日期', '订单ID']
+    AGG_SORT_KEYS = ['门店名称', '日期', '渠道', '一级分类名']
+    
+    # 已整理文件的 schema 元数据键
+    COMPACTED_MARKER = b"compacted"
+    
+    # compaction.json 保留的整理记录数
+    COMPACTION_HISTORY = 20
+    
+    # 重新导出锁的过期时间（秒，锁文件在每导出一天后刷新）
+    REEXPORT_LOCK_TIMEOUT = 600
+    
     def __init__(self, data_dir: str = None):
         # 默认数据目录
         if data_dir is None:
@@ -49,49 +123,752 @@ class ParquetSyncService:
         self.raw_dir = self.data_dir / "raw"
         self.agg_dir = self.data_dir / "aggregated"
         self.metadata_dir = self.data_dir / "metadata"
+        self.staging_dir = self.data_dir / "staging"
         
         # 确保目录存在
         for d in [self.raw_dir, self.agg_dir, self.metadata_dir]:
             d.mkdir(parents=True, exist_ok=True)
         
+        self.agg_manifest_file = self.metadata_dir / "aggregated_manifest.json"
+        self._agg_lock = threading.Lock()
+        # 并行回填时保护旧布局迁移与 partitions.json 读写
+        self._raw_lock = threading.Lock()
+        # 分区目录的文件替换（同步写入与文件整理互斥）
+        self._partition_lock = threading.Lock()
+        self.compaction_file = self.metadata_dir / "compaction.json"
+        
         print(f"📦 Parquet同步服务已初始化: {self.data_dir}")
     
-    def sync_raw_data(self, target_date: date, df: pd.DataFrame) -> str:
+    # ==================== 原始数据分区 ====================
+    
+    @classmethod
+    def encode_partition_value(cls, value) -> str:
+        """分区值编码：只转义路径保留字符，中文保持可读"""
+        if value is None or pd.isna(value) or str(value) == "":
+            return cls.NULL_PARTITION
+        return re.sub(r'[%/\\:=*?"<>|#\s]', lambda m: quote(m.group(), safe=''), str(value))
+    
+    def raw_partition_dir(self, target_date: date, store_name) -> Path:
+        """原始数据分区目录: raw/month=YYYY-MM/store=<门店>/date=YYYY-MM-DD"""
+        return (
+            self.raw_dir
+            / f"month={target_date.strftime('%Y-%m')}"
+            / f"store={self.encode_partition_value(store_name)}"
+            / f"date={target_date.isoformat()}"
+        )
+    
+    def _raw_date_dirs(self, target_date: date) -> List[Path]:
+        """某一天所有门店的分区目录"""
+        return list(self.raw_dir.glob(f"month={target_date.strftime('%Y-%m')}/store=*/date={target_date.isoformat()}"))
+    
+    def legacy_raw_files(self) -> List[Path]:
+        """旧版布局文件: raw/YYYY/MM/orders_YYYYMMDD.parquet"""
+        return sorted(self.raw_dir.glob("[0-9][0-9][0-9][0-9]/[0-9][0-9]/orders_*.parquet"))
+    
+    def _write_raw_partitions(self, target_date: date, df: pd.DataFrame) -> int:
+        """
+        按门店写入某一天的分区（替换该日全部旧分区，重复同步幂等）
+        
+        先写到 staging/，再整目录替换（_swap_raw_day）
+        
+        Returns:
+            写入的文件数
+        """
+        staging = self.staging_dir / f"{target_date.isoformat()}-{uuid.uuid4().hex[:8]}"
+        store_key = df['门店名称'] if '门店名称' in df.columns else pd.Series(None, index=df.index)
+        stores: Dict[str, object] = {}
+        try:
+            for store_name, store_df in df.groupby(store_key.astype(object), dropna=False, sort=False):
+                key = self.encode_partition_value(store_name)
+                (staging / key).mkdir(parents=True, exist_ok=True)
+                self._write_parquet_atomic(staging / key / self.RAW_FILE_NAME, store_df)
+                stores[key] = store_name
+            with self._partition_lock:
+                self._swap_raw_day(target_date, staging, stores)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return len(stores)
+    
+    def _swap_raw_day(self, target_date: date, staging: Path, stores: Dict[str, object]):
+        """
+        用 staging/<门店> 目录整体替换某一天的全部门店分区（调用方持有 _partition_lock）
+        
+        每个门店分区整目录替换（与 compact_raw_day 相同），不在新数据中的门店的旧分区移走；
+        旧分区先移到 staging/ 下，全部替换成功后再删除，中途失败时恢复旧分区
+        """
+        retired = self.staging_dir / f"{staging.name}-old"
+        targets = {
+            self.raw_partition_dir(target_date, store_name): staging / key
+            for key, store_name in stores.items()
+        }
+        moved: List[Tuple[Path, Optional[Path]]] = []  # (分区目录, 移走的旧分区)
+        try:
+            for old_dir in self._raw_date_dirs(target_date):
+                if old_dir not in targets:
+                    backup = retired / old_dir.parent.name
+                    backup.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(old_dir, backup)
+                    moved.append((old_dir, backup))
+            for partition_dir, new_dir in targets.items():
+                backup = None
+                if partition_dir.exists():
+                    backup = retired / partition_dir.parent.name
+                    backup.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(partition_dir, backup)
+                else:
+                    partition_dir.parent.mkdir(parents=True, exist_ok=True)
+                moved.append((partition_dir, backup))
+                os.replace(new_dir, partition_dir)
+        except Exception:
+            for partition_dir, backup in reversed(moved):
+                if partition_dir.exists() and partition_dir in targets:
+                    shutil.rmtree(partition_dir, ignore_errors=True)
+                if backup is not None and backup.exists():
+                    os.replace(backup, partition_dir)
+            raise
+        finally:
+            shutil.rmtree(retired, ignore_errors=True)
+    
+    def migrate_raw_layout(self) -> Dict[str, int]:
         """
-        同步原始数据到 Parquet（按日期分区）
+        旧版 raw/YYYY/MM/orders_YYYYMMDD.parquet 迁移为 hive 分区布局
+        
+        每个旧文件拆分为 month=/store=/date= 分区后删除，中断后可重复执行
+        
+        Returns:
+            {"files": 迁移的旧文件数, "partitions": 写入的分区数, "rows": 行数}
+        """
+        stats = {"files": 0, "partitions": 0, "rows": 0}
+        for legacy_file in self.legacy_raw_files():
+            match = re.match(r"orders_(\d{8})\.parquet$", legacy_file.name)
+            if not match:
+                continue
+            target_date = datetime.strptime(match.group(1), '%Y%m%d').date()
+            df = pd.read_parquet(legacy_file)
+            if not df.empty:
+                stats["partitions"] += self._write_raw_partitions(target_date, df)
+                stats["rows"] += len(df)
+            legacy_file.unlink()
+            stats["files"] += 1
+        
+        # 清理空的旧版年/月目录
+        for year_dir in self.raw_dir.glob("[0-9][0-9][0-9][0-9]"):
+            for month_dir in year_dir.glob("[0-9][0-9]"):
+                if month_dir.is_dir() and not any(month_dir.iterdir()):
+                    month_dir.rmdir()
+            if year_dir.is_dir() and not any(year_dir.iterdir()):
+                year_dir.rmdir()
+        
+        if stats["files"]:
+            print(f"✅ 原始数据已迁移为hive分区布局: {stats['files']} 个文件 → "
+                  f"{stats['partitions']} 个分区 ({stats['rows']} 行)")
+        return stats
+    
+    def sync_raw_data(self, target_date: date, df: pd.DataFrame, synced_at: Optional[datetime] = None) -> str:
+        """
+        同步原始数据到 Parquet（按 月/门店/日期 分区）
         
         Args:
             target_date: 数据日期
             df: 订单数据 DataFrame
+            synced_at: df 从数据库读取之前的时间（记为该日同步时间，默认当前时间）
         
         Returns:
-            生成的文件路径
+            该日分区的路径模式（raw/month=.../store=*/date=...）
         """
         if df.empty:
             print(f"⚠️ 空数据，跳过同步: {target_date}")
             return ""
         
-        # 构建分区路径
-        partition_path = self.raw_dir / str(target_date.year) / f"{target_date.month:02d}"
-        partition_path.mkdir(parents=True, exist_ok=True)
+        # 旧版布局文件先迁移（与新分区混存时 DuckDB 只读取新布局）
+        self._ensure_raw_layout()
+        
+        files = self._write_raw_partitions(target_date, df)
+        
+        # 更新元数据
+        self._update_partition_metadata(target_date, len(df), synced_at=synced_at)
+        
+        pattern = self.raw_dir / f"month={target_date.strftime('%Y-%m')}" / "store=*" / f"date={target_date.isoformat()}"
+        print(f"✅ 原始数据已同步: {pattern} ({len(df)} 行, {files} 个门店分区)")
+        
+        self._refresh_duckdb_tables()
+        return str(pattern)
+    
+    def _ensure_raw_layout(self):
+        """旧版布局文件迁移（并行导出时只执行一次）"""
+        with self._raw_lock:
+            if self.legacy_raw_files():
+                self.migrate_raw_layout()
+    
+    # ==================== 流式导出 ====================
+    
+    @staticmethod
+    def _split_by_store(batch: pa.RecordBatch):
+        """按门店名称拆分一批数据: (门店名称, 子批次)"""
+        if '门店名称' not in batch.schema.names:
+            yield None, batch
+            return
+        stores = batch.column(batch.schema.get_field_index('门店名称'))
+        for store_name in pc.unique(stores).to_pylist():
+            mask = pc.is_null(stores) if store_name is None else pc.equal(stores, store_name)
+            yield store_name, batch.filter(mask)
+    
+    def write_raw_batches(
+        self,
+        target_date: date,
+        batches: Iterable[pa.RecordBatch],
+        refresh: bool = True,
+        append: bool = False,
+        synced_at: Optional[datetime] = None,
+    ) -> int:
+        """
+        流式写入某一天的原始数据（按门店分区，不构造 DataFrame）
+        
+        每个门店一个 ParquetWriter，每批拆分后直接写出为 row group；
+        先写到 staging/，全部成功后再整目录替换该日分区（_swap_raw_day），失败时保留旧数据
+        
+        Args:
+            target_date: 数据日期
+            batches: Arrow RecordBatch 迭代器（如 OrderLoaderService.iter_arrow_batches）
+            refresh: 是否刷新 DuckDB 持久化表（批量回填时由调用方最后统一刷新）
+            append: True 时写为增量文件（delta-*.parquet），保留该日已有文件；
+                False 时替换该日全部旧分区（RAW_FILE_NAME）
+            synced_at: 开始读取数据库之前的时间（记为该日同步时间，默认当前时间）；
+                之后修改的行 updated_at 更晚，订单加载时该日判为不一致
+        
+        Returns:
+            写入行数（0 表示无数据，不改动已有分区）
+        """
+        staging = self.staging_dir / f"{target_date.isoformat()}-{uuid.uuid4().hex[:8]}"
+        writers: Dict[str, pq.ParquetWriter] = {}
+        stores: Dict[str, object] = {}
+        rows = 0
+        try:
+            for batch in batches:
+                if batch.num_rows == 0:
+                    continue
+                for store_name, part in self._split_by_store(batch):
+                    key = self.encode_partition_value(store_name)
+                    writer = writers.get(key)
+                    if writer is None:
+                        (staging / key).mkdir(parents=True, exist_ok=True)
+                        writer = writers[key] = pq.ParquetWriter(
+                            staging / key / self.RAW_FILE_NAME, part.schema, compression='snappy'
+                        )
+                        stores[key] = store_name
+                    writer.write_batch(part)
+                rows += batch.num_rows
+            for writer in writers.values():
+                writer.close()
+            writers.clear()
+            
+            if rows == 0:
+                if not append:
+                    print(f"⚠️ 空数据，跳过同步: {target_date}")
+                return 0
+            
+            self._ensure_raw_layout()
+            with self._partition_lock:
+                if append:
+                    file_name = f"{self.DELTA_FILE_PREFIX}{datetime.now().strftime('%Y%m%d%H%M%S')}-{staging.name[-8:]}.parquet"
+                    for key, store_name in stores.items():
+                        partition_dir = self.raw_partition_dir(target_date, store_name)
+                        partition_dir.mkdir(parents=True, exist_ok=True)
+                        os.replace(staging / key / self.RAW_FILE_NAME, partition_dir / file_name)
+                else:
+                    self._swap_raw_day(target_date, staging, stores)
+        finally:
+            for writer in writers.values():
+                writer.close()
+            shutil.rmtree(staging, ignore_errors=True)
+        
+        self._update_partition_metadata(target_date, rows, append=append, synced_at=synced_at)
+        kind = "增量" if append else "原始数据"
+        print(f"✅ {kind}已流式同步: {target_date} ({rows} 行, {len(stores)} 个门店分区)")
         
-        # 文件名
-        filename = f"orders_{target_date.strftime('%Y%m%d')}.parquet"
-        filepath = partition_path / filename
+        if refresh:
+            self._refresh_duckdb_tables()
+        return rows
+    
+    @staticmethod
+    def _day_criteria(target_date: date) -> list:
+        """某一天的过滤条件（自然日范围，含当天全部时间）"""
+        from .order_loader_service import OrderQuery
+        
+        return OrderQuery.build(None, target_date, target_date).criteria()
+    
+    def export_day(self, target_date: date, aggregate: bool = True, refresh: bool = True) -> int:
+        """
+        从 PostgreSQL 流式导出某一天的订单到 Parquet（服务端游标 → Arrow → ParquetWriter）
         
-        # 写入 Parquet（使用 snappy 压缩）
-        df.to_parquet(
-            filepath,
-            engine='pyarrow',
-            compression='snappy',
-            index=False
+        先取该日的水位线（最大id），只导出 id 不超过水位线的行，
+        导出期间新写入的行留给下一次增量同步
+        
+        Args:
+            target_date: 数据日期（按自然日范围筛选，含当天全部时间）
+            aggregate: 是否生成该日的聚合数据
+            refresh: 是否刷新 DuckDB 持久化表
+        
+        Returns:
+            导出行数（0 表示该日无数据）
+        """
+        from .order_loader_service import order_loader_service, PARQUET_SYNC_COLUMNS
+        from database.models import Order
+        
+        criteria = self._day_criteria(target_date)
+        # 同步时间取探测之前：导出期间修改的行 updated_at 晚于同步时间，不会被当作已同步
+        snapshot_at = datetime.now()
+        probe = order_loader_service.probe_rows(*criteria)
+        if not probe["max_id"]:
+            print(f"⚠️ 空数据，跳过同步: {target_date}")
+            self._save_watermark(target_date, None)
+            return 0
+        
+        batches = order_loader_service.iter_arrow_batches(
+            PARQUET_SYNC_COLUMNS, *criteria, Order.id <= probe["max_id"]
         )
+        rows = self.write_raw_batches(target_date, batches, refresh=refresh, synced_at=snapshot_at)
+        self._save_watermark(target_date, {
+            "max_id": probe["max_id"],
+            "rows": rows,
+            "max_updated_at": probe["max_updated_at"],
+        })
+        if rows and aggregate:
+            self.generate_daily_aggregations(target_date)
+        return rows
+    
+    def sync_intraday(self, target_date: date, aggregate: bool = True) -> Dict:
+        """
+        增量同步某一天（每小时刷新今日数据）
         
-        # 更新元数据
-        self._update_partition_metadata(target_date, len(df))
+        - 没有水位线或该日没有Parquet分区：整天导出（export_day）
+        - 已同步的行（id <= 水位线）行数或最大updated_at有变化（修改/删除）：整天重新导出
+        - 否则只导出 id 在 (水位线, 当前最大id] 的新行，写为增量文件
         
-        print(f"✅ 原始数据已同步: {filepath} ({len(df)} 行)")
-        return str(filepath)
+        Returns:
+            {"mode": "full" | "delta" | "none", "rows": 本次写入行数}
+        """
+        from .order_loader_service import order_loader_service, PARQUET_SYNC_COLUMNS
+        from database.models import Order
+        
+        watermark = self.get_watermark(target_date)
+        if not watermark or not self._raw_date_dirs(target_date):
+            return {"mode": "full", "rows": self.export_day(target_date, aggregate=aggregate)}
+        
+        criteria = self._day_criteria(target_date)
+        snapshot_at = datetime.now()
+        probe = order_loader_service.probe_rows(*criteria, known_id=watermark["max_id"])
+        known_updated = probe["known_max_updated_at"]
+        if probe["known_rows"] != watermark["rows"] or (
+            known_updated is not None
+            and (watermark["max_updated_at"] is None or known_updated > watermark["max_updated_at"])
+        ):
+            print(f"🔄 {target_date} 已同步的数据有修改或删除，整天重新导出")
+            return {"mode": "full", "rows": self.export_day(target_date, aggregate=aggregate)}
+        
+        if probe["max_id"] <= watermark["max_id"]:
+            return {"mode": "none", "rows": 0}
+        
+        batches = order_loader_service.iter_arrow_batches(
+            PARQUET_SYNC_COLUMNS, *criteria,
+            Order.id > watermark["max_id"], Order.id <= probe["max_id"],
+        )
+        rows = self.write_raw_batches(target_date, batches, append=True, synced_at=snapshot_at)
+        # 行数按实际写入累计：导出期间有并发修改时，下一次同步的行数检查会触发整天重新导出
+        self._save_watermark(target_date, {
+            "max_id": probe["max_id"],
+            "rows": watermark["rows"] + rows,
+            "max_updated_at": probe["max_updated_at"],
+        })
+        if rows and aggregate:
+            self.generate_daily_aggregations(target_date)
+        return {"mode": "delta", "rows": rows}
+    
+    def compact_raw_day(self, target_date: date) -> Dict[str, int]:
+        """
+        合并某一天的增量文件（每个门店分区：当天文件 + delta-*.parquet → 一个 RAW_FILE_NAME）
+        
+        合并结果先写在 staging/，再整目录替换分区（读取方不会看到重复行）
+        
+        Returns:
+            {"partitions": 合并的分区数, "files": 合并前的文件数}
+        """
+        stats = {"partitions": 0, "files": 0}
+        for partition_dir in self._raw_date_dirs(target_date):
+            if not any(partition_dir.glob(f"{self.DELTA_FILE_PREFIX}*.parquet")):
+                continue
+            stats["files"] += self._compact_partition_dir(partition_dir)
+            stats["partitions"] += 1
+        
+        if stats["partitions"]:
+            print(f"✅ 增量文件已合并: {target_date} ({stats['files']} 个文件 → {stats['partitions']} 个分区文件)")
+            self._refresh_duckdb_tables()
+        return stats
+    
+    # ==================== 文件整理 ====================
+    
+    def _compacted_table(self, files: Sequence[Path], sort_keys: Sequence[str]) -> pa.Table:
+        """读取并合并文件，按排序键排序，写入整理标记"""
+        table = pa.concat_tables([pq.read_table(f) for f in files], promote_options="default")
+        keys = [(k, "ascending") for k in sort_keys if k in table.column_names]
+        if keys:
+            table = table.sort_by(keys)
+        marker = json.dumps({
+            "sort_keys": [k for k, _ in keys],
+            "compression": self.COMPACT_COMPRESSION,
+            "row_group_size": self.COMPACT_ROW_GROUP_SIZE,
+        }, ensure_ascii=False).encode()
+        return table.replace_schema_metadata({**(table.schema.metadata or {}), self.COMPACTED_MARKER: marker})
+    
+    def _write_compacted(self, table: pa.Table, filepath: Path):
+        pq.write_table(
+            table, filepath,
+            compression=self.COMPACT_COMPRESSION,
+            row_group_size=self.COMPACT_ROW_GROUP_SIZE,
+            write_statistics=True,
+        )
+    
+    def _compact_partition_dir(self, partition_dir: Path) -> int:
+        """
+        原始数据分区目录的全部文件整理为一个 RAW_FILE_NAME（staging 中写好后整目录替换）
+        
+        Returns:
+            整理前的文件数
+        """
+        staging = self.staging_dir / f"compact-{uuid.uuid4().hex[:8]}"
+        staging.mkdir(parents=True, exist_ok=True)
+        try:
+            with self._partition_lock:
+                files = sorted(partition_dir.glob("*.parquet"))
+                if not files:
+                    return 0
+                self._write_compacted(self._compacted_table(files, self.RAW_SORT_KEYS), staging / self.RAW_FILE_NAME)
+                retired = self.staging_dir / f"{staging.name}-old"
+                os.replace(partition_dir, retired)
+                os.replace(staging, partition_dir)
+            shutil.rmtree(retired, ignore_errors=True)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return len(files)
+    
+    def _compact_file(self, filepath: Path, sort_keys: Sequence[str]):
+        """单个文件原地整理（临时文件 + 原子替换）"""
+        table = self._compacted_table([filepath], sort_keys)
+        tmp_path = filepath.with_name(f"{filepath.name}.tmp-{os.getpid()}")
+        try:
+            self._write_compacted(table, tmp_path)
+            os.replace(tmp_path, filepath)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+    
+    def _is_compacted(self, filepath: Path) -> bool:
+        metadata = pq.read_schema(filepath).metadata or {}
+        return self.COMPACTED_MARKER in metadata
+    
+    def _raw_files(self) -> List[Path]:
+        return sorted(self.raw_dir.glob("**/*.parquet"))
+    
+    def _aggregated_files(self) -> List[Path]:
+        return sorted(self.agg_dir.glob("**/*.parquet"))
+    
+    @staticmethod
+    def _files_summary(files: Sequence[Path]) -> Dict:
+        """文件数 / 字节数 / row group 数 / 行数"""
+        summary = {"files": len(files), "bytes": 0, "row_groups": 0, "rows": 0}
+        for f in files:
+            metadata = pq.read_metadata(f)
+            summary["bytes"] += f.stat().st_size
+            summary["row_groups"] += metadata.num_row_groups
+            summary["rows"] += metadata.num_rows
+        return summary
+    
+    def _compact_raw(self, before_date: Optional[date], force: bool) -> Dict[str, int]:
+        """
+        整理原始数据：多文件分区合并，未整理的单文件分区重写（before_date 当天及以后的分区跳过）
+        
+        旧版布局的按日文件逐个原地整理
+        """
+        stats = {"partitions": 0, "files": 0}
+        for partition_dir in sorted(self.raw_dir.glob("month=*/store=*/date=*")):
+            if before_date and partition_dir.name[len("date="):] >= str(before_date):
+                continue
+            files = sorted(partition_dir.glob("*.parquet"))
+            if not files or (len(files) == 1 and not force and self._is_compacted(files[0])):
+                continue
+            stats["files"] += self._compact_partition_dir(partition_dir)
+            stats["partitions"] += 1
+        
+        for legacy_file in self.legacy_raw_files():
+            match = re.match(r"orders_(\d{8})\.parquet$", legacy_file.name)
+            if before_date and match and match.group(1) >= before_date.strftime('%Y%m%d'):
+                continue
+            if not force and self._is_compacted(legacy_file):
+                continue
+            self._compact_file(legacy_file, self.RAW_SORT_KEYS)
+            stats["partitions"] += 1
+            stats["files"] += 1
+        return stats
+    
+    def _compact_aggregated(self, force: bool) -> Dict[str, int]:
+        """整理聚合数据的月分区文件（旧版单文件先拆分为月分区）"""
+        stats = {"partitions": 0, "files": 0}
+        with self._agg_lock:
+            manifest = self._read_agg_manifest()
+            for dataset in self.AGGREGATED_DATASETS:
+                self._migrate_legacy_dataset(manifest, dataset)
+            self._write_agg_manifest(manifest)
+            
+            for partitions in manifest["datasets"].values():
+                for entry in partitions.values():
+                    filepath = self.data_dir / entry["file"]
+                    if not filepath.exists() or (not force and self._is_compacted(filepath)):
+                        continue
+                    self._compact_file(filepath, self.AGG_SORT_KEYS)
+                    stats["partitions"] += 1
+                    stats["files"] += 1
+        return stats
+    
+    def _raw_scan_source(self) -> Optional[str]:
+        """本数据目录原始数据的 read_parquet 表达式（与 DuckDBService.get_raw_source 相同的布局判断）"""
+        if next(self.raw_dir.glob("month=*"), None) is not None:
+            pattern = str(self.raw_dir / "month=*" / "store=*" / "date=*" / "*.parquet").replace("'", "''")
+            return f"read_parquet('{pattern}', hive_partitioning=true)"
+        if next(self.raw_dir.glob("**/*.parquet"), None) is not None:
+            pattern = str(self.raw_dir / "**" / "*.parquet").replace("'", "''")
+            return f"read_parquet('{pattern}')"
+        return None
+    
+    def _scan_timings(self, runs: int = 3) -> Dict[str, float]:
+        """
+        DuckDB 扫描耗时（毫秒，取中位数）：全表聚合、单门店近7天、按订单ID查找、KPI聚合表全表
+        
+        每次整理前后各测一次，用于对比文件布局/统计信息的效果
+        """
+        source = self._raw_scan_source()
+        if source is None:
+            return {}
+        
+        con = duckdb.connect()
+        try:
+            store_name, max_date, order_id = con.execute(f"""
+                SELECT ANY_VALUE(门店名称), MAX(CAST(日期 AS DATE)), ANY_VALUE(订单ID) FROM {source}
+            """).fetchone()
+            queries = {
+                "raw_full_scan": (f"SELECT COUNT(*), SUM(实收价格) FROM {source}", []),
+                "raw_store_7d": (
+                    f"SELECT COUNT(*), SUM(实收价格) FROM {source} WHERE 门店名称 = ? AND 日期 >= ?",
+                    [store_name, max_date - timedelta(days=6)],
+                ),
+                "raw_order_lookup": (f"SELECT * FROM {source} WHERE 订单ID = ?", [order_id]),
+            }
+            kpi_files = [str(f).replace("'", "''") for f in self.get_aggregated_files('kpi_daily')]
+            if kpi_files:
+                file_list = ", ".join(f"'{f}'" for f in kpi_files)
+                queries["kpi_daily_scan"] = (f"SELECT COUNT(*) FROM read_parquet([{file_list}], union_by_name=true)", [])
+            
+            timings = {}
+            for name, (sql, params) in queries.items():
+                elapsed = []
+                for _ in range(runs):
+                    start = time.perf_counter()
+                    con.execute(sql, params).fetchall()
+                    elapsed.append((time.perf_counter() - start) * 1000)
+                timings[name] = round(sorted(elapsed)[len(elapsed) // 2], 2)
+            return timings
+        finally:
+            con.close()
+    
+    def compact(self, force: bool = False, include_today: bool = False, benchmark: bool = True) -> Dict:
+        """
+        文件整理任务：合并小文件、排序、zstd 压缩、统一 row group 大小
+        
+        Args:
+            force: 已整理的文件也重新整理（修改排序键/压缩参数后使用）
+            include_today: 是否整理今天的原始数据分区（默认跳过，今天仍在增量写入）
+            benchmark: 是否记录整理前后的扫描耗时
+        
+        Returns:
+            整理报告（同时追加到 metadata/compaction.json）
+        """
+        start = time.time()
+        before = {"raw": self._files_summary(self._raw_files()), "aggregated": self._files_summary(self._aggregated_files())}
+        scan_before = self._scan_timings() if benchmark else {}
+        
+        compacted = {
+            "raw": self._compact_raw(None if include_today else datetime.now().date(), force),
+            "aggregated": self._compact_aggregated(force),
+        }
+        
+        after = {"raw": self._files_summary(self._raw_files()), "aggregated": self._files_summary(self._aggregated_files())}
+        scan_after = self._scan_timings() if benchmark else {}
+        
+        report = {
+            "started_at": datetime.fromtimestamp(start).isoformat(timespec='seconds'),
+            "elapsed_seconds": round(time.time() - start, 2),
+            "settings": {
+                "compression": self.COMPACT_COMPRESSION,
+                "row_group_size": self.COMPACT_ROW_GROUP_SIZE,
+                "raw_sort_keys": self.RAW_SORT_KEYS,
+            },
+            "compacted": compacted,
+            "before": before,
+            "after": after,
+            "scan_ms": {"before": scan_before, "after": scan_after},
+        }
+        self._record_compaction(report)
+        if compacted["raw"]["partitions"]:
+            self._refresh_duckdb_tables()
+        
+        print(f"✅ Parquet文件整理完成（{report['elapsed_seconds']}s）: "
+              f"原始数据 {before['raw']['files']} → {after['raw']['files']} 个文件，"
+              f"{before['raw']['row_groups']} → {after['raw']['row_groups']} 个row group，"
+              f"{before['raw']['bytes'] / 1024 / 1024:.1f}MB → {after['raw']['bytes'] / 1024 / 1024:.1f}MB")
+        for name, ms in scan_after.items():
+            print(f"   {name}: {scan_before.get(name, 0):.1f}ms → {ms:.1f}ms")
+        return report
+    
+    def _record_compaction(self, report: Dict):
+        """追加整理记录（保留最近 COMPACTION_HISTORY 次）"""
+        history = self.get_compaction_history()
+        history.append(report)
+        tmp_path = self.compaction_file.with_name(f"{self.compaction_file.name}.tmp-{os.getpid()}")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"runs": history[-self.COMPACTION_HISTORY:]}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.compaction_file)
+    
+    def get_compaction_history(self) -> List[Dict]:
+        """文件整理记录（由旧到新）"""
+        if not self.compaction_file.exists():
+            return []
+        try:
+            with open(self.compaction_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get("runs", [])
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 文件整理记录读取失败: {e}")
+            return []
+    
+    def backfill(self, start_date: date, end_date: date, workers: Optional[int] = None) -> Dict:
+        """
+        并行回填日期范围（闭区间，每个 worker 导出一天）
+        
+        Args:
+            start_date: 开始日期
+            end_date: 结束日期
+            workers: 并行数（默认 EXPORT_WORKERS，不超过天数）
+        
+        Returns:
+            {"days", "rows", "empty_days", "failed": {日期: 错误}, "workers", "elapsed_seconds"}
+        """
+        days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        if not days:
+            return {"days": 0, "rows": 0, "empty_days": [], "failed": {}, "workers": 0, "elapsed_seconds": 0.0}
+        
+        workers = max(1, min(workers or self.EXPORT_WORKERS, len(days)))
+        self._ensure_raw_layout()
+        
+        start = time.time()
+        rows: Dict[str, int] = {}
+        failed: Dict[str, str] = {}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="parquet-backfill") as pool:
+            futures = {pool.submit(self.export_day, d, True, False): d for d in days}
+            for future in as_completed(futures):
+                day = str(futures[future])
+                try:
+                    rows[day] = future.result()
+                except Exception as e:
+                    failed[day] = str(e)
+                    print(f"  ❌ {day}: 导出失败 - {e}")
+        
+        self._refresh_duckdb_tables()
+        
+        elapsed = time.time() - start
+        total = sum(rows.values())
+        print(f"✅ 回填完成: {start_date} ~ {end_date}，{len(days)} 天 {total:,} 行，"
+              f"{workers} 个worker，耗时 {elapsed:.1f}s（失败 {len(failed)} 天）")
+        return {
+            "days": len(days),
+            "rows": total,
+            "empty_days": sorted(d for d, n in rows.items() if n == 0),
+            "failed": failed,
+            "workers": workers,
+            "elapsed_seconds": round(elapsed, 2),
+        }
+    
+    def unsynced_days(self) -> List[date]:
+        """partitions.json 中有行数但没有同步时间的日期（记录同步时间之前导出的分区）"""
+        days = []
+        for partition in self._read_partition_metadata()["partitions"].values():
+            synced_at = partition.get("synced_at", {})
+            days.extend(date.fromisoformat(d) for d in partition.get("dates", {}) if d not in synced_at)
+        return sorted(days)
+    
+    def _acquire_reexport_lock(self, lock_path: Path) -> bool:
+        """O_EXCL 创建锁文件（多worker只有一个执行），超过 REEXPORT_LOCK_TIMEOUT 没有进展的锁自动清除"""
+        try:
+            if lock_path.exists() and time.time() - lock_path.stat().st_mtime > self.REEXPORT_LOCK_TIMEOUT:
+                lock_path.unlink()
+        except OSError:
+            pass
+        try:
+            fd = os.open(str(lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            return True
+        except FileExistsError:
+            return False
+    
+    def reexport_unsynced_days(self) -> Dict:
+        """
+        重新导出没有同步时间的日期（迁移脚本/定时任务调用，不在请求路径上执行）
+        
+        订单加载时这些日期无法判断是否被原地修改过，一律从数据库加载；
+        重新导出后记录同步时间，之后可以走 Parquet。
+        跨进程只有一个执行（metadata/.reexport.lock），其他进程直接跳过。
+        
+        Returns:
+            {"days", "rows", "failed": {日期: 错误}, "skipped": 其他进程正在执行}
+        """
+        result = {"days": 0, "rows": 0, "failed": {}, "skipped": False}
+        lock_path = self.metadata_dir / ".reexport.lock"
+        if not self._acquire_reexport_lock(lock_path):
+            result["skipped"] = True
+            return result
+        
+        try:
+            # 取得锁之后再读取：其他进程刚完成的日期不会重复导出
+            days = self.unsynced_days()
+            if not days:
+                return result
+            print(f"🔄 {len(days)} 天的Parquet没有同步时间，重新导出: {days[0]} ~ {days[-1]}")
+            for d in days:
+                try:
+                    result["rows"] += self.export_day(d, refresh=False)
+                    result["days"] += 1
+                except Exception as e:
+                    result["failed"][str(d)] = str(e)
+                    print(f"  ❌ {d}: 重新导出失败 - {e}")
+                os.utime(lock_path)  # 有进展时刷新锁，避免被当作过期锁清除
+            self._refresh_duckdb_tables()
+            print(f"✅ 重新导出完成: {result['days']} 天 {result['rows']:,} 行（失败 {len(result['failed'])} 天）")
+            return result
+        finally:
+            try:
+                lock_path.unlink()
+            except OSError:
+                pass
+    
+    def _refresh_duckdb_tables(self):
+        """增量刷新 DuckDB 持久化表（未启用持久化时跳过）"""
+        from .duckdb_service import duckdb_service
+        
+        if not duckdb_service.is_persistent:
+            return
+        try:
+            duckdb_service.refresh()
+        except Exception as e:
+            # 刷新失败不影响同步，查询时会重新检测并刷新
+            print(f"⚠️ DuckDB持久化表刷新失败: {e}")
     
     def generate_daily_aggregations(self, target_date: date) -> Dict[str, str]:
         """
@@ -103,44 +880,38 @@ class ParquetSyncService:
         Returns:
             生成的聚合文件路径字典
         """
-        # 读取当日原始数据
-        raw_file = self.raw_dir / str(target_date.year) / f"{target_date.month:02d}" / f"orders_{target_date.strftime('%Y%m%d')}.parquet"
+        # 读取当日原始数据（各门店分区）
+        # 读取当日原始数据（各门店分区，含增量文件）
+        raw_files = [f for d in self._raw_date_dirs(target_date) for f in sorted(d.glob("*.parquet"))]
+        legacy_file = self.raw_dir / str(target_date.year) / f"{target_date.month:02d}" / f"orders_{target_date.strftime('%Y%m%d')}.parquet"
+        if not raw_files and legacy_file.exists():
+            raw_files = [legacy_file]
         
-        if not raw_file.exists():
-            print(f"⚠️ 原始数据不存在: {raw_file}")
+        if not raw_files:
+            print(f"⚠️ 原始数据不存在: {target_date}")
             return {}
         
-        df = pd.read_parquet(raw_file)
+        df = pd.concat([pd.read_parquet(f) for f in raw_files], ignore_index=True)
         results = {}
         
-        # 确保daily目录存在
-        daily_dir = self.agg_dir / "daily"
-        daily_dir.mkdir(parents=True, exist_ok=True)
-        
         # 1. KPI 日聚合
         try:
             kpi_agg = self._aggregate_kpi(df, target_date)
-            kpi_file = daily_dir / "kpi_daily.parquet"
-            self._append_or_create(kpi_file, kpi_agg, ['日期', '门店名称'])
-            results['kpi'] = str(kpi_file)
+            results['kpi'] = self._replace_partition('kpi_daily', target_date, kpi_agg)
         except Exception as e:
             print(f"⚠️ KPI聚合失败: {e}")
         
         # 2. 渠道日聚合
         try:
             channel_agg = self._aggregate_channel(df, target_date)
-            channel_file = daily_dir / "channel_daily.parquet"
-            self._append_or_create(channel_file, channel_agg, ['日期', '门店名称', '渠道'])
-            results['channel'] = str(channel_file)
+            results['channel'] = self._replace_partition('channel_daily', target_date, channel_agg)
         except Exception as e:
             print(f"⚠️ 渠道聚合失败: {e}")
         
         # 3. 品类日聚合
         try:
             category_agg = self._aggregate_category(df, target_date)
-            category_file = daily_dir / "category_daily.parquet"
-            self._append_or_create(category_file, category_agg, ['日期', '门店名称', '一级分类名'])
-            results['category'] = str(category_file)
+            results['category'] = self._replace_partition('category_daily', target_date, category_agg)
         except Exception as e:
             print(f"⚠️ 品类聚合失败: {e}")
         
@@ -187,7 +958,7 @@ class ParquetSyncService:
         )
         
         # 按门店聚合
-        kpi = order_agg.groupby('门店名称').agg({
+        kpi = order_agg.groupby('门店名称', observed=True).agg({
             '订单ID': 'count',
             '实收价格': 'sum',
             '订单实际利润': 'sum',
@@ -201,7 +972,7 @@ class ParquetSyncService:
         
         # 动销商品数
         if '商品名称' in df.columns and '月售' in df.columns:
-            active_products = df[df['月售'] > 0].groupby('门店名称')['商品名称'].nunique().reset_index()
+            active_products = df[df['月售'] > 0].groupby('门店名称', observed=True)['商品名称'].nunique().reset_index()
             active_products.columns = ['门店名称', '动销商品数']
             kpi = kpi.merge(active_products, on='门店名称', how='left')
             kpi['动销商品数'] = kpi['动销商品数'].fillna(0).astype(int)
@@ -241,7 +1012,7 @@ class ParquetSyncService:
         )
         
         # 按门店+渠道聚合
-        channel_agg = order_agg.groupby(['门店名称', '渠道']).agg({
+        channel_agg = order_agg.groupby(['门店名称', '渠道'], observed=True).agg({
             '订单ID': 'count',
             '实收价格': 'sum',
             '订单实际利润': 'sum',
@@ -264,7 +1035,7 @@ class ParquetSyncService:
         if '月售' not in df.columns:
             df['月售'] = 1
         
-        category_agg = df.groupby(['门店名称', '一级分类名']).agg({
+        category_agg = df.groupby(['门店名称', '一级分类名'], observed=True).agg({
             '订单ID': 'nunique',
             '实收价格': 'sum',
             '利润额': 'sum',
@@ -277,55 +1048,223 @@ class ParquetSyncService:
         
         return category_agg
     
-    def _append_or_create(self, filepath: Path, df: pd.DataFrame, dedup_keys: List[str]):
-        """追加或创建 Parquet 文件"""
-        if df.empty:
+    # ==================== 聚合分区 ====================
+    
+    def _partition_path(self, dataset: str, month: str) -> Path:
+        return self.agg_dir / "daily" / dataset / f"{month}.parquet"
+    
+    def _write_parquet_atomic(self, filepath: Path, df: pd.DataFrame):
+        """写临时文件后原子替换（读取方不会看到写了一半的文件）"""
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = filepath.with_name(f"{filepath.name}.tmp-{os.getpid()}")
+        try:
+            df.to_parquet(tmp_path, engine='pyarrow', compression='snappy', index=False)
+            os.replace(tmp_path, filepath)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+    
+    def _read_agg_manifest(self) -> Dict:
+        if self.agg_manifest_file.exists():
+            try:
+                with open(self.agg_manifest_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ 聚合分区清单读取失败: {e}")
+        return {"datasets": {}}
+    
+    def _write_agg_manifest(self, manifest: Dict):
+        tmp_path = self.agg_manifest_file.with_name(f"{self.agg_manifest_file.name}.tmp-{os.getpid()}")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.agg_manifest_file)
+    
+    def _write_partition(self, manifest: Dict, dataset: str, month: str, df: pd.DataFrame) -> Path:
+        """写入一个月分区并更新清单条目（调用方负责写回清单）"""
+        filepath = self._partition_path(dataset, month)
+        self._write_parquet_atomic(filepath, df)
+        dates = df['日期'].astype(str)
+        manifest["datasets"].setdefault(dataset, {})[month] = {
+            "file": filepath.relative_to(self.data_dir).as_posix(),
+            "rows": int(len(df)),
+            "min_date": dates.min(),
+            "max_date": dates.max(),
+            "updated_at": datetime.now().isoformat(timespec='seconds'),
+        }
+        return filepath
+    
+    def _migrate_legacy_dataset(self, manifest: Dict, dataset: str):
+        """旧版单文件聚合数据拆分为月分区（已有分区的数据较新，优先保留）"""
+        legacy_file = self.agg_dir / "daily" / f"{dataset}.parquet"
+        if not legacy_file.exists():
             return
         
-        filepath.parent.mkdir(parents=True, exist_ok=True)
+        legacy = pd.read_parquet(legacy_file)
+        if not legacy.empty and '日期' in legacy.columns:
+            legacy['日期'] = legacy['日期'].astype(str)
+            for month, part in legacy.groupby(legacy['日期'].str[:7]):
+                filepath = self._partition_path(dataset, month)
+                if filepath.exists():
+                    current = pd.read_parquet(filepath)
+                    part = pd.concat(
+                        [part[~part['日期'].isin(current['日期'].astype(str))], current],
+                        ignore_index=True,
+                    )
+                self._write_partition(manifest, dataset, month, part)
         
-        if filepath.exists():
-            # 读取现有数据
-            existing = pd.read_parquet(filepath)
-            # 合并（去重）
-            combined = pd.concat([existing, df], ignore_index=True)
-            combined = combined.drop_duplicates(subset=dedup_keys, keep='last')
-        else:
-            combined = df
+        legacy_file.unlink()
+        print(f"✅ 聚合数据已拆分为月分区: {dataset}")
+    
+    def _replace_partition(self, dataset: str, target_date: date, df: pd.DataFrame) -> str:
+        """
+        幂等写入某一天的聚合数据
+        
+        只读写 target_date 所在月份的分区：删除该日旧行后追加新行，
+        同步耗时与历史数据量无关
+        
+        Returns:
+            分区文件路径（df为空时返回空字符串）
+        """
+        if df.empty:
+            return ""
         
-        combined.to_parquet(filepath, engine='pyarrow', compression='snappy', index=False)
+        day = str(target_date)
+        month = target_date.strftime('%Y-%m')
+        with self._agg_lock:
+            manifest = self._read_agg_manifest()
+            self._migrate_legacy_dataset(manifest, dataset)
+            
+            filepath = self._partition_path(dataset, month)
+            if filepath.exists():
+                existing = pd.read_parquet(filepath)
+                existing = existing[existing['日期'].astype(str) != day]
+                combined = pd.concat([existing, df], ignore_index=True)
+            else:
+                combined = df
+            
+            self._write_partition(manifest, dataset, month, combined)
+            self._write_agg_manifest(manifest)
+        return str(filepath)
     
-    def _update_partition_metadata(self, target_date: date, record_count: int):
-        """更新分区元数据"""
-        metadata_file = self.metadata_dir / "partitions.json"
+    def get_aggregated_files(
+        self,
+        dataset: str,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> List[Path]:
+        """
+        与日期范围有交集的聚合分区文件（按清单中的日期范围裁剪）
+        
+        尚未迁移的旧版单文件原样返回
+        """
+        partitions = self._read_agg_manifest()["datasets"].get(dataset)
+        if not partitions:
+            legacy_file = self.agg_dir / "daily" / f"{dataset}.parquet"
+            return [legacy_file] if legacy_file.exists() else []
         
+        files = []
+        for month in sorted(partitions):
+            entry = partitions[month]
+            if start_date and entry["max_date"] < str(start_date):
+                continue
+            if end_date and entry["min_date"] > str(end_date):
+                continue
+            filepath = self.data_dir / entry["file"]
+            if filepath.exists():
+                files.append(filepath)
+        return files
+    
+    def _update_partition_metadata(self, target_date: date, record_count: int, append: bool = False,
+                                   synced_at: Optional[datetime] = None):
+        """更新分区元数据（append=True 时在该日已有行数上累加；synced_at 为数据快照时间，默认当前时间）"""
+        with self._raw_lock:
+            self._write_partition_metadata(target_date, record_count, append, synced_at or datetime.now())
+    
+    def _read_partition_metadata(self) -> Dict:
+        metadata_file = self.metadata_dir / "partitions.json"
         if metadata_file.exists():
             with open(metadata_file, 'r', encoding='utf-8') as f:
-                metadata = json.load(f)
-        else:
-            metadata = {"partitions": {}}
+                return json.load(f)
+        return {"partitions": {}}
+    
+    def _write_partition_metadata(self, target_date: date, record_count: int, append: bool, synced_at: datetime):
+        metadata = self._read_partition_metadata()
         
         partition_key = target_date.strftime('%Y-%m')
         if partition_key not in metadata["partitions"]:
             metadata["partitions"][partition_key] = {"dates": {}, "total_records": 0}
         
-        metadata["partitions"][partition_key]["dates"][str(target_date)] = record_count
+        dates = metadata["partitions"][partition_key]["dates"]
+        dates[str(target_date)] = record_count + (dates.get(str(target_date), 0) if append else 0)
         metadata["partitions"][partition_key]["total_records"] = sum(
             metadata["partitions"][partition_key]["dates"].values()
         )
+        # 同步时间（按日，读取数据库之前的时间），订单加载时与 PostgreSQL 的 updated_at 比较判断该日Parquet是否最新
+        metadata["partitions"][partition_key].setdefault("synced_at", {})[str(target_date)] = (
+            synced_at.isoformat()
+        )
         
-        with open(metadata_file, 'w', encoding='utf-8') as f:
+        # 临时文件 + 原子替换：其他worker读取时不会看到写了一半的文件
+        metadata_file = self.metadata_dir / "partitions.json"
+        tmp_path = metadata_file.with_name(f"{metadata_file.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, metadata_file)
+    
+    def _read_last_update(self) -> Dict:
+        metadata_file = self.metadata_dir / "last_update.json"
+        if metadata_file.exists():
+            try:
+                with open(metadata_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ last_update.json 读取失败: {e}")
+        return {}
+    
+    def _write_last_update(self, metadata: Dict):
+        metadata_file = self.metadata_dir / "last_update.json"
+        tmp_path = metadata_file.with_name(f"{metadata_file.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(metadata, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, metadata_file)
     
     def _update_last_sync(self, target_date: date):
         """更新最后同步时间"""
-        metadata_file = self.metadata_dir / "last_update.json"
-        metadata = {
-            "last_sync_date": str(target_date),
-            "last_sync_time": datetime.now().isoformat(),
+        with self._raw_lock:
+            metadata = self._read_last_update()
+            metadata["last_sync_date"] = str(target_date)
+            metadata["last_sync_time"] = datetime.now().isoformat()
+            self._write_last_update(metadata)
+    
+    def get_watermark(self, target_date: date) -> Optional[Dict]:
+        """某一天的增量同步水位线: {"max_id", "rows", "max_updated_at"(datetime)}，没有时返回None"""
+        entry = self._read_last_update().get("watermarks", {}).get(str(target_date))
+        if not entry:
+            return None
+        updated = entry.get("max_updated_at")
+        return {
+            "max_id": entry["max_id"],
+            "rows": entry["rows"],
+            "max_updated_at": datetime.fromisoformat(updated) if updated else None,
         }
-        with open(metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+    
+    def _save_watermark(self, target_date: date, watermark: Optional[Dict]):
+        """保存（None 时删除）某一天的水位线，只保留最近 WATERMARK_KEEP_DAYS 天"""
+        oldest = str(datetime.now().date() - timedelta(days=self.WATERMARK_KEEP_DAYS))
+        with self._raw_lock:
+            metadata = self._read_last_update()
+            watermarks = {d: w for d, w in metadata.get("watermarks", {}).items() if d >= oldest}
+            watermarks.pop(str(target_date), None)
+            if watermark and str(target_date) >= oldest:
+                updated = watermark["max_updated_at"]
+                watermarks[str(target_date)] = {
+                    "max_id": watermark["max_id"],
+                    "rows": watermark["rows"],
+                    "max_updated_at": updated.isoformat() if updated else None,
+                    "synced_at": datetime.now().isoformat(),
+                }
+            metadata["watermarks"] = watermarks
+            self._write_last_update(metadata)
     
     def get_status(self) -> Dict:
         """获取同步状态"""
@@ -341,11 +1280,23 @@ class ParquetSyncService:
         else:
             last_update = None
         
+        agg_manifest = self._read_agg_manifest()
+        compactions = self.get_compaction_history()
+        last_compaction = compactions[-1] if compactions else None
+        
         return {
             "data_dir": str(self.data_dir),
             "raw_files_count": len(raw_files),
             "aggregated_files_count": len(agg_files),
+            "aggregated_partitions": {
+                dataset: sorted(partitions) for dataset, partitions in agg_manifest["datasets"].items()
+            },
             "last_update": last_update,
+            "last_compaction": {
+                "started_at": last_compaction["started_at"],
+                "raw_files": [last_compaction["before"]["raw"]["files"], last_compaction["after"]["raw"]["files"]],
+                "scan_ms": last_compaction["scan_ms"],
+            } if last_compaction else None,
         }
 
 
@@ -2,14 +2,21 @@
 """
 智能查询路由服务（完整版）
 
-根据数据量自动选择最优查询引擎：
-- < 100万条: PostgreSQL + 预聚合表（低延迟）
-- >= 100万条: DuckDB + Parquet（高吞吐）
+按查询选择引擎（基于代价）：
+- 估算本次查询扫描行数：分区统计（partitions.json 每日行数）按日期范围求和，
+  指定门店时按门店数均摊（日期跨度 × 门店数）
+- 每个引擎按查询形状（概览/趋势/渠道/品类 × 数据量级别）记录最近耗时，取滑动分位数比较
+- 两个引擎都有足够样本时选分位数耗时低的；样本不足时按估算行数（< 100万 PostgreSQL，>= 100万 DuckDB）
+- 每 N 次决策把一次查询路由到另一个引擎，保持两边的耗时样本是新的
+
+数据量复查：
+- 定时（默认 5 分钟）或数据版本变化（Parquet 同步写入）时在后台线程重新统计，
+  不在查询线程里执行 COUNT(*)
 
 特性：
 - 自动检测数据量
-- 智能引擎切换（真正的路由，不只是状态报告）
-- 查询性能监控
+- 按查询路由（不是全进程固定一个引擎）
+- 查询性能监控（每个引擎 × 查询形状的滑动分位数）
 - 启动时状态报告
 - 统一查询接口（自动选择最优引擎）
 """
@@ -17,7 +24,10 @@
 from typing import Dict, Any, Optional, Tuple, List
 from datetime import date, datetime
 from dataclasses import dataclass
+from collections import deque
 from enum import Enum
+import os
+import threading
 import time
 
 from .logging_service import logging_service
@@ -36,6 +46,8 @@ class QueryResult:
     engine: QueryEngine
     query_time_ms: float
     source: str  # 数据来源描述
+    estimated_rows: int = 0  # 路由时估算的扫描行数
+    route_reason: str = ""   # 选择该引擎的原因
 
 
 @dataclass
@@ -47,19 +59,75 @@ class EngineStatus:
     reason: str
 
 
+@dataclass
+class RouteDecision:
+    """单次查询的路由决策"""
+    engine: QueryEngine
+    estimated_rows: int
+    shape: str   # 查询形状: 查询类型:数据量级别
+    reason: str
+
+
+class _LatencyTracker:
+    """按 (引擎, 查询形状) 记录最近 window 次耗时，计算滑动分位数"""
+    
+    def __init__(self, window: int, min_samples: int):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[Tuple[str, str], deque] = {}
+        self._lock = threading.Lock()
+    
+    def record(self, engine: QueryEngine, shape: str, elapsed_ms: float):
+        with self._lock:
+            key = (engine.value, shape)
+            if key not in self._samples:
+                self._samples[key] = deque(maxlen=self.window)
+            self._samples[key].append(elapsed_ms)
+    
+    def percentile(self, engine: QueryEngine, shape: str, q: float) -> Optional[float]:
+        """第 q 分位耗时（ms），样本不足 min_samples 时返回 None"""
+        with self._lock:
+            samples = sorted(self._samples.get((engine.value, shape), ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100))]
+    
+    def snapshot(self, q: float) -> Dict[str, Dict[str, Any]]:
+        """{查询形状: {引擎: {样本数, p50, pN}}}"""
+        with self._lock:
+            items = [(key, sorted(samples)) for key, samples in self._samples.items()]
+        result: Dict[str, Dict[str, Any]] = {}
+        for (engine, shape), samples in sorted(items, key=lambda item: (item[0][1], item[0][0])):
+            result.setdefault(shape, {})[engine] = {
+                "samples": len(samples),
+                "p50_ms": round(samples[len(samples) // 2], 1),
+                f"p{int(q)}_ms": round(samples[min(len(samples) - 1, int(len(samples) * q / 100))], 1),
+            }
+        return result
+
+
 class QueryRouterService:
     """
     智能查询路由服务
     
-    路由策略：
-    1. 数据量 < 100万: 使用 PostgreSQL（预聚合表已优化，延迟低）
-    2. 数据量 >= 100万: 使用 DuckDB（列式存储，大数据量更快）
-    3. DuckDB 不可用时: 降级到 PostgreSQL
+    路由策略（每次查询）：
+    1. 强制指定引擎时（测试用）使用指定引擎
+    2. 只有一个引擎可用时使用该引擎
+    3. 两个引擎在该查询形状上都有足够耗时样本: 选分位数耗时低的
+    4. 样本不足: 估算扫描行数 < 100万 用 PostgreSQL，>= 100万 用 DuckDB
+    5. DuckDB 查询失败: 降级到 PostgreSQL
     """
     
-    # 切换阈值（条）
+    # 切换阈值（条）：样本不足时按估算扫描行数选择引擎
     SWITCH_THRESHOLD = 1_000_000  # 100万条
     
+    # 耗时统计（环境变量可覆盖）
+    LATENCY_WINDOW = int(os.getenv("QUERY_ROUTER_LATENCY_WINDOW", 50))        # 每个引擎×形状保留的样本数
+    LATENCY_PERCENTILE = float(os.getenv("QUERY_ROUTER_PERCENTILE", 90))      # 比较的分位数
+    MIN_SAMPLES = int(os.getenv("QUERY_ROUTER_MIN_SAMPLES", 5))               # 参与比较的最少样本数
+    EXPLORE_EVERY = int(os.getenv("QUERY_ROUTER_EXPLORE_EVERY", 20))          # 每 N 次决策探索一次另一个引擎（0 关闭）
+    RECHECK_SECONDS = float(os.getenv("QUERY_ROUTER_RECHECK_SECONDS", 300))   # 数据量定时复查间隔
+    
     # 数据量级别描述
     DATA_LEVELS = {
         "small": (0, 100_000, "小型", "PostgreSQL"),
@@ -69,22 +137,37 @@ class QueryRouterService:
     }
     
     def __init__(self):
+        # 默认引擎（按总数据量，仅用于状态报告；实际按查询路由）
         self._current_engine: QueryEngine = QueryEngine.POSTGRESQL
+        self._forced_engine: Optional[QueryEngine] = None
         self._record_count: int = 0
         self._last_check: Optional[datetime] = None
         self._duckdb_available: bool = False
         self._postgresql_available: bool = False
         
+        # 分区统计: {"version", "day_rows": {日期: 行数}, "stores"}
+        self._partition_stats: Dict[str, Any] = {}
+        self._recheck_lock = threading.Lock()
+        self._rechecking = False
+        
+        # 耗时统计与路由决策计数（按查询形状）
+        self._latency = _LatencyTracker(self.LATENCY_WINDOW, self.MIN_SAMPLES)
+        self._decisions: Dict[str, int] = {}
+        self._decisions_lock = threading.Lock()
+        
         # 统计
         self._stats = {
             "postgresql_queries": 0,
             "duckdb_queries": 0,
             "auto_switches": 0,
+            "explorations": 0,
+            "fallbacks": 0,
+            "rechecks": 0,
         }
     
     def initialize(self) -> Dict[str, Any]:
         """
-        初始化路由服务，检测数据量和引擎可用性
+        初始化路由服务，检测数据量、分区统计和引擎可用性
         
         Returns:
             初始化状态报告
@@ -117,34 +200,39 @@ class QueryRouterService:
                 report["engines"]["postgresql"]["available"] = True
                 report["engines"]["postgresql"]["reason"] = "连接正常"
         except Exception as e:
+            self._postgresql_available = False
             report["engines"]["postgresql"]["reason"] = f"连接失败: {str(e)[:50]}"
         
-        # 检查 DuckDB
+        # 检查 DuckDB（同时读取分区统计，供估算扫描行数）
         try:
             from .duckdb_service import duckdb_service
             status = duckdb_service.get_status()
             self._duckdb_available = status.get("has_data", False)
             report["engines"]["duckdb"]["available"] = self._duckdb_available
             if self._duckdb_available:
+                self._partition_stats = duckdb_service.get_partition_stats()
                 report["engines"]["duckdb"]["reason"] = f"就绪 ({status['raw_parquet_count']} 个Parquet文件)"
             else:
+                self._partition_stats = {"version": duckdb_service.data_version(), "day_rows": {}, "stores": 0}
                 report["engines"]["duckdb"]["reason"] = "无Parquet数据"
         except Exception as e:
+            self._duckdb_available = False
             report["engines"]["duckdb"]["reason"] = f"初始化失败: {str(e)[:50]}"
         
+        # PostgreSQL 不可用时，用分区统计的总行数作为数据量
+        if not self._postgresql_available:
+            self._record_count = sum(self._partition_stats.get("day_rows", {}).values())
+            report["record_count"] = self._record_count
+        
         # 确定数据级别
         data_level, level_desc, recommended = self._get_data_level(self._record_count)
         report["data_level"] = data_level
         report["data_level_desc"] = level_desc
         report["recommended_engine"] = recommended
         
-        # 选择引擎
-        if self._record_count >= self.SWITCH_THRESHOLD and self._duckdb_available:
-            self._current_engine = QueryEngine.DUCKDB
-            report["current_engine"] = "duckdb"
-        else:
-            self._current_engine = QueryEngine.POSTGRESQL
-            report["current_engine"] = "postgresql"
+        # 默认引擎（全量查询时的选择）
+        self._current_engine = self._engine_for_rows(self._record_count)
+        report["current_engine"] = self._current_engine.value
         
         self._last_check = datetime.now()
         
@@ -157,40 +245,173 @@ class QueryRouterService:
                 return level, desc, engine
         return "unknown", "未知", "postgresql"
     
+    # ==================== 数据量复查 ====================
+    
+    def _ensure_fresh(self):
+        """首次查询时同步初始化；之后到期或数据版本变化时后台复查"""
+        if self._last_check is None:
+            self.initialize()
+            return
+        
+        due = (datetime.now() - self._last_check).total_seconds() >= self.RECHECK_SECONDS
+        if due or self._data_version() != self._partition_stats.get("version"):
+            self.recheck_async()
+    
+    def _data_version(self) -> Optional[int]:
+        try:
+            from .duckdb_service import duckdb_service
+            return duckdb_service.data_version()
+        except Exception:
+            return None
+    
+    def recheck_async(self):
+        """后台重新统计数据量和分区统计（同一时刻只运行一个）"""
+        with self._recheck_lock:
+            if self._rechecking:
+                return
+            self._rechecking = True
+        
+        def _run():
+            try:
+                self.initialize()
+                self._stats["rechecks"] += 1
+            except Exception as e:
+                logging_service.warning(f"智能路由数据量复查失败: {e}")
+            finally:
+                with self._recheck_lock:
+                    self._rechecking = False
+        
+        threading.Thread(target=_run, name="query-router-recheck", daemon=True).start()
+    
+    # ==================== 代价估算与引擎选择 ====================
+    
+    def estimate_rows(
+        self,
+        store_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        days: Optional[int] = None
+    ) -> int:
+        """
+        估算查询扫描的行数
+        
+        - 有分区统计: 日期范围内每日行数求和（只给 days 时取最近 days 天）
+        - 无分区统计: 总数据量
+        - 指定门店: 按门店数均摊
+        """
+        day_rows: Dict[str, int] = self._partition_stats.get("day_rows") or {}
+        if day_rows:
+            days_in_range = sorted(
+                day for day in day_rows
+                if (start_date is None or day >= str(start_date)[:10])
+                and (end_date is None or day <= str(end_date)[:10])
+            )
+            if days and start_date is None:
+                days_in_range = days_in_range[-days:]
+            rows = sum(day_rows[day] for day in days_in_range)
+        else:
+            rows = self._record_count
+        
+        if store_name:
+            rows //= max(self._partition_stats.get("stores") or 1, 1)
+        return rows
+    
+    def _engine_for_rows(self, rows: int) -> QueryEngine:
+        """按估算行数选择引擎（没有耗时样本时的先验，PostgreSQL 不可用时用 DuckDB）"""
+        if self._duckdb_available and (rows >= self.SWITCH_THRESHOLD or not self._postgresql_available):
+            return QueryEngine.DUCKDB
+        return QueryEngine.POSTGRESQL
+    
+    def _route(self, query_type: str, estimated_rows: int, explore: bool = True) -> RouteDecision:
+        """
+        为一次查询选择引擎
+        
+        explore=False 时不探索另一个引擎（该查询的 PostgreSQL 路径不产生耗时样本）
+        """
+        shape = f"{query_type}:{self._get_data_level(estimated_rows)[0]}"
+        
+        if self._forced_engine is not None:
+            return RouteDecision(self._forced_engine, estimated_rows, shape, "强制指定")
+        if not self._duckdb_available:
+            return RouteDecision(QueryEngine.POSTGRESQL, estimated_rows, shape, "DuckDB 不可用")
+        if not self._postgresql_available:
+            return RouteDecision(QueryEngine.DUCKDB, estimated_rows, shape, "PostgreSQL 不可用")
+        
+        q = self.LATENCY_PERCENTILE
+        pg_ms = self._latency.percentile(QueryEngine.POSTGRESQL, shape, q)
+        duck_ms = self._latency.percentile(QueryEngine.DUCKDB, shape, q)
+        if pg_ms is not None and duck_ms is not None:
+            engine = QueryEngine.DUCKDB if duck_ms < pg_ms else QueryEngine.POSTGRESQL
+            reason = f"P{int(q)} 耗时 PostgreSQL {pg_ms:.0f}ms / DuckDB {duck_ms:.0f}ms"
+        else:
+            engine = self._engine_for_rows(estimated_rows)
+            reason = f"估算扫描 {estimated_rows:,} 行（阈值 {self.SWITCH_THRESHOLD:,}）"
+        
+        # 定期探索另一个引擎，保持两边耗时样本
+        if not explore:
+            return RouteDecision(engine, estimated_rows, shape, reason)
+        with self._decisions_lock:
+            self._decisions[shape] = self._decisions.get(shape, 0) + 1
+            explore = self.EXPLORE_EVERY > 0 and self._decisions[shape] % self.EXPLORE_EVERY == 0
+        if explore:
+            engine = QueryEngine.POSTGRESQL if engine == QueryEngine.DUCKDB else QueryEngine.DUCKDB
+            reason = f"探索（{reason}）"
+            self._stats["explorations"] += 1
+        
+        return RouteDecision(engine, estimated_rows, shape, reason)
+    
     def get_engine(self) -> QueryEngine:
-        """获取当前应使用的查询引擎"""
-        return self._current_engine
+        """获取默认查询引擎（全量查询时的选择，强制指定时为指定引擎）"""
+        return self._forced_engine or self._current_engine
     
     def should_use_duckdb(self) -> bool:
-        """是否应该使用 DuckDB"""
+        """默认引擎是否为 DuckDB"""
         return (
-            self._current_engine == QueryEngine.DUCKDB
+            self.get_engine() == QueryEngine.DUCKDB
             and self._duckdb_available
         )
     
-    def record_query(self, engine: QueryEngine):
-        """记录查询"""
+    def record_query(self, engine: QueryEngine, shape: Optional[str] = None, elapsed_ms: Optional[float] = None):
+        """记录查询（给出查询形状和耗时时计入滑动分位数）"""
         if engine == QueryEngine.POSTGRESQL:
             self._stats["postgresql_queries"] += 1
         else:
             self._stats["duckdb_queries"] += 1
+        if shape is not None and elapsed_ms is not None:
+            self._latency.record(engine, shape, elapsed_ms)
     
     def get_status(self) -> Dict[str, Any]:
         """获取路由状态"""
         data_level, level_desc, recommended = self._get_data_level(self._record_count)
+        day_rows = self._partition_stats.get("day_rows") or {}
         
         return {
-            "current_engine": self._current_engine.value,
+            "current_engine": self.get_engine().value,
             "record_count": self._record_count,
             "data_level": data_level,
             "data_level_desc": level_desc,
             "recommended_engine": recommended,
             "switch_threshold": self.SWITCH_THRESHOLD,
-            "will_switch_at": f"{self.SWITCH_THRESHOLD:,} 条",
+            "will_switch_at": f"{self.SWITCH_THRESHOLD:,} 条（按单次查询估算扫描行数）",
             "engines": {
                 "postgresql": self._postgresql_available,
                 "duckdb": self._duckdb_available,
             },
+            "routing": {
+                "mode": "forced" if self._forced_engine else "cost_based",
+                "percentile": self.LATENCY_PERCENTILE,
+                "min_samples": self.MIN_SAMPLES,
+                "explore_every": self.EXPLORE_EVERY,
+                "recheck_seconds": self.RECHECK_SECONDS,
+                "partition_stats": {
+                    "days": len(day_rows),
+                    "rows": sum(day_rows.values()),
+                    "stores": self._partition_stats.get("stores", 0),
+                    "version": self._partition_stats.get("version"),
+                },
+                "latency": self._latency.snapshot(self.LATENCY_PERCENTILE),
+                "decisions": dict(self._decisions),
+            },
             "stats": self._stats,
             "last_check": self._last_check.isoformat() if self._last_check else None,
         }
@@ -207,35 +428,35 @@ class QueryRouterService:
         """
         智能路由：获取订单概览（六大卡片）
         
-        自动选择最优引擎：
-        - 数据量 < 100万: PostgreSQL + 预聚合表
-        - 数据量 >= 100万: DuckDB + Parquet
+        按本次查询估算扫描行数和各引擎历史耗时选择引擎
         """
         start_time = time.time()
+        self._ensure_fresh()
+        decision = self._route("overview", self.estimate_rows(store_name, start_date, end_date))
         
-        # 确保已初始化
-        if self._last_check is None:
-            self.initialize()
-        
-        # 根据当前引擎选择查询方式
-        if self.should_use_duckdb():
+        if decision.engine == QueryEngine.DUCKDB:
             try:
                 from .duckdb_service import duckdb_service
+                duck_start = time.time()
                 data = duckdb_service.query_kpi(store_name, start_date, end_date, channel)
                 elapsed = (time.time() - start_time) * 1000
-                self.record_query(QueryEngine.DUCKDB)
+                self.record_query(QueryEngine.DUCKDB, decision.shape, (time.time() - duck_start) * 1000)
                 
                 return QueryResult(
                     data=data,
                     engine=QueryEngine.DUCKDB,
                     query_time_ms=round(elapsed, 2),
-                    source="DuckDB + Parquet (智能路由)"
+                    source="DuckDB + Parquet (智能路由)",
+                    estimated_rows=decision.estimated_rows,
+                    route_reason=decision.reason
                 )
             except Exception as e:
                 logging_service.warning(f"DuckDB查询失败，降级到PostgreSQL: {e}")
+                self._stats["fallbacks"] += 1
                 # 降级到 PostgreSQL
         
-        # PostgreSQL 查询（使用预聚合表）
+        # PostgreSQL 查询（使用预聚合表，不可用时用统一KPI查询计划扫描原始表）
+        pg_start = time.time()
         try:
             from .aggregation_service import aggregation_service
             data = aggregation_service.get_store_overview(
@@ -243,14 +464,25 @@ class QueryRouterService:
                 start_date=start_date,
                 end_date=end_date
             )
+            source = "PostgreSQL + 预聚合表 (智能路由)"
+            if data is None:
+                data = aggregation_service.get_store_overview_raw(
+                    store_name=store_name,
+                    start_date=start_date,
+                    end_date=end_date,
+                    channel=channel
+                )
+                source = "PostgreSQL 原始表 (智能路由，统一KPI查询)"
             elapsed = (time.time() - start_time) * 1000
-            self.record_query(QueryEngine.POSTGRESQL)
+            self.record_query(QueryEngine.POSTGRESQL, decision.shape, (time.time() - pg_start) * 1000)
             
             return QueryResult(
                 data=data,
                 engine=QueryEngine.POSTGRESQL,
                 query_time_ms=round(elapsed, 2),
-                source="PostgreSQL + 预聚合表 (智能路由)"
+                source=source,
+                estimated_rows=decision.estimated_rows,
+                route_reason=decision.reason
             )
         except Exception as e:
             logging_service.error(f"PostgreSQL查询失败: {e}")
@@ -268,17 +500,19 @@ class QueryRouterService:
         """
         智能路由：获取订单趋势
         
-        自动选择最优引擎
+        按本次查询估算扫描行数和各引擎历史耗时选择引擎
         """
         start_time = time.time()
-        
-        if self._last_check is None:
-            self.initialize()
+        self._ensure_fresh()
+        decision = self._route(
+            "trend", self.estimate_rows(store_name, start_date, end_date, days=days)
+        )
         
         # DuckDB 路由
-        if self.should_use_duckdb():
+        if decision.engine == QueryEngine.DUCKDB:
             try:
                 from .duckdb_service import duckdb_service
+                duck_start = time.time()
                 data = duckdb_service.query_trend(
                     days=days,
                     store_name=store_name,
@@ -288,18 +522,22 @@ class QueryRouterService:
                     granularity=granularity
                 )
                 elapsed = (time.time() - start_time) * 1000
-                self.record_query(QueryEngine.DUCKDB)
+                self.record_query(QueryEngine.DUCKDB, decision.shape, (time.time() - duck_start) * 1000)
                 
                 return QueryResult(
                     data=data,
                     engine=QueryEngine.DUCKDB,
                     query_time_ms=round(elapsed, 2),
-                    source="DuckDB + Parquet (智能路由)"
+                    source="DuckDB + Parquet (智能路由)",
+                    estimated_rows=decision.estimated_rows,
+                    route_reason=decision.reason
                 )
             except Exception as e:
                 logging_service.warning(f"DuckDB趋势查询失败，降级到PostgreSQL: {e}")
+                self._stats["fallbacks"] += 1
         
         # PostgreSQL 查询
+        pg_start = time.time()
         try:
             from .aggregation_service import aggregation_service
             
@@ -313,7 +551,7 @@ class QueryRouterService:
                 channel=agg_channel
             )
             elapsed = (time.time() - start_time) * 1000
-            self.record_query(QueryEngine.POSTGRESQL)
+            self.record_query(QueryEngine.POSTGRESQL, decision.shape, (time.time() - pg_start) * 1000)
             
             # 转换为统一格式
             if data:
@@ -335,7 +573,9 @@ class QueryRouterService:
                 data=result_data,
                 engine=QueryEngine.POSTGRESQL,
                 query_time_ms=round(elapsed, 2),
-                source="PostgreSQL + 预聚合表 (智能路由)"
+                source="PostgreSQL + 预聚合表 (智能路由)",
+                estimated_rows=decision.estimated_rows,
+                route_reason=decision.reason
             )
         except Exception as e:
             logging_service.error(f"PostgreSQL趋势查询失败: {e}")
@@ -350,30 +590,34 @@ class QueryRouterService:
         """
         智能路由：获取渠道分析
         
-        自动选择最优引擎
-        注意：PostgreSQL 没有渠道预聚合表，使用原始查询
+        按本次查询估算扫描行数和各引擎历史耗时选择引擎
+        注意：PostgreSQL 没有渠道预聚合表，使用原始查询（不计入 PostgreSQL 耗时样本，
+        因此也不探索 PostgreSQL）
         """
         start_time = time.time()
+        self._ensure_fresh()
+        decision = self._route("channels", self.estimate_rows(store_name, start_date, end_date), explore=False)
         
-        if self._last_check is None:
-            self.initialize()
-        
-        # DuckDB 路由（优先）
-        if self.should_use_duckdb():
+        # DuckDB 路由
+        if decision.engine == QueryEngine.DUCKDB:
             try:
                 from .duckdb_service import duckdb_service
+                duck_start = time.time()
                 data = duckdb_service.query_channels(store_name, start_date, end_date)
                 elapsed = (time.time() - start_time) * 1000
-                self.record_query(QueryEngine.DUCKDB)
+                self.record_query(QueryEngine.DUCKDB, decision.shape, (time.time() - duck_start) * 1000)
                 
                 return QueryResult(
                     data=data,
                     engine=QueryEngine.DUCKDB,
                     query_time_ms=round(elapsed, 2),
-                    source="DuckDB + Parquet (智能路由)"
+                    source="DuckDB + Parquet (智能路由)",
+                    estimated_rows=decision.estimated_rows,
+                    route_reason=decision.reason
                 )
             except Exception as e:
                 logging_service.warning(f"DuckDB渠道查询失败，降级到PostgreSQL: {e}")
+                self._stats["fallbacks"] += 1
         
         # PostgreSQL 原始查询（没有渠道预聚合表）
         # 返回空结果，让 v1 API 使用原始查询逻辑
@@ -384,7 +628,9 @@ class QueryRouterService:
             data=None,  # 返回 None 表示需要使用原始查询
             engine=QueryEngine.POSTGRESQL,
             query_time_ms=round(elapsed, 2),
-            source="PostgreSQL (需要原始查询)"
+            source="PostgreSQL (需要原始查询)",
+            estimated_rows=decision.estimated_rows,
+            route_reason=decision.reason
         )
     
     def query_categories(
@@ -397,31 +643,35 @@ class QueryRouterService:
         """
         智能路由：获取品类分析
         
-        自动选择最优引擎
+        按本次查询估算扫描行数和各引擎历史耗时选择引擎
         """
         start_time = time.time()
-        
-        if self._last_check is None:
-            self.initialize()
+        self._ensure_fresh()
+        decision = self._route("categories", self.estimate_rows(store_name, start_date, end_date))
         
         # DuckDB 路由
-        if self.should_use_duckdb():
+        if decision.engine == QueryEngine.DUCKDB:
             try:
                 from .duckdb_service import duckdb_service
+                duck_start = time.time()
                 data = duckdb_service.query_categories(store_name, start_date, end_date, top_n)
                 elapsed = (time.time() - start_time) * 1000
-                self.record_query(QueryEngine.DUCKDB)
+                self.record_query(QueryEngine.DUCKDB, decision.shape, (time.time() - duck_start) * 1000)
                 
                 return QueryResult(
                     data=data,
                     engine=QueryEngine.DUCKDB,
                     query_time_ms=round(elapsed, 2),
-                    source="DuckDB + Parquet (智能路由)"
+                    source="DuckDB + Parquet (智能路由)",
+                    estimated_rows=decision.estimated_rows,
+                    route_reason=decision.reason
                 )
             except Exception as e:
                 logging_service.warning(f"DuckDB品类查询失败，降级到PostgreSQL: {e}")
+                self._stats["fallbacks"] += 1
         
         # PostgreSQL 查询（使用预聚合表）
+        pg_start = time.time()
         try:
             from .aggregation_service import aggregation_service
             data = aggregation_service.get_category_analysis(
@@ -430,7 +680,7 @@ class QueryRouterService:
                 end_date=end_date
             )
             elapsed = (time.time() - start_time) * 1000
-            self.record_query(QueryEngine.POSTGRESQL)
+            self.record_query(QueryEngine.POSTGRESQL, decision.shape, (time.time() - pg_start) * 1000)
             
             # 转换格式并限制数量
             if data:
@@ -442,7 +692,9 @@ class QueryRouterService:
                 data=result_data,
                 engine=QueryEngine.POSTGRESQL,
                 query_time_ms=round(elapsed, 2),
-                source="PostgreSQL + 预聚合表 (智能路由)"
+                source="PostgreSQL + 预聚合表 (智能路由)",
+                estimated_rows=decision.estimated_rows,
+                route_reason=decision.reason
             )
         except Exception as e:
             logging_service.error(f"PostgreSQL品类查询失败: {e}")
@@ -454,8 +706,10 @@ class QueryRouterService:
         """
         强制切换引擎（仅用于测试）
         
+        指定后所有查询都使用该引擎，"auto" 恢复按查询代价路由
+        
         Args:
-            engine: "postgresql" 或 "duckdb"
+            engine: "postgresql"、"duckdb" 或 "auto"
         
         Returns:
             切换结果
@@ -463,15 +717,18 @@ class QueryRouterService:
         if engine == "duckdb":
             if not self._duckdb_available:
                 return {"success": False, "message": "DuckDB 不可用"}
-            self._current_engine = QueryEngine.DUCKDB
+            self._forced_engine = QueryEngine.DUCKDB
             self._stats["auto_switches"] += 1
             return {"success": True, "message": "已切换到 DuckDB", "engine": "duckdb"}
         elif engine == "postgresql":
             if not self._postgresql_available:
                 return {"success": False, "message": "PostgreSQL 不可用"}
-            self._current_engine = QueryEngine.POSTGRESQL
+            self._forced_engine = QueryEngine.POSTGRESQL
             self._stats["auto_switches"] += 1
             return {"success": True, "message": "已切换到 PostgreSQL", "engine": "postgresql"}
+        elif engine == "auto":
+            self._forced_engine = None
+            return {"success": True, "message": "已恢复按查询代价路由", "engine": self._current_engine.value}
         else:
             return {"success": False, "message": f"未知引擎: {engine}"}
     
@@ -520,10 +777,9 @@ class QueryRouterService:
         # 智能切换提示
         lines.append("")
         if count < self.SWITCH_THRESHOLD:
-            remaining = self.SWITCH_THRESHOLD - count
-            lines.append(f"  💡 智能切换: 数据量达到 {self.SWITCH_THRESHOLD:,} 条后")
-            lines.append(f"              将自动切换到 DuckDB 引擎")
-            lines.append(f"              (还需 {remaining:,} 条)")
+            lines.append(f"  💡 智能切换: 按单次查询估算扫描行数路由，")
+            lines.append(f"              超过 {self.SWITCH_THRESHOLD:,} 行的查询使用 DuckDB，")
+            lines.append(f"              积累耗时样本后按 P{int(self.LATENCY_PERCENTILE)} 耗时选择")
         else:
             if dk_status["available"]:
                 lines.append(f"  ✅ 智能切换: 已启用 DuckDB 加速")
@@ -581,9 +837,8 @@ class QueryRouterService:
         # 智能切换提示
         commands.append('Write-Host ""')
         if count < self.SWITCH_THRESHOLD:
-            remaining = self.SWITCH_THRESHOLD - count
-            commands.append(f'Write-Host "  💡 智能切换: 数据量达到 {self.SWITCH_THRESHOLD:,} 条后自动切换到 DuckDB" -ForegroundColor Yellow')
-            commands.append(f'Write-Host "              (还需 {remaining:,} 条)" -ForegroundColor Gray')
+            commands.append(f'Write-Host "  💡 智能切换: 按单次查询估算扫描行数路由，超过 {self.SWITCH_THRESHOLD:,} 行的查询使用 DuckDB" -ForegroundColor Yellow')
+            commands.append(f'Write-Host "              (积累耗时样本后按 P{int(self.LATENCY_PERCENTILE)} 耗时选择)" -ForegroundColor Gray')
         else:
             if dk_status["available"]:
                 commands.append('Write-Host "  ✅ 智能切换: 已启用 DuckDB 加速" -ForegroundColor Green')
@@ -8,6 +8,7 @@ from .sync_scheduler import (
     shutdown_scheduler,
     sync_yesterday_data,
     sync_today_data,
+    compact_parquet_files,
     manual_sync,
     scheduler
 )
@@ -17,6 +18,7 @@ __all__ = [
     'shutdown_scheduler',
     'sync_yesterday_data',
     'sync_today_data',
+    'compact_parquet_files',
     'manual_sync',
     'scheduler'
 ]
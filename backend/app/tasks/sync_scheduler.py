@@ -3,13 +3,17 @@
 数据同步定时任务
 
 使用 APScheduler 实现：
-1. 每天凌晨2:00同步昨日数据到Parquet
-2. 每小时刷新预聚合缓存
+1. 每天凌晨2:00同步昨日数据到Parquet（补齐最后的增量后合并增量文件）
+2. 每小时增量同步今日数据（只导出水位线之后的新行，写为增量文件）
+3. 每天凌晨2:30重新导出没有同步时间的旧分区（多worker只有一个执行，一次性迁移后为空操作）
+4. 每天凌晨3:00整理Parquet文件（合并小文件、排序、zstd压缩，只处理未整理的分区）
+
+导出由 ParquetSyncService 完成：服务端游标按批读取为 Arrow，
+直接写入各门店分区的 ParquetWriter（不经过 DataFrame）
 """
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from datetime import datetime, timedelta, date
-import pandas as pd
 import sys
 from pathlib import Path
 
@@ -17,8 +21,6 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
 sys.path.insert(0, str(PROJECT_ROOT))
 
-from database.connection import SessionLocal
-from database.models import Order
 from app.services import parquet_sync_service
 
 # 全局调度器
@@ -32,125 +34,72 @@ def sync_yesterday_data():
     yesterday = datetime.now().date() - timedelta(days=1)
     print(f"🔄 [{datetime.now()}] 开始同步 {yesterday} 的数据...")
     
-    session = SessionLocal()
     try:
-        orders = session.query(Order).filter(Order.date == yesterday).all()
+        # 补齐最后一次增量（没有水位线或数据有修改时整天导出）
+        result = parquet_sync_service.sync_intraday(yesterday, aggregate=False)
         
-        if not orders:
+        if not parquet_sync_service.get_watermark(yesterday):
             print(f"⚠️ {yesterday} 无数据")
             return
         
-        # 转换为 DataFrame
-        data = []
-        for o in orders:
-            data.append({
-                '订单ID': o.order_id,
-                '门店名称': o.store_name,
-                '日期': o.date,
-                '渠道': o.channel,
-                '商品名称': o.product_name,
-                '一级分类名': o.category_level1,
-                '三级分类名': o.category_level3,
-                '月售': o.quantity if o.quantity is not None else 1,
-                '实收价格': float(o.actual_price or 0),
-                '商品实售价': float(o.price or 0),
-                '商品原价': float(o.original_price or 0),
-                '商品采购成本': float(o.cost or 0),
-                '利润额': float(o.profit or 0),
-                '物流配送费': float(o.delivery_fee or 0),
-                '平台服务费': float(o.platform_service_fee or 0),
-                '平台佣金': float(o.commission or 0),
-                '企客后返': float(o.corporate_rebate or 0),
-                '用户支付配送费': float(o.user_paid_delivery_fee or 0),
-                '配送费减免金额': float(o.delivery_discount or 0),
-                '满减金额': float(o.full_reduction or 0),
-                '商品减免金额': float(o.product_discount or 0),
-                '新客减免金额': float(o.new_customer_discount or 0),
-                '商家代金券': float(o.merchant_voucher or 0),
-                '商家承担部分券': float(o.merchant_share or 0),
-                '满赠金额': float(o.gift_amount or 0),
-                '商家其他优惠': float(o.other_merchant_discount or 0),
-                '打包袋金额': float(o.packaging_fee or 0),
-            })
-        
-        df = pd.DataFrame(data)
-        
-        # 同步原始数据
-        parquet_sync_service.sync_raw_data(yesterday, df)
-        
-        # 生成聚合数据
+        # 增量文件合并进当天文件，再生成聚合数据
+        parquet_sync_service.compact_raw_day(yesterday)
         parquet_sync_service.generate_daily_aggregations(yesterday)
         
-        print(f"✅ [{datetime.now()}] {yesterday} 数据同步完成: {len(df)} 条")
+        print(f"✅ [{datetime.now()}] {yesterday} 数据同步完成: {result['mode']} {result['rows']} 条")
         
     except Exception as e:
         print(f"❌ [{datetime.now()}] 同步失败: {e}")
-    finally:
-        session.close()
 
 
 def sync_today_data():
     """
-    同步今日数据（每小时执行，用于实时更新）
+    增量同步今日数据（每小时执行，用于实时更新）
     """
     today = datetime.now().date()
     print(f"🔄 [{datetime.now()}] 刷新今日 {today} 的数据...")
     
-    session = SessionLocal()
     try:
-        orders = session.query(Order).filter(Order.date == today).all()
+        # 只导出水位线之后的新行（首次或数据有修改时整天导出），有新数据时重新生成聚合
+        result = parquet_sync_service.sync_intraday(today)
         
-        if not orders:
+        if result['mode'] == 'none':
+            print(f"⚪ 今日没有新数据")
+            return
+        if not result['rows']:
             print(f"⚠️ 今日暂无数据")
             return
         
-        # 转换为 DataFrame
-        data = []
-        for o in orders:
-            data.append({
-                '订单ID': o.order_id,
-                '门店名称': o.store_name,
-                '日期': o.date,
-                '渠道': o.channel,
-                '商品名称': o.product_name,
-                '一级分类名': o.category_level1,
-                '三级分类名': o.category_level3,
-                '月售': o.quantity if o.quantity is not None else 1,
-                '实收价格': float(o.actual_price or 0),
-                '商品实售价': float(o.price or 0),
-                '商品原价': float(o.original_price or 0),
-                '商品采购成本': float(o.cost or 0),
-                '利润额': float(o.profit or 0),
-                '物流配送费': float(o.delivery_fee or 0),
-                '平台服务费': float(o.platform_service_fee or 0),
-                '平台佣金': float(o.commission or 0),
-                '企客后返': float(o.corporate_rebate or 0),
-                '用户支付配送费': float(o.user_paid_delivery_fee or 0),
-                '配送费减免金额': float(o.delivery_discount or 0),
-                '满减金额': float(o.full_reduction or 0),
-                '商品减免金额': float(o.product_discount or 0),
-                '新客减免金额': float(o.new_customer_discount or 0),
-                '商家代金券': float(o.merchant_voucher or 0),
-                '商家承担部分券': float(o.merchant_share or 0),
-                '满赠金额': float(o.gift_amount or 0),
-                '商家其他优惠': float(o.other_merchant_discount or 0),
-                '打包袋金额': float(o.packaging_fee or 0),
-            })
-        
-        df = pd.DataFrame(data)
-        
-        # 同步原始数据（覆盖今日文件）
-        parquet_sync_service.sync_raw_data(today, df)
-        
-        # 生成聚合数据
-        parquet_sync_service.generate_daily_aggregations(today)
-        
-        print(f"✅ [{datetime.now()}] 今日数据刷新完成: {len(df)} 条")
+        print(f"✅ [{datetime.now()}] 今日数据刷新完成: {result['mode']} {result['rows']} 条")
         
     except Exception as e:
         print(f"❌ [{datetime.now()}] 刷新失败: {e}")
-    finally:
-        session.close()
+
+
+def reexport_unsynced_days():
+    """
+    重新导出没有同步时间的Parquet日期（每天凌晨 2:30 执行，也可运行 迁移Parquet同步时间.py）
+    
+    这些日期在订单加载时一律从数据库读取，重新导出后才会走 Parquet
+    """
+    try:
+        result = parquet_sync_service.reexport_unsynced_days()
+        if result['skipped']:
+            print(f"⚪ [{datetime.now()}] 其他进程正在重新导出，跳过")
+    except Exception as e:
+        print(f"❌ [{datetime.now()}] 重新导出失败: {e}")
+
+
+def compact_parquet_files():
+    """
+    整理Parquet文件（每天凌晨 3:00 执行，在昨日数据同步之后）
+    """
+    print(f"🔄 [{datetime.now()}] 开始整理Parquet文件...")
+    
+    try:
+        parquet_sync_service.compact()
+    except Exception as e:
+        print(f"❌ [{datetime.now()}] 文件整理失败: {e}")
 
 
 def init_scheduler():
@@ -169,14 +118,34 @@ def init_scheduler():
         sync_today_data,
         CronTrigger(minute=0),
         id='sync_today',
-        name='刷新今日数据',
+        name='增量同步今日数据',
+        replace_existing=True
+    )
+    
+    # 每天凌晨 2:30 重新导出没有同步时间的日期
+    scheduler.add_job(
+        reexport_unsynced_days,
+        CronTrigger(hour=2, minute=30),
+        id='reexport_unsynced',
+        name='重新导出没有同步时间的Parquet日期',
+        replace_existing=True
+    )
+    
+    # 每天凌晨 3:00 整理Parquet文件
+    scheduler.add_job(
+        compact_parquet_files,
+        CronTrigger(hour=3, minute=0),
+        id='compact_parquet',
+        name='整理Parquet文件',
         replace_existing=True
     )
     
     scheduler.start()
     print("✅ 定时任务调度器已启动")
     print("   - 每天 02:00: 同步昨日数据")
-    print("   - 每小时整点: 刷新今日数据")
+    print("   - 每天 02:30: 重新导出没有同步时间的日期")
+    print("   - 每天 03:00: 整理Parquet文件")
+    print("   - 每小时整点: 增量同步今日数据")
 
 
 def shutdown_scheduler():
@@ -194,55 +163,16 @@ def manual_sync(target_date: date = None):
     
     print(f"🔄 手动同步 {target_date} 的数据...")
     
-    session = SessionLocal()
     try:
-        orders = session.query(Order).filter(Order.date == target_date).all()
+        rows = parquet_sync_service.export_day(target_date)
         
-        if not orders:
+        if not rows:
             print(f"⚠️ {target_date} 无数据")
             return False
         
-        data = []
-        for o in orders:
-            data.append({
-                '订单ID': o.order_id,
-                '门店名称': o.store_name,
-                '日期': o.date,
-                '渠道': o.channel,
-                '商品名称': o.product_name,
-                '一级分类名': o.category_level1,
-                '三级分类名': o.category_level3,
-                '月售': o.quantity if o.quantity is not None else 1,
-                '实收价格': float(o.actual_price or 0),
-                '商品实售价': float(o.price or 0),
-                '商品原价': float(o.original_price or 0),
-                '商品采购成本': float(o.cost or 0),
-                '利润额': float(o.profit or 0),
-                '物流配送费': float(o.delivery_fee or 0),
-                '平台服务费': float(o.platform_service_fee or 0),
-                '平台佣金': float(o.commission or 0),
-                '企客后返': float(o.corporate_rebate or 0),
-                '用户支付配送费': float(o.user_paid_delivery_fee or 0),
-                '配送费减免金额': float(o.delivery_discount or 0),
-                '满减金额': float(o.full_reduction or 0),
-                '商品减免金额': float(o.product_discount or 0),
-                '新客减免金额': float(o.new_customer_discount or 0),
-                '商家代金券': float(o.merchant_voucher or 0),
-                '商家承担部分券': float(o.merchant_share or 0),
-                '满赠金额': float(o.gift_amount or 0),
-                '商家其他优惠': float(o.other_merchant_discount or 0),
-                '打包袋金额': float(o.packaging_fee or 0),
-            })
-        
-        df = pd.DataFrame(data)
-        parquet_sync_service.sync_raw_data(target_date, df)
-        parquet_sync_service.generate_daily_aggregations(target_date)
-        
-        print(f"✅ 手动同步完成: {len(df)} 条")
+        print(f"✅ 手动同步完成: {rows} 条")
         return True
         
     except Exception as e:
         print(f"❌ 手动同步失败: {e}")
         return False
-    finally:
-        session.close()
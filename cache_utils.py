@@ -11,7 +11,17 @@ import pickle
 import gzip
 from pathlib import Path
 from datetime import datetime
+from typing import Optional
 import json
+import os
+
+# pyarrow 为可选依赖：不可用时 DataFrame 编解码降级为 pickle
+try:
+    import pyarrow as pa
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    PYARROW_AVAILABLE = False
 
 
 def calculate_data_hash_fast(df: pd.DataFrame) -> str:
@@ -218,6 +228,286 @@ def cleanup_old_caches(cache_dir: Path, max_age_hours: int = 72, keep_latest: in
     return deleted_count
 
 
+# =============================================================================
+# DataFrame 二进制编解码（Redis缓存使用）
+# =============================================================================
+
+# 编码格式版本号：写入缓存版本/键中，格式变化时旧缓存自动失效
+DATAFRAME_CODEC_VERSION = "arrow-ipc-v1"
+
+# 需要字典编码的低基数字符串列（门店/渠道/分类在每个商品行上重复）
+DICTIONARY_COLUMNS = ('门店名称', '渠道', '一级分类名', '三级分类名')
+
+_ARROW_MAGIC = b"O2OARW1\n"   # Arrow IPC stream（zstd/lz4 压缩）
+_PICKLE_MAGIC = b"O2OPKL1\n"  # pyarrow 不可用或类型不支持时的降级格式
+_DICT_META_KEY = b"o2o_dictionary_columns"
+
+
+def _arrow_compression() -> Optional[str]:
+    """选择可用的IPC压缩算法（优先zstd，其次lz4）"""
+    for codec in ('zstd', 'lz4'):
+        try:
+            if pa.Codec.is_available(codec):
+                return codec
+        except Exception:
+            continue
+    return None
+
+
+def is_encoded_dataframe(payload: bytes) -> bool:
+    """判断字节串是否为 encode_dataframe 生成的数据"""
+    return isinstance(payload, (bytes, bytearray)) and (
+        payload.startswith(_ARROW_MAGIC) or payload.startswith(_PICKLE_MAGIC)
+    )
+
+
+def encode_dataframe(df: pd.DataFrame) -> bytes:
+    """
+    将DataFrame编码为紧凑的二进制格式（Arrow IPC）
+    
+    相比 json.dumps(to_dict('records')) / pickle(to_dict('tight'))：
+    - 保留dtype（日期、数值不再退化为字符串/object）
+    - 门店/渠道/分类列字典编码，体积减少数倍
+    - 编解码为列式内存拷贝，几乎不消耗Python层CPU
+    
+    参数:
+        df: pandas DataFrame
+    
+    返回:
+        bytes: 带格式头的二进制数据
+    """
+    if PYARROW_AVAILABLE:
+        try:
+            encoded = df
+            dict_cols = [
+                c for c in DICTIONARY_COLUMNS
+                if c in df.columns
+                and not isinstance(df[c].dtype, pd.CategoricalDtype)
+                and pd.api.types.is_string_dtype(df[c].dtype)
+            ]
+            if dict_cols:
+                encoded = df.assign(**{c: df[c].astype('category') for c in dict_cols})
+            
+            table = pa.Table.from_pandas(encoded)
+            metadata = dict(table.schema.metadata or {})
+            metadata[_DICT_META_KEY] = json.dumps(dict_cols, ensure_ascii=False).encode('utf-8')
+            table = table.replace_schema_metadata(metadata)
+            
+            sink = pa.BufferOutputStream()
+            options = pa.ipc.IpcWriteOptions(compression=_arrow_compression())
+            with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+            return _ARROW_MAGIC + sink.getvalue().to_pybytes()
+        except Exception as e:
+            print(f"⚠️ Arrow编码失败，降级为pickle: {e}")
+    
+    return _PICKLE_MAGIC + pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_dataframe(payload: bytes) -> pd.DataFrame:
+    """
+    解码 encode_dataframe 生成的数据
+    
+    编码时临时字典编码的列会还原为原来的字符串列，
+    调用方拿到的DataFrame与编码前dtype一致。
+    
+    参数:
+        payload: encode_dataframe 的返回值
+    
+    返回:
+        pandas DataFrame
+    """
+    if payload.startswith(_PICKLE_MAGIC):
+        return pickle.loads(payload[len(_PICKLE_MAGIC):])
+    
+    if not payload.startswith(_ARROW_MAGIC):
+        raise ValueError("未知的DataFrame缓存格式")
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("pyarrow 不可用，无法解码Arrow缓存")
+    
+    reader = pa.ipc.open_stream(pa.py_buffer(payload)[len(_ARROW_MAGIC):])
+    table = reader.read_all()
+    
+    metadata = table.schema.metadata or {}
+    dict_cols = json.loads(metadata.get(_DICT_META_KEY, b"[]").decode('utf-8'))
+    for name in dict_cols:
+        idx = table.schema.get_field_index(name)
+        column = table.column(idx) if idx >= 0 else None
+        if column is not None and pa.types.is_dictionary(column.type):
+            table = table.set_column(idx, name, column.cast(column.type.value_type))
+
+    return table.to_pandas()
+
+
+# =============================================================================
+# 共享只读 DataFrame（Copy-on-Write，替代防御性 .copy()）
+# =============================================================================
+
+_PANDAS_MAJOR = int(pd.__version__.split('.')[0])
+
+
+def copy_on_write_enabled() -> bool:
+    """pandas Copy-on-Write 是否生效（pandas>=3 始终开启）"""
+    if _PANDAS_MAJOR >= 3:
+        return True
+    return pd.options.mode.copy_on_write is True
+
+
+def enable_copy_on_write() -> bool:
+    """
+    开启 pandas Copy-on-Write（pandas 2.x 需显式开启，进程级设置）
+
+    开启后链式赋值 df['a'][mask] = x 不再生效，只应在已确认无此写法的进程中调用
+
+    返回:
+        bool: 是否已生效
+    """
+    if _PANDAS_MAJOR < 3:
+        pd.options.mode.copy_on_write = True
+    return copy_on_write_enabled()
+
+
+def freeze_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    将缓存中的DataFrame标记为只读（原地操作，返回同一对象）
+
+    底层numpy数组置为不可写：任何绕过 shared_view 的原地写入都会直接报错，
+    而不是悄悄污染其他请求看到的缓存数据。
+
+    参数:
+        df: 放入缓存的DataFrame
+
+    返回:
+        pandas DataFrame（同一对象）
+    """
+    if df is None:
+        return df
+    for block in df._mgr.blocks:
+        # 分类列/扩展数组的底层编码数组同样置为只读
+        values = getattr(block.values, '_ndarray', block.values)
+        if hasattr(values, 'flags'):
+            values.flags.writeable = False
+    return df
+
+
+def shared_view(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    返回与缓存共享底层数据的DataFrame（Copy-on-Write）
+
+    - 只读使用：零拷贝
+    - 新增/替换列：只影响返回的对象
+    - 原地修改（loc/iloc 赋值）：只复制被修改的列
+
+    Copy-on-Write 未开启时（pandas 2.x 默认）返回冻结的只读视图：读取与新增/替换列同上，
+    原地修改会抛出 ValueError，而不是写入缓存（需要原地修改时请自行 .copy()）。
+
+    参数:
+        df: 缓存中的DataFrame
+
+    返回:
+        pandas DataFrame（新对象）
+    """
+    if df is None:
+        return df
+    if not copy_on_write_enabled():
+        return freeze_dataframe(df).copy(deep=False)
+    view = df.copy(deep=False)
+    # 持有源对象引用：缓存被替换/释放后，视图上的写入仍走复制而不是写只读缓冲区
+    object.__setattr__(view, '_shared_base', df)
+    return view
+
+
+# =============================================================================
+# 分类编码（重复字符串列字典编码）
+# =============================================================================
+
+# 加载时字典编码的字符串列（门店/渠道/分类/商品名称在每个商品行上重复）
+CATEGORICAL_COLUMNS = DICTIONARY_COLUMNS + ('商品名称',)
+
+
+def categorical_encoding_enabled() -> bool:
+    """
+    订单数据是否在加载时分类编码
+
+    - 环境变量 ORDER_CATEGORICAL_ENCODING=0 可关闭
+    - pandas 2.x 的 groupby 默认 observed=False 会为未出现的分类生成空组，
+      以编码列为键的分组统一显式传 observed=True；value_counts 用 observed_value_counts，
+      fillna 用 safe_fillna
+    """
+    return os.getenv('ORDER_CATEGORICAL_ENCODING', '1') not in ('0', 'false', 'False')
+
+
+def encode_categorical_columns(df: pd.DataFrame, columns=CATEGORICAL_COLUMNS) -> pd.DataFrame:
+    """
+    将重复字符串列转换为分类类型（返回新对象，不修改入参）
+
+    分类按字典序排列，排序/分组顺序与字符串列一致。
+
+    参数:
+        df: 原始DataFrame
+        columns: 需要编码的列（不存在或非字符串的列跳过）
+
+    返回:
+        pandas DataFrame
+    """
+    if df is None or df.empty or not categorical_encoding_enabled():
+        return df
+    targets = [
+        c for c in columns
+        if c in df.columns
+        and not isinstance(df[c].dtype, pd.CategoricalDtype)
+        and pd.api.types.is_string_dtype(df[c].dtype)
+    ]
+    if not targets:
+        return df
+    return df.assign(**{c: df[c].astype('category') for c in targets})
+
+
+def decode_categorical_columns(df: pd.DataFrame, columns=None) -> pd.DataFrame:
+    """
+    将分类列还原为字符串列（供依赖字符串语义的旧代码使用）
+
+    参数:
+        df: DataFrame
+        columns: 需要还原的列（默认全部分类列）
+
+    返回:
+        pandas DataFrame（无分类列时返回原对象）
+    """
+    if df is None or df.empty:
+        return df
+    targets = [
+        c for c in (columns or df.columns)
+        if c in df.columns and isinstance(df[c].dtype, pd.CategoricalDtype)
+    ]
+    if not targets:
+        return df
+    return df.assign(**{c: df[c].astype(df[c].cat.categories.dtype) for c in targets})
+
+
+def safe_fillna(series: pd.Series, value) -> pd.Series:
+    """
+    分类安全的 fillna：填充值不在分类中时先追加分类
+
+    直接对分类列 fillna('未分类') 会抛出 TypeError；分类追加后，
+    后续 df.loc[mask, col] = value 的赋值同样安全。
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        if value not in series.cat.categories:
+            series = series.cat.add_categories([value])
+    return series.fillna(value)
+
+
+def observed_value_counts(series: pd.Series) -> pd.Series:
+    """
+    只统计实际出现的取值（分类列的 value_counts 会包含计数为0的分类）
+    """
+    counts = series.value_counts()
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        counts = counts[counts > 0]
+    return counts
+
+
 # 性能基准测试
 def benchmark_hash_methods(df: pd.DataFrame):
     """
@@ -21,6 +21,8 @@ from dash import dash_table
 import pandas as pd
 from typing import Dict, List, Optional, Tuple, Any
 
+from cache_utils import observed_value_counts
+
 # 导入Redis缓存管理器
 try:
     from redis_cache_manager import get_cached_dataframe, get_cache_manager
@@ -596,7 +598,7 @@ def register_drill_down_callbacks(app):
                 '实收价格': 'sum'    # 销售额
             }
             
-            product_agg = df.groupby('商品名称').agg(agg_rules).rename(columns={
+            product_agg = df.groupby('商品名称', observed=True).agg(agg_rules).rename(columns={
                 '订单ID': '销量',
                 '利润额': '总利润',
                 '实收价格': '销售额'
@@ -608,7 +610,7 @@ def register_drill_down_callbacks(app):
             
             # 补充总成本 (用于导出展示)
             if '商品采购成本' in df.columns:
-                cost_agg = df.groupby('商品名称')['商品采购成本'].sum().reset_index().rename(columns={'商品采购成本': '总成本'})
+                cost_agg = df.groupby('商品名称', observed=True)['商品采购成本'].sum().reset_index().rename(columns={'商品采购成本': '总成本'})
                 product_agg = product_agg.merge(cost_agg, on='商品名称', how='left')
             else:
                 product_agg['总成本'] = 0
@@ -1131,7 +1133,7 @@ def render_channel_detail(channel_name, store_name=None, start_date=None, end_da
             top_products_data = top_products_data[top_products_data[category_col] != '耗材']
 
         # 聚合计算
-        product_ranks = top_products_data.groupby('商品名称').agg({
+        product_ranks = top_products_data.groupby('商品名称', observed=True).agg({
             '商品实售价': 'sum',
             '商品采购成本': 'sum' if '商品采购成本' in top_products_data.columns else lambda x: 0,
             '订单ID': 'nunique'
@@ -1423,7 +1425,7 @@ def render_product_list(channel_name, filter_type):
                 '实收价格': 'sum',
                 '商品采购成本': 'sum' if '商品采购成本' in df.columns else lambda x: 0
             }
-            product_agg = df.groupby('商品名称').agg(agg_rules).reset_index()
+            product_agg = df.groupby('商品名称', observed=True).agg(agg_rules).reset_index()
             product_agg = product_agg.rename(columns={'订单ID': '销量', '利润额': '总利润', '实收价格': '销售额', '商品采购成本': '总成本'})
             product_agg['毛利率'] = (product_agg['总利润'] / product_agg['销售额'] * 100).fillna(0).round(1)
             
@@ -2128,7 +2130,7 @@ def render_product_insight(channel_name, product_name):
         # 在 related_orders 中找同单商品
         partners = related_orders[related_orders['商品名称'] != product_name]
         if not partners.empty:
-            top_partners = partners['商品名称'].value_counts().head(5).reset_index()
+            top_partners = observed_value_counts(partners['商品名称']).head(5).reset_index()
             top_partners.columns = ['商品名称', '频次']
             fig_partner = px.bar(top_partners, x='频次', y='商品名称', orientation='h', title="🤝 最佳拍档 (Top 5 连带)",
                                  text='频次', height=300)
@@ -2245,7 +2247,7 @@ def generate_batch_volatility_analysis(channel_name, filter_type):
             '利润额': 'sum',     # 总利润
             '实收价格': 'sum'    # 销售额
         }
-        product_agg = df.groupby('商品名称').agg(agg_rules).rename(columns={
+        product_agg = df.groupby('商品名称', observed=True).agg(agg_rules).rename(columns={
             '订单ID': '销量',
             '利润额': '总利润',
             '实收价格': '销售额'
@@ -2284,7 +2286,7 @@ def generate_batch_volatility_analysis(channel_name, filter_type):
         df_trend = df_trend[df_trend[date_col] >= min_date]
         
         # 按日聚合计算平均实收价
-        daily_data = df_trend.groupby([df_trend[date_col].dt.date, '商品名称'])['实收价格'].mean().reset_index()
+        daily_data = df_trend.groupby([df_trend[date_col].dt.date, '商品名称'], observed=True)['实收价格'].mean().reset_index()
         daily_data.columns = ['日期', '商品名称', '平均实收价']
         
         # 6. 生成图表
@@ -20,6 +20,8 @@ import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
 
+from cache_utils import observed_value_counts
+
 
 def analyze_category_contribution(
     df: pd.DataFrame,
@@ -113,7 +115,7 @@ def analyze_category_contribution(
     # 按分类统计
     def calc_category_stats(data, order_count):
         """计算分类统计指标"""
-        stats = data.groupby('一级分类名').agg({
+        stats = data.groupby('一级分类名', observed=True).agg({
             '订单ID': 'nunique',
             '实收价格': 'sum'
         }).reset_index()
@@ -232,7 +234,7 @@ def analyze_channel_comparison(
     # 按渠道统计
     def calc_channel_stats(data):
         """计算渠道统计指标"""
-        stats = data.groupby('渠道').agg({
+        stats = data.groupby('渠道', observed=True).agg({
             '订单ID': 'nunique',
             '实收价格': 'sum'
         }).reset_index()
@@ -627,12 +629,14 @@ def _analyze_downgrade_reasons(
             (df['客户地址'] == customer) & 
             (df['日期'] >= history_start) & 
             (df['日期'] < recent_start)
-        ]['商品名称'].value_counts().head(3).index.tolist()
+        ]['商品名称']
+        history_products = observed_value_counts(history_products).head(3).index.tolist()
         
         recent_products = df[
             (df['客户地址'] == customer) & 
             (df['日期'] >= recent_start)
-        ]['商品名称'].value_counts().head(3).index.tolist()
+        ]['商品名称']
+        recent_products = observed_value_counts(recent_products).head(3).index.tolist()
         
         # 判断原因
         reason, detail = _identify_downgrade_reason(
@@ -1145,13 +1149,13 @@ def _identify_drag_products(
     recent_df = period_df[period_df['日期'] >= mid_date].copy()
     
     # 统计每个商品在历史期和近期的数据
-    history_stats = history_df.groupby('商品名称').agg({
+    history_stats = history_df.groupby('商品名称', observed=True).agg({
         '订单ID': 'nunique',
         price_field: 'mean'
     }).reset_index()
     history_stats.columns = ['商品名称', '历史订单数', '历史价格']
     
-    recent_stats = recent_df.groupby('商品名称').agg({
+    recent_stats = recent_df.groupby('商品名称', observed=True).agg({
         '订单ID': 'nunique',
         price_field: 'mean'
     }).reset_index()
@@ -1341,11 +1345,11 @@ def _identify_opportunity_products(
         return []
     
     # 计算每个商品在两个周期的销量
-    sales1 = period1_df.groupby('商品名称')['订单ID'].nunique()
-    sales2 = period2_df.groupby('商品名称')['订单ID'].nunique()
+    sales1 = period1_df.groupby('商品名称', observed=True)['订单ID'].nunique()
+    sales2 = period2_df.groupby('商品名称', observed=True)['订单ID'].nunique()
     
     # 计算平均价格（使用动态价格字段）
-    avg_prices = df[df['日期'] >= start_date].groupby('商品名称')[price_field].mean()
+    avg_prices = df[df['日期'] >= start_date].groupby('商品名称', observed=True)[price_field].mean()
     
     # 合并
     comparison = pd.DataFrame({
@@ -36,6 +36,8 @@ import json  # V5.1: 用于ECharts图表生成
 import time  # 用于防抖处理
 import gc  # 用于内存管理
 
+from cache_utils import observed_value_counts
+
 # ECharts 导入
 try:
     from dash_echarts import DashECharts
@@ -3376,7 +3378,7 @@ def create_trend_comparison_section(
                 # 高利润商品：利润额和商品数（使用店内码分组）
                 if '利润额' in day_df.columns and '商品名称' in day_df.columns:
                     group_cols = get_product_group_columns(day_df, include_category=False)
-                    product_profit = day_df.groupby(group_cols)['利润额'].sum()
+                    product_profit = day_df.groupby(group_cols, observed=True)['利润额'].sum()
                     high_profit = product_profit[product_profit > 0]
                     daily_counts[d] = len(high_profit)
                     daily_amounts[d] = high_profit.sum()  # 利润总额
@@ -4066,7 +4068,7 @@ def create_overflow_charts(product_data: pd.DataFrame, order_data: pd.DataFrame)
             channel_col = next((c for c in ['渠道', '平台', 'channel'] if c in order_data.columns), None)
             if channel_col and '订单实际利润' in order_data.columns:
                 # 按渠道汇总穿底金额
-                channel_loss = order_data.groupby(channel_col)['订单实际利润'].apply(
+                channel_loss = order_data.groupby(channel_col, observed=True)['订单实际利润'].apply(
                     lambda x: abs(x[x < 0].sum())
                 ).sort_values(ascending=False).head(5)
                 
@@ -4279,7 +4281,7 @@ def get_overflow_products_with_channel(df: pd.DataFrame) -> pd.DataFrame:
         if '店内码' in overflow_items.columns:
             agg_dict['店内码'] = pd.NamedAgg(column='店内码', aggfunc='first')
         
-        product_agg = overflow_items.groupby(group_cols).agg(**agg_dict).reset_index()
+        product_agg = overflow_items.groupby(group_cols, observed=True).agg(**agg_dict).reset_index()
         
         # 重命名渠道列
         if channel_col and channel_col in product_agg.columns:
@@ -5224,7 +5226,7 @@ def create_traffic_drop_detail_table(df: pd.DataFrame, days: int = 1) -> html.Di
             # ===== 图表1：按分类统计下滑商品数（找出问题分类）=====
             category_col = '一级分类名' if '一级分类名' in data.columns else None
             if category_col:
-                category_counts = data[category_col].value_counts().head(8)
+                category_counts = observed_value_counts(data[category_col]).head(8)
                 if not category_counts.empty:
                     option1 = {
                         'title': {'text': '🔍 哪些分类下滑最多', 'left': 'center', 'top': 5,
@@ -5660,7 +5662,7 @@ def create_profit_drop_detail_table(df: pd.DataFrame, days: int = 1) -> html.Div
             category_col = '一级分类' if '一级分类' in data.columns else None
             if category_col:
                 # 按分类统计下滑商品数
-                category_stats = data.groupby(category_col).agg({
+                category_stats = data.groupby(category_col, observed=True).agg({
                     '商品名称': 'count'
                 }).rename(columns={'商品名称': '下滑商品数'}).sort_values('下滑商品数', ascending=False).head(6)
                 
@@ -6099,7 +6101,7 @@ def create_price_elasticity_detail_table(df: pd.DataFrame, sensitivity_filter: s
     stockout_count = len(price_changes[price_changes['是否售罄'] == True]) if '是否售罄' in price_changes.columns else 0
     
     # 统计渠道分布
-    channel_counts = price_changes['渠道'].value_counts().to_dict() if '渠道' in price_changes.columns else {}
+    channel_counts = observed_value_counts(price_changes['渠道']).to_dict() if '渠道' in price_changes.columns else {}
     
     # ===== 准备不同视图的表格数据 =====
     
@@ -6422,7 +6424,7 @@ def create_price_elasticity_charts(price_changes: pd.DataFrame, high_count: int,
         # 图表1：调价效果按分类统计（柱状图）
         if not price_changes.empty and '一级分类' in price_changes.columns and '调价效果' in price_changes.columns:
             # 统计各分类的调价效果
-            effect_stats = price_changes.groupby(['一级分类', '调价效果']).size().unstack(fill_value=0)
+            effect_stats = price_changes.groupby(['一级分类', '调价效果'], observed=True).size().unstack(fill_value=0)
             
             # 准备数据
             categories = effect_stats.index.tolist()[:10]  # 最多显示10个分类
@@ -8894,7 +8896,7 @@ def prepare_pricing_data_v2(df: pd.DataFrame, channel: str = None) -> pd.DataFra
     if group_key == '店内码':
         # 过滤掉没有店内码的数据
         df_filtered = df_filtered[df_filtered['店内码'].notna() & (df_filtered['店内码'] != '')]
-    product_data = df_filtered.groupby(group_key).agg(agg_dict).reset_index()
+    product_data = df_filtered.groupby(group_key, observed=True).agg(agg_dict).reset_index()
     
     # ===== 计算核心指标 =====
     # ⭐ 商品实售价 = 总销售额 / 总销量（加权平均，考虑不同订单销量权重）
@@ -12778,13 +12780,13 @@ def calculate_enhanced_product_scores(df: pd.DataFrame) -> pd.DataFrame:
             # 抽样检查：是否存在同一商品在不同渠道价格不同的情况
             if use_store_code:
                 # 使用店内码检查
-                sample_check = df_copy.groupby(['店内码', '渠道'])['商品原价'].mean().reset_index()
+                sample_check = df_copy.groupby(['店内码', '渠道'], observed=True)['商品原价'].mean().reset_index()
                 price_variance = sample_check.groupby('店内码')['商品原价'].std().fillna(0)
                 has_price_diff = (price_variance > 0.1).any()  # 价格标准差>0.1元视为有差异
             else:
                 # 使用商品名称检查
-                sample_check = df_copy.groupby(['商品名称', '渠道'])['商品原价'].mean().reset_index()
-                price_variance = sample_check.groupby('商品名称')['商品原价'].std().fillna(0)
+                sample_check = df_copy.groupby(['商品名称', '渠道'], observed=True)['商品原价'].mean().reset_index()
+                price_variance = sample_check.groupby('商品名称', observed=True)['商品原价'].std().fillna(0)
                 has_price_diff = (price_variance > 0.1).any()
             
             if has_price_diff:
@@ -12804,7 +12806,7 @@ def calculate_enhanced_product_scores(df: pd.DataFrame) -> pd.DataFrame:
     if category_col and category_col in df_copy.columns:
         group_cols.append(category_col)
     
-    product_data = df_copy.groupby(group_cols).agg(agg_dict).reset_index()
+    product_data = df_copy.groupby(group_cols, observed=True).agg(agg_dict).reset_index()
     
     # 重命名列
     product_data = product_data.rename(columns={
@@ -12942,7 +12944,7 @@ def calculate_enhanced_product_scores(df: pd.DataFrame) -> pd.DataFrame:
     
     # 计算每个品类的利润率中位数
     if category_field:
-        category_profit_median = product_data.groupby(category_field)['综合利润率'].median()
+        category_profit_median = product_data.groupby(category_field, observed=True)['综合利润率'].median()
         product_data['品类利润率阈值'] = product_data[category_field].map(category_profit_median)
         # 如果某品类只有1个商品，使用全局中位数作为阈值
         global_profit_median = product_data['综合利润率'].median()
@@ -13336,7 +13338,7 @@ def calculate_enhanced_product_scores_with_trend(df: pd.DataFrame, days: int = 3
         # 按商品分层采样，确保每个商品都有代表性
         if '商品名称' in df.columns:
             # 每个商品最多保留200行（足够计算趋势）
-            df = df.groupby('商品名称', group_keys=False).apply(
+            df = df.groupby('商品名称', group_keys=False, observed=True).apply(
                 lambda x: x.sample(min(len(x), 200), random_state=42)
             ).reset_index(drop=True)
             
@@ -16612,13 +16614,13 @@ def create_product_scoring_section(df: pd.DataFrame, all_channel_options: list =
     
     if category_col:
         # V7.4：改为按明星商品数量排序（评分体系已删除）
-        category_stats = product_scores.groupby(category_col).agg({
+        category_stats = product_scores.groupby(category_col, observed=True).agg({
             '商品名称': 'count'
         }).reset_index()
         category_stats.columns = [category_col, '商品数']
         
         # 计算每个品类的明星商品数量
-        star_counts = product_scores[product_scores['四象限分类'] == '🌟 明星商品'].groupby(category_col).size()
+        star_counts = product_scores[product_scores['四象限分类'] == '🌟 明星商品'].groupby(category_col, observed=True).size()
         category_stats['明星商品数'] = category_stats[category_col].map(star_counts).fillna(0).astype(int)
         
         # 按明星商品数量降序排序
@@ -17445,7 +17447,7 @@ def calculate_period_comparison_quadrants(df, days_range=30, profit_threshold=30
             if '一级分类名' in period_df.columns:
                 agg_dict['一级分类名'] = 'first'
             
-            product_agg = period_df.groupby(group_key).agg(agg_dict).reset_index()
+            product_agg = period_df.groupby(group_key, observed=True).agg(agg_dict).reset_index()
             
             # 统一字段名
             rename_map = {
@@ -17718,7 +17720,7 @@ def calculate_time_period_quadrants_v2(df, period='week', profit_threshold=30.0)
             if group_key != '店内码' and '店内码' in period_df.columns:
                 agg_dict['店内码'] = 'first'
             
-            product_agg = period_df.groupby(group_key).agg(agg_dict).reset_index()
+            product_agg = period_df.groupby(group_key, observed=True).agg(agg_dict).reset_index()
             
             # 统一字段名
             rename_map = {
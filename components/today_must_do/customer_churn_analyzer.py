@@ -385,7 +385,7 @@ def analyze_churn_reasons(
     
     # Step 3: 批量聚合所有客户商品统计（替代循环）
     step_time = time.time()
-    customer_product_stats = df_churn.groupby(['customer_id', '商品名称']).agg({
+    customer_product_stats = df_churn.groupby(['customer_id', '商品名称'], observed=True).agg({
         '商品实售价': 'mean',  # 历史平均购买价
         '订单ID': 'nunique',   # 购买次数
         'stock': 'first'       # 当前库存（来自JOIN）
@@ -405,7 +405,7 @@ def analyze_churn_reasons(
     
     # 5.1 计算近7天平均价格
     recent_start = today - pd.Timedelta(days=7)
-    recent_prices = df[df['下单时间'] >= recent_start].groupby('商品名称')['商品实售价'].mean()
+    recent_prices = df[df['下单时间'] >= recent_start].groupby('商品名称', observed=True)['商品实售价'].mean()
     
     # JOIN近期价格
     top3_per_customer = top3_per_customer.merge(
@@ -38,6 +38,8 @@ import numpy as np
 from datetime import timedelta
 from typing import Dict, Tuple, Optional, Any, List
 
+from cache_utils import safe_fillna, observed_value_counts
+
 # 导入弹性系数学习机制
 try:
     from .pricing_engine import learn_elasticity_from_price_change
@@ -251,7 +253,7 @@ def get_channel_distribution(df: pd.DataFrame, mask: pd.Series = None) -> Dict[s
     if mask is not None:
         df = df[mask]
     
-    return df[channel_col].value_counts().to_dict()
+    return observed_value_counts(df[channel_col]).to_dict()
 
 
 # ============ V7.6 性能优化：批量计算趋势数据 ============
@@ -581,7 +583,7 @@ def analyze_urgent_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> D
                 # 穿底损失 = 负利润订单的利润绝对值之和
                 result['overflow']['loss'] = round(abs(overflow_orders['订单实际利润'].sum()), 2)
                 if '渠道' in overflow_orders.columns:
-                    result['overflow']['channels'] = overflow_orders['渠道'].value_counts().to_dict()
+                    result['overflow']['channels'] = observed_value_counts(overflow_orders['渠道']).to_dict()
             
             # ===== V7.6优化：穿底趋势分析（批量计算）=====
             try:
@@ -616,7 +618,7 @@ def analyze_urgent_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> D
                 
                 # 渠道分布统计
                 if '渠道' in high_delivery_orders.columns:
-                    result['delivery']['channels'] = high_delivery_orders['渠道'].value_counts().to_dict()
+                    result['delivery']['channels'] = observed_value_counts(high_delivery_orders['渠道']).to_dict()
                 
                 # 距离分布分析（需要从原始df获取）
                 order_id_col = '订单ID' if '订单ID' in df.columns else None
@@ -707,12 +709,12 @@ def analyze_urgent_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> D
                 
                 if not period_df.empty:
                     # 统计期间商品销量
-                    period_sales = period_df.groupby('商品名称')[sales_col].sum().reset_index()
+                    period_sales = period_df.groupby('商品名称', observed=True)[sales_col].sum().reset_index()
                     period_sales.columns = ['商品名称', f'{stat_days}天销量']
                     
                     # 昨日库存情况
                     if stock_col:
-                        yesterday_stock = yesterday_df.groupby('商品名称')[stock_col].first().reset_index()
+                        yesterday_stock = yesterday_df.groupby('商品名称', observed=True)[stock_col].first().reset_index()
                         yesterday_stock.columns = ['商品名称', '昨日库存']
                         
                         # 合并
@@ -725,9 +727,9 @@ def analyze_urgent_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> D
                     else:
                         # 没有库存字段时，回退到旧逻辑：前日销量>=3 且 昨日销量=0
                         if not day_before_df.empty:
-                            day_before_sales = day_before_df.groupby('商品名称')[sales_col].sum().reset_index()
+                            day_before_sales = day_before_df.groupby('商品名称', observed=True)[sales_col].sum().reset_index()
                             day_before_sales.columns = ['商品名称', '前日销量']
-                            yesterday_sales = yesterday_df.groupby('商品名称')[sales_col].sum().reset_index()
+                            yesterday_sales = yesterday_df.groupby('商品名称', observed=True)[sales_col].sum().reset_index()
                             yesterday_sales.columns = ['商品名称', '昨日销量']
                             comparison = day_before_sales.merge(yesterday_sales, on='商品名称', how='left')
                             comparison['昨日销量'] = comparison['昨日销量'].fillna(0)
@@ -739,7 +741,7 @@ def analyze_urgent_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> D
                     # ===== 过滤耗材分类 =====
                     if category_col_stockout and not stockout_products.empty:
                         # 获取商品的一级分类
-                        product_category = period_df.groupby('商品名称')[category_col_stockout].first().reset_index()
+                        product_category = period_df.groupby('商品名称', observed=True)[category_col_stockout].first().reset_index()
                         product_category.columns = ['商品名称', '_category']
                         stockout_products = stockout_products.merge(product_category, on='商品名称', how='left')
                         stockout_products = stockout_products[stockout_products['_category'] != '耗材'].copy()
@@ -752,7 +754,7 @@ def analyze_urgent_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> D
                         profit_col = next((c for c in ['利润额'] if c in period_df.columns), None)
                         if profit_col:
                             stockout_names = stockout_products['商品名称'].tolist()
-                            stockout_profit = period_df[period_df['商品名称'].isin(stockout_names)].groupby('商品名称')[profit_col].sum()
+                            stockout_profit = period_df[period_df['商品名称'].isin(stockout_names)].groupby('商品名称', observed=True)[profit_col].sum()
                             result['stockout']['loss'] = round(stockout_profit.sum() / stat_days, 2)
                         
                         # 渠道分布（按商品数统计，不是订单行数）
@@ -761,10 +763,10 @@ def analyze_urgent_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> D
                             stockout_names = stockout_products['商品名称'].tolist()
                             # 获取每个商品的主渠道（销量最高的渠道）
                             stockout_channel = period_df[period_df['商品名称'].isin(stockout_names)]
-                            product_main_channel = stockout_channel.groupby(['商品名称', channel_col])[sales_col].sum().reset_index()
-                            idx = product_main_channel.groupby('商品名称')[sales_col].idxmax()
+                            product_main_channel = stockout_channel.groupby(['商品名称', channel_col], observed=True)[sales_col].sum().reset_index()
+                            idx = product_main_channel.groupby('商品名称', observed=True)[sales_col].idxmax()
                             main_channels = product_main_channel.loc[idx][channel_col]
-                            result['stockout']['channels'] = main_channels.value_counts().to_dict()
+                            result['stockout']['channels'] = observed_value_counts(main_channels).to_dict()
                         
                         # ===== 缺货连续天数分析 =====
                         # 统计每个缺货商品连续缺货了多少天
@@ -914,12 +916,12 @@ def analyze_watch_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Di
             
             if not prev_7d_df.empty:
                 # 前7天日均销量
-                prev_sales = prev_7d_df.groupby('商品名称')[sales_col].sum().reset_index()
+                prev_sales = prev_7d_df.groupby('商品名称', observed=True)[sales_col].sum().reset_index()
                 prev_sales.columns = ['商品名称', '前7天总销量']
                 prev_sales['前7天日均'] = (prev_sales['前7天总销量'] / 7).round(1)
                 
                 # 最近7天日均销量
-                recent_sales = recent_7d_df.groupby('商品名称')[sales_col].sum().reset_index()
+                recent_sales = recent_7d_df.groupby('商品名称', observed=True)[sales_col].sum().reset_index()
                 recent_sales.columns = ['商品名称', '近7天总销量']
                 recent_sales['近7天日均'] = (recent_sales['近7天总销量'] / 7).round(1)
                 
@@ -935,7 +937,7 @@ def analyze_watch_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Di
                 # 过滤耗材
                 category_col = next((c for c in ['一级分类名', '一级分类'] if c in df.columns), None)
                 if category_col and not drop_products.empty:
-                    product_category = df.groupby('商品名称')[category_col].first().reset_index()
+                    product_category = df.groupby('商品名称', observed=True)[category_col].first().reset_index()
                     product_category.columns = ['商品名称', '_category']
                     drop_products = drop_products.merge(product_category, on='商品名称', how='left')
                     drop_products = drop_products[drop_products['_category'] != '耗材'].copy()
@@ -950,10 +952,10 @@ def analyze_watch_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Di
                         drop_names = drop_products['商品名称'].tolist()
                         # 获取每个商品的主渠道（前7天销量最高的渠道）
                         drop_channel = prev_7d_df[prev_7d_df['商品名称'].isin(drop_names)]
-                        product_main_channel = drop_channel.groupby(['商品名称', channel_col])[sales_col].sum().reset_index()
-                        idx = product_main_channel.groupby('商品名称')[sales_col].idxmax()
+                        product_main_channel = drop_channel.groupby(['商品名称', channel_col], observed=True)[sales_col].sum().reset_index()
+                        idx = product_main_channel.groupby('商品名称', observed=True)[sales_col].idxmax()
                         main_channels = product_main_channel.loc[idx][channel_col]
-                        result['traffic_drop']['channels'] = main_channels.value_counts().to_dict()
+                        result['traffic_drop']['channels'] = observed_value_counts(main_channels).to_dict()
         
         # ================== 2. 滞销分析（精确匹配 - 状态变化点） ==================
         # 只在商品"刚进入"某个滞销状态时提醒，避免每天重复
@@ -967,7 +969,7 @@ def analyze_watch_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Di
             cost_col = next((c for c in ['商品采购成本', '成本'] if c in df.columns), None)
             
             # 计算每个商品的最后销售日期和最新库存
-            product_last_sale = df.groupby('商品名称')[date_col].max().reset_index()
+            product_last_sale = df.groupby('商品名称', observed=True)[date_col].max().reset_index()
             product_last_sale.columns = ['商品名称', '最后销售日']
             product_last_sale['无销量天数'] = (yesterday - product_last_sale['最后销售日'].dt.normalize()).dt.days
             
@@ -978,12 +980,12 @@ def analyze_watch_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Di
                 # 步骤1: 获取最后一天有销售的商品库存
                 last_day_data = df[df[date_col] == last_date]
                 if len(last_day_data) > 0:
-                    last_day_stock_map = last_day_data.groupby('商品名称')[stock_col].last().to_dict()
+                    last_day_stock_map = last_day_data.groupby('商品名称', observed=True)[stock_col].last().to_dict()
                 else:
                     last_day_stock_map = {}
                 
                 # 步骤2: 获取每个商品最后一次售卖记录的库存（回退方案）
-                last_sale_stock_map = df.sort_values(date_col).groupby('商品名称')[stock_col].last().to_dict()
+                last_sale_stock_map = df.sort_values(date_col).groupby('商品名称', observed=True)[stock_col].last().to_dict()
                 
                 # 步骤3: 双重判断 - 优先使用最后一天的库存，否则使用最后售卖时的库存
                 def get_final_stock(product_name):
@@ -1024,7 +1026,7 @@ def analyze_watch_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Di
                     if sales_col_local:
                         slow_df['_销量'] = pd.to_numeric(slow_df[sales_col_local], errors='coerce').fillna(1).replace(0, 1)
                         slow_df['_总成本'] = pd.to_numeric(slow_df[cost_col], errors='coerce').fillna(0)
-                        cost_agg = slow_df.groupby(group_key).agg({
+                        cost_agg = slow_df.groupby(group_key, observed=True).agg({
                             '_总成本': 'sum',
                             '_销量': 'sum',
                             '商品名称': 'first'
@@ -1032,7 +1034,7 @@ def analyze_watch_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Di
                         cost_agg['单品成本'] = cost_agg['_总成本'] / cost_agg['_销量']
                         cost_info = cost_agg.set_index('商品名称')['单品成本'].to_dict()
                     else:
-                        cost_info = slow_df.sort_values(date_col).groupby('商品名称')[cost_col].last().to_dict()
+                        cost_info = slow_df.sort_values(date_col).groupby('商品名称', observed=True)[cost_col].last().to_dict()
                     
                     # 使用已有的库存数据和获取的成本计算总值
                     total_cost = 0
@@ -1061,7 +1063,7 @@ def analyze_watch_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Di
                     if sales_col_local:
                         slow_df['_销量'] = pd.to_numeric(slow_df[sales_col_local], errors='coerce').fillna(1).replace(0, 1)
                         slow_df['_总成本'] = pd.to_numeric(slow_df[cost_col], errors='coerce').fillna(0)
-                        cost_agg = slow_df.groupby(group_key).agg({
+                        cost_agg = slow_df.groupby(group_key, observed=True).agg({
                             '_总成本': 'sum',
                             '_销量': 'sum',
                             '商品名称': 'first'
@@ -1069,7 +1071,7 @@ def analyze_watch_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Di
                         cost_agg['单品成本'] = cost_agg['_总成本'] / cost_agg['_销量']
                         cost_info = cost_agg.set_index('商品名称')['单品成本'].to_dict()
                     else:
-                        cost_info = slow_df.sort_values(date_col).groupby('商品名称')[cost_col].last().to_dict()
+                        cost_info = slow_df.sort_values(date_col).groupby('商品名称', observed=True)[cost_col].last().to_dict()
                     
                     total_cost = 0
                     for _, row in ongoing_slow_products.iterrows():
@@ -1097,7 +1099,7 @@ def analyze_watch_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Di
                     if sales_col_local:
                         slow_df['_销量'] = pd.to_numeric(slow_df[sales_col_local], errors='coerce').fillna(1).replace(0, 1)
                         slow_df['_总成本'] = pd.to_numeric(slow_df[cost_col], errors='coerce').fillna(0)
-                        cost_agg = slow_df.groupby(group_key).agg({
+                        cost_agg = slow_df.groupby(group_key, observed=True).agg({
                             '_总成本': 'sum',
                             '_销量': 'sum',
                             '商品名称': 'first'
@@ -1105,7 +1107,7 @@ def analyze_watch_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Di
                         cost_agg['单品成本'] = cost_agg['_总成本'] / cost_agg['_销量']
                         cost_info = cost_agg.set_index('商品名称')['单品成本'].to_dict()
                     else:
-                        cost_info = slow_df.sort_values(date_col).groupby('商品名称')[cost_col].last().to_dict()
+                        cost_info = slow_df.sort_values(date_col).groupby('商品名称', observed=True)[cost_col].last().to_dict()
                     
                     total_cost = 0
                     for _, row in severe_slow_products.iterrows():
@@ -1153,13 +1155,13 @@ def analyze_watch_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Di
             if '一级分类名' in new_df.columns and '利润额' in new_df.columns:
                 # 计算分类销售额和利润额
                 if '_销售额' in new_df.columns:
-                    category_stats = new_df.groupby('一级分类名').agg({
+                    category_stats = new_df.groupby('一级分类名', observed=True).agg({
                         '_销售额': 'sum',
                         '利润额': 'sum'
                     }).reset_index()
                     category_stats.columns = ['分类', '销售额', '利润额']
                 else:
-                    category_stats = new_df.groupby('一级分类名').agg({
+                    category_stats = new_df.groupby('一级分类名', observed=True).agg({
                         '利润额': 'sum'
                     }).reset_index()
                     category_stats.columns = ['分类', '利润额']
@@ -1202,14 +1204,14 @@ def analyze_watch_issues(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Di
                 prev_df['_销售额'] = prev_df['实收价格'].fillna(0) * prev_df[sales_field].fillna(1)
                 
                 # 按商品汇总
-                recent_stats = recent_df.groupby('商品名称').agg({
+                recent_stats = recent_df.groupby('商品名称', observed=True).agg({
                     '_销售额': 'sum',
                     '利润额': 'sum',
                     sales_field: 'sum'
                 }).reset_index()
                 recent_stats.columns = ['商品名称', '近7天销售额', '近7天利润', '近7天销量']
                 
-                prev_stats = prev_df.groupby('商品名称').agg({
+                prev_stats = prev_df.groupby('商品名称', observed=True).agg({
                     '_销售额': 'sum',
                     '利润额': 'sum',
                     sales_field: 'sum'
@@ -1309,14 +1311,14 @@ def analyze_highlights(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Dict
         # 定义：昨日销量环比增长>50% 且 昨日销量>=10
         if sales_col in yesterday_df.columns and not day_before_df.empty:
             # 昨日销量汇总
-            yesterday_sales = yesterday_df.groupby('商品名称').agg({
+            yesterday_sales = yesterday_df.groupby('商品名称', observed=True).agg({
                 sales_col: 'sum',
                 '利润额': 'sum' if '利润额' in yesterday_df.columns else 'count'
             }).reset_index()
             yesterday_sales.columns = ['商品名称', '昨日销量', '昨日利润']
             
             # 前日销量汇总
-            day_before_sales = day_before_df.groupby('商品名称')[sales_col].sum().reset_index()
+            day_before_sales = day_before_df.groupby('商品名称', observed=True)[sales_col].sum().reset_index()
             day_before_sales.columns = ['商品名称', '前日销量']
             
             # 合并对比
@@ -1336,7 +1338,7 @@ def analyze_highlights(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Dict
             # 过滤耗材
             category_col = next((c for c in ['一级分类名', '一级分类'] if c in df.columns), None)
             if category_col and not hot_products.empty:
-                product_category = df.groupby('商品名称')[category_col].first().reset_index()
+                product_category = df.groupby('商品名称', observed=True)[category_col].first().reset_index()
                 product_category.columns = ['商品名称', '_category']
                 hot_products = hot_products.merge(product_category, on='商品名称', how='left')
                 hot_products = hot_products[hot_products['_category'] != '耗材'].copy()
@@ -1402,7 +1404,7 @@ def analyze_highlights(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Dict
                 yesterday_df['_销售额'] = 0
             
             # 按商品汇总
-            profit_stats = yesterday_df.groupby('商品名称').agg({
+            profit_stats = yesterday_df.groupby('商品名称', observed=True).agg({
                 '利润额': 'sum',
                 '_销售额': 'sum',
                 sales_col: 'sum'
@@ -1421,7 +1423,7 @@ def analyze_highlights(df: pd.DataFrame, order_agg: pd.DataFrame = None) -> Dict
             
             # 过滤耗材
             if category_col and not high_profit.empty:
-                product_category = df.groupby('商品名称')[category_col].first().reset_index()
+                product_category = df.groupby('商品名称', observed=True)[category_col].first().reset_index()
                 product_category.columns = ['商品名称', '_category']
                 high_profit = high_profit.merge(product_category, on='商品名称', how='left')
                 high_profit = high_profit[high_profit['_category'] != '耗材'].copy()
@@ -1871,7 +1873,7 @@ def get_overflow_products(df: pd.DataFrame, days: int = 1) -> pd.DataFrame:
         
         # ⭐ 使用店内码作为聚合key，区分同名不同规格商品
         group_key = get_product_group_key(overflow_items)
-        product_agg = overflow_items.groupby(group_key).agg(**agg_dict).reset_index()
+        product_agg = overflow_items.groupby(group_key, observed=True).agg(**agg_dict).reset_index()
         
         # 如果用店内码聚合，重命名列
         if group_key != '商品名称':
@@ -1897,7 +1899,7 @@ def get_overflow_products(df: pd.DataFrame, days: int = 1) -> pd.DataFrame:
         # ===== Step 4: 获取该商品在筛选周期内的总销量（用于对比）=====
         # 使用相同的聚合key
         group_key = get_product_group_key(filtered_df)
-        all_product_sales = filtered_df.groupby(group_key)[sales_field].sum().reset_index()
+        all_product_sales = filtered_df.groupby(group_key, observed=True)[sales_field].sum().reset_index()
         all_product_sales.columns = [group_key, '周期总销量']
         
         # 确保merge的key一致
@@ -2246,7 +2248,7 @@ def get_stockout_products(df: pd.DataFrame) -> pd.DataFrame:
         if '三级分类名' in period_df.columns:
             agg_dict['三级分类名'] = 'first'
         
-        period_sales = period_df.groupby(group_key).agg(agg_dict).reset_index()
+        period_sales = period_df.groupby(group_key, observed=True).agg(agg_dict).reset_index()
         if group_key != '商品名称':
             period_sales = period_sales.rename(columns={group_key: '店内码'})
         period_sales.rename(columns={sales_col: f'{stat_days}天销量'}, inplace=True)
@@ -2258,9 +2260,9 @@ def get_stockout_products(df: pd.DataFrame) -> pd.DataFrame:
         channel_col = next((c for c in ['渠道', '平台', 'channel'] if c in period_df.columns), None)
         if channel_col:
             # 按商品+渠道统计销量
-            product_channel_sales = period_df.groupby([group_key, channel_col])[sales_col].sum().reset_index()
+            product_channel_sales = period_df.groupby([group_key, channel_col], observed=True)[sales_col].sum().reset_index()
             # 取每个商品销量最高的渠道
-            idx = product_channel_sales.groupby(group_key)[sales_col].idxmax()
+            idx = product_channel_sales.groupby(group_key, observed=True)[sales_col].idxmax()
             main_channel = product_channel_sales.loc[idx][[group_key, channel_col]].copy()
             main_channel.columns = [merge_key, '主渠道']
             period_sales = period_sales.merge(main_channel, on=merge_key, how='left')
@@ -2277,7 +2279,7 @@ def get_stockout_products(df: pd.DataFrame) -> pd.DataFrame:
         
         if profit_col:
             # 计算每个商品的总利润（使用相同的聚合key）
-            product_profit = df.groupby(group_key).agg({
+            product_profit = df.groupby(group_key, observed=True).agg({
                 profit_col: 'sum'
             }).reset_index()
             product_profit.columns = [merge_key, '总利润额']
@@ -2289,7 +2291,7 @@ def get_stockout_products(df: pd.DataFrame) -> pd.DataFrame:
             # 计算总利润率
             if cost_col and price_col and sales_col in df.columns:
                 # 计算总销售额和总成本
-                product_financials = df.groupby(group_key).agg({
+                product_financials = df.groupby(group_key, observed=True).agg({
                     price_col: lambda x: (x * df.loc[x.index, sales_col]).sum(),
                     cost_col: lambda x: (x * df.loc[x.index, sales_col]).sum()
                 }).reset_index()
@@ -2307,7 +2309,7 @@ def get_stockout_products(df: pd.DataFrame) -> pd.DataFrame:
         # ========== 筛选缺货商品 ==========
         if stock_col and not yesterday_df.empty:
             # 有库存字段：使用库存逻辑
-            yesterday_stock = yesterday_df.groupby(group_key)[stock_col].first().reset_index()
+            yesterday_stock = yesterday_df.groupby(group_key, observed=True)[stock_col].first().reset_index()
             yesterday_stock.columns = [merge_key, '昨日库存']
             
             # 合并
@@ -2325,10 +2327,10 @@ def get_stockout_products(df: pd.DataFrame) -> pd.DataFrame:
                 if day_before_df.empty:
                     return pd.DataFrame()
                 
-                day_before_sales = day_before_df.groupby('商品名称')[sales_col].sum().reset_index()
+                day_before_sales = day_before_df.groupby('商品名称', observed=True)[sales_col].sum().reset_index()
                 day_before_sales.columns = ['商品名称', '前日销量']
                 
-                yesterday_sales = yesterday_df.groupby('商品名称')[sales_col].sum().reset_index()
+                yesterday_sales = yesterday_df.groupby('商品名称', observed=True)[sales_col].sum().reset_index()
                 yesterday_sales.columns = ['商品名称', '昨日销量']
                 
                 comparison = period_sales.merge(day_before_sales, on='商品名称', how='left')
@@ -2435,21 +2437,21 @@ def get_traffic_drop_products(df: pd.DataFrame) -> pd.DataFrame:
         if '店内码' in prev_7d_df.columns and group_key != '店内码':
             agg_dict['店内码'] = 'first'
         
-        prev_sales = prev_7d_df.groupby(group_key).agg(agg_dict).reset_index()
+        prev_sales = prev_7d_df.groupby(group_key, observed=True).agg(agg_dict).reset_index()
         prev_sales.rename(columns={sales_col: '前7天销量'}, inplace=True)
         prev_sales['前7天日均'] = (prev_sales['前7天销量'] / 7).round(1)
         
         # ========== 最近7天统计 ==========
         recent_agg = {sales_col: 'sum'}
-        recent_sales = recent_7d_df.groupby(group_key).agg(recent_agg).reset_index()
+        recent_sales = recent_7d_df.groupby(group_key, observed=True).agg(recent_agg).reset_index()
         recent_sales.columns = [group_key, '近7天销量']
         recent_sales['近7天日均'] = (recent_sales['近7天销量'] / 7).round(1)
         
         # ========== 计算主渠道（前7天销量最高的渠道） ==========
         channel_col = next((c for c in ['渠道', '平台', 'channel'] if c in prev_7d_df.columns), None)
         if channel_col:
-            product_channel_sales = prev_7d_df.groupby([group_key, channel_col])[sales_col].sum().reset_index()
-            idx = product_channel_sales.groupby(group_key)[sales_col].idxmax()
+            product_channel_sales = prev_7d_df.groupby([group_key, channel_col], observed=True)[sales_col].sum().reset_index()
+            idx = product_channel_sales.groupby(group_key, observed=True)[sales_col].idxmax()
             main_channel = product_channel_sales.loc[idx][[group_key, channel_col]].copy()
             main_channel.columns = [group_key, '主渠道']
             prev_sales = prev_sales.merge(main_channel, on=group_key, how='left')
@@ -2459,14 +2461,14 @@ def get_traffic_drop_products(df: pd.DataFrame) -> pd.DataFrame:
         price_col = next((c for c in ['实收价格', '商品实售价'] if c in df.columns), None)
         
         if profit_col:
-            product_profit = df.groupby(group_key)[profit_col].sum().reset_index()
+            product_profit = df.groupby(group_key, observed=True)[profit_col].sum().reset_index()
             product_profit.columns = [group_key, '总利润额']
             product_profit['总利润额'] = product_profit['总利润额'].round(2)
             prev_sales = prev_sales.merge(product_profit, on=group_key, how='left')
             
             # 计算总利润率
             if price_col and sales_col in df.columns:
-                product_revenue = df.groupby(group_key).apply(
+                product_revenue = df.groupby(group_key, observed=True).apply(
                     lambda x: (x[price_col] * x[sales_col]).sum()
                 ).reset_index()
                 product_revenue.columns = [group_key, '_总销售额']
@@ -2558,7 +2560,7 @@ def get_slow_moving_products(df: pd.DataFrame) -> pd.DataFrame:
         group_key = get_product_group_key(df)
         
         # 计算每个商品的最后销售日期和最新库存
-        product_stats = df.sort_values(date_col).groupby(group_key).agg(agg_dict).reset_index()
+        product_stats = df.sort_values(date_col).groupby(group_key, observed=True).agg(agg_dict).reset_index()
         product_stats['无销量天数'] = (yesterday - product_stats[date_col].dt.normalize()).dt.days
         
         # 获取库存
@@ -2677,7 +2679,7 @@ def get_new_products(df: pd.DataFrame) -> pd.DataFrame:
         # 计算每个商品的上次销售日期（用于计算沉寂天数）
         before_yesterday_df = df[df[date_col].dt.normalize() < yesterday]
         if not before_yesterday_df.empty:
-            product_last_sale = before_yesterday_df.groupby(group_key)[date_col].max().reset_index()
+            product_last_sale = before_yesterday_df.groupby(group_key, observed=True)[date_col].max().reset_index()
             product_last_sale.columns = [group_key, '上次销售日']
             product_last_sale['沉寂天数'] = (yesterday - product_last_sale['上次销售日'].dt.normalize()).dt.days
         else:
@@ -2716,7 +2718,7 @@ def get_new_products(df: pd.DataFrame) -> pd.DataFrame:
         if channel_col:
             agg_dict[channel_col] = lambda x: x.value_counts().index[0] if len(x) > 0 else ''
         
-        product_stats = new_df.groupby(group_key).agg(agg_dict).reset_index()
+        product_stats = new_df.groupby(group_key, observed=True).agg(agg_dict).reset_index()
         
         # 构建结果
         results = []
@@ -2897,7 +2899,7 @@ def get_price_abnormal_products(df: pd.DataFrame, store_name: str = None) -> pd.
         if channel_col:
             agg_dict[channel_col] = 'first'
         
-        product_stats = abnormal_df.groupby(group_key, as_index=False).agg(agg_dict)
+        product_stats = abnormal_df.groupby(group_key, as_index=False, observed=True).agg(agg_dict)
         
         # 分级：严重亏损（售价<单品成本×0.8）vs 轻度亏损
         def get_abnormal_level(row):
@@ -3087,13 +3089,13 @@ def get_profit_rate_drop_products(df: pd.DataFrame, store_name: str = None) -> p
         if channel_col:
             agg_dict[channel_col] = 'first'
         
-        recent_stats = recent_df.groupby(group_key, as_index=False).agg(agg_dict)
+        recent_stats = recent_df.groupby(group_key, as_index=False, observed=True).agg(agg_dict)
         
         # 前7天只需要利润率相关字段
         prev_agg_dict = {'利润额': 'sum', '销售额': 'sum'}
         if sales_col:
             prev_agg_dict[sales_col] = 'sum'
-        prev_stats = prev_df.groupby(group_key, as_index=False).agg(prev_agg_dict)
+        prev_stats = prev_df.groupby(group_key, as_index=False, observed=True).agg(prev_agg_dict)
         
         # 计算利润率（避免除零，并限制在合理范围 -100% ~ 100%）
         raw_recent_rate = np.where(
@@ -3289,11 +3291,11 @@ def get_hot_products(df: pd.DataFrame, store_name: str = None) -> pd.DataFrame:
         if channel_col and channel_col in yesterday_df.columns:
             agg_dict[channel_col] = 'first'
         
-        yesterday_stats = yesterday_df.groupby(group_key, as_index=False).agg(agg_dict)
+        yesterday_stats = yesterday_df.groupby(group_key, as_index=False, observed=True).agg(agg_dict)
         
         # 前日销量
         prev_agg = {sales_col: 'sum'} if sales_col else {}
-        day_before_stats = day_before_df.groupby(group_key, as_index=False).agg(prev_agg) if sales_col else pd.DataFrame()
+        day_before_stats = day_before_df.groupby(group_key, as_index=False, observed=True).agg(prev_agg) if sales_col else pd.DataFrame()
         if not day_before_stats.empty:
             day_before_stats = day_before_stats.rename(columns={sales_col: '前日销量'})
         
@@ -3438,7 +3440,7 @@ def detect_price_changes_from_orders(df: pd.DataFrame, price_threshold: float =
         
         # 填充渠道空值
         if channel_col and channel_col in df.columns:
-            df[channel_col] = df[channel_col].fillna('未知渠道')
+            df[channel_col] = safe_fillna(df[channel_col], '未知渠道')
         else:
             df['_渠道'] = '全渠道'
             channel_col = '_渠道'
@@ -3472,7 +3474,7 @@ def detect_price_changes_from_orders(df: pd.DataFrame, price_threshold: float =
         if stock_col:
             agg_dict[stock_col] = 'last'
         
-        daily_data = df.groupby(group_cols).agg(agg_dict).reset_index()
+        daily_data = df.groupby(group_cols, observed=True).agg(agg_dict).reset_index()
         daily_data = daily_data.rename(columns={
             code_col: '店内码',
             channel_col: '渠道',
@@ -3493,7 +3495,7 @@ def detect_price_changes_from_orders(df: pd.DataFrame, price_threshold: float =
         # 3. 检测价格变动（按 店内码+渠道 分组）
         price_changes = []
         
-        for (code, channel), group_data in daily_data.groupby(['店内码', '渠道']):
+        for (code, channel), group_data in daily_data.groupby(['店内码', '渠道'], observed=True):
             product_data = group_data.copy()
             
             if len(product_data) < 2:
@@ -4091,7 +4093,7 @@ def get_high_profit_products(df: pd.DataFrame, store_name: str = None, days: int
         if code_col and code_col in filtered_df.columns:
             group_cols.append(code_col)
         
-        profit_stats = filtered_df.groupby(group_cols, as_index=False).agg(agg_dict)
+        profit_stats = filtered_df.groupby(group_cols, as_index=False, observed=True).agg(agg_dict)
         
         # 计算利润率
         profit_stats['利润率'] = np.where(
@@ -95,11 +95,11 @@ def get_price_increase_opportunity_products(df: pd.DataFrame, selected_days: int
         if profit_col and profit_col in recent_df.columns:
             agg_dict[profit_col] = 'sum'
         
-        recent_stats = recent_df.groupby(group_key, as_index=False).agg(agg_dict)
+        recent_stats = recent_df.groupby(group_key, as_index=False, observed=True).agg(agg_dict)
         recent_stats = recent_stats.rename(columns={sales_col: f'近{selected_days}天销量'})
         
         # 聚合前期数据
-        prev_stats = prev_df.groupby(group_key, as_index=False).agg({sales_col: 'sum'})
+        prev_stats = prev_df.groupby(group_key, as_index=False, observed=True).agg({sales_col: 'sum'})
         prev_stats = prev_stats.rename(columns={sales_col: f'前{selected_days}天销量'})
         
         # 合并
@@ -1152,7 +1152,7 @@ def get_stagnant_products(df: pd.DataFrame, store: str = None, level: str = 'all
         if qty_col:
             agg_dict[qty_col] = 'sum'
         
-        product_stats = df_copy.groupby(name_col).agg(agg_dict).reset_index()
+        product_stats = df_copy.groupby(name_col, observed=True).agg(agg_dict).reset_index()
         product_stats.columns = ['商品名称', '最后销售日期'] + (['总销量'] if qty_col else [])
         product_stats['滞销天数'] = (last_date - product_stats['最后销售日期']).dt.days
         
@@ -1181,7 +1181,7 @@ def get_stagnant_products(df: pd.DataFrame, store: str = None, level: str = 'all
         agg_dict['_单品成本'] = 'mean'
         
         if agg_dict:
-            product_info = df_copy.groupby(name_col).agg(agg_dict).reset_index()
+            product_info = df_copy.groupby(name_col, observed=True).agg(agg_dict).reset_index()
         else:
             product_info = df_copy[[name_col]].drop_duplicates()
         
@@ -1190,12 +1190,12 @@ def get_stagnant_products(df: pd.DataFrame, store: str = None, level: str = 'all
             # 步骤1: 获取最后一天有销售的商品库存
             last_day_data = df_copy[df_copy[date_col] == last_date]
             if len(last_day_data) > 0:
-                last_day_stock_map = last_day_data.groupby(name_col)[stock_col].last().to_dict()
+                last_day_stock_map = last_day_data.groupby(name_col, observed=True)[stock_col].last().to_dict()
             else:
                 last_day_stock_map = {}
             
             # 步骤2: 获取每个商品最后一次售卖记录的库存（关键！）
-            last_sale_stock = df_copy.sort_values(date_col).groupby(name_col).agg({
+            last_sale_stock = df_copy.sort_values(date_col).groupby(name_col, observed=True).agg({
                 stock_col: 'last'
             })
             last_sale_stock_map = last_sale_stock[stock_col].to_dict()
@@ -106,7 +106,7 @@ def get_product_daily_metrics(
         return pd.DataFrame()
     
     # 执行聚合
-    result = day_data.groupby(group_key).agg(**agg_dict).reset_index()
+    result = day_data.groupby(group_key, observed=True).agg(**agg_dict).reset_index()
     
     # 计算毛利率
     # 修正逻辑: 销售额为0时，毛利率应视为无效(NaN)，不参与"毛利率下滑"计算
@@ -233,7 +233,7 @@ def analyze_traffic_drop_products(df: pd.DataFrame, top_n: int = 20) -> Dict[str
             # 获取昨日最后一条记录的库存
             yesterday_data = df_stock[df_stock[date_col].dt.normalize() == yesterday]
             # 按时间排序取最后一条
-            latest_stock = yesterday_data.sort_values(date_col).groupby('商品名称')[stock_col].last().reset_index()
+            latest_stock = yesterday_data.sort_values(date_col).groupby('商品名称', observed=True)[stock_col].last().reset_index()
             latest_stock.rename(columns={stock_col: '昨日库存'}, inplace=True)
             
             drops = drops.merge(latest_stock, on='商品名称', how='left')
@@ -286,7 +286,7 @@ def analyze_new_slow_moving_products(df: pd.DataFrame) -> Dict[str, Any]:
         last_date = df[date_col].max().normalize()
         
         # 计算每个商品的最后销售日期
-        last_sales = df.groupby('商品名称')[date_col].max().reset_index()
+        last_sales = df.groupby('商品名称', observed=True)[date_col].max().reset_index()
         last_sales['days_since'] = (last_date - last_sales[date_col].dt.normalize()).dt.days
         
         # 筛选刚好满7天或30天的
@@ -311,7 +311,7 @@ def analyze_new_slow_moving_products(df: pd.DataFrame) -> Dict[str, Any]:
         if stock_col and cost_col:
             # 获取每个商品的最新库存和成本
             # 注意: 这里的成本应该是单价
-            latest_info = df.sort_values(date_col).groupby('商品名称')[[stock_col, cost_col]].last().reset_index()
+            latest_info = df.sort_values(date_col).groupby('商品名称', observed=True)[[stock_col, cost_col]].last().reset_index()
             combined = combined.merge(latest_info, on='商品名称', how='left')
             combined['积压成本'] = (combined[stock_col] * combined[cost_col]).fillna(0).round(2)
         else:
@@ -566,11 +566,11 @@ def analyze_slow_moving_products(df: pd.DataFrame) -> Dict[str, Any]:
             result['error'] = '无销售记录'
             return result
         
-        last_sale = sales_df.groupby('商品名称').agg({date_col: 'max'}).reset_index()
+        last_sale = sales_df.groupby('商品名称', observed=True).agg({date_col: 'max'}).reset_index()
         last_sale.columns = ['商品名称', '最后销售日']
         
         if category_col in df.columns:
-            product_category = df.groupby('商品名称')[category_col].first().reset_index()
+            product_category = df.groupby('商品名称', observed=True)[category_col].first().reset_index()
             last_sale = last_sale.merge(product_category, on='商品名称', how='left')
         
         last_sale['无销量天数'] = (max_date - pd.to_datetime(last_sale['最后销售日'])).dt.days
@@ -966,13 +966,13 @@ def get_product_insight_enhanced(df: pd.DataFrame, product_name: str) -> Dict[st
         if not partners.empty:
             # 统计频次并保留分类信息
             if category_col:
-                partner_stats = partners.groupby('商品名称').agg({
+                partner_stats = partners.groupby('商品名称', observed=True).agg({
                     '订单ID': 'nunique',
                     category_col: 'first'
                 }).reset_index()
                 partner_stats.columns = ['商品名称', '频次', '一级分类']
             else:
-                partner_stats = partners.groupby('商品名称')['订单ID'].nunique().reset_index()
+                partner_stats = partners.groupby('商品名称', observed=True)['订单ID'].nunique().reset_index()
                 partner_stats.columns = ['商品名称', '频次']
                 partner_stats['一级分类'] = '-'
             
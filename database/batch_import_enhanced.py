@@ -30,6 +30,7 @@ sys.path.insert(0, str(PROJECT_ROOT))
 
 from database.connection import SessionLocal, init_database
 from database.models import Order, DataUploadHistory
+from database.order_bulk_import import import_orders_frame, BATCH_DATE_COLUMNS
 from sqlalchemy import func, text
 
 # 尝试导入数据处理器
@@ -68,6 +69,9 @@ class BatchDataImporterEnhanced:
             'errors': []
         }
         
+        # 本次导入变更的 门店 → 日期集合（None 表示全部日期），导入后只刷新这些预聚合分区
+        self.dirty_days: Dict[str, Optional[set]] = {}
+        
         # 确保数据库已初始化
         init_database()
         
@@ -189,168 +193,20 @@ class BatchDataImporterEnhanced:
         - 同一订单中同一商品可能出现多次（顾客购买多份），这些都是有效数据
         - 不再使用 订单ID+商品名称 去重，改为全量导入
         - 增量模式下，只检查文件是否已导入过，不检查单条记录
+        - 映射与写入见 database/order_bulk_import.py（向量化 + COPY，替换模式删除与写入同一事务）
         """
-        session = SessionLocal()
-        inserted = 0
-        updated = 0
-        skipped = 0
-        
-        try:
-            # 替换模式：先删除所有涉及门店的旧数据
-            if self.mode == "replace":
-                total_deleted = 0
-                for store_name in store_names:
-                    deleted = session.query(Order).filter(Order.store_name == store_name).delete()
-                    if deleted > 0:
-                        print(f"   🗑️ 删除 {store_name}: {deleted:,} 条")
-                        total_deleted += deleted
-                session.commit()
-                if total_deleted > 0:
-                    print(f"   🗑️ 删除旧数据总计: {total_deleted:,} 条")
-            
-            # 获取日期列
-            date_col = None
-            for col in ['日期', '下单时间', '采集时间', 'date']:
-                if col in df.columns:
-                    date_col = col
-                    break
-            
-            if not date_col:
-                raise ValueError("未找到日期列")
-            
-            # 批量处理
-            batch_size = 5000
-            total_rows = len(df)
-            
-            for batch_start in range(0, total_rows, batch_size):
-                batch_end = min(batch_start + batch_size, total_rows)
-                batch_df = df.iloc[batch_start:batch_end]
-                
-                orders_to_insert = []
-                
-                for _, row in batch_df.iterrows():
-                    order_id = str(row.get('订单ID', ''))
-                    if not order_id or order_id == 'nan':
-                        skipped += 1
-                        continue
-                    
-                    # 注意：不再进行单条记录去重
-                    # 原因：同一订单中同一商品可能出现多次（如顾客买了2份同样的商品）
-                    # 这些都是有效的销售数据，不应该被跳过
-                    # 增量模式的去重通过文件哈希检查实现（check_file_imported）
-                    
-                    # 解析日期
-                    order_date = None
-                    if pd.notna(row.get(date_col)):
-                        try:
-                            order_date = pd.to_datetime(row[date_col])
-                            if pd.isna(order_date):
-                                order_date = None
-                        except:
-                            order_date = None
-                    
-                    if order_date is None:
-                        skipped += 1
-                        continue
-                    
-                    # 辅助函数
-                    def safe_float(val, default=0):
-                        if pd.isna(val): return default
-                        try: return float(val)
-                        except: return default
-                    
-                    def safe_int(val, default=0):
-                        if pd.isna(val): return default
-                        try: return int(val)
-                        except: return default
-                    
-                    def safe_str(val, default=''):
-                        if pd.isna(val): return default
-                        return str(val)
-                    
-                    # 创建订单对象（从每行数据获取门店名称，支持多门店聚合表）
-                    row_store_name = safe_str(row.get('门店名称', ''))
-                    if not row_store_name:
-                        row_store_name = store_names[0] if store_names else '未知门店'
-                    
-                    order = Order(
-                        order_id=order_id,
-                        order_number=safe_str(row.get('订单编号', '')),
-                        store_name=row_store_name,
-                        product_name=safe_str(row.get('商品名称', '')),
-                        date=order_date,
-                        channel=safe_str(row.get('渠道', '')),
-                        address=safe_str(row.get('收货地址', '')),
-                        
-                        # 分类
-                        category_level1=safe_str(row.get('一级分类名', row.get('一级分类', ''))),
-                        category_level3=safe_str(row.get('三级分类名', row.get('三级分类', ''))),
-                        
-                        # 价格和成本
-                        price=safe_float(row.get('商品实售价', 0)),
-                        original_price=safe_float(row.get('商品原价', 0)),
-                        cost=safe_float(row.get('商品采购成本', row.get('成本', 0))),
-                        actual_price=safe_float(row.get('实收价格', 0)),
-                        
-                        # 销量和金额
-                        quantity=safe_int(row.get('销量', row.get('月售', 1)), 1),
-                        stock=safe_int(row.get('库存', 0)),
-                        remaining_stock=safe_float(row.get('剩余库存', row.get('库存', 0))),
-                        amount=safe_float(row.get('预计订单收入', row.get('订单零售额', row.get('销售额', 0)))),
-                        profit=safe_float(row.get('利润额', row.get('实际利润', row.get('利润', 0)))),
-                        
-                        # 费用
-                        delivery_fee=safe_float(row.get('物流配送费', 0)),
-                        commission=safe_float(row.get('平台佣金', 0)),
-                        platform_service_fee=safe_float(row.get('平台服务费', row.get('平台佣金', 0))),
-                        
-                        # 营销活动费用
-                        user_paid_delivery_fee=safe_float(row.get('用户支付配送费', 0)),
-                        delivery_discount=safe_float(row.get('配送费减免金额', 0)),
-                        full_reduction=safe_float(row.get('满减金额', 0)),
-                        product_discount=safe_float(row.get('商品减免金额', 0)),
-                        merchant_voucher=safe_float(row.get('商家代金券', 0)),
-                        merchant_share=safe_float(row.get('商家承担部分券', 0)),
-                        packaging_fee=safe_float(row.get('打包袋金额', 0)),
-                        gift_amount=safe_float(row.get('满赠金额', 0)),
-                        other_merchant_discount=safe_float(row.get('商家其他优惠', 0)),
-                        new_customer_discount=safe_float(row.get('新客减免金额', 0)),
-                        
-                        # 利润补偿项
-                        corporate_rebate=safe_float(row.get('企客后返', 0)),
-                        
-                        # 配送信息
-                        delivery_distance=safe_float(row.get('配送距离', 0)),
-                        delivery_platform=safe_str(row.get('配送平台', '')),
-                        
-                        # 门店信息
-                        store_id=safe_str(row.get('门店ID', '')),
-                        city=safe_str(row.get('城市名称', row.get('城市', ''))),
-                        
-                        # 条码
-                        barcode=safe_str(row.get('条码', '')),
-                        store_code=safe_str(row.get('店内码', '')),
-                    )
-                    orders_to_insert.append(order)
-                    inserted += 1
-                
-                # 批量插入
-                if orders_to_insert:
-                    session.bulk_save_objects(orders_to_insert)
-                    session.commit()
-                
-                # 显示进度
-                progress = min(batch_end, total_rows)
-                print(f"   📊 进度: {progress:,}/{total_rows:,} ({progress*100//total_rows}%)", end='\r')
-            
-            print()  # 换行
-            return inserted, updated, skipped
-            
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
+        result = import_orders_frame(
+            df,
+            default_store=store_names[0] if store_names else None,
+            replace_stores=store_names if self.mode == "replace" else None,
+            date_columns=BATCH_DATE_COLUMNS,
+            date_fallback=False,
+        )
+        total_deleted = sum(result.deleted.values())
+        if total_deleted > 0:
+            print(f"   🗑️ 删除旧数据总计: {total_deleted:,} 条")
+        self._record_dirty_days(result.dirty_days, store_names)
+        return result.inserted, 0, result.skipped
     
     def log_upload_history(self, filename: str, file_hash: str, file_size: int,
                           rows_imported: int, success: bool, error_msg: str = None):
@@ -439,7 +295,7 @@ class BatchDataImporterEnhanced:
             self.stats['orders_updated'] += updated
             self.stats['orders_skipped'] += skipped
             
-            # 10. 记录需要更新预聚合表的门店
+            # 10. 记录需要更新预聚合表的门店和日期（脏集合）
             if not hasattr(self, 'stores_to_sync'):
                 self.stores_to_sync = set()
             self.stores_to_sync.update(store_names)
@@ -455,6 +311,22 @@ class BatchDataImporterEnhanced:
             self.log_upload_history(filepath, '', file_size, 0, False, error_msg)
             return False
     
+    def _record_dirty_days(self, written_days: Dict[str, set], store_names: List[str]):
+        """
+        记录本次导入变更的 门店 → 日期集合，预聚合表只刷新这些分区
+        
+        written_days 为实际写入的行（ImportResult.dirty_days），
+        替换模式会删除门店的全部旧订单，该门店记为全部日期
+        """
+        if self.mode == "replace":
+            for store_name in store_names:
+                self.dirty_days[store_name] = None
+        
+        for store_name, store_days in written_days.items():
+            if self.dirty_days.get(store_name, set()) is None:
+                continue
+            self.dirty_days.setdefault(store_name, set()).update(store_days)
+    
     def run(self):
         """执行批量导入"""
         print("\n" + "="*60)
@@ -484,7 +356,7 @@ class BatchDataImporterEnhanced:
             print("="*60)
             try:
                 from backend.app.services.aggregation_sync_service import AggregationSyncService
-                AggregationSyncService.sync_store_data(list(self.stores_to_sync), async_mode=False)
+                AggregationSyncService.sync_dirty(self.dirty_days, async_mode=False)
             except ImportError:
                 # 如果无法导入，尝试直接执行SQL
                 print("⚠️ 无法导入同步服务，尝试直接更新...")
@@ -12,6 +12,7 @@ from datetime import datetime, timedelta
 from sqlalchemy import text, func
 from database.connection import SessionLocal, engine
 from database.models import Order
+from database.order_changes import notify_orders_changed
 
 
 class DataLifecycleManager:
@@ -20,6 +21,21 @@ class DataLifecycleManager:
     def __init__(self):
         self.session = SessionLocal()
     
+    def _affected_stores(self, query):
+        """删除前：查询范围涉及的门店"""
+        return [row[0] for row in query.with_entities(Order.store_name).distinct() if row[0]]
+    
+    def _notify_deleted(self, store_names):
+        """删除提交后通知数据变更（版本号自增、订单事实表失效），区分仍有数据和已清空的门店"""
+        remaining = {
+            row[0] for row in self.session.query(Order.store_name)
+            .filter(Order.store_name.in_(store_names)).distinct()
+        }
+        notify_orders_changed(
+            changed=[s for s in store_names if s in remaining],
+            removed=[s for s in store_names if s not in remaining],
+        )
+    
     def get_database_stats(self):
         """获取数据库统计信息"""
         print("\n" + "="*70)
@@ -135,8 +151,10 @@ class DataLifecycleManager:
             
             # 真实删除
             print(f"\n开始删除...")
+            affected = self._affected_stores(query)
             deleted = query.delete(synchronize_session=False)
             self.session.commit()
+            self._notify_deleted(affected)
             
             print(f"✅ 成功删除 {deleted:,} 条数据")
             
@@ -202,8 +220,10 @@ class DataLifecycleManager:
                 return {'deleted': 0, 'preview': to_delete, 'dry_run': True}
             
             # 真实删除
+            affected = self._affected_stores(query)
             deleted = query.delete(synchronize_session=False)
             self.session.commit()
+            self._notify_deleted(affected)
             
             print(f"✅ 成功删除 {deleted:,} 条数据")
             
@@ -271,6 +291,7 @@ class DataLifecycleManager:
                 Order.store_name == store_name
             ).delete(synchronize_session=False)
             self.session.commit()
+            notify_orders_changed(removed=[store_name])
             
             print(f"✅ 成功删除 {deleted:,} 条数据")
             
@@ -363,8 +384,10 @@ class DataLifecycleManager:
             
             # 删除已归档数据
             print(f"\n🗑️  删除已归档数据...")
+            affected = self._affected_stores(query)
             deleted = query.delete(synchronize_session=False)
             self.session.commit()
+            self._notify_deleted(affected)
             
             print(f"✅ 归档完成: {deleted:,} 条数据")
             print(f"📁 归档文件: {len(archived_files)} 个")
@@ -19,6 +19,13 @@ sys.path.insert(0, str(PROJECT_ROOT / "backend" / "app"))
 from services.aggregation_config import AGGREGATION_CONFIGS, AggregationConfig
 
 
+def metric_field_type(name: str) -> str:
+    """指标字段类型：计数（*_count）为整数，其余为金额（discount 等名称中含 count 但不是计数）"""
+    if name.lower().endswith("_count"):
+        return "INTEGER DEFAULT 0"
+    return "DECIMAL(12,2) DEFAULT 0"
+
+
 def generate_create_table_sql(config: AggregationConfig) -> str:
     """根据配置生成 CREATE TABLE SQL"""
     
@@ -57,19 +64,11 @@ def generate_create_table_sql(config: AggregationConfig) -> str:
     
     # 从 fields 提取字段
     for f in config.fields:
-        if "count" in f.name.lower():
-            field_type = "INTEGER DEFAULT 0"
-        else:
-            field_type = "DECIMAL(12,2) DEFAULT 0"
-        lines.append(f"    {f.name} {field_type},")
+        lines.append(f"    {f.name} {metric_field_type(f.name)},")
     
     # 从 derived_fields 提取字段
     for df in config.derived_fields:
-        if "count" in df.name.lower():
-            field_type = "INTEGER DEFAULT 0"
-        else:
-            field_type = "DECIMAL(12,2) DEFAULT 0"
-        lines.append(f"    {df.name} {field_type},")
+        lines.append(f"    {df.name} {metric_field_type(df.name)},")
     
     # 时间戳
     lines.append("    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,")
@@ -79,6 +78,11 @@ def generate_create_table_sql(config: AggregationConfig) -> str:
     # 索引
     lines.append("")
     lines.append(f"-- 索引")
+    # 唯一键（增量刷新 INSERT ... ON CONFLICT 的冲突目标）
+    lines.append(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{config.table_name}_key "
+        f"ON {config.table_name}({', '.join(config.key_columns())});"
+    )
     lines.append(f"CREATE INDEX IF NOT EXISTS idx_{config.table_name}_store ON {config.table_name}(store_name);")
     
     # 日期索引
@@ -0,0 +1,21 @@
+-- 迁移: 预聚合表优惠金额字段改为 DECIMAL
+-- 日期: 2026-10-16
+-- 说明: generate_table_sql.py 曾把名称含 count 的字段（avg_discount / total_delivery_discount）
+--       建为 INTEGER，按日期范围增量刷新与全量重建的取整结果不一致
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'store_daily_summary' AND column_name = 'total_delivery_discount'
+               AND data_type = 'integer') THEN
+        ALTER TABLE store_daily_summary ALTER COLUMN total_delivery_discount TYPE DECIMAL(12,2);
+        RAISE NOTICE '✓ store_daily_summary.total_delivery_discount → DECIMAL(12,2)';
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'category_daily_summary' AND column_name = 'avg_discount'
+               AND data_type = 'integer') THEN
+        ALTER TABLE category_daily_summary ALTER COLUMN avg_discount TYPE DECIMAL(12,2);
+        RAISE NOTICE '✓ category_daily_summary.avg_discount → DECIMAL(12,2)';
+    END IF;
+END $$;
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+订单批量导入管道（向量化映射 + COPY FROM STDIN）
+
+批量导入脚本、看板上传接口、智能导入脚本共用：
+- 字段映射和类型转换全部用 pandas 列运算完成（不再逐行 iterrows + safe_float + ORM 对象）
+- 映射结果分块生成 CSV，通过 COPY orders (...) FROM STDIN 写入 PostgreSQL
+- 替换模式的删除与写入在同一事务中，读取方不会看到门店数据为空的中间状态
+- 提交后调用 notify_orders_changed（数据版本自增、受影响门店的订单事实表失效），
+  三个入口都经过这里，不会遗漏
+
+跳过规则：
+- 订单ID为空或 'nan'
+- 日期缺失或无法解析
+
+日期列优先级由调用方传入（保持各入口原有行为）：
+- 批量导入: BATCH_DATE_COLUMNS，只取第一个存在的列（该列无效则跳过该行）
+- 看板上传: UPLOAD_DATE_COLUMNS（下单时间优先，保留时分秒），只取第一个存在的列
+- 智能导入: DATE_COLUMNS（下单时间优先），逐行回退到下一个可解析的列
+
+用法：
+    from database.order_bulk_import import import_orders_frame
+    result = import_orders_frame(df, default_store='门店A', replace_stores=['门店A'])
+    print(result.inserted, result.skipped, result.rows_per_second)
+"""
+
+import csv
+import io
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from database.connection import engine
+from database.order_changes import notify_orders_changed
+
+
+# 日期候选列（按优先级）：下单时间带时分秒，优先于可能只有日期的 日期 列
+DATE_COLUMNS = ['下单时间', '日期', '订单时间', '采集时间', '时间', 'date', 'order_date']
+# 批量导入原有顺序（日期优先）
+BATCH_DATE_COLUMNS = ['日期', '下单时间', '采集时间', 'date']
+# 看板上传原有顺序
+UPLOAD_DATE_COLUMNS = ['下单时间', '日期']
+
+# orders 列 → (候选源列（取第一个存在的列）, 类型, 空值默认)
+# 类型: str / float / int / nullable_int（空值写 NULL）
+ORDER_COLUMN_SOURCES: Dict[str, Tuple[List[str], str, Any]] = {
+    'order_number': (['订单编号'], 'str', ''),
+    'product_name': (['商品名称'], 'str', ''),
+    'channel': (['渠道'], 'str', ''),
+    'address': (['收货地址'], 'str', ''),
+    # 分类
+    'category_level1': (['一级分类名', '一级分类'], 'str', ''),
+    'category_level3': (['三级分类名', '三级分类'], 'str', ''),
+    # 价格和成本
+    'price': (['商品实售价'], 'float', 0.0),
+    'original_price': (['商品原价'], 'float', 0.0),
+    'cost': (['商品采购成本', '成本'], 'float', 0.0),
+    'actual_price': (['实收价格'], 'float', 0.0),
+    # 销量和金额
+    'quantity': (['销量', '月售'], 'int', 1),
+    'stock': (['库存'], 'int', 0),
+    'remaining_stock': (['剩余库存', '库存'], 'float', 0.0),
+    'amount': (['预计订单收入', '订单零售额', '销售额'], 'float', 0.0),
+    'profit': (['利润额', '实际利润', '利润'], 'float', 0.0),
+    # 费用
+    'delivery_fee': (['物流配送费'], 'float', 0.0),
+    'commission': (['平台佣金'], 'float', 0.0),
+    'platform_service_fee': (['平台服务费', '平台佣金'], 'float', 0.0),
+    # 营销活动费用
+    'user_paid_delivery_fee': (['用户支付配送费'], 'float', 0.0),
+    'delivery_discount': (['配送费减免金额'], 'float', 0.0),
+    'full_reduction': (['满减金额'], 'float', 0.0),
+    'product_discount': (['商品减免金额'], 'float', 0.0),
+    'merchant_voucher': (['商家代金券'], 'float', 0.0),
+    'merchant_share': (['商家承担部分券'], 'float', 0.0),
+    'packaging_fee': (['打包袋金额'], 'float', 0.0),
+    'gift_amount': (['满赠金额'], 'float', 0.0),
+    'other_merchant_discount': (['商家其他优惠'], 'float', 0.0),
+    'new_customer_discount': (['新客减免金额'], 'float', 0.0),
+    # 利润补偿项
+    'corporate_rebate': (['企客后返'], 'float', 0.0),
+    # 配送信息
+    'delivery_distance': (['配送距离', 'distance', '距离'], 'float', 0.0),
+    'delivery_platform': (['配送平台'], 'str', ''),
+    # 门店信息
+    'store_id': (['门店ID'], 'str', ''),
+    'store_franchise_type': (['门店加盟类型'], 'nullable_int', None),
+    'city': (['城市名称', '城市'], 'str', ''),
+    # 条码
+    'barcode': (['条码'], 'str', ''),
+    'store_code': (['店内码'], 'str', ''),
+}
+
+# COPY 写入的列（created_at/updated_at 为 ORM 端默认值，COPY 时需显式写入）
+COPY_COLUMNS = (
+    ['order_id', 'date', 'store_name']
+    + list(ORDER_COLUMN_SOURCES)
+    + ['created_at', 'updated_at']
+)
+
+# 每次 COPY 的行数（控制 CSV 缓冲内存）
+COPY_CHUNK_ROWS = int(os.getenv("ORDER_COPY_CHUNK_ROWS", "50000"))
+
+
+@dataclass
+class ImportResult:
+    """导入结果"""
+    rows: int = 0                # 输入行数
+    inserted: int = 0            # 写入行数
+    skipped: int = 0             # 跳过行数（订单ID/日期无效）
+    deleted: Dict[str, int] = field(default_factory=dict)  # 替换模式删除的 门店 → 行数
+    dirty_days: Dict[str, Set[date]] = field(default_factory=dict)  # 实际写入的 门店 → 日期集合
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.inserted / self.seconds if self.seconds > 0 else 0.0
+
+
+def _source(df: pd.DataFrame, candidates: List[str]) -> Optional[pd.Series]:
+    """取第一个存在的候选列（列存在但值为空时使用默认值，不再回退到下一列）"""
+    for name in candidates:
+        if name in df.columns:
+            return df[name]
+    return None
+
+
+def _to_str(series: Optional[pd.Series], default: str, index: pd.Index) -> pd.Series:
+    if series is None:
+        return pd.Series(default, index=index, dtype=object)
+    return series.astype(object).where(series.notna(), default).astype(str)
+
+
+def _to_number(series: Optional[pd.Series], index: pd.Index) -> pd.Series:
+    """数值列：无法转换的值（含 ±inf）为 NaN"""
+    if series is None:
+        return pd.Series(np.nan, index=index, dtype='float64')
+    return pd.to_numeric(series, errors='coerce').astype('float64').replace([np.inf, -np.inf], np.nan)
+
+
+def parse_order_dates(df: pd.DataFrame, date_columns: List[str] = DATE_COLUMNS,
+                      fallback: bool = True) -> pd.Series:
+    """
+    解析订单日期（逐值推断格式，无法解析为 NaT）
+
+    Args:
+        date_columns: 候选日期列（按优先级）
+        fallback: True 逐行取第一个可解析的值；False 只用第一个存在的列
+
+    Raises:
+        ValueError: 没有任何日期列
+    """
+    present = [c for c in date_columns if c in df.columns]
+    if not present:
+        raise ValueError("未找到日期列")
+    if not fallback:
+        present = present[:1]
+
+    result = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    for name in present:
+        column = df[name]
+        if pd.api.types.is_datetime64_any_dtype(column):
+            parsed = column
+        else:
+            parsed = pd.to_datetime(column, errors='coerce', format='mixed')
+        if getattr(parsed.dt, 'tz', None) is not None:
+            parsed = parsed.dt.tz_localize(None)
+        result = result.fillna(parsed.astype('datetime64[ns]'))
+    return result
+
+
+def prepare_orders(df: pd.DataFrame, default_store: Optional[str] = None,
+                   date_columns: List[str] = DATE_COLUMNS,
+                   date_fallback: bool = True) -> Tuple[pd.DataFrame, int]:
+    """
+    DataFrame（标准化后的中文列）→ orders 列的 DataFrame
+
+    Args:
+        df: 订单明细
+        default_store: 门店名称为空时写入的值（None 写 '未知门店'）
+        date_columns / date_fallback: 见 parse_order_dates
+
+    Returns:
+        (COPY_COLUMNS 列的 DataFrame, 跳过行数)
+    """
+    index = df.index
+    order_id = _to_str(_source(df, ['订单ID']), '', index)
+    dates = parse_order_dates(df, date_columns, date_fallback)
+    valid = (order_id != '') & (order_id != 'nan') & dates.notna()
+
+    out = pd.DataFrame(index=index)
+    out['order_id'] = order_id
+    out['date'] = dates
+    store = _to_str(_source(df, ['门店名称']), '', index)
+    out['store_name'] = store.where(store != '', '未知门店' if default_store is None else default_store)
+
+    for column, (candidates, kind, default) in ORDER_COLUMN_SOURCES.items():
+        series = _source(df, candidates)
+        if kind == 'str':
+            out[column] = _to_str(series, default, index)
+            continue
+        values = _to_number(series, index)
+        if kind == 'float':
+            out[column] = values.fillna(default)
+        elif kind == 'int':
+            # 与 int(float) 一致：向零取整
+            out[column] = np.trunc(values.fillna(default)).astype('int64')
+        else:
+            out[column] = np.trunc(values).astype('Int64')
+
+    now = datetime.now()
+    out['created_at'] = now
+    out['updated_at'] = now
+
+    out = out.loc[valid, COPY_COLUMNS]
+    return out, int((~valid).sum())
+
+
+def written_days(frame: pd.DataFrame) -> Dict[str, Set[date]]:
+    """prepare_orders 结果中的 门店 → 日期集合（预聚合表按此刷新，与写入的行一致）"""
+    if frame.empty:
+        return {}
+    pairs = pd.DataFrame({'store': frame['store_name'], 'day': frame['date'].dt.date}).drop_duplicates()
+    return {store: set(group['day']) for store, group in pairs.groupby('store')}
+
+
+def _copy_chunk(cursor, sql: str, frame: pd.DataFrame):
+    """一块数据 COPY FROM STDIN（pg8000 用 stream 参数，psycopg2 用 copy_expert）"""
+    buffer = io.StringIO()
+    # 字符串全部加引号：空字符串写入 ''，而不是 NULL
+    frame.to_csv(
+        buffer, header=False, index=False,
+        quoting=csv.QUOTE_NONNUMERIC, date_format='%Y-%m-%d %H:%M:%S.%f',
+    )
+    buffer.seek(0)
+    if hasattr(cursor, 'copy_expert'):
+        cursor.copy_expert(sql, buffer)
+    else:
+        cursor.execute(sql, stream=buffer)
+
+
+def copy_orders(frame: pd.DataFrame, replace_stores: Optional[List[str]] = None,
+                chunk_rows: int = COPY_CHUNK_ROWS) -> Dict[str, int]:
+    """
+    prepare_orders 的结果写入 orders 表（一个事务），提交后通知数据变更
+
+    Args:
+        replace_stores: 写入前删除这些门店的全部订单（同一事务）
+
+    Returns:
+        替换模式删除的 门店 → 行数
+    """
+    sql = (
+        f"COPY orders ({', '.join(COPY_COLUMNS)}) FROM STDIN "
+        f"WITH (FORMAT csv, FORCE_NULL (store_franchise_type))"
+    )
+    deleted = {}
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        for store_name in replace_stores or []:
+            cursor.execute("DELETE FROM orders WHERE store_name = %s", (store_name,))
+            deleted[store_name] = cursor.rowcount
+        for start in range(0, len(frame), chunk_rows):
+            _copy_chunk(cursor, sql, frame.iloc[start:start + chunk_rows])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    changed = frame['store_name'].unique().tolist()
+    notify_orders_changed(changed=changed, removed=[s for s in deleted if s not in changed])
+    return deleted
+
+
+def import_orders_frame(df: pd.DataFrame, default_store: Optional[str] = None,
+                        replace_stores: Optional[List[str]] = None,
+                        date_columns: List[str] = DATE_COLUMNS,
+                        date_fallback: bool = True) -> ImportResult:
+    """
+    订单明细导入 orders 表：向量化映射 + COPY
+
+    Args:
+        df: 标准化后的订单明细
+        default_store: 门店名称为空时写入的值（None 写 '未知门店'）
+        replace_stores: 替换模式下需要先删除旧数据的门店
+        date_columns / date_fallback: 日期列优先级，见 parse_order_dates
+
+    Returns:
+        ImportResult（写入/跳过行数、删除行数、写入的门店日期、耗时、行/秒）
+    """
+    start = time.perf_counter()
+    frame, skipped = prepare_orders(df, default_store, date_columns, date_fallback)
+    deleted = copy_orders(frame, replace_stores)
+    result = ImportResult(
+        rows=len(df), inserted=len(frame), skipped=skipped, deleted=deleted,
+        dirty_days=written_days(frame),
+        seconds=time.perf_counter() - start,
+    )
+    for store_name, count in deleted.items():
+        if count > 0:
+            print(f"   🗑️ 删除 {store_name}: {count:,} 条")
+    print(f"   ⚡ COPY 导入 {result.inserted:,} 行（跳过 {result.skipped:,}），"
+          f"{result.seconds:.1f}s，{result.rows_per_second:,.0f} 行/秒")
+    return result
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+订单数据变更通知（orders 表写入/删除提交后调用）
+
+看板各层缓存都以“数据版本”判断是否过期：
+- Redis 订单缓存、各worker共享快照（order_snapshot_service）、谓词结果缓存
+- 订单级事实表（order_facts_service，manifest 记录每个门店的版本）
+- Parquet 过期日期缓存（order_loader_service）
+
+数据版本优先取 Redis 全局版本号（Generation Clock），只在这里自增。
+因此所有修改 orders 的入口提交后都必须调用 notify_orders_changed：
+- 订单导入管道 import_orders_frame（批量导入、看板上传、智能导入共用，提交后自动调用）
+- 看板删除门店、数据生命周期清理（DataLifecycleManager）、Dash 上传
+
+Redis 不可用时数据版本退回数据库 MAX(updated_at)，写入即变化，无需自增。
+
+用法：
+    from database.order_changes import notify_orders_changed
+    notify_orders_changed(changed=['门店A'])          # 门店A 仍有数据（新增/替换/部分删除）
+    notify_orders_changed(removed=['门店B'])          # 门店B 的订单已全部删除
+"""
+
+import sys
+from pathlib import Path
+from typing import Iterable, Optional
+
+PROJECT_ROOT = Path(__file__).parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def _redis_manager():
+    """已启用的全局 Redis 缓存管理器（不可用时返回None）"""
+    try:
+        from redis_cache_manager import REDIS_CACHE_MANAGER
+    except Exception:
+        return None
+    if REDIS_CACHE_MANAGER and REDIS_CACHE_MANAGER.enabled:
+        return REDIS_CACHE_MANAGER
+    return None
+
+
+def get_data_version(store_name: Optional[str] = None) -> str:
+    """
+    当前订单数据版本
+
+    优先使用 Redis 全局版本号（任何写入后自增）；
+    Redis 不可用时退回数据库 MAX(updated_at)（可按门店，精确到微秒：同一秒内的两次写入也能区分）
+    """
+    manager = _redis_manager()
+    if manager is not None:
+        return manager.get_global_version()
+
+    from sqlalchemy import func
+    from database.connection import SessionLocal
+    from database.models import Order
+
+    session = SessionLocal()
+    try:
+        query = session.query(func.max(Order.updated_at))
+        if store_name:
+            query = query.filter(Order.store_name == store_name)
+        last_updated = query.scalar()
+        if last_updated:
+            return last_updated.strftime("%Y%m%d%H%M%S%f")
+        return "0"
+    except Exception as e:
+        print(f"⚠️ 获取数据版本失败: {e}")
+        return "0"
+    finally:
+        session.close()
+
+
+def bump_data_version() -> Optional[str]:
+    """Redis 全局数据版本号自增（Redis 不可用时返回None）"""
+    manager = _redis_manager()
+    if manager is None:
+        return None
+    return manager.bump_global_version()
+
+
+def _order_facts_service():
+    """订单事实表服务（API 进程内为 app.services 包，脚本/Dash 进程经 backend 包导入）"""
+    try:
+        from app.services.order_facts_service import order_facts_service
+    except ImportError:
+        from backend.app.services.order_facts_service import order_facts_service
+    return order_facts_service
+
+
+def invalidate_order_facts(changed: Iterable[str] = (), removed: Iterable[str] = (),
+                           version: Optional[str] = None):
+    """
+    使受影响门店的订单事实表失效，其余门店沿用到新版本
+
+    changed 门店的事实表删除后，manifest 标记为不完整：
+    下一次按门店/全量读取时回退到实时计算，并只补建缺失的门店。
+    removed 门店已无数据，删除事实表即可，全量视图仍然完整。
+    """
+    changed = [s for s in dict.fromkeys(changed) if s]
+    removed = [s for s in dict.fromkeys(removed) if s and s not in changed]
+    try:
+        service = _order_facts_service()
+        service.remove(changed + removed)
+        service.carry_forward(version or get_data_version(), complete=False if changed else None)
+    except Exception as e:
+        print(f"⚠️ 订单事实表失效处理失败: {e}")
+
+
+def notify_orders_changed(changed: Iterable[str] = (), removed: Iterable[str] = ()) -> str:
+    """
+    orders 表写入/删除提交后调用：自增数据版本，使受影响门店的订单事实表失效
+
+    Args:
+        changed: 写入或部分删除了订单的门店（仍有数据）
+        removed: 订单已全部删除的门店
+
+    Returns:
+        新的数据版本
+    """
+    changed = list(changed)
+    removed = list(removed)
+    version = bump_data_version() or get_data_version()
+    invalidate_order_facts(changed, removed, version)
+    return version
@@ -31,6 +31,8 @@ from typing import Any, Optional, Dict, List, Tuple
 import logging
 from collections import defaultdict
 
+from cache_utils import encode_dataframe, decode_dataframe, is_encoded_dataframe
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -129,6 +131,9 @@ class HierarchicalCacheManager:
         """压缩数据"""
         if not self.enable_compression:
             return data
+        if is_encoded_dataframe(data):
+            # Arrow IPC 已内置 zstd/lz4 压缩，无需再gzip
+            return data
         return gzip.compress(data, compresslevel=6)
     
     def _decompress(self, data: bytes) -> bytes:
@@ -144,11 +149,8 @@ class HierarchicalCacheManager:
     def _serialize(self, value: Any) -> bytes:
         """序列化数据"""
         if isinstance(value, pd.DataFrame):
-            # DataFrame特殊处理（更紧凑）
-            return pickle.dumps({
-                'type': 'dataframe',
-                'data': value.to_dict('tight'),  # tight格式更紧凑
-            }, protocol=pickle.HIGHEST_PROTOCOL)
+            # DataFrame使用Arrow IPC二进制编码（保留dtype，字典编码门店/渠道/分类）
+            return encode_dataframe(value)
         else:
             return pickle.dumps({
                 'type': 'generic',
@@ -157,6 +159,8 @@ class HierarchicalCacheManager:
     
     def _deserialize(self, data: bytes) -> Any:
         """反序列化数据"""
+        if is_encoded_dataframe(data):
+            return decode_dataframe(data)
         obj = pickle.loads(data)
         if obj['type'] == 'dataframe':
             return pd.DataFrame.from_dict(obj['data'], orient='tight')
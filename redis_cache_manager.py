@@ -14,6 +14,8 @@ from typing import Any, Optional, Dict, List
 import pandas as pd
 import logging
 
+from cache_utils import encode_dataframe, decode_dataframe, is_encoded_dataframe
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -122,13 +124,8 @@ class RedisCacheManager:
         try:
             # 序列化数据
             if isinstance(value, pd.DataFrame):
-                # DataFrame特殊处理
-                serialized = pickle.dumps({
-                    'type': 'dataframe',
-                    'data': value.to_dict('records'),
-                    'columns': value.columns.tolist(),
-                    'index': value.index.tolist()
-                })
+                # DataFrame使用Arrow IPC二进制编码（保留dtype，体积更小）
+                serialized = encode_dataframe(value)
             else:
                 serialized = pickle.dumps({
                     'type': 'generic',
@@ -170,9 +167,15 @@ class RedisCacheManager:
                 return None
             
             # 反序列化
+            if is_encoded_dataframe(serialized):
+                df = decode_dataframe(serialized)
+                logger.info(f"✅ 缓存命中: {key} (DataFrame {df.shape})")
+                return df
+            
             data_obj = pickle.loads(serialized)
             
             if data_obj['type'] == 'dataframe':
+                # 兼容旧格式（to_dict('records')）
                 # 重建DataFrame
                 df = pd.DataFrame(data_obj['data'], columns=data_obj['columns'])
                 df.index = data_obj['index']
@@ -245,6 +248,49 @@ class RedisCacheManager:
             logger.error(f"❌ 批量删除失败 {pattern}: {e}")
             return 0
     
+    # 全局数据版本号键（Generation Clock：任何写入都会自增）
+    GLOBAL_VERSION_KEY = "o2o_dashboard:global_data_version"
+
+    def get_global_version(self) -> str:
+        """
+        获取全局数据版本号
+
+        版本号只增不减，上传/删除订单数据后自增；
+        各worker据此判断本地缓存/共享快照是否过期。
+
+        Returns:
+            版本号字符串（从未写入过时为 "0"）
+        """
+        if not self.enabled:
+            return "0"
+
+        try:
+            value = self.client.get(self.GLOBAL_VERSION_KEY)
+            if value is None:
+                return "0"
+            return value.decode() if isinstance(value, bytes) else str(value)
+        except Exception as e:
+            logger.error(f"❌ 全局版本号读取失败: {e}")
+            return "0"
+
+    def bump_global_version(self) -> Optional[str]:
+        """
+        全局数据版本号自增（数据写入后调用）
+
+        Returns:
+            新版本号字符串，失败返回None
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            version = str(self.client.incr(self.GLOBAL_VERSION_KEY))
+            logger.info(f"🔢 全局数据版本号已更新: {version}")
+            return version
+        except Exception as e:
+            logger.error(f"❌ 全局版本号更新失败: {e}")
+            return None
+
     def get_stats(self) -> Dict[str, Any]:
         """获取缓存统计信息"""
         if not self.enabled:
@@ -20,6 +20,8 @@ from typing import Any, Optional, Dict, List, Tuple, Callable
 from datetime import datetime, date
 from functools import wraps
 
+from cache_utils import observed_value_counts
+
 from .cache.hierarchical_cache_adapter import OrderDashboardCacheManager, get_cache_manager
 from .cache.cache_keys import CacheKeys
 
@@ -299,7 +301,7 @@ class BaseService:
         if mask is not None:
             df = df[mask]
         
-        return df[channel_col].value_counts().to_dict()
+        return observed_value_counts(df[channel_col]).to_dict()
     
     def clean_for_json(self, obj: Any) -> Any:
         """
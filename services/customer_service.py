@@ -257,7 +257,7 @@ class CustomerService(BaseService):
                 return {'error': '缺少商品名称字段'}
             
             # 获取流失客户的TOP购买商品
-            top_products = churn_history.groupby('商品名称').agg({
+            top_products = churn_history.groupby('商品名称', observed=True).agg({
                 '标准地址': 'nunique',  # 购买客户数
                 '订单ID': 'count' if '订单ID' in churn_history.columns else lambda x: len(x),  # 购买次数
             }).reset_index()
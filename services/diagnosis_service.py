@@ -383,7 +383,7 @@ class DiagnosisService(BaseService):
             sales_col = self.get_sales_column(data)
             
             # 计算每个商品的最后销售日期
-            product_last_sale = data.groupby(group_key).agg({
+            product_last_sale = data.groupby(group_key, observed=True).agg({
                 '商品名称': 'first',
                 date_col: 'max',
                 sales_col: 'sum' if sales_col in data.columns else lambda x: 0,
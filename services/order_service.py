@@ -278,7 +278,7 @@ class OrderService(BaseService):
                 return {'error': '缺少渠道字段'}
             
             # 按渠道聚合
-            channel_stats = data.groupby(channel_col).agg({
+            channel_stats = data.groupby(channel_col, observed=True).agg({
                 '订单ID': 'nunique' if '订单ID' in data.columns else 'count',
                 '实收价格': 'sum' if '实收价格' in data.columns else lambda x: 0,
                 '利润额': 'sum' if '利润额' in data.columns else lambda x: 0,
@@ -116,7 +116,7 @@ class ProductService(BaseService):
             return pd.DataFrame()
         
         # 执行聚合
-        result = day_data.groupby(group_key).agg(**agg_dict).reset_index()
+        result = day_data.groupby(group_key, observed=True).agg(**agg_dict).reset_index()
         
         # 计算毛利率
         if '销售额' in result.columns:
@@ -356,7 +356,7 @@ class ProductService(BaseService):
             if '利润额' in data.columns:
                 agg_dict['利润额'] = ('利润额', 'sum')
             
-            category_stats = data.groupby(category_col).agg(**agg_dict).reset_index()
+            category_stats = data.groupby(category_col, observed=True).agg(**agg_dict).reset_index()
             category_stats.columns = ['分类', '商品数', '销量', '销售额', '利润额'][:len(category_stats.columns)]
             
             # 计算占比
@@ -418,7 +418,7 @@ class ProductService(BaseService):
             # 按商品聚合（取最新库存）
             group_key = self.get_product_group_key(data)
             
-            product_stock = data.groupby(group_key).agg({
+            product_stock = data.groupby(group_key, observed=True).agg({
                 '商品名称': 'first' if group_key != '商品名称' else 'first',
                 stock_col: 'last',  # 取最新库存
                 self.get_sales_column(data): 'sum' if self.get_sales_column(data) in data.columns else lambda x: 0,
@@ -331,7 +331,7 @@ class ReportService(BaseService):
             if '商品采购成本' in data.columns:
                 agg_dict['成本'] = ('商品采购成本', 'sum')
             
-            product_stats = data.groupby(group_key).agg(**agg_dict).reset_index()
+            product_stats = data.groupby(group_key, observed=True).agg(**agg_dict).reset_index()
             
             # 计算毛利率
             if '销售额' in product_stats.columns:
@@ -418,7 +418,7 @@ class ReportService(BaseService):
             sales_col = self.get_sales_column(data)
             
             if sales_col in data.columns:
-                product_stats = data.groupby(group_key).agg({
+                product_stats = data.groupby(group_key, observed=True).agg({
                     sales_col: 'sum',
                     '利润额': 'sum' if '利润额' in data.columns else lambda x: 0,
                 }).reset_index()
@@ -429,7 +429,7 @@ class ReportService(BaseService):
             # 4. 渠道分析
             channel_col = next((c for c in ['平台', '渠道'] if c in order_data.columns), None)
             if channel_col:
-                channel_stats = order_data.groupby(channel_col).agg({
+                channel_stats = order_data.groupby(channel_col, observed=True).agg({
                     '订单ID': 'count',
                     '实收价格': 'sum' if '实收价格' in order_data.columns else lambda x: 0,
                 }).reset_index()
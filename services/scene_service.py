@@ -261,7 +261,7 @@ class SceneService(BaseService):
                 return {'error': '缺少渠道字段'}
             
             # 交叉统计
-            cross_stats = data.groupby(['场景', channel_col]).agg({
+            cross_stats = data.groupby(['场景', channel_col], observed=True).agg({
                 '订单ID': 'count' if '订单ID' in data.columns else lambda x: len(x),
                 '实收价格': 'sum' if '实收价格' in data.columns else lambda x: 0,
             }).reset_index()
@@ -418,7 +418,7 @@ class SceneService(BaseService):
             
             sales_col = self.get_sales_column(scene_data)
             
-            product_stats = scene_data.groupby('商品名称').agg({
+            product_stats = scene_data.groupby('商品名称', observed=True).agg({
                 sales_col: 'sum' if sales_col in scene_data.columns else lambda x: 0,
                 '实收价格': 'sum' if '实收价格' in scene_data.columns else lambda x: 0,
                 '利润额': 'sum' if '利润额' in scene_data.columns else lambda x: 0,
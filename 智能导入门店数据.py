@@ -21,6 +21,7 @@ sys.path.insert(0, project_root)
 
 from database.connection import SessionLocal, init_database
 from database.models import Order
+from database.order_bulk_import import import_orders_frame
 from 真实数据处理器 import RealDataProcessor
 
 # 导入历史记录文件
@@ -216,7 +217,8 @@ class SmartImporter:
             #         print(f"\n2️⃣ 过滤数据: 移除 {filtered_count:,} 条耗材记录")
             print(f"\n2️⃣ ✅ 保留耗材数据 (包含购物袋等成本)")
             
-            # 3. 检查是否已存在该门店数据
+            # 3. 检查是否已存在该门店数据（删除与写入在同一事务中完成）
+            replace_stores = None
             if '门店名称' in df.columns:
                 store_name = df['门店名称'].iloc[0]
                 existing = self.session.query(Order).filter(
@@ -225,89 +227,19 @@ class SmartImporter:
                 
                 if existing:
                     print(f"\n⚠️  检测到门店 '{store_name}' 已存在数据")
-                    print("   🔄 自动覆盖模式: 正在删除旧数据...")
-                    
-                    # 删除旧数据
-                    self.session.query(Order).filter(
-                        Order.store_name == store_name
-                    ).delete()
-                    self.session.commit()
-            
-            # 4. 导入数据（批量插入优化）
-            print(f"\n3️⃣ 导入数据（批量模式）...")
-            success_count = 0
-            error_count = 0
-            field_errors = {}  # 记录字段错误
-            batch_size = 5000  # 批量大小
-            batch_orders = []
-            
-            start_time = datetime.now()
-            
-            for idx, row in df.iterrows():
-                try:
-                    order_data = self.map_row_to_order(row)
-                    batch_orders.append(order_data)
-                    success_count += 1
-                    
-                    # 每batch_size条批量插入一次
-                    if len(batch_orders) >= batch_size:
-                        try:
-                            self.session.bulk_insert_mappings(Order, batch_orders)
-                            self.session.commit()
-                            batch_orders = []
-                        except Exception as batch_error:
-                            self.session.rollback()
-                            print(f"\n   ⚠️ 批量插入失败（可能有重复订单ID），尝试逐条插入...")
-                            # 逐条插入，跳过重复的
-                            for order in batch_orders:
-                                try:
-                                    self.session.execute(
-                                        Order.__table__.insert().values(**order)
-                                    )
-                                    self.session.commit()
-                                except:
-                                    self.session.rollback()
-                                    success_count -= 1
-                                    error_count += 1
-                            batch_orders = []
-                        
-                        # 计算进度和预估时间
-                        elapsed = (datetime.now() - start_time).total_seconds()
-                        speed = success_count / elapsed if elapsed > 0 else 0
-                        remaining = (len(df) - success_count) / speed if speed > 0 else 0
-                        
-                        print(f"   进度: {success_count:,}/{len(df):,} ({success_count/len(df)*100:.1f}%) | "
-                              f"速度: {speed:.0f}行/秒 | "
-                              f"预计剩余: {int(remaining)}秒", end='\r')
-                
-                except Exception as e:
-                    error_count += 1
-                    error_msg = str(e)
-                    field_errors[error_msg] = field_errors.get(error_msg, 0) + 1
-                    
-                    if error_count <= 3:
-                        print(f"\n   ⚠️  第{idx+1}行失败: {e}")
+                    print("   🔄 自动覆盖模式: 导入时替换旧数据...")
+                    replace_stores = [store_name]
             
-            # 插入剩余数据
-            if batch_orders:
-                try:
-                    self.session.bulk_insert_mappings(Order, batch_orders)
-                    self.session.commit()
-                except Exception as e:
-                    self.session.rollback()
-                    print(f"\n   ⚠️ 最后一批数据插入失败: {e}")
-                    error_count += len(batch_orders)
+            # 4. 导入数据（向量化映射 + COPY）
+            print(f"\n3️⃣ 导入数据（COPY 模式）...")
+            result = import_orders_frame(df, default_store='', replace_stores=replace_stores)
+            success_count = result.inserted
+            error_count = result.skipped
             
-            total_time = (datetime.now() - start_time).total_seconds()
-            print(f"\n   ⏱️  总耗时: {total_time:.1f}秒 | 平均速度: {success_count/total_time if total_time > 0 else 0:.0f}行/秒")
-            
-            print(f"\n\n4️⃣ 导入结果:")
+            print(f"\n4️⃣ 导入结果:")
             print(f"   ✅ 成功: {success_count:,}/{len(df):,} ({success_count/len(df)*100:.1f}%)")
             if error_count > 0:
-                print(f"   ❌ 失败: {error_count:,}")
-                print(f"\n   失败原因统计:")
-                for error, count in field_errors.items():
-                    print(f"     • {error}: {count}次")
+                print(f"   ⚠️ 跳过: {error_count:,}（订单ID为空或日期无效）")
             
             # 6. 数据完整性校验
             self.validate_imported_data(file_path, df, success_count)
@@ -332,76 +264,6 @@ class SmartImporter:
             traceback.print_exc()
             return False
     
-    def map_row_to_order(self, row):
-        """映射Excel行到Order对象"""
-        # ✅ 智能识别日期字段
-        order_date = None
-        for date_field in ['下单时间', '日期', '订单时间', '时间', 'date', 'order_date']:
-            if date_field in row.index and pd.notna(row.get(date_field)):
-                try:
-                    order_date = pd.to_datetime(row.get(date_field))
-                    break
-                except:
-                    continue
-        
-        # 如果没有找到有效日期，使用当前时间并记录警告
-        if order_date is None:
-            order_date = datetime.now()
-            if not hasattr(self, '_date_warning_shown'):
-                print(f"⚠️  警告: 未找到有效日期字段，使用当前时间")
-                self._date_warning_shown = True
-        
-        return {
-            'order_id': str(row.get('订单ID', '')),
-            'order_number': str(row.get('订单编号', '')),  # ✅ 新增订单编号字段映射
-            'date': order_date,
-            'store_name': str(row.get('门店名称', '')),
-            # ✅ 移除了store_id字段(Order模型中不存在)
-            'product_name': str(row.get('商品名称', '')),
-            'barcode': str(row.get('条码', '')),
-            # ✅ 添加店内码字段映射
-            'store_code': str(row.get('店内码', '')) if pd.notna(row.get('店内码')) else '',
-            'price': float(row.get('商品实售价', 0)),
-            'original_price': float(row.get('商品原价', 0)),
-            'quantity': int(row.get('销量', row.get('月售', 0))), # 兼容标准化后的'月售'
-            'cost': float(row.get('成本', row.get('商品采购成本', 0))) if pd.notna(row.get('成本', row.get('商品采购成本'))) else 0.0,
-            'profit': float(row.get('利润额', 0)) if pd.notna(row.get('利润额')) else 0.0,
-            'category_level1': str(row.get('一级分类名', '')),
-            'category_level3': str(row.get('三级分类名', '')),
-            'barcode': str(row.get('条码', '')),
-            # ✅ 添加剩余库存字段映射
-            'remaining_stock': float(row.get('剩余库存', row.get('库存', 0))) if pd.notna(row.get('剩余库存', row.get('库存'))) else 0.0,
-            'delivery_fee': float(row.get('物流配送费', 0)) if pd.notna(row.get('物流配送费')) else 0.0,
-            'commission': float(row.get('平台佣金', 0)) if pd.notna(row.get('平台佣金')) else 0.0,
-            'platform_service_fee': float(row.get('平台服务费', 0)) if pd.notna(row.get('平台服务费')) else 0.0,  # 修复:添加平台服务费字段映射
-            'user_paid_delivery_fee': float(row.get('用户支付配送费', 0)) if pd.notna(row.get('用户支付配送费')) else 0.0,
-            'delivery_discount': float(row.get('配送费减免金额', 0)) if pd.notna(row.get('配送费减免金额')) else 0.0,
-            'full_reduction': float(row.get('满减金额', 0)) if pd.notna(row.get('满减金额')) else 0.0,
-            'product_discount': float(row.get('商品减免金额', 0)) if pd.notna(row.get('商品减免金额')) else 0.0,
-            'merchant_voucher': float(row.get('商家代金券', 0)) if pd.notna(row.get('商家代金券')) else 0.0,
-            'merchant_share': float(row.get('商家承担部分券', 0)) if pd.notna(row.get('商家承担部分券')) else 0.0,
-            'packaging_fee': float(row.get('打包袋金额', 0)) if pd.notna(row.get('打包袋金额')) else 0.0,
-            # ✅ 新增营销维度字段
-            'gift_amount': float(row.get('满赠金额', 0)) if pd.notna(row.get('满赠金额')) else 0.0,
-            'other_merchant_discount': float(row.get('商家其他优惠', 0)) if pd.notna(row.get('商家其他优惠')) else 0.0,
-            'new_customer_discount': float(row.get('新客减免金额', 0)) if pd.notna(row.get('新客减免金额')) else 0.0,
-            # ✅ 新增利润维度字段
-            'corporate_rebate': float(row.get('企客后返', 0)) if pd.notna(row.get('企客后返')) else 0.0,
-            # ✅ 配送平台字段
-            'delivery_platform': str(row.get('配送平台', '')),
-            # ✅ 恢复delivery_distance和city字段映射 (Order模型已支持)
-            'delivery_distance': float(row.get('配送距离', row.get('distance', row.get('距离', 0)))) if pd.notna(row.get('配送距离', row.get('distance', row.get('距离')))) else 0.0,
-            'city': str(row.get('城市', '')),
-            'store_id': str(row.get('门店ID', '')),
-            'store_franchise_type': int(row.get('门店加盟类型', 0)) if pd.notna(row.get('门店加盟类型')) else None,
-            
-            'address': str(row.get('收货地址', '')),
-            'channel': str(row.get('渠道', '')),
-            'actual_price': float(row.get('实收价格', 0)) if pd.notna(row.get('实收价格')) else 0.0,
-            # ✅ 修复: 存储"预计订单收入"而不是"订单零售额"(与migrate.py保持一致)
-            'amount': float(row.get('预计订单收入', row.get('订单零售额', 0))) if pd.notna(row.get('预计订单收入', row.get('订单零售额', 0))) else 0.0,
-        }
-    
     def validate_imported_data(self, file_path, df_source, imported_count):
         """验证导入数据的完整性"""
         print(f"\n5️⃣ 数据完整性校验...")
@@ -322,9 +322,17 @@ from cache_utils import (
     save_dataframe_compressed,
     load_dataframe_compressed,
     get_cache_metadata,
-    cleanup_old_caches
+    cleanup_old_caches,
+    shared_view,
+    enable_copy_on_write,
+    encode_categorical_columns,
+    safe_fillna,
+    observed_value_counts
 )
 
+# GLOBAL_DATA 以Copy-on-Write视图共享给各回调（pandas 2.x 需显式开启）
+enable_copy_on_write()
+
 # ✨ 导入Redis缓存管理器（多用户缓存共享）
 # 🔴 默认禁用以提升启动速度,如需启用请修改下方ENABLE_REDIS=True
 ENABLE_REDIS = True  
@@ -751,29 +759,30 @@ DATA_SOURCE_MANAGER = None  # 数据源管理器实例
 # ================================================================================
 def optimize_dataframe_dtypes(df):
     """
-    优化DataFrame数据类型，减少内存占用（仅数值类型）
+    优化DataFrame数据类型，减少内存占用
     
-    🔧 优化策略（v2.0 - 安全版本）:
+    🔧 优化策略（v3.0）:
     1. int64 → int32/int16 (根据数值范围自动选择)
     2. float64 → float32 (精度足够O2O业务，误差<0.01元)
-    3. ❌ 不转换category类型（避免与fillna()冲突）
+    3. 门店/渠道/分类/商品名称 → category（cache_utils.encode_categorical_columns）
     
     🛡️ 安全保障:
-    - 只优化数值类型，不触碰object/string类型
     - 精度验证：float32可精确表示0.01元级别
-    - 避免category类型导致的fillna/replace冲突
+    - 分类列的 fillna 使用 safe_fillna，value_counts 使用 observed_value_counts，
+      groupby 显式传 observed=True
+    - ORDER_CATEGORICAL_ENCODING=0 时不做分类编码
     
     Args:
         df: 原始DataFrame
         
     Returns:
-        优化后的DataFrame (in-place修改)
+        优化后的DataFrame（数值列原地降精度；分类编码返回新对象）
     """
     if df is None or df.empty:
         return df
     
     print("\n" + "="*80, flush=True)
-    print("🔧 数据类型优化（v2.0安全版 - 仅数值类型）", flush=True)
+    print("🔧 数据类型优化（v3.0 - 数值降精度 + 分类编码）", flush=True)
     print("="*80, flush=True)
     
     # 记录优化前内存
@@ -796,8 +805,10 @@ def optimize_dataframe_dtypes(df):
             df[col] = pd.to_numeric(df[col], downcast='float')
             optimized_cols['float'].append(col)
         
-        # ❌ 3. 不转换category类型（避免fillna冲突）
-        # 之前因为category类型导致内存飙升99%
+    
+    # 3. 重复字符串列分类编码
+    df = encode_categorical_columns(df)
+    category_cols = df.select_dtypes(include=['category']).columns.tolist()
     
     # 记录优化后内存
     mem_after = df.memory_usage(deep=True).sum() / 1024 / 1024
@@ -807,17 +818,12 @@ def optimize_dataframe_dtypes(df):
     print(f"✅ 优化完成:")
     print(f"   整数列优化: {len(optimized_cols['int'])} 列", flush=True)
     print(f"   浮点列优化: {len(optimized_cols['float'])} 列", flush=True)
+    print(f"   分类编码: {len(category_cols)} 列 {category_cols}", flush=True)
     print(f"   优化前内存: {mem_before:.1f} MB", flush=True)
     print(f"   优化后内存: {mem_after:.1f} MB", flush=True)
     print(f"   节省内存: {mem_saved:.1f} MB ({saved_pct:.1f}%)", flush=True)
     print("="*80 + "\n", flush=True)
     
-    # 🔍 自检验证：确保没有category类型
-    category_cols = df.select_dtypes(include=['category']).columns.tolist()
-    if category_cols:
-        print(f"⚠️ 警告：发现{len(category_cols)}个category列，可能导致问题", flush=True)
-        print(f"   列名: {category_cols[:5]}", flush=True)
-    
     return df
 
 # ✅ Redis缓存管理器实例（多用户共享）
@@ -1437,18 +1443,18 @@ def initialize_ai_tools():
 
 
 def get_active_dataframe(data_scope: str, diagnostic_records: Optional[List[Dict[str, Any]]]) -> Optional[pd.DataFrame]:
-    """根据用户选择返回副本数据，用于AI分析"""
+    """根据用户选择返回数据视图（Copy-on-Write，修改不影响GLOBAL_DATA），用于AI分析"""
     if data_scope == 'diagnostic' and diagnostic_records:
         try:
             df = pd.DataFrame(diagnostic_records)
             if not df.empty:
-                return df.copy()
+                return df
         except Exception as exc:
             print(f"⚠️ 将诊断记录转换为DataFrame失败: {exc}")
 
     if GLOBAL_DATA is None or GLOBAL_DATA.empty:
         return None
-    return GLOBAL_DATA.copy()
+    return shared_view(GLOBAL_DATA)
 
 
 def build_business_summary(df: Optional[pd.DataFrame]) -> Dict[str, Any]:
@@ -2309,7 +2315,7 @@ def calculate_channel_comparison(df: pd.DataFrame, order_agg: pd.DataFrame,
             if col not in current_filtered.columns and col != '订单ID':
                 current_filtered[col] = 0
                 
-        current_metrics = current_filtered.groupby('渠道').agg(agg_dict).reset_index()
+        current_metrics = current_filtered.groupby('渠道', observed=True).agg(agg_dict).reset_index()
         
         # 重命名和计算衍生指标
         current_metrics = current_metrics.rename(columns={
@@ -2427,7 +2433,7 @@ def calculate_channel_comparison(df: pd.DataFrame, order_agg: pd.DataFrame,
                 if col not in order_metrics.columns and col != '订单ID':
                     order_metrics[col] = 0
             
-            channel_metrics = order_metrics.groupby('渠道').agg(agg_dict).reset_index()
+            channel_metrics = order_metrics.groupby('渠道', observed=True).agg(agg_dict).reset_index()
             
             # 重命名和计算衍生指标
             channel_metrics = channel_metrics.rename(columns={
@@ -3591,7 +3597,7 @@ def _create_channel_comparison_cards(df: pd.DataFrame, order_agg: pd.DataFrame,
         if '商品减免金额' in order_agg_filtered.columns:
             agg_dict['商品减免金额'] = 'sum'
             
-        channel_stats = order_agg_filtered.groupby('渠道').agg(agg_dict).reset_index()
+        channel_stats = order_agg_filtered.groupby('渠道', observed=True).agg(agg_dict).reset_index()
         
         # 重命名列以匹配后续逻辑
         rename_dict = {
@@ -3620,7 +3626,7 @@ def _create_channel_comparison_cards(df: pd.DataFrame, order_agg: pd.DataFrame,
             channel_stats['商品减免'] = 0
 
         if '平台服务费' in order_agg_filtered.columns:
-            platform_fee_stats = order_agg_filtered.groupby('渠道')['平台服务费'].sum().reset_index()
+            platform_fee_stats = order_agg_filtered.groupby('渠道', observed=True)['平台服务费'].sum().reset_index()
             channel_stats = channel_stats.merge(platform_fee_stats, on='渠道', how='left')
             channel_stats['平台服务费'] = channel_stats['平台服务费'].fillna(0)
         else:
@@ -5067,7 +5073,7 @@ def _create_aov_analysis(df: pd.DataFrame, order_agg: pd.DataFrame, selected_cha
                                                 html.Br(),
                                                 html.Small("最高客单价渠道", className="text-muted")
                                             ], className="small mb-0")
-                                            if '渠道' in order_agg.columns and len(channel_avg := order_agg.groupby('渠道')['客单价'].mean()) > 0
+                                            if '渠道' in order_agg.columns and len(channel_avg := order_agg.groupby('渠道', observed=True)['客单价'].mean()) > 0
                                             else html.P("渠道数据不可用", className="small text-muted")
                                         ))()
                                     ])
@@ -5318,7 +5324,7 @@ def _create_health_warnings(total_sales: float, total_profit: float, order_agg:
                 if '月售' in df.columns:
                     agg_dict['月售'] = 'sum'
                     
-                product_stats = df.groupby('商品名称').agg(agg_dict).reset_index()
+                product_stats = df.groupby('商品名称', observed=True).agg(agg_dict).reset_index()
                 
                 # 计算毛利率
                 product_stats['毛利率'] = (
@@ -7212,6 +7218,14 @@ def upload_data_to_database(list_of_contents, list_of_names, list_of_dates):
         
         print("✅ 缓存已清除")
         
+        # 通知数据变更：全局数据版本号自增，API 端订单缓存/共享快照/订单事实表随之失效
+        if uploaded_stores:
+            try:
+                from database.order_changes import notify_orders_changed
+                notify_orders_changed(changed=set(uploaded_stores))
+            except Exception as e:
+                print(f"⚠️ 数据变更通知失败: {e}")
+        
         # ===== 6. 自动加载第一个上传的门店数据 =====
         if uploaded_stores and all_results[0]['status'] == 'success':
             first_store = uploaded_stores[0]
@@ -8364,7 +8378,7 @@ def update_category_loss_chart(data):
     
     # 按分类汇总收入损失
     try:
-        category_loss = df.groupby('一级分类名').agg({
+        category_loss = df.groupby('一级分类名', observed=True).agg({
             '收入变化': 'sum',
             '商品名称': 'count'
         }).reset_index()
@@ -8880,8 +8894,8 @@ def update_category_treemap_chart(data):
             treemap_df['变化幅度%'] = -50  # 默认值
     
     # 填充缺失值
-    treemap_df['一级分类名'] = treemap_df['一级分类名'].fillna('未分类')
-    treemap_df['三级分类名'] = treemap_df['三级分类名'].fillna('其他')
+    treemap_df['一级分类名'] = safe_fillna(treemap_df['一级分类名'], '未分类')
+    treemap_df['三级分类名'] = safe_fillna(treemap_df['三级分类名'], '其他')
     
     # 创建树状图
     fig = px.treemap(
@@ -9600,7 +9614,7 @@ def create_category_cost_chart_echarts(df):
         return html.Div("⚠️ 缺少必要字段", className="text-center text-muted p-5")
     
     # 按一级分类统计商品成本
-    category_cost = df.groupby('一级分类名').agg({
+    category_cost = df.groupby('一级分类名', observed=True).agg({
         '商品采购成本': 'sum',
         '商品名称': 'count'
     }).reset_index()
@@ -9747,7 +9761,7 @@ def create_category_cost_chart(df):
         )
     
     # 按一级分类统计商品成本
-    category_cost = df.groupby('一级分类名').agg({
+    category_cost = df.groupby('一级分类名', observed=True).agg({
         '商品采购成本': 'sum',
         '商品名称': 'count'  # 统计商品数量
     }).reset_index()
@@ -10247,7 +10261,7 @@ def calculate_daily_sales_with_channel(df, order_agg, selected_channel='all'):
     if '日期' in df.columns:
         # 🔍 检查order_agg中渠道分布(merge前)
         if channel_available and '渠道' in order_agg.columns:
-            channel_dist_before = order_agg['渠道'].value_counts()
+            channel_dist_before = observed_value_counts(order_agg['渠道'])
             print(f"   📊 [Merge前] order_agg渠道分布:")
             for ch, cnt in channel_dist_before.items():
                 print(f"      {ch}: {cnt} 订单")
@@ -10268,7 +10282,7 @@ def calculate_daily_sales_with_channel(df, order_agg, selected_channel='all'):
         
         # 🔍 检查渠道分布(merge后)
         if channel_available and '渠道' in order_agg_with_info.columns:
-            channel_dist = order_agg_with_info['渠道'].value_counts()
+            channel_dist = observed_value_counts(order_agg_with_info['渠道'])
             print(f"   📊 [Merge后] 渠道分布:")
             for ch, cnt in channel_dist.items():
                 print(f"      {ch}: {cnt} 订单")
@@ -10373,7 +10387,7 @@ def analyze_channel_health_warnings(df, order_agg):
     order_agg_with_info = order_agg.merge(date_map, on='订单ID', how='left')
     
     # 按渠道+日期聚合
-    channel_daily = order_agg_with_info.groupby(['渠道', '日期']).agg({
+    channel_daily = order_agg_with_info.groupby(['渠道', '日期'], observed=True).agg({
         '实收价格': 'sum',
         '订单实际利润': 'sum'
     }).reset_index()
@@ -10744,7 +10758,7 @@ def analyze_daily_anomalies(df, daily_sales):
             '实收价格': 'sum'
         }
         
-        product_analysis = day_df.groupby('商品名称').agg(product_agg_dict).reset_index()
+        product_analysis = day_df.groupby('商品名称', observed=True).agg(product_agg_dict).reset_index()
         
         # 计算商品利润率
         product_analysis['商品利润率'] = (
@@ -11298,7 +11312,7 @@ def create_category_trend_chart_echarts(df, order_agg, selected_channel='all'):
         agg_dict['实收价格'] = 'sum'
     
     # 按分类聚合
-    category_stats = order_agg_with_category.groupby('一级分类名').agg(agg_dict).reset_index()
+    category_stats = order_agg_with_category.groupby('一级分类名', observed=True).agg(agg_dict).reset_index()
     
     # 🔍 调试：查看聚合后的数据
     print(f"\n🔍 [一级分类聚合] 聚合后数据 (前5行):")
@@ -11357,7 +11371,7 @@ def create_category_trend_chart_echarts(df, order_agg, selected_channel='all'):
         })
         
         # 添加分类信息
-        product_category_map = df.groupby('商品名称')['一级分类名'].first().to_dict()
+        product_category_map = df.groupby('商品名称', observed=True)['一级分类名'].first().to_dict()
         last_stock['一级分类名'] = last_stock['商品名称'].map(product_category_map)
     else:
         # 如果没有库存字段,创建空DataFrame
@@ -11384,7 +11398,7 @@ def create_category_trend_chart_echarts(df, order_agg, selected_channel='all'):
         # 按分类统计售罄品数量
         if len(sellout_products) > 0:
             sellout_df = df[df['商品名称'].isin(sellout_products)][['一级分类名', '商品名称']].drop_duplicates()
-            sellout_count = sellout_df.groupby('一级分类名').size().reset_index()
+            sellout_count = sellout_df.groupby('一级分类名', observed=True).size().reset_index()
             sellout_count.columns = ['分类', '售罄品数']
             category_stats = category_stats.merge(sellout_count, on='分类', how='left')
         else:
@@ -11399,7 +11413,7 @@ def create_category_trend_chart_echarts(df, order_agg, selected_channel='all'):
     # 只有当同时有日期和库存字段时才计算
     if required_fields['日期'] and required_fields['库存'] and stock_col:
         # 计算每个商品的最后销售日期
-        product_last_sale = df.groupby('商品名称')['日期'].max().reset_index() if '日期' in df.columns else df.groupby('商品名称')['下单时间'].max().reset_index()
+        product_last_sale = df.groupby('商品名称', observed=True)['日期'].max().reset_index() if '日期' in df.columns else df.groupby('商品名称', observed=True)['下单时间'].max().reset_index()
         product_last_sale.columns = ['商品名称', '最后销售日期']
         
         # 计算滞销天数
@@ -11421,7 +11435,7 @@ def create_category_trend_chart_echarts(df, order_agg, selected_channel='all'):
         product_stagnant['超重度滞销'] = ((product_stagnant['滞销天数'] > 30) & (product_stagnant['库存'] > 0)).astype(int)
         
         # 按分类汇总滞销品数量
-        stagnant_stats = product_stagnant.groupby('一级分类名').agg({
+        stagnant_stats = product_stagnant.groupby('一级分类名', observed=True).agg({
             '轻度滞销': 'sum',
             '中度滞销': 'sum',
             '重度滞销': 'sum',
@@ -11445,13 +11459,13 @@ def create_category_trend_chart_echarts(df, order_agg, selected_channel='all'):
         date_range_days = (df['日期'].max() - df['日期'].min()).days + 1 if '日期' in df.columns else (df['下单时间'].max() - df['下单时间'].min()).days + 1
         
         # 按分类统计总销量
-        category_quantity = df.groupby('一级分类名')['月售'].sum().reset_index()
+        category_quantity = df.groupby('一级分类名', observed=True)['月售'].sum().reset_index()
         category_quantity.columns = ['分类', '总销量']
         category_stats = category_stats.merge(category_quantity, on='分类', how='left')
         category_stats['总销量'] = category_stats['总销量'].fillna(0)
         
         # 按分类统计当前库存（使用统一的库存字段名）
-        category_stock = last_stock.groupby('一级分类名')[stock_col].sum().reset_index()
+        category_stock = last_stock.groupby('一级分类名', observed=True)[stock_col].sum().reset_index()
         category_stock.columns = ['分类', '当前库存']
         category_stats = category_stats.merge(category_stock, on='分类', how='left')
         category_stats['当前库存'] = category_stats['当前库存'].fillna(0)
@@ -11462,7 +11476,7 @@ def create_category_trend_chart_echarts(df, order_agg, selected_channel='all'):
     else:
         # 缺少必需字段,无法计算库存周转
         if '月售' in df.columns:
-            category_quantity = df.groupby('一级分类名')['月售'].sum().reset_index()
+            category_quantity = df.groupby('一级分类名', observed=True)['月售'].sum().reset_index()
             category_quantity.columns = ['分类', '总销量']
             category_stats = category_stats.merge(category_quantity, on='分类', how='left')
             category_stats['总销量'] = category_stats['总销量'].fillna(0)
@@ -12060,7 +12074,7 @@ def get_product_latest_stock(df, stock_col='库存', date_col='日期'):
             actual_date_col = '下单时间'
         else:
             print(f"⚠️ [get_product_latest_stock] 未找到日期字段，使用最后一条记录的库存")
-            return df.groupby('商品名称')[stock_col].last().to_dict()
+            return df.groupby('商品名称', observed=True)[stock_col].last().to_dict()
     
     # 确保日期格式正确
     df = df.copy()
@@ -12071,7 +12085,7 @@ def get_product_latest_stock(df, stock_col='库存', date_col='日期'):
     
     # 步骤2: 获取每个商品在最新日期的库存
     last_day_data = df[df[actual_date_col] == max_date]
-    last_day_stock_map = last_day_data.groupby('商品名称')[stock_col].last().to_dict()
+    last_day_stock_map = last_day_data.groupby('商品名称', observed=True)[stock_col].last().to_dict()
     
     # 步骤3: 对于最新日期没有销售记录的商品，取其最后一条记录的库存
     all_products = df['商品名称'].unique()
@@ -12080,7 +12094,7 @@ def get_product_latest_stock(df, stock_col='库存', date_col='日期'):
     if len(products_without_last_day) > 0:
         # 按日期排序后取每个商品的最后一条记录
         sorted_df = df.sort_values(actual_date_col)
-        last_records = sorted_df.groupby('商品名称')[stock_col].last()
+        last_records = sorted_df.groupby('商品名称', observed=True)[stock_col].last()
         
         for product in products_without_last_day:
             if product in last_records.index:
@@ -12266,7 +12280,7 @@ def calculate_order_metrics(df, calc_mode: Optional[str] = None):
         print(f"   订单ID样本: {order_agg['订单ID'].head().tolist()}")
         # 🔍 检查渠道字段
         if '渠道' in order_agg.columns:
-            channel_dist = order_agg['渠道'].value_counts()
+            channel_dist = observed_value_counts(order_agg['渠道'])
             print(f"   渠道分布:")
             for ch, cnt in channel_dist.items():
                 print(f"     {ch}: {cnt} 订单")
@@ -12627,7 +12641,7 @@ def calculate_peak_profit_rate(df):
     ).fillna(0)
     
     # 按商品取最大值（高光利润率）
-    peak_rates = df.groupby('商品名称')['实收利润率'].max().round(2)
+    peak_rates = df.groupby('商品名称', observed=True)['实收利润率'].max().round(2)
     
     print(f"✅ [高光利润率] 计算完成，平均高光利润率: {peak_rates.mean():.2f}%")
     
@@ -12741,7 +12755,7 @@ def prepare_pricing_data_v3(df, scenario='loss'):
     if '商品减免金额' in df_with_marketing.columns:
         agg_dict['商品减免金额'] = 'first'  # 订单级字段
     
-    product_df = df_with_marketing.groupby('商品名称').agg(agg_dict).reset_index()
+    product_df = df_with_marketing.groupby('商品名称', observed=True).agg(agg_dict).reset_index()
     
     # Step 3: 计算单品成本
     product_df['单品成本'] = (product_df[cost_col] / product_df[sales_col].replace(0, 1)).round(2)
@@ -13808,7 +13822,7 @@ def export_tab1_order_report(n_clicks, cached_agg, cached_comparison):
                     agg_dict['订单总收入'] = 'sum'
                 if '订单实际利润' in channel_data.columns:
                     agg_dict['订单实际利润'] = 'sum'
-                channel_stats = channel_data.groupby('渠道').agg(agg_dict).reset_index()
+                channel_stats = channel_data.groupby('渠道', observed=True).agg(agg_dict).reset_index()
                 rename_map = {'订单ID': '订单数', '订单总收入': '销售额', '订单实际利润': '利润额'}
             else:
                 # 原始df是商品级，需要按订单聚合后再按渠道聚合
@@ -13818,7 +13832,7 @@ def export_tab1_order_report(n_clicks, cached_agg, cached_comparison):
                     agg_dict['_销售额'] = 'sum'
                 if '利润额' in channel_data.columns:
                     agg_dict['利润额'] = 'sum'
-                channel_stats = channel_data.groupby('渠道').agg(agg_dict).reset_index()
+                channel_stats = channel_data.groupby('渠道', observed=True).agg(agg_dict).reset_index()
                 rename_map = {'订单ID': '订单数', '_销售额': '销售额'}
             
             channel_stats = channel_stats.rename(columns=rename_map)
@@ -13920,7 +13934,7 @@ def export_tab1_order_report(n_clicks, cached_agg, cached_comparison):
             if '三级分类名' in df_calc.columns:
                 agg_cols['三级分类名'] = 'first'
             
-            product_stats = df_calc.groupby('商品名称').agg(agg_cols).reset_index(drop=True)
+            product_stats = df_calc.groupby('商品名称', observed=True).agg(agg_cols).reset_index(drop=True)
             
             # 计算利润率
             if '_商品销售额' in product_stats.columns and '利润额' in product_stats.columns:
@@ -14682,7 +14696,7 @@ def show_tab1_detail_analysis(n_clicks, current_style):
         else:
             # Plotly 备份 - 保留原饼图 (✅ 使用实收价格)
             sales_field = '实收价格'
-            category_sales = df.groupby('一级分类名')[sales_field].sum().sort_values(ascending=False)
+            category_sales = df.groupby('一级分类名', observed=True)[sales_field].sum().sort_values(ascending=False)
             fig_category = go.Figure(data=[go.Pie(
                 labels=category_sales.index,
                 values=category_sales.values,
@@ -15249,7 +15263,7 @@ def update_category_trend_by_channel(selected_channel):
         # 🔍 调试日志
         print(f"\n🔍 [分类趋势-渠道筛选] 渠道='{selected_channel}', 订单数={len(order_agg)}")
         if '渠道' in order_agg.columns:
-            print(f"   渠道分布: {order_agg['渠道'].value_counts().to_dict()}")
+            print(f"   渠道分布: {observed_value_counts(order_agg['渠道']).to_dict()}")
         
         # 调用修改后的图表生成函数,传入selected_channel参数
         if ECHARTS_AVAILABLE:
@@ -15272,10 +15286,10 @@ def update_category_trend_by_channel(selected_channel):
             if sales_col in df_filtered.columns:
                 df_filtered_temp = df_filtered.copy()
                 df_filtered_temp['订单总收入'] = df_filtered_temp['实收价格'] * df_filtered_temp[sales_col]
-                category_sales = df_filtered_temp.groupby('一级分类名')['订单总收入'].sum().sort_values(ascending=False)
+                category_sales = df_filtered_temp.groupby('一级分类名', observed=True)['订单总收入'].sum().sort_values(ascending=False)
                 print(f"🔧 [分类销售占比] 实收价格修复: 使用(实收价格×{sales_col})聚合")
             else:
-                category_sales = df_filtered.groupby('一级分类名')['实收价格'].sum().sort_values(ascending=False)
+                category_sales = df_filtered.groupby('一级分类名', observed=True)['实收价格'].sum().sort_values(ascending=False)
                 print(f"⚠️ [分类销售占比] 实收价格兜底: 直接sum（缺少销量字段）")
             
             fig_category = go.Figure(data=[go.Pie(
@@ -15377,7 +15391,7 @@ def export_category_trend_data(n_clicks, category_data, selected_channel):
             # 获取最新日期的数据
             last_day_data = df[df[date_col] == max_date]
             # 每个商品在最新日期的库存
-            last_day_stock_map = last_day_data.groupby('商品名称')[stock_col].last().to_dict()
+            last_day_stock_map = last_day_data.groupby('商品名称', observed=True)[stock_col].last().to_dict()
             
             print(f"📌 [一级分类导出] 最新日期商品数: {len(last_day_stock_map)}")
             
@@ -15423,11 +15437,11 @@ def export_category_trend_data(n_clicks, category_data, selected_channel):
         if date_col in df.columns:
             agg_dict[date_col] = 'max'
         
-        product_agg = df.groupby('商品名称').agg(agg_dict).reset_index()
+        product_agg = df.groupby('商品名称', observed=True).agg(agg_dict).reset_index()
         
         # 计算销售额
         if sales_col and '实收价格' in df.columns:
-            product_sales = df.groupby('商品名称').apply(
+            product_sales = df.groupby('商品名称', observed=True).apply(
                 lambda x: (x['实收价格'] * x[sales_col]).sum() if sales_col in x.columns else x['实收价格'].sum()
             )
             product_agg['销售额'] = product_agg['商品名称'].map(product_sales)
@@ -15516,7 +15530,7 @@ def export_category_trend_data(n_clicks, category_data, selected_channel):
                 category_summary = category_summary[category_summary['一级分类名'] != '耗材']
         else:
             # 如果没有store数据，手动计算（已剔除耗材）
-            category_summary = product_agg.groupby('一级分类名').agg({
+            category_summary = product_agg.groupby('一级分类名', observed=True).agg({
                 '销售额': 'sum',
                 '利润额': 'sum',
                 '月售': 'sum',
@@ -15627,7 +15641,7 @@ def update_aov_analysis_by_channel(selected_channel, cached_agg, cache_version):
         # 🔍 调试日志
         print(f"\n🔍 [客单价-渠道筛选] 渠道='{selected_channel}', 订单数={len(order_agg)}")
         if '渠道' in order_agg.columns:
-            print(f"   渠道分布: {order_agg['渠道'].value_counts().to_dict()}")
+            print(f"   渠道分布: {observed_value_counts(order_agg['渠道']).to_dict()}")
         
         # 获取当前门店名称
         store_name = None
@@ -15887,7 +15901,7 @@ def calculate_time_period_quadrants(df, period='week', profit_threshold=30.0, st
                 period_stock_map = {}
             
             # 商品聚合(简化版,只计算关键指标)
-            product_agg = period_df.groupby('商品名称').agg({
+            product_agg = period_df.groupby('商品名称', observed=True).agg({
                 '预计订单收入': 'sum',
                 '实收价格': 'sum' if '实收价格' in period_df.columns else lambda x: period_df['预计订单收入'].sum(),
                 '利润额': 'sum',
@@ -16793,7 +16807,7 @@ def render_tab3_content(active_tab, data_trigger, tabs_status):
         if has_actual_price:
             agg_dict['实收价格'] = 'sum'   # ✅ W列实收价格（排除补贴/折扣，更真实）
         
-        product_agg = df.groupby('商品名称').agg(agg_dict).reset_index()
+        product_agg = df.groupby('商品名称', observed=True).agg(agg_dict).reset_index()
         
         # 设置列名
         if has_actual_price:
@@ -16901,12 +16915,12 @@ def render_tab3_content(active_tab, data_trigger, tabs_status):
         print("🔍 [订单级盈利分析] 开始计算...")
         
         # 准备订单级利润数据（每个商品的每个订单的利润）
-        order_profit_detail = df_with_profit.groupby(['商品名称', '订单ID']).agg({
+        order_profit_detail = df_with_profit.groupby(['商品名称', '订单ID'], observed=True).agg({
             '订单实际利润': 'first'  # 每个订单的实际利润
         }).reset_index()
         
         # 计算每个商品的盈利订单统计
-        profit_health = order_profit_detail.groupby('商品名称').agg(
+        profit_health = order_profit_detail.groupby('商品名称', observed=True).agg(
             总订单数=('订单ID', 'count'),
             盈利订单数=('订单实际利润', lambda x: (x > 0).sum()),
             亏损订单数=('订单实际利润', lambda x: (x <= 0).sum()),
@@ -16997,7 +17011,7 @@ def render_tab3_content(active_tab, data_trigger, tabs_status):
         if '一级分类名' in df.columns:
             # 📊 分类分析：分析各分类商品的盈利能力
             # ✅ 使用原始利润额(N列)：商品毛利，与商品聚合保持一致
-            category_sales = df.groupby('一级分类名').agg({
+            category_sales = df.groupby('一级分类名', observed=True).agg({
                 '预计订单收入': 'sum',      # ✅ Y列：销售额
                 '月售': 'sum',              # 销量
                 '利润额': 'sum',            # ✅ N列：商品毛利
@@ -20315,7 +20329,7 @@ def analyze_ranking_module(df: pd.DataFrame, analyzer) -> html.Div:
 def analyze_category_module(df: pd.DataFrame, analyzer) -> html.Div:
     """分类分析板块"""
     if '一级分类名' in df.columns:
-        category_sales = df.groupby('一级分类名')['销售额'].sum().nlargest(5).to_dict()
+        category_sales = df.groupby('一级分类名', observed=True)['销售额'].sum().nlargest(5).to_dict()
         prompt = f"""
 基于分类数据,优化品类结构(限300字):
 
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+测试 DuckDB 参数化查询 + 语句缓存
+
+1. 微基准：首页 KPI 查询，改造前（值拼进SQL，每次重新拼接/解析）与改造后（绑定参数 + 语句缓存）耗时对比
+2. 结果一致：改造前后 KPI 结果相同
+3. 门店名含单引号时查询不再报错（改造前为 SQL 语法错误）
+"""
+import sys
+from pathlib import Path
+import statistics
+import time
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "backend" / "app"))
+
+from backend.app.services.duckdb_service import duckdb_service
+
+
+def literal_kpi(store_name=None, start_date=None, end_date=None, channel=None) -> dict:
+    """改造前的 KPI 查询：条件值直接拼进SQL文本"""
+    where_clauses = []
+    if store_name:
+        where_clauses.append(f"门店名称 = '{store_name}'")
+    if start_date:
+        where_clauses.append(f"日期 >= '{start_date}'")
+    if end_date:
+        where_clauses.append(f"日期 <= '{end_date}'")
+    if channel and channel != 'all':
+        where_clauses.append(f"渠道 = '{channel}'")
+    if duckdb_service.is_hive_layout():
+        if store_name:
+            where_clauses.append(f"store = '{store_name}'")
+        if start_date:
+            where_clauses.append(f"month >= '{str(start_date)[:7]}'")
+            where_clauses.append(f"date >= CAST('{str(start_date)[:10]}' AS DATE)")
+        if end_date:
+            where_clauses.append(f"month <= '{str(end_date)[:7]}'")
+            where_clauses.append(f"date <= CAST('{str(end_date)[:10]}' AS DATE)")
+    where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    raw_source = duckdb_service.get_raw_source()
+
+    result = duckdb_service.conn.execute(f"""
+        WITH order_level AS (
+            SELECT
+                订单ID,
+                门店名称,
+                SUM(实收价格 * 月售) as 订单金额,
+                SUM(利润额) - SUM(平台服务费) - MAX(物流配送费) + SUM(企客后返) as 订单利润
+            FROM {raw_source}
+            {where_sql}
+            GROUP BY 订单ID, 门店名称
+        )
+        SELECT
+            COUNT(*) as total_orders,
+            COALESCE(SUM(订单金额), 0) as total_actual_sales,
+            COALESCE(SUM(订单利润), 0) as total_profit,
+            COALESCE(AVG(订单金额), 0) as avg_order_value,
+            COALESCE(SUM(订单利润) / NULLIF(SUM(订单金额), 0) * 100, 0) as profit_rate
+        FROM order_level
+    """).fetchone()
+    active_products = duckdb_service.conn.execute(f"""
+        SELECT COUNT(DISTINCT 商品名称)
+        FROM {raw_source}
+        {where_sql}
+        {"AND" if where_clauses else "WHERE"} 月售 > 0
+    """).fetchone()[0] or 0
+
+    return {
+        "total_orders": int(result[0] or 0),
+        "total_actual_sales": round(float(result[1] or 0), 2),
+        "total_profit": round(float(result[2] or 0), 2),
+        "avg_order_value": round(float(result[3] or 0), 2),
+        "profit_rate": round(float(result[4] or 0), 2),
+        "active_products": int(active_products),
+    }
+
+
+def pick_filters() -> dict:
+    """取一个实际存在的门店和最近一周的日期范围作为看板刷新的典型条件"""
+    stores = duckdb_service.query_distinct('门店名称')
+    date_range = duckdb_service.query_date_range(stores[0])
+    end_date = date_range["max_date"]
+    start_date = str((duckdb_service.conn.execute(
+        "SELECT CAST(? AS DATE) - 6", [end_date]).fetchone()[0]))
+    return {"store_name": stores[0], "start_date": start_date, "end_date": end_date}
+
+
+def benchmark(name: str, func, filters: dict, runs: int) -> float:
+    func(**filters)  # 预热
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(**filters)
+        samples.append((time.perf_counter() - start) * 1000)
+    median = statistics.median(samples)
+    print(f"   {name:<22} 中位数 {median:7.2f}ms   最小 {min(samples):7.2f}ms")
+    return median
+
+
+def test_benchmark(runs: int = 50) -> bool:
+    """KPI 查询微基准（单门店 + 全部门店两种形状）"""
+    results = []
+    for label, filters in [("单门店近7天", pick_filters()), ("全部门店", {})]:
+        print(f"\n📊 {label}: {filters or '无筛选'}（{runs} 次）")
+        before = benchmark("改造前(拼接SQL)", literal_kpi, filters, runs)
+        after = benchmark("改造后(参数+语句缓存)", duckdb_service._query_kpi_from_raw,
+                          {"store_name": None, "start_date": None, "end_date": None,
+                           "channel": None, **filters}, runs)
+        print(f"   变化: {(after - before) / before * 100:+.1f}%")
+        results.append(literal_kpi(**filters) == duckdb_service.query_kpi(**filters))
+        print(f"{'✅' if results[-1] else '❌'} 改造前后结果一致")
+    return all(results)
+
+
+def test_quoted_store_name() -> bool:
+    """门店名含单引号"""
+    store_name = "O'Neil 便利店"
+    try:
+        literal_kpi(store_name=store_name)
+        print("⚠️ 改造前拼接SQL未报错")
+    except Exception as e:
+        print(f"   改造前: {type(e).__name__}")
+
+    try:
+        kpi = duckdb_service.query_kpi(store_name=store_name)
+        stores = duckdb_service.query_distinct('渠道', store_name=store_name)
+        channels = duckdb_service.query_channels(store_name=store_name)
+    except Exception as e:
+        print(f"❌ 门店名含单引号查询失败: {e}")
+        return False
+    ok = kpi["total_orders"] == 0 and stores == [] and channels == []
+    print(f"{'✅' if ok else '❌'} 门店名含单引号查询正常（无匹配数据）")
+    return ok
+
+
+def main():
+    print("""
+╔══════════════════════════════════════════════════════════════════╗
+║           ⚡ DuckDB 参数化查询 + 语句缓存测试
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    if not duckdb_service.has_parquet_data():
+        print("❌ 没有Parquet数据，请先同步数据")
+        return 1
+    print(f"📁 数据源: {duckdb_service.get_raw_source()}")
+
+    results = [
+        test_benchmark(),
+        test_quoted_store_name(),
+    ]
+    print(f"\n📋 语句缓存: {duckdb_service.get_status()['statement_cache']}")
+
+    print("\n" + "=" * 60)
+    if all(results):
+        print("✅ 全部通过")
+        return 0
+    print("❌ 存在失败项")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+测试 Parquet 文件整理（ParquetSyncService.compact）
+
+在 data/ 的临时副本上执行（不改动真实数据）：
+1. 旧版布局迁移为 hive 分区后，部分分区追加增量文件，制造多文件/小 row group 分区
+2. 整理后每个分区一个文件，按 (门店名称, 日期, 订单ID) 有序，zstd 压缩，带整理标记
+3. 整理前后数据一致（行数、金额合计、每门店每天行数）
+4. 整理记录写入 metadata/compaction.json（前后文件数、扫描耗时），再次整理不重复处理
+"""
+import sys
+from pathlib import Path
+import shutil
+import tempfile
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "backend" / "app"))
+
+import duckdb
+import pyarrow.parquet as pq
+
+from backend.app.services.parquet_sync_service import ParquetSyncService
+
+
+class LocalSync(ParquetSyncService):
+    """临时目录中的同步服务（不刷新全局 DuckDB 表）"""
+
+    def _refresh_duckdb_tables(self):
+        pass
+
+
+def fingerprint(service: ParquetSyncService):
+    """行数、金额合计、每门店每天行数"""
+    source = service._raw_scan_source()
+    con = duckdb.connect()
+    totals = con.execute(f"SELECT COUNT(*), ROUND(SUM(实收价格), 2), COUNT(DISTINCT 订单ID) FROM {source}").fetchone()
+    per_day = con.execute(f"""
+        SELECT 门店名称, CAST(日期 AS DATE) AS d, COUNT(*) FROM {source} GROUP BY ALL ORDER BY ALL
+    """).fetchall()
+    con.close()
+    return totals, per_day
+
+
+def add_deltas(service: ParquetSyncService, partitions: int = 20) -> int:
+    """把部分分区拆成 基础文件 + 增量文件（模拟每小时增量同步）"""
+    count = 0
+    for partition_dir in sorted(service.raw_dir.glob("month=*/store=*/date=*"))[:partitions]:
+        base = partition_dir / service.RAW_FILE_NAME
+        table = pq.read_table(base)
+        if table.num_rows < 4:
+            continue
+        half = table.num_rows // 2
+        pq.write_table(table.slice(0, half), base, row_group_size=100)
+        pq.write_table(table.slice(half), partition_dir / f"{service.DELTA_FILE_PREFIX}test.parquet", row_group_size=100)
+        count += 1
+    return count
+
+
+def is_sorted(path: Path, keys) -> bool:
+    table = pq.read_table(path, columns=keys)
+    return table.equals(table.sort_by([(k, "ascending") for k in keys]))
+
+
+def main():
+    print("""
+╔══════════════════════════════════════════════════════════════════╗
+║           🗜️ Parquet 文件整理测试
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    source_dir = PROJECT_ROOT / "data"
+    if not any((source_dir / "raw").glob("**/*.parquet")):
+        print("❌ 没有Parquet数据，请先同步数据")
+        return 1
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp) / "data"
+        shutil.copytree(source_dir / "raw", data_dir / "raw")
+        shutil.copytree(source_dir / "aggregated", data_dir / "aggregated")
+        shutil.copytree(source_dir / "metadata", data_dir / "metadata")
+        service = LocalSync(data_dir=data_dir)
+        service.migrate_raw_layout()
+        split = add_deltas(service)
+
+        expected = fingerprint(service)
+        report = service.compact(include_today=True)
+        actual = fingerprint(service)
+
+        files = sorted(service.raw_dir.glob("**/*.parquet"))
+        partitions = list(service.raw_dir.glob("month=*/store=*/date=*"))
+        sample = files[len(files) // 2]
+        metadata = pq.read_metadata(sample)
+        agg_files = sorted(service.agg_dir.glob("**/*.parquet"))
+        checks = {
+            f"{split} 个分区拆分为多文件后合并，{len(partitions)} 个分区各一个文件":
+                len(files) == len(partitions) and all(f.name == service.RAW_FILE_NAME for f in files),
+            f"数据一致（{expected[0][0]:,} 行，实收合计 {expected[0][1]:,}）": actual == expected,
+            "按 (门店名称, 日期, 订单ID) 有序": is_sorted(sample, service.RAW_SORT_KEYS),
+            f"压缩算法 {metadata.row_group(0).column(0).compression}":
+                metadata.row_group(0).column(0).compression.lower() == service.COMPACT_COMPRESSION,
+            "原始/聚合文件都有整理标记": all(service._is_compacted(f) for f in files + agg_files),
+            "row group 数减少": report["after"]["raw"]["row_groups"] < report["before"]["raw"]["row_groups"],
+        }
+
+        history = service.get_compaction_history()
+        checks["compaction.json 记录前后文件数和扫描耗时"] = (
+            len(history) == 1
+            and history[0]["before"]["raw"]["files"] == report["before"]["raw"]["files"]
+            and set(history[0]["scan_ms"]["after"]) >= {"raw_full_scan", "raw_store_7d", "raw_order_lookup"}
+        )
+
+        second = service.compact(include_today=True, benchmark=False)
+        checks["再次整理不重复处理"] = (
+            second["compacted"]["raw"]["partitions"] == 0 and second["compacted"]["aggregated"]["partitions"] == 0
+        )
+        checks["状态包含最后一次整理"] = service.get_status()["last_compaction"] is not None
+
+        for name, ok in checks.items():
+            print(f"{'✅' if ok else '❌'} {name}")
+        results.append(all(checks.values()))
+
+        print(f"\n📊 原始数据: {report['before']['raw']['files']} → {report['after']['raw']['files']} 个文件，"
+              f"{report['before']['raw']['row_groups']} → {report['after']['raw']['row_groups']} 个row group，"
+              f"{report['before']['raw']['bytes'] / 1024 / 1024:.1f}MB → {report['after']['raw']['bytes'] / 1024 / 1024:.1f}MB")
+        for name, ms in report["scan_ms"]["after"].items():
+            print(f"   {name}: {report['scan_ms']['before'][name]:.1f}ms → {ms:.1f}ms")
+
+    print("\n" + "=" * 60)
+    if all(results):
+        print("✅ 全部通过")
+        return 0
+    print("❌ 存在失败项")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+测试 Parquet 新鲜度检查（OrderLoaderService._get_stale_days，需要 PostgreSQL）
+
+1. 数据库侧只统计查询覆盖的日期（GROUP BY 带日期条件，不扫全表）
+2. 按范围检查的结果与全量检查结果在该范围内一致
+3. 同一数据版本下，已核对区间内的子范围不再查询数据库；数据版本变化后重新核对
+4. 加载统计在线程池并发写入时计数准确
+
+运行：python 测试Parquet新鲜度检查.py
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT / "backend"))
+sys.path.insert(0, str(PROJECT_ROOT))
+# backend/app 放在最后：`services` 优先解析为项目根目录的服务包
+sys.path.append(str(PROJECT_ROOT / "backend" / "app"))
+
+from sqlalchemy import event
+
+from database.connection import check_connection, engine
+from database.order_changes import get_data_version
+from backend.app.services.duckdb_service import duckdb_service
+from backend.app.services.order_loader_service import OrderLoaderService
+
+
+class StatementLog:
+    """记录期间执行的 GROUP BY 语句"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if "GROUP BY" in statement.upper():
+            self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, "before_cursor_execute", self)
+
+
+def check(results: list, name: str, ok: bool):
+    print(f"{'✅' if ok else '❌'} {name}")
+    results.append(ok)
+
+
+def test_range_check(results: list):
+    days = sorted(duckdb_service.raw_day_counts())
+    if not days:
+        print("⏭️ 跳过范围检查（没有原始Parquet数据）")
+        return
+    end = date.fromisoformat(days[-1])
+    start = end - timedelta(days=6)
+    version = get_data_version()
+
+    full = OrderLoaderService()._get_stale_days(version)
+    loader = OrderLoaderService()
+    with StatementLog() as log:
+        stale = loader._get_stale_days(version, start, end)
+    check(results, f"范围检查 {start} ~ {end} 只执行一次带日期条件的分组统计",
+          len(log.statements) == 1 and "WHERE" in log.statements[0].upper())
+    expected = {d for d in full if str(start) <= d <= str(end)}
+    check(results, f"范围检查结果与全量检查一致 (不一致 {len(stale)} 天)", stale == expected)
+
+    with StatementLog() as log:
+        sub = loader._get_stale_days(version, start + timedelta(days=2), end)
+    check(results, "已核对区间内的子范围不查询数据库",
+          not log.statements and sub == {d for d in expected if d >= str(start + timedelta(days=2))})
+
+    with StatementLog() as log:
+        loader._get_stale_days(f"{version}-changed", start, end)
+    check(results, "数据版本变化后重新核对", len(log.statements) == 1)
+
+
+def test_concurrent_stats(results: list):
+    loader = OrderLoaderService()
+    threads, per_thread = 8, 5_000
+
+    def record(i):
+        for _ in range(per_thread):
+            loader._record_load("parquet" if i % 2 else "postgresql", 1, time.time())
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(record, range(threads)))
+    stats = loader.get_status()
+    total = threads * per_thread
+    check(results, f"并发加载统计准确 (loads={stats['loads']}, parquet_loads={stats['parquet_loads']})",
+          stats["loads"] == total and stats["rows"] == total and stats["parquet_loads"] == total // 2)
+
+
+def main():
+    print("""
+╔══════════════════════════════════════════════════════════════════╗
+║           🧊 Parquet 新鲜度检查测试
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    status = check_connection()
+    if not status.get('connected'):
+        print(f"❌ 需要 PostgreSQL（DATABASE_URL）: {status.get('message')}")
+        return 1
+
+    results = []
+    test_range_check(results)
+    test_concurrent_stats(results)
+
+    print("\n" + "=" * 60)
+    if all(results):
+        print("✅ 全部通过")
+        return 0
+    print("❌ 存在失败项")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
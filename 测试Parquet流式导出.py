@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+测试 Parquet 流式导出（ParquetSyncService.write_raw_batches / backfill）
+
+数据库不可用时也能运行：以现有原始Parquet按批读取模拟服务端游标的 RecordBatch，
+写入临时目录后检查：
+1. 按门店分区写出的数据与源数据一致，schema 与 OrderLoaderService.arrow_schema 一致
+2. 流式写入期间 Arrow 内存峰值只与批大小有关（远小于整天/全部数据）
+3. 空数据不改动已有分区，重复导出幂等
+4. backfill 按天并行导出，partitions.json 行数与源数据一致
+5. 增量文件：append 写入 delta-*.parquet，DuckDB 按分区 glob 读取时与基础文件自动合并；
+   compact_raw_day 合并后每个分区只剩一个文件且数据不变；水位线读写
+6. 整天替换：不在新数据中的门店分区移除；读取或替换中途失败时保留旧分区
+7. 没有同步时间的日期：reexport_unsynced_days 重新导出，跨进程锁被占用时跳过
+"""
+import sys
+from pathlib import Path
+from datetime import date, datetime, timedelta
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "backend" / "app"))
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from backend.app.services.duckdb_service import duckdb_service
+from backend.app.services.order_loader_service import OrderLoaderService, PARQUET_SYNC_COLUMNS
+from backend.app.services.parquet_sync_service import ParquetSyncService
+
+BATCH_SIZE = 2_000
+
+
+def source_files(target_date: date):
+    """源数据中某一天的文件（旧版布局或hive分区）"""
+    raw_dir = duckdb_service.raw_dir
+    legacy = raw_dir / str(target_date.year) / f"{target_date.month:02d}" / f"orders_{target_date.strftime('%Y%m%d')}.parquet"
+    if legacy.exists():
+        return [legacy]
+    return sorted(raw_dir.glob(f"month=*/store=*/date={target_date.isoformat()}/*.parquet"))
+
+
+def source_days():
+    days = set()
+    for f in duckdb_service.raw_dir.glob("**/*.parquet"):
+        name = f.stem if f.name.startswith("orders_") else f.parent.name
+        digits = name.replace("orders_", "").replace("date=", "").replace("-", "")
+        days.add(date(int(digits[:4]), int(digits[4:6]), int(digits[6:8])))
+    return sorted(days)
+
+
+class FileSourceSync(ParquetSyncService):
+    """以源Parquet代替数据库游标的导出（只替换数据来源，写入逻辑不变）"""
+
+    peak_bytes = 0
+
+    def iter_source(self, target_date: date):
+        files = source_files(target_date)
+        columns = [c for c in PARQUET_SYNC_COLUMNS if c in pq.read_schema(files[0]).names] if files else []
+        schema = OrderLoaderService.arrow_schema(columns)
+        for f in files:
+            for batch in pq.ParquetFile(f).iter_batches(batch_size=BATCH_SIZE, columns=columns):
+                yield batch.cast(schema)
+                FileSourceSync.peak_bytes = max(FileSourceSync.peak_bytes, pa.total_allocated_bytes())
+
+    def export_day(self, target_date: date, aggregate: bool = True, refresh: bool = True) -> int:
+        return self.write_raw_batches(target_date, self.iter_source(target_date), refresh=False)
+
+    def _refresh_duckdb_tables(self):
+        pass
+
+
+def read_day(service: ParquetSyncService, target_date: date) -> pd.DataFrame:
+    files = [d / service.RAW_FILE_NAME for d in service._raw_date_dirs(target_date)]
+    return pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+
+
+def normalize(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def test_day(service: FileSourceSync, target_date: date) -> bool:
+    expected = pd.concat([pd.read_parquet(f) for f in source_files(target_date)], ignore_index=True)
+    rows = service.export_day(target_date)
+    actual = read_day(service, target_date)
+    expected = expected[list(actual.columns)]
+
+    stores = expected['门店名称'].nunique(dropna=False)
+    files = len(service._raw_date_dirs(target_date))
+    schema = pq.read_schema(next(iter(service._raw_date_dirs(target_date))) / service.RAW_FILE_NAME)
+    checks = {
+        f"行数 {rows:,} 与源数据一致": rows == len(expected),
+        f"{files} 个门店分区": files == stores,
+        "数据一致": normalize(actual).equals(normalize(expected)),
+        "schema 与 arrow_schema 一致": schema.remove_metadata().equals(
+            OrderLoaderService.arrow_schema(list(actual.columns))
+        ),
+    }
+    for name, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {target_date} {name}")
+
+    # 空数据不改动已有分区；重复导出幂等
+    service.write_raw_batches(target_date, iter([]), refresh=False)
+    ok = len(read_day(service, target_date)) == rows
+    service.export_day(target_date)
+    ok = ok and len(read_day(service, target_date)) == rows and not any(service.staging_dir.glob("*"))
+    print(f"{'✅' if ok else '❌'} 空数据保留已有分区，重复导出幂等，staging 已清理")
+
+    # 同步时间记录为读取数据库之前的快照时间，而不是写完之后
+    snapshot_at = datetime.now() - timedelta(minutes=5)
+    service.write_raw_batches(target_date, service.iter_source(target_date), refresh=False, synced_at=snapshot_at)
+    metadata = json.loads((service.metadata_dir / "partitions.json").read_text(encoding='utf-8'))
+    recorded = metadata["partitions"][target_date.strftime('%Y-%m')]["synced_at"][str(target_date)]
+    synced_ok = recorded == snapshot_at.isoformat()
+    print(f"{'✅' if synced_ok else '❌'} 同步时间记录为快照时间 {recorded}")
+    return all(checks.values()) and ok and synced_ok
+
+
+def test_delta(service: FileSourceSync, target_date: date) -> bool:
+    """一天的数据分三段：基础文件 + 两个增量文件"""
+    batches = list(service.iter_source(target_date))
+    table = pa.Table.from_batches(batches)
+    third = table.num_rows // 3
+    parts = [table.slice(0, third), table.slice(third, third), table.slice(2 * third)]
+
+    service.write_raw_batches(target_date, parts[0].to_batches(), refresh=False)
+    for part in parts[1:]:
+        service.write_raw_batches(target_date, part.to_batches(), refresh=False, append=True)
+
+    pattern = str(service.raw_dir / "month=*" / "store=*" / "date=*" / "*.parquet")
+    union_rows = duckdb.sql(f"SELECT COUNT(*) FROM read_parquet('{pattern}', hive_partitioning=true)").fetchone()[0]
+    deltas = len(list(service.raw_dir.glob(f"**/{service.DELTA_FILE_PREFIX}*.parquet")))
+    metadata = json.loads((service.metadata_dir / "partitions.json").read_text(encoding='utf-8'))
+    recorded = metadata["partitions"][target_date.strftime('%Y-%m')]["dates"][str(target_date)]
+    agg = service.generate_daily_aggregations(target_date)
+    kpi = pd.read_parquet(agg['kpi'])
+    before = normalize(read_all_files(service, target_date))
+
+    compact = service.compact_raw_day(target_date)
+    files = list(service.raw_dir.glob("**/*.parquet"))
+    after = normalize(read_all_files(service, target_date))
+
+    today = date.today()
+    service._save_watermark(today, {"max_id": 42, "rows": table.num_rows, "max_updated_at": datetime(2026, 1, 1, 12)})
+    watermark = service.get_watermark(today)
+    service._save_watermark(date(2000, 1, 1), {"max_id": 1, "rows": 1, "max_updated_at": None})
+
+    checks = {
+        f"{deltas} 个增量文件，DuckDB 合并读取 {union_rows:,} 行": union_rows == table.num_rows and deltas > 0,
+        f"partitions.json 累加为 {recorded:,} 行": recorded == table.num_rows,
+        "聚合包含增量文件": int(kpi['订单数'].sum()) == table.to_pandas()['订单ID'].nunique()
+        if '订单数' in kpi.columns else len(kpi) > 0,
+        f"合并 {compact['partitions']} 个分区的 {compact['files']} 个文件 → 每个分区一个文件":
+            all(f.name == service.RAW_FILE_NAME for f in files)
+            and len(files) == len(service._raw_date_dirs(target_date)),
+        "合并前后数据一致": before.equals(after) and len(after) == table.num_rows,
+        "水位线读写": watermark == {"max_id": 42, "rows": table.num_rows, "max_updated_at": datetime(2026, 1, 1, 12)},
+        "过期水位线不保留": service.get_watermark(date(2000, 1, 1)) is None,
+    }
+    for name, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+    return all(checks.values())
+
+
+def test_replace(service: FileSourceSync, target_date: date) -> bool:
+    """整天替换：门店集合变化、读取中途失败、目录替换中途失败"""
+    service.export_day(target_date)
+    full = normalize(read_day(service, target_date))
+    table = pa.Table.from_batches(list(service.iter_source(target_date)))
+    stores = table.column('门店名称').unique().to_pylist()
+    if len(stores) < 2:
+        print(f"⏭️ {target_date} 只有一个门店，跳过整天替换测试")
+        return True
+
+    def failing_source():
+        yield table.slice(0, 10).to_batches()[0]
+        raise RuntimeError("游标中断")
+
+    try:
+        service.write_raw_batches(target_date, failing_source(), refresh=False)
+    except RuntimeError:
+        pass
+    kept_after_read_error = normalize(read_day(service, target_date)).equals(full)
+
+    real_replace = os.replace
+    calls = []
+
+    def flaky_replace(src, dst):
+        calls.append(src)
+        if len(calls) == 3:
+            raise OSError("模拟替换失败")
+        return real_replace(src, dst)
+
+    with mock.patch.object(os, "replace", side_effect=flaky_replace):
+        try:
+            service.write_raw_batches(target_date, iter(table.to_batches()), refresh=False)
+        except OSError:
+            pass
+    kept_after_swap_error = normalize(read_day(service, target_date)).equals(full)
+
+    subset = table.filter(pa.compute.equal(table.column('门店名称'), stores[0]))
+    service.write_raw_batches(target_date, iter(subset.to_batches()), refresh=False)
+    dirs = service._raw_date_dirs(target_date)
+    checks = {
+        "读取中途失败保留旧分区": kept_after_read_error,
+        "目录替换中途失败恢复旧分区": kept_after_swap_error,
+        f"只剩 1 个门店时其余 {len(stores) - 1} 个门店分区移除": len(dirs) == 1
+            and normalize(read_day(service, target_date)).equals(normalize(subset.to_pandas())),
+        "staging 已清理": not any(service.staging_dir.glob("*")),
+    }
+    for name, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+    return all(checks.values())
+
+
+def test_reexport(service: FileSourceSync, target_date: date) -> bool:
+    """记录同步时间之前导出的日期（partitions.json 中没有 synced_at）"""
+    service.export_day(target_date)
+    metadata_file = service.metadata_dir / "partitions.json"
+    metadata = json.loads(metadata_file.read_text(encoding='utf-8'))
+    for partition in metadata["partitions"].values():
+        partition.pop("synced_at", None)
+    metadata_file.write_text(json.dumps(metadata), encoding='utf-8')
+    unsynced = service.unsynced_days()
+
+    lock_path = service.metadata_dir / ".reexport.lock"
+    lock_path.write_text("other-worker")
+    skipped = service.reexport_unsynced_days()["skipped"] and service.unsynced_days() == [target_date]
+    lock_path.unlink()
+    result = service.reexport_unsynced_days()
+
+    checks = {
+        "没有同步时间的日期": unsynced == [target_date],
+        "其他进程持有锁时跳过": skipped,
+        f"重新导出 {result['days']} 天 {result['rows']:,} 行": result["days"] == 1 and not result["failed"],
+        "导出后记录同步时间，锁已释放": not service.unsynced_days() and not lock_path.exists(),
+    }
+    for name, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+    return all(checks.values())
+
+
+def read_all_files(service: ParquetSyncService, target_date: date) -> pd.DataFrame:
+    files = [f for d in service._raw_date_dirs(target_date) for f in d.glob("*.parquet")]
+    return pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+
+
+def test_backfill(service: FileSourceSync, days) -> bool:
+    FileSourceSync.peak_bytes = 0
+    baseline = pa.total_allocated_bytes()
+    start = time.perf_counter()
+    result = service.backfill(days[0], days[-1], workers=4)
+    elapsed = time.perf_counter() - start
+
+    metadata = pd.read_json(service.metadata_dir / "partitions.json")
+    recorded = sum(p["total_records"] for p in metadata["partitions"])
+    total_bytes = sum(f.stat().st_size for f in service.raw_dir.glob("**/*.parquet"))
+    checks = {
+        f"{result['days']} 天 {result['rows']:,} 行，失败 {len(result['failed'])} 天": not result['failed'],
+        f"partitions.json 记录 {recorded:,} 行": recorded == result['rows'],
+    }
+    for name, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+    peak = (FileSourceSync.peak_bytes - baseline) / 1024 / 1024
+    print(f"📊 {result['workers']} 个worker，{elapsed:.1f}s（{result['rows'] / elapsed:,.0f} 行/秒），"
+          f"流式写入 Arrow 内存峰值 {peak:.1f}MB，写出 {total_bytes / 1024 / 1024:.1f}MB")
+    return all(checks.values())
+
+
+def main():
+    print("""
+╔══════════════════════════════════════════════════════════════════╗
+║           📦 Parquet 流式导出测试
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    days = source_days()
+    if not days:
+        print("❌ 没有Parquet数据，请先同步数据")
+        return 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        service = FileSourceSync(data_dir=tmp)
+        results = [test_day(service, days[-1])]
+        service = FileSourceSync(data_dir=Path(tmp) / "replace")
+        results.append(test_replace(service, days[-1]))
+        service = FileSourceSync(data_dir=Path(tmp) / "reexport")
+        results.append(test_reexport(service, days[-1]))
+        service = FileSourceSync(data_dir=Path(tmp) / "delta")
+        results.append(test_delta(service, days[-1]))
+        service = FileSourceSync(data_dir=Path(tmp) / "backfill")
+        results.append(test_backfill(service, days))
+
+    print("\n" + "=" * 60)
+    if all(results):
+        print("✅ 全部通过")
+        return 0
+    print("❌ 存在失败项")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
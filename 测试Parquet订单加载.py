@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+测试 v1 订单数据的 Parquet 列式加载（DuckDBService.load_orders）
+
+1. 筛选下推结果与 OrderQuery.apply（缓存数据上的 pandas 筛选）一致：门店/日期/渠道/分类/列投影
+2. 列类型与数据库加载一致：金额 float64、销量 int64、日期 datetime64、分类列类别按字典序
+3. 公共列检测：旧文件缺少的同步列（门店ID/预计订单收入/库存）不会走 Parquet
+4. 耗时：DuckDB → Arrow → DataFrame 与 pandas 读取全部文件后筛选对比
+"""
+import sys
+from pathlib import Path
+import time
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "backend" / "app"))
+
+import pandas as pd
+
+from backend.app.services.duckdb_service import duckdb_service
+from backend.app.services.order_loader_service import (
+    API_COLUMNS, ORDER_FIELD_MAP, OrderQuery, _FLOAT, _QTY,
+)
+
+
+def read_all(columns) -> pd.DataFrame:
+    """pandas 读取全部原始Parquet（按数据库加载的默认值规则补齐空值）"""
+    files = sorted(duckdb_service.raw_dir.glob("**/*.parquet"))
+    df = pd.concat([pd.read_parquet(f, columns=columns) for f in files], ignore_index=True)
+    for name in columns:
+        kind = ORDER_FIELD_MAP[name][1]
+        if kind == _FLOAT:
+            df[name] = df[name].fillna(0).astype("float64")
+        elif kind == _QTY:
+            df[name] = df[name].fillna(1).astype("int64")
+    return df
+
+
+def normalize(df: pd.DataFrame) -> pd.DataFrame:
+    """比较前去掉分类类型并按全部列排序"""
+    df = df.copy()
+    for name in df.columns:
+        if isinstance(df[name].dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(df[name]):
+            df[name] = df[name].astype(object)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def load(query: OrderQuery, columns) -> pd.DataFrame:
+    return duckdb_service.load_orders(
+        query.select_columns(columns),
+        store_name=query.store_name,
+        start_date=query.start_date,
+        end_date=query.end_date,
+        channels=list(query.channels or []),
+        categories=list(query.categories or []),
+    )
+
+
+def test_equivalence(columns) -> bool:
+    full = read_all(columns)
+    stores = sorted(full['门店名称'].dropna().unique())
+    store_df = full[full['门店名称'] == stores[0]]
+    channels = sorted(store_df['渠道'].dropna().unique())[:2]
+    categories = sorted(store_df['一级分类名'].dropna().unique())[:3]
+    max_day = pd.to_datetime(full['日期']).max().date()
+    start_day = max_day - pd.Timedelta(days=6)
+
+    cases = [
+        ("全量", OrderQuery.build()),
+        ("单门店", OrderQuery.build(stores[0])),
+        ("单门店近7天", OrderQuery.build(stores[0], start_day, max_day)),
+        ("渠道+分类", OrderQuery.build(stores[0], channels=channels, categories=categories)),
+        ("日期+列投影", OrderQuery.build(None, start_day, max_day, columns=['订单ID', '日期', '实收价格'])),
+    ]
+    results = []
+    for label, query in cases:
+        expected = normalize(query.apply(full))
+        actual = normalize(load(query, columns))
+        ok = list(actual.columns) == list(expected.columns) and actual.equals(expected)
+        results.append(ok)
+        print(f"{'✅' if ok else '❌'} {label}: {len(actual):,} 行 / 预期 {len(expected):,} 行")
+    return all(results)
+
+
+def test_dtypes(columns) -> bool:
+    df = load(OrderQuery.build(), columns)
+    checks = {
+        "实收价格 float64": df['实收价格'].dtype == "float64",
+        "月售 int64": df['月售'].dtype == "int64",
+        "日期 datetime64": pd.api.types.is_datetime64_any_dtype(df['日期']),
+    }
+    categorical = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+    checks["分类列类别按字典序"] = all(
+        list(df[c].cat.categories) == sorted(df[c].cat.categories) for c in categorical
+    )
+    for name, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+    print(f"   分类编码列: {categorical or '无（ORDER_CATEGORICAL_ENCODING 关闭或 pandas<3）'}")
+    return all(checks.values())
+
+
+def test_raw_columns() -> bool:
+    available = duckdb_service.raw_columns()
+    missing = [c for c in API_COLUMNS if c not in available]
+    covers = not missing
+    print(f"📋 全部文件都包含的列: {len(available)} 个，API_COLUMNS 缺少: {missing or '无'}")
+    print(f"   默认列集合{'可以' if covers else '暂不能'}走 Parquet（缺少的列在下次同步后补齐）")
+    return all(c in available for c in API_COLUMNS if c not in ('门店ID', '预计订单收入', '库存'))
+
+
+def test_benchmark(columns, runs: int = 3) -> bool:
+    def timed(func):
+        func()
+        start = time.perf_counter()
+        for _ in range(runs):
+            func()
+        return (time.perf_counter() - start) * 1000 / runs
+
+    store_name = duckdb_service.query_distinct('门店名称')[0]
+    max_day = pd.Timestamp(duckdb_service.query_date_range(store_name)["max_date"]).date()
+    print(f"\n📊 {len(columns)} 列（{runs} 次平均）:")
+    for label, query in [
+        ("全量", OrderQuery.build()),
+        ("单门店近7天", OrderQuery.build(store_name, max_day - pd.Timedelta(days=6), max_day)),
+    ]:
+        duck = timed(lambda: load(query, columns))
+        pandas_ms = timed(lambda: query.apply(read_all(columns)))
+        print(f"   {label}: DuckDB→Arrow {duck:.0f}ms，pandas 读取全部文件后筛选 {pandas_ms:.0f}ms")
+    return True
+
+
+def main():
+    print("""
+╔══════════════════════════════════════════════════════════════════╗
+║           📦 v1 订单数据 Parquet 列式加载测试
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    if not duckdb_service.has_parquet_data():
+        print("❌ 没有Parquet数据，请先同步数据")
+        return 1
+
+    available = duckdb_service.raw_columns()
+    columns = [c for c in API_COLUMNS if c in available]
+
+    results = [
+        test_raw_columns(),
+        test_equivalence(columns),
+        test_dtypes(columns),
+        test_benchmark(columns),
+    ]
+
+    print("\n" + "=" * 60)
+    if all(results):
+        print("✅ 全部通过")
+        return 0
+    print("❌ 存在失败项")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+测试订单数据分类编码（字典编码字符串列）
+
+1. 内存基准：500万行模拟数据，字符串列编码前后内存对比
+2. 分批字典编码（加载层）与整列 astype('category') 结果一致
+3. 指标计算（calculate_order_metrics / 诊断渠道分布 / 品类 fillna）编码前后结果一致
+"""
+import sys
+from pathlib import Path
+import time
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT / "backend"))
+sys.path.insert(0, str(PROJECT_ROOT))
+# backend/app 放在最后：`services` 优先解析为项目根目录的服务包
+sys.path.append(str(PROJECT_ROOT / "backend" / "app"))
+
+import numpy as np
+import pandas as pd
+
+from cache_utils import (
+    CATEGORICAL_COLUMNS,
+    categorical_encoding_enabled,
+    encode_categorical_columns,
+    decode_categorical_columns,
+    safe_fillna,
+    observed_value_counts,
+)
+
+
+def build_order_frame(rows: int, seed: int = 42) -> pd.DataFrame:
+    """构造与 API_COLUMNS 结构一致的模拟订单数据（字符串列未编码）"""
+    rng = np.random.default_rng(seed)
+    stores = np.array([f'惠宜选-门店{i:02d}' for i in range(40)], dtype=object)
+    channels = np.array(['美团闪购', '饿了么', '京东到家', '美团咖啡店'], dtype=object)
+    level1 = np.array([f'一级分类{i}' for i in range(25)], dtype=object)
+    level3 = np.array([f'三级分类{i}' for i in range(300)], dtype=object)
+    products = np.array([f'商品{i:05d}' for i in range(20_000)], dtype=object)
+    money = lambda: rng.uniform(0, 50, rows).round(2)
+
+    category1 = level1[rng.integers(0, len(level1), rows)]
+    category1[rng.random(rows) < 0.01] = None
+    return pd.DataFrame({
+        '订单ID': rng.integers(1, rows // 3, rows).astype(str).astype(object),
+        '门店名称': stores[rng.integers(0, len(stores), rows)],
+        '日期': pd.to_datetime('2026-01-01') + pd.to_timedelta(rng.integers(0, 90, rows), unit='D'),
+        '渠道': channels[rng.integers(0, len(channels), rows)],
+        '商品名称': products[rng.integers(0, len(products), rows)],
+        '一级分类名': category1,
+        '三级分类名': level3[rng.integers(0, len(level3), rows)],
+        '月售': rng.integers(1, 5, rows),
+        '实收价格': money(),
+        '商品实售价': money(),
+        '商品采购成本': money(),
+        '利润额': money(),
+        '物流配送费': money(),
+        '平台服务费': money(),
+        '平台佣金': money(),
+        '预计订单收入': money(),
+        '企客后返': money(),
+        '用户支付配送费': money(),
+        '配送费减免金额': money(),
+        '满减金额': money(),
+        '商品减免金额': money(),
+        '新客减免金额': money(),
+        '商家代金券': money(),
+        '商家承担部分券': money(),
+        '满赠金额': money(),
+        '商家其他优惠': money(),
+    })
+
+
+def string_memory_mb(df: pd.DataFrame) -> float:
+    cols = [c for c in CATEGORICAL_COLUMNS if c in df.columns]
+    return df[cols].memory_usage(deep=True, index=False).sum() / 1024 / 1024
+
+
+def test_memory(rows: int = 5_000_000) -> bool:
+    """500万行内存基准"""
+    print(f"📊 构造 {rows:,} 行模拟数据...")
+    df = build_order_frame(rows)
+    cols = [c for c in CATEGORICAL_COLUMNS if c in df.columns]
+
+    variants = [(str(df[cols[0]].dtype), df)]
+    start = time.time()
+    encoded = encode_categorical_columns(df) if categorical_encoding_enabled() \
+        else df.astype({c: 'category' for c in cols})
+    encode_ms = (time.time() - start) * 1000
+    variants.append(('category', encoded))
+
+    baseline_total = df.memory_usage(deep=True, index=False).sum() / 1024 / 1024
+    print(f"   {'类型':<10} {'字符串列(MB)':>14} {'整表(MB)':>12}")
+    for name, frame in variants:
+        total = frame.memory_usage(deep=True, index=False).sum() / 1024 / 1024
+        print(f"   {name:<10} {string_memory_mb(frame):>14.1f} {total:>12.1f}")
+
+    saved = baseline_total - encoded.memory_usage(deep=True, index=False).sum() / 1024 / 1024
+    print(f"   编码耗时: {encode_ms:.0f}ms, 整表节省 {saved:.1f}MB ({saved / baseline_total * 100:.1f}%)")
+    return string_memory_mb(encoded) < string_memory_mb(df)
+
+
+def test_streaming_encoder() -> bool:
+    """加载层分批字典编码与整列编码一致"""
+    from backend.app.services.order_loader_service import _DictionaryEncoder
+
+    values = build_order_frame(200_000)['一级分类名'].to_numpy(dtype=object)
+    encoder = _DictionaryEncoder()
+    chunks = [encoder.encode(values[i:i + 30_000]) for i in range(0, len(values), 30_000)]
+    streamed = pd.Series(encoder.finish(chunks))
+    expected = pd.Series(values).astype('category')
+
+    same = (list(streamed.cat.categories) == list(expected.cat.categories)
+            and streamed.isna().equals(expected.isna())
+            and (streamed.astype(object).fillna('') == expected.astype(object).fillna('')).all())
+    print(f"{'✅' if same else '❌'} 分批字典编码与整列编码一致 (分类数 {len(streamed.cat.categories)})")
+    return same
+
+
+def load_diagnosis_analysis():
+    """直接加载诊断分析模块（不经过 components 包的 Dash 回调注册）"""
+    import importlib.util
+    path = PROJECT_ROOT / "components" / "today_must_do" / "diagnosis_analysis.py"
+    spec = importlib.util.spec_from_file_location("diagnosis_analysis", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_metrics_unchanged() -> bool:
+    """指标计算在编码前后结果一致"""
+    from backend.app.api.v1.orders import calculate_order_metrics
+    get_channel_distribution = load_diagnosis_analysis().get_channel_distribution
+
+    raw = build_order_frame(300_000)
+    encoded = encode_categorical_columns(raw)
+    if encoded is raw:
+        encoded = raw.astype({c: 'category' for c in CATEGORICAL_COLUMNS})
+
+    results = []
+
+    # 订单级聚合 + 按渠道分组（筛选单渠道后不应出现空组）
+    subset_raw = raw[raw['渠道'] == '饿了么']
+    subset_enc = encoded[encoded['渠道'] == '饿了么']
+    agg_raw = calculate_order_metrics(subset_raw)
+    agg_enc = decode_categorical_columns(calculate_order_metrics(subset_enc))
+    pd.testing.assert_frame_equal(
+        agg_raw.astype({'渠道': object, '门店名称': object}),
+        agg_enc.astype({'渠道': object, '门店名称': object}),
+        check_dtype=False,
+    )
+    by_channel_raw = agg_raw.groupby('渠道')['实收价格'].sum()
+    by_channel_enc = agg_enc.groupby('渠道')['实收价格'].sum()
+    results.append(by_channel_raw.round(6).to_dict() == by_channel_enc.round(6).to_dict())
+    print(f"{'✅' if results[-1] else '❌'} calculate_order_metrics + 渠道分组一致 ({len(by_channel_enc)} 个渠道)")
+
+    # 诊断渠道分布（value_counts 不应包含计数为0的分类）
+    results.append(get_channel_distribution(subset_raw) == get_channel_distribution(subset_enc))
+    print(f"{'✅' if results[-1] else '❌'} 诊断渠道分布一致: {get_channel_distribution(subset_enc)}")
+
+    # 空分类填充（分类列直接 fillna 新值会报错）
+    filled_raw = raw['一级分类名'].fillna('未分类')
+    filled_enc = safe_fillna(encoded['一级分类名'], '未分类')
+    results.append(filled_raw.astype(object).equals(filled_enc.astype(object)))
+    print(f"{'✅' if results[-1] else '❌'} 品类空值填充一致 (未分类 {int((filled_enc == '未分类').sum())} 行)")
+
+    # 筛选后计数（只保留实际出现的门店）
+    stores = ['惠宜选-门店01', '惠宜选-门店02']
+    counts_raw = raw[raw['门店名称'].isin(stores)]['门店名称'].value_counts().to_dict()
+    counts_enc = observed_value_counts(encoded[encoded['门店名称'].isin(stores)]['门店名称']).to_dict()
+    results.append(counts_raw == counts_enc)
+    print(f"{'✅' if results[-1] else '❌'} 筛选后门店计数一致 ({len(counts_enc)} 个门店)")
+    return all(results)
+
+
+def main():
+    print("""
+╔══════════════════════════════════════════════════════════════════╗
+║           🧬 订单数据分类编码测试（字典编码字符串列）
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    print(f"📊 pandas {pd.__version__}, 加载时分类编码: {categorical_encoding_enabled()}\n")
+
+    results = [
+        test_memory(),
+        test_streaming_encoder(),
+        test_metrics_unchanged(),
+    ]
+
+    print("\n" + "=" * 60)
+    if all(results):
+        print("✅ 全部通过")
+        return 0
+    print("❌ 存在失败项")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
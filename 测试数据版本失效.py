@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+测试脚本入口写入后数据版本失效（需要 PostgreSQL，Redis 可选）
+
+数据版本（Redis 全局版本号，Redis 不可用时为数据库 MAX(updated_at)）是
+共享快照、Redis 订单缓存、订单事实表、Parquet 过期日期缓存的共同失效依据。
+在 DATABASE_URL 指向的库中写入两个临时测试门店（结束后删除）：
+1. 批量导入脚本（BatchDataImporterEnhanced.import_orders）写入后，数据版本变化，
+   旧版本的共享快照不再被当前版本命中
+2. 写入门店的订单事实表失效，其余门店的事实表沿用到新版本，manifest 标记为不完整
+3. 数据生命周期清理（DataLifecycleManager.clean_store_data）删除门店后，
+   数据版本再次变化（需要 Redis；MAX(updated_at) 不随删除变化），该门店事实表删除
+
+运行：python 测试数据版本失效.py
+"""
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import numpy as np
+import pandas as pd
+
+from database.connection import check_connection
+from database.order_changes import get_data_version, _redis_manager
+from database.batch_import_enhanced import BatchDataImporterEnhanced
+from database.data_lifecycle_manager import DataLifecycleManager
+from backend.app.services.order_snapshot_service import OrderSnapshotService
+from backend.app.services.order_facts_service import order_facts_service
+
+SUFFIX = uuid.uuid4().hex[:8]
+STORE_A = f"__version_test_A_{SUFFIX}"
+STORE_B = f"__version_test_B_{SUFFIX}"
+
+
+def synthetic_orders(store: str, rows: int = 200) -> pd.DataFrame:
+    rng = np.random.default_rng(11)
+    return pd.DataFrame({
+        '订单ID': [f"{SUFFIX}-{i // 3}" for i in range(rows)],
+        '门店名称': store,
+        '日期': pd.Timestamp('2025-11-01') + pd.to_timedelta(rng.integers(0, 5, rows), unit='D'),
+        '渠道': rng.choice(['美团闪购', '饿了么'], rows),
+        '商品名称': rng.choice(['可乐', '薯片', '纸巾'], rows),
+        '商品实售价': rng.uniform(1, 20, rows).round(2),
+        '月售': rng.integers(1, 4, rows),
+    })
+
+
+def check(results: list, name: str, ok: bool):
+    print(f"{'✅' if ok else '❌'} {name}")
+    results.append(ok)
+
+
+def main():
+    print("""
+╔══════════════════════════════════════════════════════════════════╗
+║           🔢 脚本入口写入后数据版本失效测试
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    status = check_connection()
+    if not status.get('connected'):
+        print(f"❌ 需要 PostgreSQL（DATABASE_URL）: {status.get('message')}")
+        return 1
+    redis_enabled = _redis_manager() is not None
+    print(f"数据版本来源: {'Redis 全局版本号' if redis_enabled else '数据库 MAX(updated_at)'}")
+
+    results = []
+    snapshots = OrderSnapshotService(tempfile.mkdtemp(prefix="snapshot_test_"))
+    scope = f"order_data:{STORE_A}"
+    facts = pd.DataFrame({'订单ID': ['1'], '门店名称': ['x']})
+    importer = BatchDataImporterEnhanced(tempfile.mkdtemp(prefix="import_test_"), mode="replace")
+    try:
+        # 门店B 先导入，两个门店的事实表在同一版本发布
+        importer.import_orders(synthetic_orders(STORE_B), [STORE_B])
+        before = get_data_version()
+        snapshots.publish(scope, before, synthetic_orders(STORE_A))
+        order_facts_service.publish(STORE_A, before, facts)
+        order_facts_service.publish(STORE_B, before, facts)
+        check(results, "写入前快照命中", snapshots.get(scope, before) is not None)
+
+        # 1. 批量导入脚本写入门店A
+        inserted, _, _ = importer.import_orders(synthetic_orders(STORE_A), [STORE_A])
+        after = get_data_version()
+        check(results, f"导入 {inserted} 行后数据版本变化 ({before} → {after})", after != before)
+        check(results, "旧版本快照不再命中", snapshots.get(scope, after) is None)
+
+        # 2. 订单事实表：写入门店失效，其余门店沿用
+        check(results, "门店A 事实表已失效", order_facts_service.get(STORE_A, after) is None)
+        check(results, "门店B 事实表沿用到新版本", order_facts_service.get(STORE_B, after) is not None)
+        check(results, "manifest 标记为不完整（待补建门店A）", not order_facts_service.get_status()["complete"])
+
+        # 3. 数据生命周期清理删除门店A
+        order_facts_service.publish(STORE_A, after, facts)
+        DataLifecycleManager().clean_store_data(STORE_A, dry_run=False, auto_confirm=True)
+        deleted_version = get_data_version()
+        if redis_enabled:
+            check(results, f"删除门店后数据版本变化 ({after} → {deleted_version})", deleted_version != after)
+        else:
+            print("⏭️ 跳过删除后版本检查（Redis 不可用，MAX(updated_at) 不随删除变化）")
+        check(results, "删除门店的事实表已删除",
+              STORE_A not in order_facts_service.get_status()["stores"])
+    finally:
+        for store in (STORE_A, STORE_B):
+            DataLifecycleManager().clean_store_data(store, dry_run=False, auto_confirm=True)
+        order_facts_service.remove([STORE_A, STORE_B])
+        print(f"\n🧹 已删除测试门店 {STORE_A} / {STORE_B}")
+
+    print("\n" + "=" * 60)
+    if all(results):
+        print("✅ 全部通过")
+        return 0
+    print("❌ 存在失败项")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+测试按查询代价路由（QueryRouterService）
+
+1. 估算扫描行数：分区统计估算值与 DuckDB 实际行数对比（全量/单门店/日期范围/最近N天）
+2. 样本不足时按估算行数选择引擎；两个引擎都有样本后按滑动分位数耗时选择
+3. 每 N 次决策探索一次另一个引擎（渠道查询不探索）
+4. 数据版本变化时后台复查数据量（不在查询线程执行 COUNT(*)）
+5. DuckDB 耗时样本从查询开始计时（不含 _ensure_fresh）
+"""
+import sys
+from pathlib import Path
+import time
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "backend" / "app"))
+
+from backend.app.services.duckdb_service import duckdb_service
+from backend.app.services.query_router_service import QueryEngine, QueryRouterService
+
+
+def actual_rows(store_name=None, start_date=None, end_date=None) -> int:
+    clauses, params = duckdb_service.row_filters(store_name, start_date, end_date, by_day=True)
+    sql = f"SELECT COUNT(*) FROM {duckdb_service.get_raw_source()} {duckdb_service._where_sql(clauses)}"
+    with duckdb_service._pool.cursor() as cur:
+        return cur.execute(sql, params).fetchone()[0]
+
+
+def test_estimate(router: QueryRouterService) -> bool:
+    """估算行数与实际行数（门店按均摊估算，允许偏差）"""
+    stores = duckdb_service.query_distinct('门店名称')
+    date_range = duckdb_service.query_date_range()
+    last_days = sorted(router._partition_stats["day_rows"])[-7:]
+    cases = [
+        ("全量", {}, 0.01),
+        ("日期范围", {"start_date": date_range["min_date"], "end_date": last_days[0]}, 0.01),
+        ("单门店", {"store_name": stores[0]}, 1.0),
+    ]
+    results = []
+    for label, filters, tolerance in cases:
+        estimated = router.estimate_rows(**filters)
+        actual = actual_rows(**filters)
+        ok = abs(estimated - actual) <= max(actual, 1) * tolerance
+        results.append(ok)
+        print(f"{'✅' if ok else '❌'} {label}: 估算 {estimated:,} 行，实际 {actual:,} 行")
+
+    estimated = router.estimate_rows(days=7)
+    actual = actual_rows(start_date=last_days[0], end_date=last_days[-1])
+    ok = abs(estimated - actual) <= actual * 0.01
+    results.append(ok)
+    print(f"{'✅' if ok else '❌'} 最近7天: 估算 {estimated:,} 行，实际 {actual:,} 行")
+    return all(results)
+
+
+def test_cost_routing(router: QueryRouterService) -> bool:
+    """先验 → 分位数 → 探索（两个引擎都可用时的决策逻辑）"""
+    router._postgresql_available = True
+    router._duckdb_available = True
+    router.EXPLORE_EVERY = 0
+    results = []
+
+    small = router._route("overview", 50_000)
+    large = router._route("overview", 2_000_000)
+    ok = small.engine == QueryEngine.POSTGRESQL and large.engine == QueryEngine.DUCKDB
+    results.append(ok)
+    print(f"{'✅' if ok else '❌'} 无样本: 5万行 → {small.engine.value}，200万行 → {large.engine.value}")
+
+    # 小查询上 DuckDB 实测更快 → 改走 DuckDB
+    for _ in range(router.MIN_SAMPLES):
+        router.record_query(QueryEngine.POSTGRESQL, small.shape, 120.0)
+        router.record_query(QueryEngine.DUCKDB, small.shape, 40.0)
+    decision = router._route("overview", 50_000)
+    ok = decision.engine == QueryEngine.DUCKDB
+    results.append(ok)
+    print(f"{'✅' if ok else '❌'} 有样本: 5万行 → {decision.engine.value}（{decision.reason}）")
+
+    # 另一形状不受影响
+    decision = router._route("trend", 50_000)
+    ok = decision.engine == QueryEngine.POSTGRESQL
+    results.append(ok)
+    print(f"{'✅' if ok else '❌'} 其他查询形状仍按估算行数: trend 5万行 → {decision.engine.value}")
+
+    # 每 N 次探索一次
+    router.EXPLORE_EVERY = 5
+    engines = [router._route("categories", 50_000).engine for _ in range(10)]
+    explored = sum(1 for e in engines if e == QueryEngine.DUCKDB)
+    ok = explored == 2
+    results.append(ok)
+    print(f"{'✅' if ok else '❌'} 探索: 10 次决策中 {explored} 次路由到另一个引擎")
+
+    # 渠道查询的 PostgreSQL 路径不产生耗时样本，不探索
+    engines = [router._route("channels", 2_000_000, explore=False).engine for _ in range(10)]
+    ok = all(e == QueryEngine.DUCKDB for e in engines)
+    results.append(ok)
+    print(f"{'✅' if ok else '❌'} 渠道查询不探索: 10 次决策都走 {engines[0].value}")
+    return all(results)
+
+
+def test_duckdb_sample(router: QueryRouterService) -> bool:
+    """DuckDB 耗时样本只计查询本身（不含 _ensure_fresh，首次调用时为同步初始化）"""
+    router._forced_engine = QueryEngine.DUCKDB
+    ensure_fresh = router._ensure_fresh
+    router._ensure_fresh = lambda: (time.sleep(0.5), ensure_fresh())
+    try:
+        result = router.query_overview()
+    finally:
+        router._ensure_fresh = ensure_fresh
+        router._forced_engine = None
+    shape = f"overview:{router._get_data_level(result.estimated_rows)[0]}"
+    sample = router._latency._samples[(QueryEngine.DUCKDB.value, shape)][-1]
+    ok = sample <= result.query_time_ms - 500 + 1  # 注入的 500ms 只计入请求总耗时
+    print(f"{'✅' if ok else '❌'} DuckDB 耗时样本 {sample:.1f}ms 不含刷新检查（请求总耗时 {result.query_time_ms:.0f}ms）")
+    return ok
+
+
+def test_recheck(router: QueryRouterService) -> bool:
+    """数据版本变化 → 后台复查"""
+    rechecks = router._stats["rechecks"]
+    router._partition_stats["version"] = -1
+    start = time.perf_counter()
+    router._ensure_fresh()
+    elapsed = (time.perf_counter() - start) * 1000
+    for _ in range(100):
+        if router._stats["rechecks"] > rechecks:
+            break
+        time.sleep(0.1)
+    ok = router._stats["rechecks"] == rechecks + 1 and router._partition_stats["version"] == duckdb_service.data_version()
+    print(f"{'✅' if ok else '❌'} 数据版本变化后后台复查（查询线程耗时 {elapsed:.1f}ms）")
+    return ok
+
+
+def main():
+    print("""
+╔══════════════════════════════════════════════════════════════════╗
+║           🧠 按查询代价路由测试
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    if not duckdb_service.has_parquet_data():
+        print("❌ 没有Parquet数据，请先同步数据")
+        return 1
+
+    router = QueryRouterService()
+    report = router.initialize()
+    print(f"📊 数据量: {report['record_count']:,} 条，默认引擎: {report['current_engine']}")
+    print(f"   PostgreSQL: {report['engines']['postgresql']['reason']}")
+    print(f"   DuckDB: {report['engines']['duckdb']['reason']}\n")
+
+    result = router.query_overview()
+    print(f"📋 概览查询: {result.engine.value}，估算 {result.estimated_rows:,} 行，{result.route_reason}\n")
+
+    results = [
+        test_estimate(router),
+        test_recheck(router),
+        test_cost_routing(router),
+        test_duckdb_sample(router),
+    ]
+
+    print("\n" + "=" * 60)
+    if all(results):
+        print("✅ 全部通过")
+        return 0
+    print("❌ 存在失败项")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
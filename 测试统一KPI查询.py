@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+测试统一 KPI 查询计划（一次扫描：六大卡片 + GMV + 营销成本）
+
+1. 六大卡片与改造前的 DuckDB 两次扫描查询结果一致
+2. GMV / 营销成本与 store_daily_summary 同步SQL（gmv_order_level → gmv_daily）口径一致
+3. PostgreSQL 方言SQL：在 DuckDB 中建立英文列名视图执行，结果与 DuckDB 方言一致
+4. 执行计划中原始数据只扫描一次（改造前两次）
+"""
+import sys
+from pathlib import Path
+import time
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "backend" / "app"))
+
+from backend.app.services.duckdb_service import duckdb_service
+from backend.app.services.kpi_query_plan import KPI_COLUMNS, build_kpi_sql, parse_kpi_row
+
+
+def run(sql: str, params=None):
+    with duckdb_service._pool.cursor() as cur:
+        return cur.execute(sql, params or []).fetchall()
+
+
+def where_for(filters: dict):
+    """与 DuckDBService._query_kpi_from_raw 相同的过滤条件"""
+    clauses, params = duckdb_service.row_filters(
+        filters.get("store_name"), filters.get("start_date"), filters.get("end_date"), filters.get("channel")
+    )
+    return duckdb_service._where_sql(clauses), params
+
+
+def legacy_kpi(filters: dict) -> dict:
+    """改造前的 KPI 查询：订单级 CTE 一次扫描 + 动销商品数再扫描一次"""
+    where_sql, params = where_for(filters)
+    source = duckdb_service.get_raw_source()
+    result = run(f"""
+        WITH order_level AS (
+            SELECT 订单ID, 门店名称,
+                SUM(实收价格 * 月售) as 订单金额,
+                SUM(利润额) - SUM(平台服务费) - MAX(物流配送费) + SUM(企客后返) as 订单利润
+            FROM {source}
+            {where_sql}
+            GROUP BY 订单ID, 门店名称
+        )
+        SELECT COUNT(*), COALESCE(SUM(订单金额), 0), COALESCE(SUM(订单利润), 0),
+            COALESCE(AVG(订单金额), 0), COALESCE(SUM(订单利润) / NULLIF(SUM(订单金额), 0) * 100, 0)
+        FROM order_level
+    """, params)[0]
+    active = run(f"""
+        SELECT COUNT(DISTINCT 商品名称) FROM {source}
+        {where_sql} {"AND" if where_sql else "WHERE"} 月售 > 0
+    """, params)[0][0]
+    return {
+        "total_orders": int(result[0] or 0),
+        "total_actual_sales": round(float(result[1] or 0), 2),
+        "total_profit": round(float(result[2] or 0), 2),
+        "avg_order_value": round(float(result[3] or 0), 2),
+        "profit_rate": round(float(result[4] or 0), 2),
+        "active_products": int(active or 0),
+    }
+
+
+def summary_gmv(filters: dict) -> tuple:
+    """store_daily_summary 的 GMV / 营销成本口径（按 门店/日期/订单/渠道 取订单级，再求和）"""
+    where_sql, params = where_for(filters)
+    gmv_where = f"{where_sql} {'AND' if where_sql else 'WHERE'} 商品原价 > 0"
+    row = run(f"""
+        WITH gmv_order_level AS (
+            SELECT
+                SUM(COALESCE(商品原价, 0) * COALESCE(月售, 1)) as order_original_price_sales,
+                MAX(COALESCE(打包袋金额, 0)) as order_packaging_fee,
+                MAX(COALESCE(用户支付配送费, 0)) as order_user_paid_delivery_gmv,
+                MAX(COALESCE(满减金额, 0)) + MAX(COALESCE(商品减免金额, 0)) +
+                MAX(COALESCE(商家代金券, 0)) + MAX(COALESCE(商家承担部分券, 0)) +
+                MAX(COALESCE(满赠金额, 0)) + MAX(COALESCE(商家其他优惠, 0)) +
+                MAX(COALESCE(新客减免金额, 0)) as order_marketing_cost_gmv
+            FROM {duckdb_service.get_raw_source()}
+            {gmv_where}
+            GROUP BY 门店名称, CAST(日期 AS DATE), 订单ID, 渠道
+        )
+        SELECT
+            COALESCE(SUM(order_original_price_sales + order_packaging_fee + order_user_paid_delivery_gmv), 0),
+            COALESCE(SUM(order_marketing_cost_gmv), 0)
+        FROM gmv_order_level
+    """, params)[0]
+    return round(float(row[0]), 2), round(float(row[1]), 2)
+
+
+def postgresql_dialect_kpi(filters: dict) -> dict:
+    """PostgreSQL 方言SQL在 DuckDB 英文列名视图上执行"""
+    mapping = KPI_COLUMNS["postgresql"]
+    select_list = ", ".join(f'"{KPI_COLUMNS["duckdb"][k]}" AS "{v}"' for k, v in mapping.items())
+    source = (f"(SELECT {select_list}, 日期 AS date, 渠道 AS channel "
+              f"FROM {duckdb_service.get_raw_source()}) AS orders")
+
+    clauses, params = [], []
+    if filters.get("store_name"):
+        clauses.append("store_name = ?")
+        params.append(filters["store_name"])
+    if filters.get("start_date"):
+        clauses.append("date >= CAST(? AS TIMESTAMP)")
+        params.append(filters["start_date"])
+    if filters.get("end_date"):
+        clauses.append("date <= CAST(? AS TIMESTAMP)")
+        params.append(filters["end_date"])
+    if filters.get("channel"):
+        clauses.append("channel = ?")
+        params.append(filters["channel"])
+    where_sql = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return parse_kpi_row(run(build_kpi_sql("postgresql", source, where_sql), params)[0])
+
+
+def count_scans(sql: str, params) -> int:
+    """执行计划中 READ_PARQUET 算子的个数（算子名下一行是分隔线，Function: 行不计）"""
+    lines = "\n".join(row[1] for row in run(f"EXPLAIN {sql}", params)).split("\n")
+    return sum(
+        1 for line, below in zip(lines, lines[1:])
+        for cell, cell_below in zip(line.split("│"), below.split("│"))
+        if cell.strip() == "READ_PARQUET" and cell_below.strip().startswith("─")
+    )
+
+
+def test_equivalence(cases: list) -> bool:
+    results = []
+    for label, filters in cases:
+        unified = duckdb_service.query_kpi(**filters)
+        legacy = legacy_kpi(filters)
+        six_same = all(unified[k] == v for k, v in legacy.items())
+        gmv, marketing = summary_gmv(filters)
+        gmv_same = unified["gmv"] == gmv and unified["marketing_cost"] == marketing
+        pg_same = postgresql_dialect_kpi(filters) == unified
+
+        ok = six_same and gmv_same and pg_same
+        results.append(ok)
+        print(f"{'✅' if ok else '❌'} {label}: 六大卡片{'一致' if six_same else '不一致'}, "
+              f"GMV/营销成本{'一致' if gmv_same else '不一致'}, PostgreSQL方言{'一致' if pg_same else '不一致'}")
+        print(f"     订单 {unified['total_orders']:,}, 实收 {unified['total_actual_sales']:,}, "
+              f"动销 {unified['active_products']}, GMV {unified['gmv']:,}, 营销成本率 {unified['marketing_cost_rate']}%")
+        if not ok:
+            print(f"     改造前: {legacy}, GMV/营销成本: {(gmv, marketing)}")
+            print(f"     统一计划: {unified}")
+    return all(results)
+
+
+def test_single_scan(filters: dict, runs: int = 20) -> bool:
+    where_sql, params = where_for(filters)
+    source = duckdb_service.get_raw_source()
+    unified_sql = build_kpi_sql("duckdb", source, where_sql)
+    scans = count_scans(unified_sql, params)
+    print(f"\n📊 执行计划中的Parquet扫描: 统一计划 {scans} 次（改造前 2 次）")
+
+    def timed(func):
+        func()
+        start = time.perf_counter()
+        for _ in range(runs):
+            func()
+        return (time.perf_counter() - start) * 1000 / runs
+
+    before = timed(lambda: (legacy_kpi(filters), summary_gmv(filters)))
+    after = timed(lambda: run(unified_sql, params))
+    print(f"   改造前（KPI 两次扫描 + GMV 一次扫描）: {before:.1f}ms")
+    print(f"   统一计划（一次扫描）: {after:.1f}ms")
+    return scans == 1
+
+
+def main():
+    print("""
+╔══════════════════════════════════════════════════════════════════╗
+║           🧮 统一 KPI 查询计划测试（一次扫描）
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    if not duckdb_service.has_parquet_data():
+        print("❌ 没有Parquet数据，请先同步数据")
+        return 1
+
+    stores = duckdb_service.query_distinct('门店名称')
+    channels = duckdb_service.query_distinct('渠道', stores[0])
+    date_range = duckdb_service.query_date_range()
+    cases = [
+        ("全部数据", {}),
+        ("单门店", {"store_name": stores[0]}),
+        ("单门店+日期范围", {"store_name": stores[0], "start_date": date_range["min_date"],
+                       "end_date": date_range["max_date"]}),
+        ("单门店+渠道", {"store_name": stores[0], "channel": channels[0]}),
+        ("日期范围", {"start_date": date_range["min_date"], "end_date": date_range["max_date"]}),
+    ]
+
+    results = [
+        test_equivalence(cases),
+        test_single_scan({}),
+    ]
+
+    print("\n" + "=" * 60)
+    if all(results):
+        print("✅ 全部通过")
+        return 0
+    print("❌ 存在失败项")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
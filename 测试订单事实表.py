@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+测试订单级事实表与实时 calculate_order_metrics 一致
+
+事实表按门店物化 calculate_order_metrics(门店明细)，端点读取后再按日期/渠道筛选：
+1. 单门店：事实表 = calculate_order_metrics(该门店明细)
+2. 单门店 + 日期/渠道：筛选后的事实表 = calculate_order_metrics(同条件筛选的明细)
+3. 全部门店：事实表 = 事实表缺失时的实时计算 calculate_order_metrics_by_store(全部明细)
+4. 口径：不同门店出现相同订单ID时，事实表与实时计算都按门店分别保留，
+   结果不随事实表是否已建好而变化
+
+运行：python 测试订单事实表.py
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT / "backend"))
+sys.path.insert(0, str(PROJECT_ROOT))
+# backend/app 放在最后：`services` 优先解析为项目根目录的服务包
+sys.path.append(str(PROJECT_ROOT / "backend" / "app"))
+
+import numpy as np
+import pandas as pd
+
+from backend.app.api.v1.orders import calculate_order_metrics, calculate_order_metrics_by_store
+from backend.app.services.order_facts_service import OrderFactsService
+from backend.app.services.order_loader_service import OrderQuery
+
+STORES = ['惠宜选-泰州泰兴店', '惠宜选-南京江宁店']
+SHARED_ORDER_ID = 'SHARED-0001'
+VERSION = '42'
+
+
+def build_order_frame(orders_per_store: int = 2_000) -> pd.DataFrame:
+    """商品行明细：同一订单的门店/日期/渠道一致，另有一个订单ID在两个门店各出现一次"""
+    rng = np.random.default_rng(7)
+    frames = []
+    for s, store in enumerate(STORES):
+        order_ids = np.array([f"{s}-{i}" for i in range(orders_per_store)] + [SHARED_ORDER_ID])
+        lines = rng.integers(1, 4, len(order_ids))
+        ids = np.repeat(order_ids, lines)
+        rows = len(ids)
+        money = lambda: rng.uniform(0, 30, rows).round(2)
+        order_day = dict(zip(order_ids, pd.Timestamp('2026-01-01') + pd.to_timedelta(rng.integers(0, 20, len(order_ids)), unit='D')))
+        order_channel = dict(zip(order_ids, rng.choice(['美团闪购', '饿了么', '京东到家', '自营'], len(order_ids))))
+        order_channel[SHARED_ORDER_ID] = '自营'  # 不收平台服务费的渠道，不会被异常订单规则过滤
+        frames.append(pd.DataFrame({
+            '订单ID': ids,
+            '门店名称': store,
+            '日期': [order_day[i] for i in ids],
+            '渠道': [order_channel[i] for i in ids],
+            '商品名称': rng.choice([f'商品{i}' for i in range(50)], rows),
+            '月售': rng.integers(1, 4, rows),
+            '实收价格': money(),
+            '商品实售价': money(),
+            '商品采购成本': money(),
+            '利润额': money(),
+            '预计订单收入': money(),
+            '物流配送费': money(),
+            '平台服务费': rng.choice([0.0, 1.5, 3.0], rows),
+            '平台佣金': money(),
+            '企客后返': money(),
+            '用户支付配送费': money(),
+            '配送费减免金额': money(),
+            '满减金额': money(),
+            '商品减免金额': money(),
+            '新客减免金额': money(),
+            '商家代金券': money(),
+            '商家承担部分券': money(),
+            '满赠金额': money(),
+            '商家其他优惠': money(),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def same_facts(name: str, facts: pd.DataFrame, expected: pd.DataFrame) -> bool:
+    """按 (门店, 订单ID) 排序后逐列比较（dtype 经 Parquet 往返可能不同，只比较值）"""
+    keys = ['门店名称', '订单ID']
+    left = facts[expected.columns].sort_values(keys).reset_index(drop=True)
+    right = expected.sort_values(keys).reset_index(drop=True)
+    try:
+        pd.testing.assert_frame_equal(left, right, check_dtype=False, check_categorical=False)
+        ok = True
+    except AssertionError as e:
+        print(f"   {str(e)[:200]}")
+        ok = False
+    print(f"{'✅' if ok else '❌'} {name}: 事实表 {len(facts)} 单 / 实时计算 {len(expected)} 单")
+    return ok
+
+
+def main():
+    print("""
+╔══════════════════════════════════════════════════════════════════╗
+║           📊 订单事实表 vs calculate_order_metrics
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    raw = build_order_frame()
+    service = OrderFactsService(tempfile.mkdtemp(prefix="order_facts_test_"))
+    for store in STORES:
+        service.publish(store, VERSION, calculate_order_metrics(raw[raw['门店名称'] == store]))
+    service.mark_complete()
+
+    results = []
+    store = STORES[0]
+    store_raw = raw[raw['门店名称'] == store]
+    results.append(same_facts("单门店", service.get(store, VERSION), calculate_order_metrics(store_raw)))
+
+    query = OrderQuery.build(store, '2026-01-05', '2026-01-12', ['美团闪购', '饿了么'])
+    results.append(same_facts(
+        "单门店 + 日期/渠道",
+        query.apply(service.get(store, VERSION)),
+        calculate_order_metrics(query.apply(store_raw)),
+    ))
+
+    fallback = calculate_order_metrics_by_store(raw)
+    all_facts = service.get(None, VERSION)
+    results.append(same_facts("全部门店（事实表 = 缺失时的实时计算）", all_facts, fallback))
+
+    query = OrderQuery.build(None, '2026-01-05', '2026-01-12', ['自营'])
+    results.append(same_facts(
+        "全部门店 + 日期/渠道",
+        query.apply(all_facts),
+        calculate_order_metrics_by_store(query.apply(raw)),
+    ))
+
+    shared_facts = (all_facts['订单ID'] == SHARED_ORDER_ID).sum()
+    shared_fallback = (fallback['订单ID'] == SHARED_ORDER_ID).sum()
+    ok = shared_facts == 2 and shared_fallback == 2
+    print(f"{'✅' if ok else '❌'} 跨门店相同订单ID：事实表 {shared_facts} 单，实时计算 {shared_fallback} 单")
+    results.append(ok)
+
+    print("\n" + "=" * 60)
+    if all(results):
+        print("✅ 全部通过")
+        return 0
+    print("❌ 存在失败项")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+测试订单向量化导入（database/order_bulk_import.py）
+
+不需要数据库：
+1. prepare_orders 与原逐行映射（iterrows + safe_float/safe_int/safe_str）逐列一致
+2. 跳过规则一致：订单ID为空/'nan'、日期缺失或无法解析
+   各入口日期列优先级：批量导入 日期 优先且不回退，看板上传/智能导入 下单时间 优先
+3. COPY 用的 CSV：空字符串与 NULL 区分、日期保留微秒、门店加盟类型空值为 NULL
+4. 向量化映射速度（行/秒）对比逐行映射
+"""
+import csv
+import io
+import sys
+import time
+from pathlib import Path
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import numpy as np
+import pandas as pd
+
+from database.order_bulk_import import (
+    ORDER_COLUMN_SOURCES, COPY_COLUMNS, BATCH_DATE_COLUMNS, UPLOAD_DATE_COLUMNS,
+    prepare_orders, _copy_chunk,
+)
+
+
+def safe_float(val, default=0):
+    if pd.isna(val): return default
+    try: return float(val)
+    except: return default
+
+
+def safe_int(val, default=0):
+    if pd.isna(val): return default
+    try: return int(val)
+    except: return default
+
+
+def safe_str(val, default=''):
+    if pd.isna(val): return default
+    return str(val)
+
+
+def map_rows(df: pd.DataFrame, default_store: str):
+    """原批量导入的逐行映射（对照基准）"""
+    date_col = next(c for c in BATCH_DATE_COLUMNS if c in df.columns)
+    rows, skipped = [], 0
+    for _, row in df.iterrows():
+        order_id = str(row.get('订单ID', ''))
+        if not order_id or order_id == 'nan':
+            skipped += 1
+            continue
+        order_date = None
+        if pd.notna(row.get(date_col)):
+            try:
+                order_date = pd.to_datetime(row[date_col])
+                if pd.isna(order_date):
+                    order_date = None
+            except:
+                order_date = None
+        if order_date is None:
+            skipped += 1
+            continue
+
+        store = safe_str(row.get('门店名称', '')) or default_store
+        record = {'order_id': order_id, 'date': order_date, 'store_name': store}
+        for column, (candidates, kind, default) in ORDER_COLUMN_SOURCES.items():
+            value = next((row.get(c) for c in candidates if c in row.index), None)
+            if kind == 'str':
+                record[column] = safe_str(value, default) if value is not None else default
+            elif kind == 'float':
+                record[column] = safe_float(value, default) if value is not None else default
+            elif kind == 'int':
+                record[column] = safe_int(value, default) if value is not None else default
+            else:
+                record[column] = safe_int(value) if value is not None and pd.notna(value) else None
+        rows.append(record)
+    return rows, skipped
+
+
+def synthetic_orders(n: int = 20_000) -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    dates = pd.Timestamp('2025-10-01') + pd.to_timedelta(rng.integers(0, 30 * 86400, n), unit='s')
+    df = pd.DataFrame({
+        '订单ID': rng.integers(10**9, 10**10, n).astype(str),
+        '日期': dates.strftime('%Y-%m-%d %H:%M:%S'),
+        '门店名称': rng.choice(['门店A', '门店B', None], n),
+        '商品名称': rng.choice(['苹果', '香蕉', '牛奶', '面包'], n),
+        '渠道': rng.choice(['美团', '饿了么', None], n),
+        '一级分类名': rng.choice(['水果', '乳品', None], n),
+        '商品实售价': rng.uniform(1, 50, n).round(2),
+        '商品采购成本': rng.uniform(0, 30, n).round(2),
+        '实收价格': rng.uniform(1, 60, n).round(2),
+        '月售': rng.integers(1, 5, n).astype(float),
+        '库存': rng.integers(0, 100, n),
+        '物流配送费': rng.choice([3.5, np.nan, 5.0], n),
+        '平台佣金': rng.uniform(0, 5, n).round(2),
+        '配送距离': rng.choice(['1200', 'abc', None], n),
+        '门店加盟类型': rng.choice([1.0, 2.0, np.nan], n),
+        '条码': rng.choice(['6901234', None], n),
+    })
+    # 无效行：订单ID空/'nan'，日期缺失/无法解析
+    df.loc[::97, '订单ID'] = None
+    df.loc[5::101, '订单ID'] = 'nan'
+    df.loc[7::89, '日期'] = None
+    df.loc[11::103, '日期'] = '不是日期'
+    return df
+
+
+def compare(df: pd.DataFrame, default_store: str = '默认门店') -> bool:
+    start = time.perf_counter()
+    expected, expected_skipped = map_rows(df, default_store)
+    row_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    frame, skipped = prepare_orders(df, default_store, BATCH_DATE_COLUMNS, date_fallback=False)
+    vector_seconds = time.perf_counter() - start
+
+    expected = pd.DataFrame(expected, columns=COPY_COLUMNS[:-2])
+    actual = frame[COPY_COLUMNS[:-2]].reset_index(drop=True)
+    mismatched = []
+    for column in expected.columns:
+        left, right = expected[column], actual[column]
+        if column == 'date':
+            same = (pd.to_datetime(left).values == right.values).all()
+        elif column == 'store_franchise_type':
+            same = left.fillna(-1).astype(int).tolist() == right.fillna(-1).astype(int).tolist()
+        else:
+            same = left.tolist() == right.tolist()
+        if not same:
+            mismatched.append(column)
+
+    checks = {
+        f"跳过行数一致（{skipped:,}）": skipped == expected_skipped,
+        f"写入行数一致（{len(frame):,}）": len(frame) == len(expected),
+        "逐列一致" + (f"，不一致: {mismatched}" if mismatched else ""): not mismatched,
+    }
+    for name, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+    print(f"📊 逐行映射 {len(df) / row_seconds:,.0f} 行/秒，向量化映射 {len(df) / vector_seconds:,.0f} 行/秒"
+          f"（{row_seconds / vector_seconds:.0f}x）")
+    return all(checks.values())
+
+
+def test_date_priority() -> bool:
+    df = pd.DataFrame({
+        '订单ID': ['A1', 'A2', 'A3'],
+        '日期': ['2025-10-01', '无效', None],
+        '下单时间': ['2025-10-01 08:15:00', '2025-10-02 09:30:00', '2025-10-03 10:00:00'],
+        '门店名称': ['门店A', None, '门店A'],
+    })
+    batch, batch_skipped = prepare_orders(df, '门店A', BATCH_DATE_COLUMNS, date_fallback=False)
+    upload, _ = prepare_orders(df, '', UPLOAD_DATE_COLUMNS, date_fallback=False)
+    smart, _ = prepare_orders(df, '')
+    only_date = df.drop(columns=['下单时间'])
+    smart_only_date, smart_skipped = prepare_orders(only_date, '')
+
+    checks = {
+        "批量导入：日期 优先，无效不回退到 下单时间（跳过 2 行）":
+            batch_skipped == 2 and batch['date'].tolist() == [pd.Timestamp('2025-10-01')],
+        "看板上传：下单时间 优先，保留时分秒":
+            upload['date'].dt.hour.tolist() == [8, 9, 10],
+        "看板上传/智能导入：门店名称为空写 ''（与原逻辑一致）":
+            upload['store_name'].tolist() == ['门店A', '', '门店A'] and smart['store_name'].tolist()[1] == '',
+        "智能导入：下单时间 优先": smart['date'].dt.hour.tolist() == [8, 9, 10],
+        "智能导入：无 下单时间 时逐行回退到 日期，无效跳过": smart_skipped == 2 and len(smart_only_date) == 1,
+    }
+    for name, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+    return all(checks.values())
+
+
+class CaptureCursor:
+    """记录 COPY 的 CSV 内容（psycopg2 接口）"""
+
+    def copy_expert(self, sql, buffer):
+        self.sql, self.text = sql, buffer.read()
+
+
+def test_copy_csv() -> bool:
+    df = pd.DataFrame({
+        '订单ID': ['A1', 'A2'],
+        '日期': ['2025-10-01 08:00:00.123456', '2025-10-02 09:30:00'],
+        '门店名称': ['门店A', '门店A'],
+        '商品名称': ['苹果, "红富士"', ''],
+        '门店加盟类型': [1, None],
+    })
+    frame, _ = prepare_orders(df)
+    cursor = CaptureCursor()
+    _copy_chunk(cursor, "COPY orders FROM STDIN", frame)
+    rows = list(csv.reader(io.StringIO(cursor.text)))
+    position = {c: i for i, c in enumerate(COPY_COLUMNS)}
+    raw_lines = cursor.text.splitlines()
+
+    checks = {
+        "每行字段数与 COPY_COLUMNS 一致": all(len(r) == len(COPY_COLUMNS) for r in rows),
+        "含逗号/引号的字符串原样往返": rows[0][position['product_name']] == '苹果, "红富士"',
+        "空字符串加引号（非 NULL）": ',"",' in raw_lines[1],
+        "日期保留微秒": rows[0][position['date']] == '2025-10-01 08:00:00.123456',
+        "门店加盟类型空值写空字段（FORCE_NULL 为 NULL）": rows[1][position['store_franchise_type']] == ''
+                                                        and rows[0][position['store_franchise_type']] == '1',
+    }
+    for name, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+    return all(checks.values())
+
+
+def main():
+    print("""
+╔══════════════════════════════════════════════════════════════════╗
+║           ⚡ 订单向量化导入测试
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    results = []
+    print("📋 合成数据（含无效订单ID/日期、空值、非数值）")
+    results.append(compare(synthetic_orders()))
+
+    files = sorted((PROJECT_ROOT / "data" / "raw").glob("**/*.parquet"))
+    if files:
+        df = pd.read_parquet(files[-1])
+        df['日期'] = df['日期'].astype(str)
+        print(f"\n📋 原始Parquet {files[-1].name}（{len(df):,} 行）")
+        results.append(compare(df))
+
+    print("\n📋 日期列优先级")
+    results.append(test_date_priority())
+
+    print("\n📋 COPY CSV 格式")
+    results.append(test_copy_csv())
+
+    print("\n" + "=" * 60)
+    if all(results):
+        print("✅ 全部通过")
+        return 0
+    print("❌ 存在失败项")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
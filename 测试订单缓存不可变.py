@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+测试订单缓存DataFrame不可变（Copy-on-Write共享）
+
+验证 get_order_data 返回的 shared_view：
+1. 各指标计算函数（会新增/替换列、原地赋值）执行后，缓存数据逐字节不变
+2. 绕过 shared_view 直接原地写缓存会报错
+3. shared_view 的内存开销远小于 .copy()
+4. 未开启 Copy-on-Write 的进程（不经过 main.py）中 shared_view 仍不深拷贝
+"""
+import subprocess
+import sys
+from pathlib import Path
+import time
+import tracemalloc
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT / "backend"))
+sys.path.insert(0, str(PROJECT_ROOT))
+# backend/app 放在最后：`services` 优先解析为项目根目录的服务包
+sys.path.append(str(PROJECT_ROOT / "backend" / "app"))
+
+import numpy as np
+import pandas as pd
+
+from cache_utils import (
+    enable_copy_on_write,
+    freeze_dataframe,
+    shared_view,
+    calculate_data_hash_fast,
+)
+
+
+def build_order_frame(rows: int = 200_000) -> pd.DataFrame:
+    """构造与 API_COLUMNS 一致的模拟订单数据"""
+    rng = np.random.default_rng(42)
+    order_count = rows // 3
+    money = lambda: rng.uniform(0, 50, rows).round(2)
+    return pd.DataFrame({
+        '订单ID': rng.integers(1, order_count, rows).astype(str),
+        '门店名称': rng.choice(['惠宜选-泰州泰兴店', '惠宜选-南京江宁店', '惠宜选-常州武进店'], rows),
+        '日期': pd.to_datetime('2026-01-01') + pd.to_timedelta(rng.integers(0, 30, rows), unit='D'),
+        '渠道': rng.choice(['美团闪购', '饿了么', '京东到家'], rows),
+        '商品名称': rng.choice([f'商品{i}' for i in range(500)], rows),
+        '一级分类名': rng.choice(['休闲食品', '饮料', '日用百货'], rows),
+        '三级分类名': rng.choice(['薯片', '碳酸饮料', '纸巾'], rows),
+        '月售': rng.integers(1, 5, rows),
+        '实收价格': money(),
+        '商品实售价': money(),
+        '商品原价': money(),
+        '商品采购成本': money(),
+        '利润额': money(),
+        '物流配送费': money(),
+        '平台服务费': money(),
+        '平台佣金': money(),
+        '预计订单收入': money(),
+        '企客后返': money(),
+        '用户支付配送费': money(),
+        '配送费减免金额': money(),
+        '满减金额': money(),
+        '商品减免金额': money(),
+        '新客减免金额': money(),
+        '商家代金券': money(),
+        '商家承担部分券': money(),
+        '满赠金额': money(),
+        '商家其他优惠': money(),
+        '打包袋金额': money(),
+        '库存': rng.integers(0, 100, rows),
+    })
+
+
+def test_cached_frame_not_mutated() -> bool:
+    """指标计算前后缓存数据不变"""
+    from backend.app.api.v1.orders import (
+        calculate_order_metrics,
+        calculate_gmv,
+        calculate_period_metrics,
+        calculate_channel_metrics,
+    )
+    from backend.app.api.v1.inventory_risk import calculate_inventory_risk_dash_style
+
+    cached = freeze_dataframe(build_order_frame())
+    before_hash = calculate_data_hash_fast(cached)
+    expected = cached.copy()
+
+    # 模拟端点的典型写法：新增/替换列、原地赋值、筛选后再赋值
+    df = shared_view(cached)
+    df['日期'] = pd.to_datetime(df['日期'])
+    df.loc[df['渠道'] == '饿了么', '利润额'] = 0
+    df['订单ID'] = df['订单ID'].astype(str)
+
+    calculate_order_metrics(shared_view(cached))
+    calculate_gmv(shared_view(cached))
+    calculate_period_metrics(shared_view(cached))
+    calculate_channel_metrics(shared_view(cached))
+    calculate_inventory_risk_dash_style(shared_view(cached))
+
+    pd.testing.assert_frame_equal(cached, expected)
+    same = calculate_data_hash_fast(cached) == before_hash
+    print(f"{'✅' if same else '❌'} 指标计算后缓存数据未被修改")
+    return same
+
+
+def test_direct_write_rejected() -> bool:
+    """绕过 shared_view 的原地写入被拒绝"""
+    cached = freeze_dataframe(build_order_frame(1_000))
+    try:
+        cached.loc[0, '利润额'] = -1
+    except ValueError:
+        print("✅ 直接原地写缓存被拒绝 (只读缓冲区)")
+        return True
+    print("❌ 直接原地写缓存未被拒绝")
+    return False
+
+
+def check_view_without_cow() -> bool:
+    """子进程入口：未开启 Copy-on-Write 时 shared_view 返回冻结的只读视图"""
+    from backend.app.api.v1.orders import calculate_order_metrics, calculate_gmv
+
+    assert pd.options.mode.copy_on_write is not True, "子进程不应开启 Copy-on-Write"
+    cached = build_order_frame(10_000)
+    expected = cached.copy()
+
+    df = shared_view(cached)
+    shared = np.shares_memory(df['实收价格'].to_numpy(), cached['实收价格'].to_numpy())
+    print(f"{'✅' if shared else '❌'} 未开启CoW: shared_view 与缓存共享底层数据（未深拷贝）")
+
+    # 新增/替换列只影响视图
+    df['日期'] = pd.to_datetime(df['日期']).dt.normalize()
+    df['利润额'] = df['利润额'] * 2
+    df['新列'] = 1
+    calculate_order_metrics(shared_view(cached))
+    calculate_gmv(shared_view(cached))
+
+    try:
+        df.loc[df['渠道'] == '饿了么', '实收价格'] = 0
+        rejected = False
+    except ValueError:
+        rejected = True
+    print(f"{'✅' if rejected else '❌'} 未开启CoW: 视图上的原地写入被拒绝")
+
+    pd.testing.assert_frame_equal(cached, expected)
+    print("✅ 未开启CoW: 缓存数据未被修改")
+    return shared and rejected
+
+
+def test_view_without_cow() -> bool:
+    """在不经过 main.py（未开启 Copy-on-Write）的独立进程中验证 shared_view"""
+    result = subprocess.run(
+        [sys.executable, __file__, "--without-cow"],
+        capture_output=True, text=True, cwd=str(PROJECT_ROOT), timeout=300,
+    )
+    for line in result.stdout.splitlines():
+        if line.startswith(('✅', '❌')) and '未开启CoW' in line:
+            print(line)
+    if result.returncode != 0:
+        print(f"❌ 未开启CoW的子进程失败:\n{result.stderr[-2000:]}")
+        return False
+    return True
+
+
+def test_view_cost() -> bool:
+    """shared_view 与 .copy() 的内存/耗时对比"""
+    cached = freeze_dataframe(build_order_frame())
+
+    for name, func in [('.copy()', lambda d: d.copy()), ('shared_view', shared_view)]:
+        tracemalloc.start()
+        start = time.time()
+        views = [func(cached) for _ in range(20)]
+        elapsed = (time.time() - start) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"   {name:<12} 20次: {elapsed:8.1f}ms, 峰值内存 {peak / 1024 / 1024:8.1f}MB")
+        del views
+    return True
+
+
+def main():
+    print("""
+╔══════════════════════════════════════════════════════════════════╗
+║           🔒 订单缓存不可变测试（Copy-on-Write）
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    # 先在未开启 Copy-on-Write 的子进程中验证，再开启本进程的 Copy-on-Write
+    without_cow = test_view_without_cow()
+
+    cow = enable_copy_on_write()
+    print(f"\n📊 pandas {pd.__version__}, Copy-on-Write: {cow}\n")
+
+    results = [
+        without_cow,
+        test_cached_frame_not_mutated(),
+        test_direct_write_rejected(),
+        test_view_cost(),
+    ]
+
+    print("\n" + "=" * 60)
+    if all(results):
+        print("✅ 全部通过")
+        return 0
+    print("❌ 存在失败项")
+    return 1
+
+
+if __name__ == "__main__":
+    if "--without-cow" in sys.argv:
+        sys.exit(0 if check_view_without_cow() else 1)
+    sys.exit(main())
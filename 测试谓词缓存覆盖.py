@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+测试谓词结果缓存的覆盖判断（OrderQuery.covers）
+
+缓存结果只有在包含全部所需筛选列时，才能通过 OrderQuery.apply 得到更窄查询的结果：
+1. 只含 渠道 列的全量结果不能覆盖指定门店的查询（缺少 门店名称 列，筛选会被跳过）
+2. 不含 日期 列的结果不能覆盖不同日期范围的查询
+3. 包含筛选列的投影结果可以覆盖，且 apply 结果与直接筛选一致
+4. 谓词完全相同时，投影结果无需筛选列即可覆盖
+
+运行：python 测试谓词缓存覆盖.py
+"""
+import sys
+from pathlib import Path
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT / "backend"))
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.append(str(PROJECT_ROOT / "backend" / "app"))
+
+import pandas as pd
+
+from backend.app.services.order_loader_service import OrderQuery
+
+STORES = ['门店A', '门店B']
+
+
+def build_frame() -> pd.DataFrame:
+    days = pd.date_range('2026-01-01', periods=10, freq='D')
+    return pd.DataFrame([
+        {'订单ID': f"{store}-{i}", '门店名称': store, '日期': day,
+         '渠道': ['美团闪购', '饿了么'][i % 2], '一级分类名': ['饮料', '零食'][i % 2], '实收价格': float(i)}
+        for store in STORES for i, day in enumerate(days)
+    ])
+
+
+def check(results: list, name: str, ok: bool):
+    print(f"{'✅' if ok else '❌'} {name}")
+    results.append(ok)
+
+
+def main():
+    print("""
+╔══════════════════════════════════════════════════════════════════╗
+║           🧩 谓词结果缓存覆盖判断
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    raw = build_frame()
+    results = []
+
+    channels_only = OrderQuery.build(None, columns=['渠道'])
+    check(results, "全量[渠道] 不覆盖 门店A[渠道]",
+          not channels_only.covers(OrderQuery.build(STORES[0], columns=['渠道'])))
+    check(results, "全量[渠道] 不覆盖 近3天[渠道]",
+          not channels_only.covers(OrderQuery.build(None, '2026-01-08', '2026-01-10', columns=['渠道'])))
+    check(results, "全量[渠道] 覆盖 饿了么[渠道]（筛选列在投影中）",
+          channels_only.covers(OrderQuery.build(None, channels=['饿了么'], columns=['渠道'])))
+    check(results, "全量[实收价格] 不覆盖 饮料[实收价格]",
+          not OrderQuery.build(None, columns=['实收价格']).covers(
+              OrderQuery.build(None, categories=['饮料'], columns=['实收价格'])))
+
+    cached = OrderQuery.build(None, '2026-01-01', '2026-01-10', columns=['门店名称', '日期', '实收价格'])
+    narrower = OrderQuery.build(STORES[0], '2026-01-03', '2026-01-05', columns=['实收价格'])
+    covered = cached.covers(narrower)
+    check(results, "含筛选列的投影结果覆盖更窄查询", covered)
+    if covered:
+        via_cache = narrower.apply(cached.apply(raw))
+        direct = narrower.apply(raw)
+        check(results, f"apply 结果一致 ({len(via_cache)} / {len(direct)} 行)",
+              via_cache.reset_index(drop=True).equals(direct.reset_index(drop=True)))
+
+    same = OrderQuery.build(STORES[0], '2026-01-03', '2026-01-05', columns=['实收价格'])
+    check(results, "谓词相同的投影结果可直接覆盖", same.covers(narrower))
+
+    print("\n" + "=" * 60)
+    if all(results):
+        print("✅ 全部通过")
+        return 0
+    print("❌ 存在失败项")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
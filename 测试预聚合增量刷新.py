@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+测试预聚合表按脏集合增量刷新（需要 PostgreSQL）
+
+在 DATABASE_URL 指向的库中写入两个临时测试门店（结束后删除，不影响其他门店）：
+1. COPY 导入合成订单后全量重建，作为初始状态
+2. 修改订单：删除某天全部订单、删除某天某渠道订单、修改某天金额、新增一天订单
+3. 只按脏集合 (门店, 日期) 刷新（共享暂存扫描 + 并行 upsert），与再次全量重建的结果逐表逐行一致
+4. 删除的日期/渠道在预聚合表中同步删除（清理行数 > 0）
+5. 配置驱动引擎 AggregationEngine 的增量 upsert 同样与其全量重建一致
+6. 其他门店的预聚合行数不变
+7. 暂存表不可用时的子查询来源（绑定参数）与暂存表结果一致；刷新开始时清理崩溃遗留的暂存表
+
+运行：python 测试预聚合增量刷新.py
+"""
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "backend" / "app"))
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from database.connection import SessionLocal, check_connection, init_database
+from database.order_bulk_import import import_orders_frame
+from backend.app.services.aggregation_config import get_all_table_names
+from backend.app.services.aggregation_engine import AggregationEngine, RefreshScope
+from backend.app.services.aggregation_sync_service import AggregationSyncService
+
+SUFFIX = uuid.uuid4().hex[:8]
+STORE_A = f"__agg_test_A_{SUFFIX}"
+STORE_B = f"__agg_test_B_{SUFFIX}"
+STORES = [STORE_A, STORE_B]
+FIRST_DAY = date(2025, 10, 1)
+DAYS = 10
+EXCLUDED_COLUMNS = {'id', 'created_at', 'updated_at'}
+
+
+def synthetic_orders(stores, first_day: date, days: int, orders_per_day: int = 40, seed: int = 7) -> pd.DataFrame:
+    """多渠道、多分类、全天各小时、不同配送距离的订单明细（每单 1~3 个商品）"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for store in stores:
+        for d in range(days):
+            day = datetime.combine(first_day + timedelta(days=d), datetime.min.time())
+            for n in range(orders_per_day):
+                order_id = f"{store}-{d}-{n}"
+                placed = day + timedelta(seconds=int(rng.integers(0, 86400)))
+                channel = rng.choice(['美团闪购', '饿了么', '京东到家'])
+                order_fields = {
+                    '物流配送费': round(float(rng.uniform(2, 8)), 2),
+                    '平台佣金': round(float(rng.uniform(0, 5)), 2),
+                    '用户支付配送费': float(rng.choice([0, 3])),
+                    '配送费减免金额': float(rng.choice([0, 1])),
+                    '满减金额': float(rng.choice([0, 5])),
+                    '商品减免金额': float(rng.choice([0, 2])),
+                    '新客减免金额': float(rng.choice([0, 3])),
+                    '配送距离': int(rng.integers(200, 6000)),
+                }
+                for _ in range(int(rng.integers(1, 4))):
+                    price = round(float(rng.uniform(3, 40)), 2)
+                    rows.append({
+                        '订单ID': order_id,
+                        '下单时间': placed,
+                        '门店名称': store,
+                        '渠道': channel,
+                        '商品名称': rng.choice(['苹果', '香蕉', '牛奶', '面包', '购物袋']),
+                        '一级分类名': rng.choice(['水果', '乳品', '烘焙']),
+                        '三级分类名': rng.choice(['时令', '常温', '冷藏']),
+                        '商品实售价': price,
+                        '商品原价': round(price * 1.2, 2),
+                        '实收价格': round(price * 0.9, 2),
+                        '商品采购成本': round(price * 0.6, 2),
+                        '月售': int(rng.integers(1, 4)),
+                        '利润额': round(price * 0.3, 2),
+                        '预计订单收入': round(price * 0.85, 2),
+                        '平台服务费': round(price * 0.05, 2),
+                        **order_fields,
+                    })
+    return pd.DataFrame(rows)
+
+
+def table_columns(session, table: str):
+    rows = session.execute(text(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = :t ORDER BY ordinal_position"
+    ), {"t": table}).fetchall()
+    return [r[0] for r in rows if r[0] not in EXCLUDED_COLUMNS]
+
+
+def snapshot(session) -> dict:
+    """测试门店在各预聚合表中的全部行（去掉 id/时间戳，浮点保留4位，排序后比较）"""
+    result = {}
+    for table in get_all_table_names():
+        columns = table_columns(session, table)
+        rows = session.execute(
+            text(f"SELECT {', '.join(columns)} FROM {table} WHERE store_name IN (:a, :b)"),
+            {"a": STORE_A, "b": STORE_B},
+        ).fetchall()
+        df = pd.DataFrame(rows, columns=columns)
+        for column in df.columns:
+            if df[column].map(lambda v: isinstance(v, (float, Decimal))).any():
+                df[column] = pd.to_numeric(df[column], errors='coerce').round(4)
+        df = df.astype(object).where(df.notna(), '<NULL>').astype(str)
+        result[table] = df.sort_values(columns).reset_index(drop=True)
+    return result
+
+
+def other_store_counts(session) -> dict:
+    return {
+        table: session.execute(
+            text(f"SELECT COUNT(*) FROM {table} WHERE store_name NOT IN (:a, :b)"), {"a": STORE_A, "b": STORE_B}
+        ).scalar()
+        for table in get_all_table_names()
+    }
+
+
+def count_rows(session, table: str, where: str, params: dict) -> int:
+    return session.execute(text(f"SELECT COUNT(*) FROM {table} WHERE {where}"), params).scalar()
+
+
+def has_column(session, table: str, column: str) -> bool:
+    return column in table_columns(session, table)
+
+
+def mutated_days(offset: int):
+    """第 offset 轮修改的日期：(整天删除, 删除渠道, 修改金额, 新增)"""
+    return tuple(FIRST_DAY + timedelta(days=i + offset) for i in (2, 4, 6)) + (
+        FIRST_DAY + timedelta(days=DAYS + offset),
+    )
+
+
+def mutate_orders(session, offset: int) -> dict:
+    """
+    修改测试门店订单，返回脏集合（门店 → 日期）
+
+    - 门店A 第3天：删除全部订单（预聚合行需整天删除）
+    - 门店A 第5天：删除 饿了么 订单（该渠道行需删除，其他渠道保留）
+    - 门店B 第7天：实收价格 +10
+    - 门店A 第11天：新增订单（COPY 导入，脏集合取自实际写入的行）
+    （每轮 offset 后移一天，各轮修改不同的日期）
+    """
+    day3, day5, day7, new_day = mutated_days(offset)
+    session.execute(text(
+        "DELETE FROM orders WHERE store_name = :s AND date >= :f AND date < :t"
+    ), {"s": STORE_A, "f": day3, "t": day3 + timedelta(days=1)})
+    session.execute(text(
+        "DELETE FROM orders WHERE store_name = :s AND channel = '饿了么' AND date >= :f AND date < :t"
+    ), {"s": STORE_A, "f": day5, "t": day5 + timedelta(days=1)})
+    session.execute(text(
+        "UPDATE orders SET actual_price = actual_price + 10, updated_at = NOW() "
+        "WHERE store_name = :s AND date >= :f AND date < :t"
+    ), {"s": STORE_B, "f": day7, "t": day7 + timedelta(days=1)})
+    session.commit()
+
+    added = import_orders_frame(synthetic_orders([STORE_A], new_day, 1, seed=offset + 1))
+    dirty = {STORE_A: {day3, day5}, STORE_B: {day7}}
+    for store, days in added.dirty_days.items():
+        dirty.setdefault(store, set()).update(days)
+    return dirty
+
+
+def compare(name: str, scoped: dict, full: dict) -> bool:
+    ok = True
+    for table in get_all_table_names():
+        same = scoped[table].equals(full[table])
+        ok = ok and same
+        print(f"{'✅' if same else '❌'} {name} {table}: 增量 {len(scoped[table])} 行 / 全量 {len(full[table])} 行")
+    return ok
+
+
+def removed_checks(session, offset: int, label: str = "增量刷新后") -> dict:
+    day3, day5, _, _ = mutated_days(offset)
+    checks = {}
+    for table in get_all_table_names():
+        if not has_column(session, table, 'summary_date'):
+            continue
+        checks[f"{label} {table}: 已删除日期无残留"] = count_rows(
+            session, table, "store_name = :s AND summary_date = :d", {"s": STORE_A, "d": day3}
+        ) == 0
+        if has_column(session, table, 'channel'):
+            checks[f"{label} {table}: 已删除渠道无残留"] = count_rows(
+                session, table, "store_name = :s AND summary_date = :d AND channel = '饿了么'",
+                {"s": STORE_A, "d": day5}
+            ) == 0
+    return checks
+
+
+def test_sync_service(session) -> bool:
+    """AggregationSyncService：共享暂存 + 并行 upsert"""
+    print("\n📋 AggregationSyncService")
+    AggregationSyncService.sync_dirty({s: None for s in STORES}, async_mode=False)
+    initial_ok = bool(AggregationSyncService.get_last_refresh()["success"])
+    others_before = other_store_counts(session)
+
+    dirty = mutate_orders(session, offset=0)
+    AggregationSyncService.sync_dirty(dirty, async_mode=False)
+    refresh = AggregationSyncService.get_last_refresh()
+    session.rollback()
+    scoped = snapshot(session)
+    checks = removed_checks(session, offset=0)
+    removed = sum(t.get("removed", 0) for t in refresh["tables"].values())
+
+    AggregationSyncService.sync_dirty({s: None for s in STORES}, async_mode=False)
+    session.rollback()
+    full = snapshot(session)
+
+    checks.update({
+        "初始全量重建成功": initial_ok,
+        f"增量刷新成功（{refresh['scope']}）": bool(refresh["success"]),
+        f"清理旧行 {removed} 条": removed > 0,
+        "其他门店行数不变": other_store_counts(session) == others_before,
+    })
+    for name, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+    return compare("增量=全量", scoped, full) and all(checks.values())
+
+
+def test_staging(session) -> bool:
+    """订单明细暂存：子查询回退与遗留暂存表清理"""
+    print("\n📋 订单明细暂存")
+    staged = snapshot(session)
+    scope = RefreshScope.for_stores(STORES)
+    where, _ = scope.where("date")
+    source = f"({AggregationSyncService._order_lines_sql(where)})"
+    errors = [
+        result["error"] for result in (
+            AggregationSyncService._refresh_table(table, rebuild, scope, source)
+            for table, rebuild in AggregationSyncService._table_builders()
+        ) if result.get("error")
+    ]
+    session.rollback()
+    checks = {"子查询来源各表刷新成功": not errors}
+    ok = compare("子查询=暂存表", snapshot(session), staged)
+
+    prefix = AggregationSyncService.STAGING_TABLE_PREFIX
+    now = int(time.time())
+    legacy = f"{prefix}{uuid.uuid4().hex[:12]}"
+    expired = f"{prefix}{now - AggregationSyncService.STAGING_MAX_AGE - 60}_{SUFFIX}"
+    running = f"{prefix}{now}_{SUFFIX}"
+    for name in (legacy, expired, running):
+        session.execute(text(f"CREATE UNLOGGED TABLE {name} (id INTEGER)"))
+    session.commit()
+    AggregationSyncService._drop_leftover_staging()
+    remaining = set(session.execute(
+        text("SELECT tablename FROM pg_tables WHERE tablename IN (:a, :b, :c)"),
+        {"a": legacy, "b": expired, "c": running}
+    ).scalars())
+    session.execute(text(f"DROP TABLE IF EXISTS {running}"))
+    session.commit()
+    checks.update({
+        "遗留暂存表已删除（旧格式/超时）": not remaining & {legacy, expired},
+        "进行中的暂存表保留": running in remaining,
+    })
+    for name, passed in checks.items():
+        print(f"{'✅' if passed else '❌'} {name}")
+    return ok and all(checks.values())
+
+
+def test_engine(session) -> bool:
+    """AggregationEngine：配置生成的 upsert SQL"""
+    print("\n📋 AggregationEngine")
+    AggregationEngine.sync_all_tables(STORES)
+    dirty = mutate_orders(session, offset=1)
+    results = AggregationEngine.sync_dirty(dirty)
+    session.rollback()
+    scoped = snapshot(session)
+    checks = removed_checks(session, offset=1)
+
+    AggregationEngine.sync_all_tables(STORES)
+    session.rollback()
+    full = snapshot(session)
+
+    checks.update({
+        "各表 upsert 成功": all(r is not None for r in results.values()),
+        f"清理旧行 {sum(r[1] for r in results.values() if r)} 条": sum(r[1] for r in results.values() if r) > 0,
+    })
+    for name, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+    return compare("增量=全量", scoped, full) and all(checks.values())
+
+
+def cleanup(session):
+    session.rollback()
+    session.execute(text("DELETE FROM orders WHERE store_name IN (:a, :b)"), {"a": STORE_A, "b": STORE_B})
+    for table in get_all_table_names():
+        session.execute(text(f"DELETE FROM {table} WHERE store_name IN (:a, :b)"), {"a": STORE_A, "b": STORE_B})
+    session.commit()
+
+
+def main():
+    print("""
+╔══════════════════════════════════════════════════════════════════╗
+║           🔄 预聚合表增量刷新测试（PostgreSQL）
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    status = check_connection()
+    if not status.get('connected'):
+        print(f"❌ 需要 PostgreSQL（DATABASE_URL）: {status.get('message')}")
+        return 1
+    init_database()
+
+    session = SessionLocal()
+    results = []
+    try:
+        result = import_orders_frame(synthetic_orders(STORES, FIRST_DAY, DAYS))
+        stored = session.execute(
+            text("SELECT COUNT(*) FROM orders WHERE store_name IN (:a, :b)"), {"a": STORE_A, "b": STORE_B}
+        ).scalar()
+        ok = stored == result.inserted and result.skipped == 0
+        print(f"{'✅' if ok else '❌'} COPY 导入 {result.inserted:,} 行，库中 {stored:,} 行")
+        results.append(ok)
+
+        results.append(test_sync_service(session))
+        results.append(test_staging(session))
+        results.append(test_engine(session))
+    finally:
+        cleanup(session)
+        session.close()
+        print(f"\n🧹 已删除测试门店 {STORE_A} / {STORE_B}")
+
+    print("\n" + "=" * 60)
+    if all(results):
+        print("✅ 全部通过")
+        return 0
+    print("❌ 存在失败项")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Parquet 原始数据分区布局迁移脚本
+
+旧布局: data/raw/YYYY/MM/orders_YYYYMMDD.parquet（一天一个文件，所有门店混在一起）
+新布局: data/raw/month=YYYY-MM/store=<门店>/date=YYYY-MM-DD/orders.parquet
+
+DuckDB 以 hive_partitioning 读取新布局，按门店/日期过滤时只打开匹配的文件。
+迁移逐个旧文件执行（写入新分区后删除旧文件），中断后重新运行即可继续。
+"""
+import sys
+from pathlib import Path
+import time
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "backend" / "app"))
+
+from backend.app.services.parquet_sync_service import parquet_sync_service
+
+
+def migrate_layout() -> bool:
+    """执行迁移并输出前后文件统计"""
+    print(f"""
+╔══════════════════════════════════════════════════════════════════╗
+║           📦 Parquet 原始数据分区布局迁移（hive: 月/门店/日期）
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+
+    legacy_files = parquet_sync_service.legacy_raw_files()
+    if not legacy_files:
+        print("✅ 没有旧版布局文件，无需迁移")
+        return True
+
+    print(f"📁 旧版布局文件: {len(legacy_files)} 个")
+    start = time.time()
+    try:
+        stats = parquet_sync_service.migrate_raw_layout()
+    except Exception as e:
+        print(f"❌ 迁移失败（可重新运行继续）: {e}")
+        return False
+
+    print(f"""
+╔══════════════════════════════════════════════════════════════════╗
+║                      📋 迁移完成
+╠══════════════════════════════════════════════════════════════════╣
+║  旧文件数: {stats['files']}
+║  新分区数: {stats['partitions']}
+║  总记录数: {stats['rows']:,}
+║  耗时: {time.time() - start:.1f}秒
+║  存储位置: {parquet_sync_service.raw_dir}
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    return not parquet_sync_service.legacy_raw_files()
+
+
+if __name__ == "__main__":
+    success = migrate_layout()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Parquet 同步时间迁移脚本（一次性）
+
+记录按日同步时间（partitions.json 的 synced_at）之前导出的日期，订单加载时无法判断
+数据库是否原地修改过，一律从数据库读取。本脚本重新导出这些日期并记录同步时间，
+之后这些日期可以走 Parquet。
+
+与定时任务（每天 02:30）共用跨进程锁，同一时间只有一个进程执行；
+中断后重新运行只导出仍没有同步时间的日期。
+"""
+import sys
+from pathlib import Path
+import time
+
+# 添加项目路径
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "backend" / "app"))
+
+from backend.app.services.parquet_sync_service import parquet_sync_service
+
+
+def reexport() -> bool:
+    """重新导出并输出统计"""
+    print(f"""
+╔══════════════════════════════════════════════════════════════════╗
+║           🕒 Parquet 同步时间迁移（重新导出没有同步时间的日期）
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+
+    days = parquet_sync_service.unsynced_days()
+    if not days:
+        print("✅ 所有日期都有同步时间，无需迁移")
+        return True
+
+    print(f"📅 没有同步时间的日期: {len(days)} 天 ({days[0]} ~ {days[-1]})")
+    start = time.time()
+    result = parquet_sync_service.reexport_unsynced_days()
+    if result['skipped']:
+        print("⚠️ 其他进程正在重新导出，请稍后重新运行")
+        return False
+
+    print(f"""
+╔══════════════════════════════════════════════════════════════════╗
+║                      📋 迁移完成
+╠══════════════════════════════════════════════════════════════════╣
+║  导出天数: {result['days']}
+║  总记录数: {result['rows']:,}
+║  失败天数: {len(result['failed'])}
+║  耗时: {time.time() - start:.1f}秒
+╚══════════════════════════════════════════════════════════════════╝
+    """)
+    return not parquet_sync_service.unsynced_days()
+
+
+if __name__ == "__main__":
+    success = reexport()
+    sys.exit(0 if success else 1)
@@ -4,11 +4,18 @@
 
 将 PostgreSQL 中的历史订单数据迁移到 Parquet 文件
 支持增量迁移和全量迁移
+
+按天并行导出（ParquetSyncService.backfill）：每个 worker 导出一天，
+服务端游标按批读取为 Arrow 后直接写入 Parquet，内存与数据量无关
+
+用法:
+    python 迁移历史数据到Parquet.py                                  # 全部历史数据
+    python 迁移历史数据到Parquet.py --start 2026-01-01 --end 2026-01-31 --workers 8
 """
 import sys
 from pathlib import Path
-from datetime import datetime, timedelta, date
-import pandas as pd
+from datetime import datetime, date
+import argparse
 
 # 添加项目路径
 PROJECT_ROOT = Path(__file__).resolve().parent
@@ -17,7 +24,7 @@ sys.path.insert(0, str(PROJECT_ROOT / "backend" / "app"))
 
 from database.connection import SessionLocal
 from database.models import Order
-from sqlalchemy import func, distinct
+from sqlalchemy import func
 
 
 def get_date_range():
@@ -32,61 +39,8 @@ def get_date_range():
         session.close()
 
 
-def get_orders_by_date(target_date: date) -> pd.DataFrame:
-    """获取指定日期的订单数据"""
-    session = SessionLocal()
-    try:
-        from sqlalchemy import cast, Date
-        
-        # 使用cast将datetime转换为date进行比较
-        orders = session.query(Order).filter(
-            cast(Order.date, Date) == target_date
-        ).all()
-        
-        if not orders:
-            return pd.DataFrame()
-        
-        data = []
-        for o in orders:
-            data.append({
-                '订单ID': o.order_id,
-                '门店名称': o.store_name,
-                '日期': o.date,
-                '渠道': o.channel,
-                '商品名称': o.product_name,
-                '一级分类名': o.category_level1,
-                '三级分类名': o.category_level3,
-                '月售': o.quantity if o.quantity is not None else 1,
-                '实收价格': float(o.actual_price or 0),
-                '商品实售价': float(o.price or 0),
-                '商品原价': float(o.original_price or 0),
-                '商品采购成本': float(o.cost or 0),
-                '利润额': float(o.profit or 0),
-                '物流配送费': float(o.delivery_fee or 0),
-                '平台服务费': float(o.platform_service_fee or 0),
-                '平台佣金': float(o.commission or 0),
-                '预计订单收入': float(o.amount or 0),
-                '企客后返': float(o.corporate_rebate or 0),
-                '用户支付配送费': float(o.user_paid_delivery_fee or 0),
-                '配送费减免金额': float(o.delivery_discount or 0),
-                '满减金额': float(o.full_reduction or 0),
-                '商品减免金额': float(o.product_discount or 0),
-                '新客减免金额': float(o.new_customer_discount or 0),
-                '商家代金券': float(o.merchant_voucher or 0),
-                '商家承担部分券': float(o.merchant_share or 0),
-                '满赠金额': float(o.gift_amount or 0),
-                '商家其他优惠': float(o.other_merchant_discount or 0),
-                '打包袋金额': float(o.packaging_fee or 0),
-                '库存': o.stock,
-            })
-        
-        return pd.DataFrame(data)
-    finally:
-        session.close()
-
-
-def migrate_all_data():
-    """迁移全部历史数据"""
+def migrate_all_data(start_date: date = None, end_date: date = None, workers: int = None):
+    """迁移历史数据（默认全部日期）"""
     from backend.app.services import parquet_sync_service
     
     print("""
@@ -99,57 +53,34 @@ def migrate_all_data():
     """)
     
     # 获取日期范围
-    min_date, max_date = get_date_range()
+    if start_date is None or end_date is None:
+        min_date, max_date = get_date_range()
+        if not min_date or not max_date:
+            print("❌ 数据库中没有订单数据")
+            return False
+        start_date = start_date or min_date
+        end_date = end_date or max_date
     
-    if not min_date or not max_date:
-        print("❌ 数据库中没有订单数据")
-        return False
-    
-    print(f"📅 数据日期范围: {min_date} ~ {max_date}")
+    print(f"📅 迁移日期范围: {start_date} ~ {end_date}")
     
     # 计算总天数
-    total_days = (max_date - min_date).days + 1
+    total_days = (end_date - start_date).days + 1
     print(f"📊 共需迁移 {total_days} 天的数据\n")
     
-    # 统计
-    total_records = 0
-    success_days = 0
-    failed_days = 0
-    
-    # 按日期迁移
-    current_date = min_date
-    while current_date <= max_date:
-        try:
-            # 获取当日数据
-            df = get_orders_by_date(current_date)
-            
-            if df.empty:
-                print(f"  ⚪ {current_date}: 无数据")
-            else:
-                # 同步原始数据
-                parquet_sync_service.sync_raw_data(current_date, df)
-                
-                # 生成聚合数据
-                parquet_sync_service.generate_daily_aggregations(current_date)
-                
-                total_records += len(df)
-                success_days += 1
-                print(f"  ✅ {current_date}: {len(df):,} 条记录")
-        
-        except Exception as e:
-            failed_days += 1
-            print(f"  ❌ {current_date}: 迁移失败 - {e}")
-        
-        current_date += timedelta(days=1)
+    # 按天并行导出
+    result = parquet_sync_service.backfill(start_date, end_date, workers=workers)
+    rows_per_second = result['rows'] / result['elapsed_seconds'] if result['elapsed_seconds'] else 0
     
     # 汇总
     print(f"""
 ╔══════════════════════════════════════════════════════════════════╗
 ║                      📋 迁移完成
 ╠══════════════════════════════════════════════════════════════════╣
-║  总记录数: {total_records:,}
-║  成功天数: {success_days}
-║  失败天数: {failed_days}
+║  总记录数: {result['rows']:,}
+║  成功天数: {result['days'] - len(result['empty_days']) - len(result['failed'])}
+║  无数据天数: {len(result['empty_days'])}
+║  失败天数: {len(result['failed'])}
+║  并行数: {result['workers']}，耗时 {result['elapsed_seconds']}s（{rows_per_second:,.0f} 行/秒）
 ║  存储位置: {parquet_sync_service.data_dir}
 ╚══════════════════════════════════════════════════════════════════╝
     """)
@@ -159,9 +90,19 @@ def migrate_all_data():
     print(f"📁 原始Parquet文件: {status['raw_files_count']} 个")
     print(f"📁 聚合Parquet文件: {status['aggregated_files_count']} 个")
     
-    return failed_days == 0
+    return not result['failed']
+
+
+def parse_date(value: str) -> date:
+    return datetime.strptime(value, '%Y-%m-%d').date()
 
 
 if __name__ == "__main__":
-    success = migrate_all_data()
+    parser = argparse.ArgumentParser(description='历史数据迁移到 Parquet')
+    parser.add_argument('--start', type=parse_date, help='开始日期 YYYY-MM-DD（默认数据库最早日期）')
+    parser.add_argument('--end', type=parse_date, help='结束日期 YYYY-MM-DD（默认数据库最晚日期）')
+    parser.add_argument('--workers', '-w', type=int, help='并行天数（默认 PARQUET_EXPORT_WORKERS=4）')
+    args = parser.parse_args()
+    
+    success = migrate_all_data(args.start, args.end, args.workers)
     sys.exit(0 if success else 1)
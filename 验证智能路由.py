@@ -78,8 +78,8 @@ def main():
         print(f"   查询耗时: {result.query_time_ms:.2f}ms")
         
         # 切换回原引擎
-        query_router_service.force_engine(current)
-        print(f"\n✅ 已恢复到 {current.upper()}")
+        query_router_service.force_engine('auto')
+        print(f"\n✅ 已恢复按查询代价路由")
     else:
         print(f"❌ {switch_result['message']}")
     
@@ -105,7 +105,7 @@ def main():
             dk_times.append(result.query_time_ms)
     
     # 恢复
-    query_router_service.force_engine(current)
+    query_router_service.force_engine('auto')
     
     print(f"\n🐘 PostgreSQL (5次查询):")
     print(f"   平均耗时: {sum(pg_times)/len(pg_times):.2f}ms")
@@ -148,11 +148,8 @@ def main():
     print("\n💡 说明:")
     print(f"   - 当前数据量: {report['record_count']:,} 条")
     print(f"   - 切换阈值: {report['switch_threshold']:,} 条")
-    remaining = report['switch_threshold'] - report['record_count']
-    if remaining > 0:
-        print(f"   - 还需 {remaining:,} 条数据才会自动切换到 DuckDB")
-    else:
-        print(f"   - 数据量已达标，系统会自动使用 DuckDB")
+    print(f"   - 按单次查询估算扫描行数路由，超过阈值的查询使用 DuckDB")
+    print(f"   - 两个引擎积累耗时样本后按 P{int(status['routing']['percentile'])} 耗时选择")
 
 if __name__ == "__main__":
     main()